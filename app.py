@@ -1,32 +1,415 @@
 import streamlit as st
 import pandas as pd
-from openai import OpenAI
 from dotenv import load_dotenv
+import glob
+import json
 import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
 
-# Carrega as variáveis de ambiente
-load_dotenv()
+from cache_llm import CacheLLM
+from calculos import (tabela_depreciacao, calcular_margens, calcular_impostos_base, calcular_dre, analise_vertical_dre,
+                      indices_balanco, indices_empresa, analisar_orcamento, montar_fluxo, projetar_fluxo,
+                      INDICADORES_BALANCO)
+from cliente_llm import criar_cliente, ErroLLM
+from classificacao import ler_extrato, ClassificadorLocal, classificar_com_triagem
+import desempenho
+from demonstrativos import (dividir_demonstrativo, analisar_em_blocos, reduzir_parciais, montar_prompt_reducao,
+                            compactar_demonstrativo, PROMPT_ANALISE)
+from depreciacao import preparar_ativos, depreciacao_no_periodo, totais_mensais, cronograma, METODOS
+from dre import DREMultiperiodo, NOMES_LINHAS, SUBTOTAIS
+from faq import IndicePerguntas, SIMILARIDADE_MINIMA_PADRAO
+from fluxo_caixa import simular, resumir_simulacao, LIMITE_CELULAS_SIMULACAO
+from folha import calcular_folha, resumir_folha, TABELAS_INSS
+from historico import Historico
+from indicadores import (calcular_indicadores, avaliar_indicadores, gerar_recomendacoes, pivotar_lancamentos,
+                         formatar_indicador, INDICADORES)
+from ingestao import hash_arquivo, carregar_csv, pagina, uso_memoria_mb
+from llm import completar, completar_stream
+from notas_fiscais import ler_lote_notas, montar_regras, calcular_impostos, totalizar, ANEXOS_SIMPLES, ISS_PADRAO
+from orcamento import ControleOrcamento
+from sped import ler_arquivos, apurar_campos, saldos_por_conta, descrever, MAPEAMENTO_PADRAO
+from tarefas import FilaTarefas, LimiteTarefasExcedido, ATIVAS, CONCLUIDA, ERRO
+
+# Duração de cada execução do script, registrada por tela ao final do arquivo.
+# Execuções interrompidas (st.stop, st.rerun ou erro não tratado) não entram na conta.
+span_execucao = desempenho.span("tela")
+
+# Variáveis de ambiente carregadas uma vez por processo, não a cada rerun
+@st.cache_resource
+def ler_chave_api():
+    load_dotenv()
+    return os.getenv('OPENAI_API_KEY')
 
 # Verificação da chave API
-api_key = os.getenv('OPENAI_API_KEY')
+api_key = ler_chave_api()
 if not api_key:
+    # Chave ausente não fica em cache: é procurada de novo depois que o .env for corrigido
+    ler_chave_api.clear()
     st.error('Erro: Chave API da OpenAI não encontrada. Verifique seu arquivo .env')
     st.stop()
 
-# Configuração do cliente OpenAI
-client = OpenAI(api_key=api_key)
+# Cliente OpenAI único por processo: pool de conexões, repetição com backoff e
+# agrupamento de perguntas idênticas feitas ao mesmo tempo por sessões diferentes
+@st.cache_resource
+def obter_cliente_llm(api_key):
+    return criar_cliente(api_key)
+
+client = obter_cliente_llm(api_key)
+
+# Cache de respostas do GPT-4 compartilhado entre sessões
+@st.cache_resource
+def obter_cache_llm():
+    return CacheLLM()
+
+cache_llm = obter_cache_llm()
+
+# Classificador local (plano de contas + regras aprendidas) compartilhado entre sessões
+@st.cache_resource
+def obter_classificador():
+    return ClassificadorLocal()
+
+# Perguntas e respostas aprovadas de "Dúvidas Contábeis", compartilhadas entre sessões
+@st.cache_resource
+def obter_indice_perguntas():
+    return IndicePerguntas()
+
+# Fila de tarefas em segundo plano compartilhada entre sessões (limite global e por usuário)
+@st.cache_resource
+def obter_fila_tarefas():
+    return FilaTarefas()
+
+fila_tarefas = obter_fila_tarefas()
+
+# Histórico de empresas, períodos, indicadores e análises, com resultados memorizados por hash das entradas
+@st.cache_resource
+def obter_historico():
+    return Historico()
+
+historico = obter_historico()
+
+# Endpoint /metrics no formato do Prometheus, se DESEMPENHO_PORTA_PROMETHEUS estiver definida
+@st.cache_resource
+def iniciar_servidor_metricas():
+    if desempenho.PORTA_PROMETHEUS:
+        return desempenho.iniciar_servidor(desempenho.REGISTRO)
+
+iniciar_servidor_metricas()
+
+# Arquivos grandes podem ser lidos direto do disco, mas só de dentro desta pasta.
+# Sem ARQUIVOS_SERVIDOR_DIRETORIO definida, os campos de caminho no servidor não aparecem.
+DIRETORIO_SERVIDOR = os.getenv('ARQUIVOS_SERVIDOR_DIRETORIO')
+# Tamanho máximo descompactado de cada .zip de notas fiscais (pode ser sobrescrito pelo .env)
+LIMITE_ZIP_BYTES = int(os.getenv('NOTAS_LIMITE_ZIP_MB', 2048)) * 1024 * 1024
+
+def caminho_servidor(caminho):
+    """Caminho real de `caminho` (relativo a DIRETORIO_SERVIDOR ou absoluto), ou None se cair fora da pasta."""
+    if not DIRETORIO_SERVIDOR:
+        return None
+    base = os.path.realpath(DIRETORIO_SERVIDOR)
+    real = os.path.realpath(os.path.join(base, caminho))
+    return real if os.path.commonpath([base, real]) == base else None
+
+# CSVs carregados ficam em memória por hash do conteúdo (sem cópia a cada rerun).
+# Quem precisar alterar o DataFrame deve trabalhar sobre uma cópia.
+@st.cache_resource(max_entries=8)
+def _carregar_csv_por_hash(chave, _arquivo):
+    with desempenho.span("leitura", "csv") as span:
+        df = carregar_csv(_arquivo, chave)
+        span["linhas"] = len(df)
+    return df
+
+def hash_upload(arquivo):
+    # O hash é calculado uma vez por upload e reaproveitado nos reruns
+    hashes = st.session_state.setdefault("hashes_uploads", {})
+    if arquivo.file_id not in hashes:
+        hashes[arquivo.file_id] = hash_arquivo(arquivo)
+    return hashes[arquivo.file_id]
+
+def ler_upload_csv(arquivo):
+    # Reruns reaproveitam o DataFrame já carregado
+    return _carregar_csv_por_hash(hash_upload(arquivo), arquivo)
+
+# A busca binária do prompt compacto roda uma vez por arquivo e parâmetros, não a cada interação
+@st.cache_data(max_entries=16)
+def compactar_por_hash(chave, orcamento_tokens, coluna_grupo, coluna_periodo, _df):
+    return compactar_demonstrativo(_df, orcamento_tokens, coluna_grupo, coluna_periodo)
+
+def exibir_previa(df, chave, linhas_por_pagina=100):
+    # Envia ao navegador só uma página do arquivo, nunca o DataFrame inteiro
+    st.caption(f"{len(df):,} linhas x {df.shape[1]} colunas | {uso_memoria_mb(df):.1f} MB em memória")
+    total_paginas = max((len(df) - 1) // linhas_por_pagina + 1, 1)
+    numero = st.number_input("Página", min_value=1, max_value=total_paginas, value=1, key=f"pagina_{chave}")
+    st.dataframe(pagina(df, numero, linhas_por_pagina))
+
+def importar_ecd(campos):
+    """Expander para ler arquivos da ECD e preencher os `campos` da tela (chaves "campo_<nome>")."""
+    with st.expander("Importar da ECD (SPED Contábil)"):
+        arquivos_ecd = st.file_uploader("Arquivos da ECD (.txt)", type="txt", accept_multiple_files=True,
+                                        key="uploads_ecd")
+        caminhos_servidor = ""
+        if DIRETORIO_SERVIDOR:
+            caminhos_servidor = st.text_area(f"Ou caminhos de arquivos em {DIRETORIO_SERVIDOR} no servidor "
+                                             "(um por linha), para arquivos grandes")
+        
+        if st.button("Ler arquivos"):
+            digitados = [c.strip() for c in caminhos_servidor.splitlines() if c.strip()]
+            caminhos = [caminho_servidor(c) for c in digitados]
+            recusados = [c for c, real in zip(digitados, caminhos) if real is None]
+            if recusados:
+                st.error(f"Caminhos fora de {DIRETORIO_SERVIDOR}: {', '.join(recusados)}")
+                return
+            # Uploads são copiados em blocos para disco: cada arquivo é lido por um processo separado
+            diretorio = tempfile.mkdtemp(prefix="ecd_")
+            for arquivo in arquivos_ecd or []:
+                destino = os.path.join(diretorio, os.path.basename(arquivo.name))
+                arquivo.seek(0)
+                with open(destino, "wb") as saida:
+                    shutil.copyfileobj(arquivo, saida)
+                caminhos.append(destino)
+            
+            if caminhos:
+                barra = st.progress(0.0, text="Lendo arquivos...")
+                with desempenho.span("leitura", "ecd") as span:
+                    try:
+                        st.session_state.ecd = ler_arquivos(
+                            caminhos, progresso=lambda feitos, total: barra.progress(feitos / total, text=f"Arquivos lidos: {feitos}/{total}")
+                        )
+                    finally:
+                        shutil.rmtree(diretorio, ignore_errors=True)
+                    span["linhas"] = linhas = sum(r["linhas"] for r in st.session_state.ecd)
+                st.success(f"{len(caminhos)} arquivo(s), {linhas:,} linhas em {span.duracao:.1f}s")
+        
+        if not st.session_state.get("ecd"):
+            return
+        
+        resultados = st.session_state.ecd
+        indice = st.selectbox("Arquivo", range(len(resultados)), format_func=lambda i: descrever(resultados[i]))
+        texto_mapeamento = st.text_area("Mapeamento de contas (JSON)",
+                                        json.dumps(MAPEAMENTO_PADRAO, indent=2, ensure_ascii=False), height=200)
+        try:
+            mapeamento = json.loads(texto_mapeamento)
+        except json.JSONDecodeError as erro:
+            st.error(f"Mapeamento inválido: {erro}")
+            return
+        
+        valores = apurar_campos(resultados[indice], {c: mapeamento[c] for c in campos if c in mapeamento})
+        st.dataframe(pd.Series(valores, name="Valor (R$)").to_frame().style.format("{:,.2f}"))
+        if st.button("Preencher campos"):
+            for campo, minimo in campos.items():
+                if campo in valores:
+                    st.session_state[f"campo_{campo}"] = valores[campo] if minimo is None else max(valores[campo], minimo)
+            # Empresa e exercício do arquivo identificam o período no histórico
+            st.session_state.historico_empresa = resultados[indice]["empresa"]
+            if pd.notna(resultados[indice]["fim"]):
+                st.session_state.historico_periodo = f"{resultados[indice]['fim']:%Y}"
+        
+        st.write("Balancete das contas analíticas:")
+        contas = saldos_por_conta(resultados[indice])
+        exibir_previa(contas.drop(columns="hierarquia"), f"ecd_{indice}")
+        demonstracoes = resultados[indice]["demonstracoes"]
+        if len(demonstracoes):
+            st.write("Demonstrações publicadas no arquivo (J100/J150):")
+            st.dataframe(demonstracoes)
+
+# Histórico de latências das chamadas ao LLM nesta sessão
+if "latencias_llm" not in st.session_state:
+    st.session_state.latencias_llm = []
+
+def exibir_resposta_llm(titulo, prompt, referencia=None):
+    st.write(titulo)
+    metricas = {}
+    try:
+        if modo_streaming:
+            # write_stream renderiza os tokens conforme chegam; um rerun interrompe o gerador
+            resposta = st.write_stream(completar_stream(client, prompt, cache=cache_llm, metricas=metricas))
+        else:
+            with st.spinner("Consultando o modelo..."):
+                resposta = completar(client, prompt, cache=cache_llm, metricas=metricas)
+            st.write(resposta)
+    except ErroLLM as erro:
+        st.error(f"Não foi possível consultar a IA agora. Tente novamente em alguns instantes. ({erro})")
+        return None
+    
+    metricas["tela"] = opcao
+    st.session_state.latencias_llm.append(metricas)
+    historico.gravar_analise(opcao, prompt, resposta, referencia)
+    origem = "cache" if metricas.get("cache") else "API"
+    st.caption(f"Primeiro token: {metricas.get('tempo_primeiro_token', 0):.2f}s | "
+               f"Total: {metricas.get('latencia_total', 0):.2f}s | Origem: {origem}")
+    return resposta
+
+def enviar_tarefa(chave, tipo, titulo, funcao):
+    """Envia `funcao(contexto)` para a fila e guarda o id em st.session_state[chave] para acompanhar na tela."""
+    try:
+        st.session_state[chave] = fila_tarefas.submeter(usuario, tipo, titulo, funcao)
+    except LimiteTarefasExcedido as erro:
+        st.warning(str(erro))
+
+@st.fragment(run_every=2)
+def exibir_andamento_tarefa(id_):
+    # Só este trecho é reexecutado a cada 2s; ao terminar, um rerun completo carrega o resultado
+    tarefa = fila_tarefas.obter(id_)
+    if tarefa is None or tarefa["status"] not in ATIVAS:
+        st.rerun()
+    st.progress(tarefa["progresso"], text=f"{tarefa['titulo']}: {tarefa['mensagem']}")
+    if st.button("Cancelar", key=f"cancelar_{id_}"):
+        fila_tarefas.cancelar(id_)
+
+def acompanhar_tarefa(chave):
+    """Mostra o andamento da tarefa da tela e, quando ela termina, carrega o resultado em st.session_state."""
+    id_ = st.session_state.get(chave)
+    if id_ is None:
+        return
+    tarefa = fila_tarefas.obter(id_)
+    if tarefa is not None and tarefa["status"] in ATIVAS:
+        exibir_andamento_tarefa(id_)
+        return
+    
+    del st.session_state[chave]
+    if tarefa is None:
+        return
+    if tarefa["status"] == CONCLUIDA:
+        st.session_state.update(fila_tarefas.resultado(id_))
+    elif tarefa["status"] == ERRO:
+        st.error(f"A tarefa \"{tarefa['titulo']}\" falhou: {tarefa['erro']}")
+    else:
+        st.warning(f"Tarefa \"{tarefa['titulo']}\" cancelada")
+
+def analisar_demonstrativo(arquivo, prompt, blocos=None, max_workers=4, progresso=None):
+    # Versão sem streaming da análise, para execução em segundo plano
+    parciais = None
+    if blocos is not None:
+        parciais = analisar_em_blocos(client, blocos, max_workers=max_workers, cache=cache_llm, progresso=progresso)
+        prompt = montar_prompt_reducao(reduzir_parciais(client, parciais, max_workers=max_workers, cache=cache_llm))
+    analise = completar(client, prompt, cache=cache_llm)
+    historico.gravar_analise("Análise de Demonstrativos", prompt, analise, arquivo)
+    return {"demonstrativo_analise": {"arquivo": arquivo, "parciais": parciais, "analise": analise}}
+
+def classificar_extrato(df_extrato, coluna_descricao, classificador, confianca_minima, arquivo, progresso=None,
+                        **parametros_lote):
+    inicio = time.perf_counter()
+    with desempenho.span("calculo", "classificacao", linhas=len(df_extrato)):
+        classificacoes = classificar_com_triagem(
+            client, df_extrato[coluna_descricao].tolist(), classificador, confianca_minima,
+            cache=cache_llm, progresso=progresso, **parametros_lote
+        )
+    df_extrato = df_extrato.copy()
+    df_extrato["conta_classificada"] = df_extrato[coluna_descricao].map(lambda d: classificacoes.get(d, (None,))[0])
+    df_extrato["origem"] = df_extrato[coluna_descricao].map(lambda d: classificacoes.get(d, (None, None, None))[2])
+    falhas = sum(1 for _, _, origem in classificacoes.values() if origem == "falha")
+    return {"extrato_classificado": df_extrato, "extrato_decorrido": time.perf_counter() - inicio,
+            "extrato_arquivo": arquivo, "extrato_falhas": falhas}
+
+def avisar_falhas_classificacao(falhas):
+    if falhas:
+        st.warning(f"{falhas:,} descrições ficaram sem classificação porque a IA falhou ou respondeu fora do "
+                   "formato (origem \"falha\"). Classifique de novo mais tarde ou revise-as manualmente.")
+
+def processar_notas(caminhos, diretorio, regras, progresso=None):
+    inicio = time.perf_counter()
+    try:
+        with desempenho.span("leitura", "notas") as span:
+            itens_notas, erros_notas = ler_lote_notas(caminhos, progresso=progresso)
+            span["linhas"] = len(itens_notas)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    return {"notas": calcular_impostos(itens_notas, regras), "notas_erros": erros_notas,
+            "notas_decorrido": time.perf_counter() - inicio, "notas_arquivos": len(caminhos)}
+
+def campos_historico():
+    """Empresa e período opcionais do formulário; preenchidos, o cálculo é gravado no histórico."""
+    col1, col2 = st.columns(2)
+    with col1:
+        entidade = st.text_input("Empresa (opcional, para o histórico)", key="historico_empresa")
+    with col2:
+        periodo = st.text_input("Período (ex.: 2024 ou 2024-12)", key="historico_periodo")
+    return entidade.strip(), periodo.strip()
+
+def exibir_comparacao(entidade, demonstrativo, indicadores):
+    # Os períodos já gravados vêm da base, sem recalcular nada
+    linhas = historico.demonstrativo(entidade, demonstrativo)
+    if len(linhas) < 2:
+        return
+    st.write(f"### Comparação entre Períodos - {entidade}")
+    st.dataframe(linhas.T.style.format("{:,.2f}", na_rep="-"))
+    indices = historico.indicadores(entidade, indicadores)
+    if not indices.empty:
+        st.line_chart(indices)
+
+def _indicadores_carteira(carteira):
+    indices = calcular_indicadores(carteira)
+    status, _ = avaliar_indicadores(indices)
+    return indices, status, gerar_recomendacoes(carteira, indices)
+
+def exibir_resultado_tarefa(tipo, resultado):
+    # Resumo do resultado guardado, para reabrir tarefas de qualquer tela
+    if tipo == "demonstrativo":
+        analise = resultado["demonstrativo_analise"]
+        if analise["parciais"]:
+            with st.expander("Análises parciais"):
+                for i, parcial in enumerate(analise["parciais"], start=1):
+                    st.write(f"**Bloco {i}**")
+                    st.write(parcial)
+        st.write(analise["analise"])
+    elif tipo == "classificacao":
+        df_extrato = resultado["extrato_classificado"]
+        st.write(f"{len(df_extrato):,} lançamentos de {resultado['extrato_arquivo']} "
+                 f"em {resultado['extrato_decorrido']:.1f}s")
+        avisar_falhas_classificacao(resultado.get("extrato_falhas", 0))
+        st.dataframe(df_extrato.head(1000))
+        st.download_button("Baixar arquivo classificado", df_extrato.to_csv(index=False).encode("utf-8"),
+                           file_name="extrato_classificado.csv", mime="text/csv")
+    elif tipo == "notas":
+        notas = resultado["notas"]
+        st.write(f"{resultado['notas_arquivos']:,} arquivos, {len(notas):,} itens, "
+                 f"{len(resultado['notas_erros']):,} com erro, em {resultado['notas_decorrido']:.1f}s")
+        st.dataframe(totalizar(notas, "periodo").style.format("{:,.2f}", na_rep="-"))
+        st.download_button("Baixar itens apurados", notas.to_csv(index=False).encode("utf-8"),
+                           file_name="impostos_notas.csv", mime="text/csv")
 
 # Configuração da página
 st.set_page_config(page_title="Assistente Contábil IA", layout="wide")
 st.title("Assistente Contábil IA")
 
+# O usuário é identificado pela URL: as tarefas em segundo plano continuam acessíveis ao recarregar a página
+if "sessao" not in st.query_params:
+    st.query_params["sessao"] = uuid.uuid4().hex
+usuario = st.query_params["sessao"]
+
+# O painel "Desempenho" só aparece com ?admin=<DESEMPENHO_ADMIN_CHAVE> na URL
+chave_admin = os.getenv('DESEMPENHO_ADMIN_CHAVE')
+eh_admin = bool(chave_admin) and st.query_params.get("admin") == chave_admin
+
 # Sidebar para seleção de funcionalidades
 opcao = st.sidebar.selectbox(
     "Escolha a função desejada",
     ["Análise de Demonstrativos", "Classificação de Contas", "Dúvidas Contábeis", 
      "Cálculos Contábeis", "Folha de Pagamento", "Análise de Balanço", 
-     "Controle de Orçamento", "Fluxo de Caixa", "Análise DRE", "Análise de Indicadores"]
+     "Controle de Orçamento", "Fluxo de Caixa", "Análise DRE", "Análise de Indicadores",
+     "Histórico de Empresas", "Tarefas em Segundo Plano"] + (["Desempenho"] if eh_admin else [])
 )
+span_execucao.rotulo = opcao
+
+modo_streaming = st.sidebar.checkbox("Exibir respostas da IA em tempo real", value=True)
+em_segundo_plano = st.sidebar.checkbox("Executar análises longas em segundo plano", value=False,
+                                       help="A análise continua mesmo que a tela seja atualizada; "
+                                            "o resultado fica disponível em \"Tarefas em Segundo Plano\"")
+
+# Estatísticas do cache de respostas
+with st.sidebar.expander("Cache de respostas IA"):
+    estatisticas_cache = cache_llm.estatisticas()
+    st.write(f"Acertos: {estatisticas_cache['hits']} | Falhas: {estatisticas_cache['misses']}")
+    st.write(f"Taxa de acerto: {estatisticas_cache['taxa_acerto']:.1%}")
+    st.write(f"Entradas: {estatisticas_cache['entradas']} ({estatisticas_cache['tamanho_bytes'] / 1024:.1f} KB)")
+    if st.button("Limpar cache"):
+        cache_llm.limpar()
+    estatisticas_cliente = client.estatisticas()
+    st.write(f"Chamadas à API: {estatisticas_cliente['chamadas']} | "
+             f"Repetidas: {estatisticas_cliente['repeticoes']} | Agrupadas: {estatisticas_cliente['agrupadas']}")
 
 if opcao == "Análise de Demonstrativos":
     st.header("Análise de Demonstrativos Financeiros")
@@ -34,42 +417,184 @@ if opcao == "Análise de Demonstrativos":
     uploaded_file = st.file_uploader("Faça upload do seu demonstrativo (CSV)", type="csv")
     
     if uploaded_file is not None:
-        df = pd.read_csv(uploaded_file)
+        df = ler_upload_csv(uploaded_file)
         st.write("Dados carregados:")
-        st.write(df)
+        exibir_previa(df, "demonstrativo")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            coluna_grupo = st.selectbox("Coluna de agrupamento (conta/grupo)", ["(nenhum)"] + list(df.columns))
+        with col2:
+            coluna_periodo = st.selectbox("Coluna de período", ["(nenhum)"] + list(df.columns))
+        coluna_grupo = None if coluna_grupo == "(nenhum)" else coluna_grupo
+        coluna_periodo = None if coluna_periodo == "(nenhum)" else coluna_periodo
+        
+        # Arquivos grandes são analisados em blocos paralelos (map) e consolidados ao final (reduce)
+        analise_em_blocos = st.checkbox("Analisar em blocos (recomendado para arquivos grandes)",
+                                        value=len(df) > 500)
+        if analise_em_blocos:
+            col1, col2 = st.columns(2)
+            with col1:
+                linhas_por_bloco = st.number_input("Linhas por bloco", min_value=50, value=500, step=50)
+            with col2:
+                max_workers = st.slider("Requisições simultâneas", 1, 16, 4)
+        else:
+            # Prompt compacto: resumo numérico + detalhe em CSV dentro do orçamento de tokens
+            orcamento_tokens = st.number_input("Limite de tokens do prompt", min_value=500, value=6000, step=500)
+            compactado = compactar_por_hash(hash_upload(uploaded_file), int(orcamento_tokens), coluna_grupo,
+                                            coluna_periodo, df)
+            st.caption(f"Tokens estimados do prompt: {compactado['tokens']:,} | "
+                       f"Linhas de detalhe incluídas: {compactado['linhas_detalhe']:,} de {len(df):,}")
+            with st.expander("Visualizar prompt compactado"):
+                st.text(compactado["texto"])
         
         if st.button("Analisar Demonstrativo"):
-            prompt = f"Analise os seguintes dados financeiros e forneça insights importantes:\n{df.to_string()}"
-            
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Você é um especialista contábil."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
+            st.session_state.pop("demonstrativo_analise", None)
+            if em_segundo_plano:
+                blocos = dividir_demonstrativo(df, int(linhas_por_bloco), coluna_grupo=coluna_grupo) if analise_em_blocos else None
+                prompt = None if analise_em_blocos else PROMPT_ANALISE.format(dados=compactado["texto"])
+                workers = max_workers if analise_em_blocos else 1
+                arquivo = uploaded_file.name
+                enviar_tarefa("tarefa_demonstrativo", "demonstrativo", f"Análise de {arquivo}",
+                              lambda contexto: analisar_demonstrativo(arquivo, prompt, blocos, workers, contexto.progresso))
+            else:
+                if analise_em_blocos:
+                    blocos = dividir_demonstrativo(df, int(linhas_por_bloco), coluna_grupo=coluna_grupo)
+                    barra = st.progress(0.0, text=f"Analisando {len(blocos)} blocos...")
+                    try:
+                        parciais = analisar_em_blocos(
+                            client, blocos, max_workers=max_workers, cache=cache_llm,
+                            progresso=lambda feitos, total: barra.progress(feitos / total, text=f"Blocos analisados: {feitos}/{total}")
+                        )
+                        # Muitas parciais não cabem em um só prompt: são consolidadas em níveis antes
+                        reduzidas = reduzir_parciais(client, parciais, max_workers=max_workers, cache=cache_llm)
+                    except ErroLLM as erro:
+                        st.error(f"Não foi possível concluir a análise em blocos. Tente novamente em alguns instantes. ({erro})")
+                        st.stop()
+                    with st.expander("Análises parciais"):
+                        for i, parcial in enumerate(parciais, start=1):
+                            st.write(f"**Bloco {i}**")
+                            st.write(parcial)
+                    prompt = montar_prompt_reducao(reduzidas)
+                else:
+                    prompt = PROMPT_ANALISE.format(dados=compactado["texto"])
+                
+                exibir_resposta_llm("### Análise:", prompt, uploaded_file.name)
+        
+        acompanhar_tarefa("tarefa_demonstrativo")
+        analise_anterior = st.session_state.get("demonstrativo_analise")
+        if analise_anterior and analise_anterior["arquivo"] == uploaded_file.name:
             st.write("### Análise:")
-            st.write(response.choices[0].message.content)
+            exibir_resultado_tarefa("demonstrativo", st.session_state)
+        
+        analises_anteriores = historico.analises(opcao, uploaded_file.name)
+        if not analises_anteriores.empty:
+            with st.expander(f"Análises anteriores deste arquivo ({len(analises_anteriores)})"):
+                for analise in analises_anteriores.itertuples():
+                    st.write(f"**{time.strftime('%d/%m/%Y %H:%M', time.localtime(analise.criado_em))}**")
+                    st.write(analise.conteudo)
 
 elif opcao == "Classificação de Contas":
     st.header("Classificação de Contas")
     
-    descricao = st.text_area("Digite a descrição da transação:")
+    classificador = obter_classificador()
     
-    if st.button("Classificar"):
-        prompt = f"Classifique a seguinte transação contábil e sugira a conta adequada:\n{descricao}"
+    with st.expander("Plano de contas e triagem local"):
+        arquivo_plano = st.file_uploader("Plano de contas (CSV com colunas codigo, conta e palavras_chave)", type="csv")
+        if arquivo_plano is not None and st.button("Carregar plano de contas"):
+            classificador.definir_plano(pd.read_csv(arquivo_plano))
+        st.write(f"{len(classificador.contas)} contas no plano, {len(classificador.regras)} regras aprendidas")
+        confianca_minima = st.slider("Confiança mínima para dispensar a IA", 0.0, 1.0, 0.6, 0.05)
+    
+    modo_classificacao = st.radio("Modo", ["Transação única", "Lote (CSV/OFX)"], horizontal=True)
+    
+    if modo_classificacao == "Transação única":
+        descricao = st.text_area("Digite a descrição da transação:")
         
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "Você é um especialista contábil."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        if st.button("Classificar"):
+            conta_local, confianca = classificador.classificar(descricao)
+            if conta_local is not None and confianca >= confianca_minima:
+                st.write("### Classificação:")
+                st.write(conta_local)
+                st.caption(f"Classificação local (confiança {confianca:.0%})")
+            else:
+                prompt = f"Classifique a seguinte transação contábil e sugira a conta adequada:\n{descricao}"
+                
+                exibir_resposta_llm("### Classificação:", prompt)
+        
+        # Confirmações alimentam as regras do classificador local
+        conta_confirmada = st.selectbox("Confirmar conta para esta descrição", [""] + classificador.contas)
+        if conta_confirmada and st.button("Confirmar classificação"):
+            classificador.aprender([(descricao, conta_confirmada)])
+            st.success("Classificação registrada")
+    
+    else:
+        arquivo_extrato = st.file_uploader("Faça upload do extrato (CSV ou OFX)", type=["csv", "ofx"])
         
-        st.write("### Classificação:")
-        st.write(response.choices[0].message.content)
+        if arquivo_extrato is not None:
+            if arquivo_extrato.name.lower().endswith(".csv"):
+                df_extrato = ler_upload_csv(arquivo_extrato)
+            else:
+                df_extrato = ler_extrato(arquivo_extrato, arquivo_extrato.name)
+            colunas_texto = list(df_extrato.columns)
+            coluna_descricao = st.selectbox(
+                "Coluna com a descrição", colunas_texto,
+                index=colunas_texto.index("descricao") if "descricao" in colunas_texto else 0
+            )
+            st.write(f"{len(df_extrato):,} lançamentos, {df_extrato[coluna_descricao].nunique():,} descrições distintas")
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                itens_por_requisicao = st.number_input("Descrições por requisição", min_value=1, value=50)
+            with col2:
+                max_workers = st.slider("Requisições simultâneas", 1, 32, 8)
+            with col3:
+                limite_rpm = st.number_input("Limite de requisições/min", min_value=1, value=500)
+            with col4:
+                limite_tpm = st.number_input("Limite de tokens/min", min_value=1000, value=80000, step=1000)
+            
+            if st.button("Classificar Lote"):
+                parametros_lote = dict(itens_por_requisicao=int(itens_por_requisicao), max_workers=max_workers,
+                                       requisicoes_por_minuto=int(limite_rpm), tokens_por_minuto=int(limite_tpm))
+                arquivo = arquivo_extrato.name
+                if em_segundo_plano:
+                    enviar_tarefa("tarefa_classificacao", "classificacao", f"Classificação de {arquivo}",
+                                  lambda contexto: classificar_extrato(df_extrato, coluna_descricao, classificador,
+                                                                       confianca_minima, arquivo, contexto.progresso,
+                                                                       **parametros_lote))
+                else:
+                    barra = st.progress(0.0, text="Classificando...")
+                    st.session_state.update(classificar_extrato(
+                        df_extrato, coluna_descricao, classificador, confianca_minima, arquivo,
+                        progresso=lambda feitos, total: barra.progress(feitos / total, text=f"Requisições concluídas: {feitos}/{total}"),
+                        **parametros_lote
+                    ))
+                    barra.progress(1.0, text="Concluído")
+            
+            acompanhar_tarefa("tarefa_classificacao")
+            if st.session_state.get("extrato_arquivo") == arquivo_extrato.name:
+                df_extrato = st.session_state.extrato_classificado
+                decorrido = st.session_state.extrato_decorrido
+                locais = (df_extrato["origem"] == "local").mean()
+                st.write("### Classificação:")
+                st.write(f"{len(df_extrato):,} lançamentos em {decorrido:.1f}s "
+                         f"({len(df_extrato) / max(decorrido, 1e-9) * 60:,.0f} linhas/min, {locais:.0%} classificados localmente)")
+                avisar_falhas_classificacao(st.session_state.get("extrato_falhas", 0))
+                
+                # Revisão: descrições distintas editáveis; confirmadas viram regras do classificador local
+                revisao = (df_extrato[[coluna_descricao, "conta_classificada", "origem"]]
+                           .drop_duplicates(coluna_descricao).head(1000))
+                revisado = st.data_editor(revisao, disabled=[coluna_descricao, "origem"], key="revisao_extrato")
+                if st.button("Confirmar classificações revisadas"):
+                    classificador.aprender(zip(revisado[coluna_descricao], revisado["conta_classificada"]))
+                    st.success(f"{len(revisado)} classificações registradas")
+                
+                st.download_button(
+                    "Baixar arquivo classificado",
+                    df_extrato.to_csv(index=False).encode("utf-8"),
+                    file_name="extrato_classificado.csv",
+                    mime="text/csv"
+                )
 
 elif opcao == "Cálculos Contábeis":
     st.header("Cálculos Contábeis")
@@ -80,41 +605,101 @@ elif opcao == "Cálculos Contábeis":
     )
     
     if calculo_tipo == "Depreciação":
-        valor_bem = st.number_input("Valor do bem (R$)", min_value=0.0)
-        vida_util = st.number_input("Vida útil (anos)", min_value=1)
-        
-        if st.button("Calcular Depreciação"):
-            depreciacao_anual = valor_bem / vida_util
-            depreciacao_mensal = depreciacao_anual / 12
-            
-            st.write("### Resultados:")
-            st.write(f"Depreciação Anual: R$ {depreciacao_anual:.2f}")
-            st.write(f"Depreciação Mensal: R$ {depreciacao_mensal:.2f}")
-            
-            # Gerar tabela de depreciação
-            dados_depreciacao = []
-            valor_atual = valor_bem
-            for ano in range(1, int(vida_util) + 1):
-                dados_depreciacao.append({
-                    "Ano": ano,
-                    "Valor Inicial": valor_atual,
-                    "Depreciação": depreciacao_anual,
-                    "Valor Final": valor_atual - depreciacao_anual
-                })
-                valor_atual -= depreciacao_anual
+        modo_depreciacao = st.radio("Modo", ["Bem individual", "Cadastro de ativos (planilha)"], horizontal=True)
+        
+        if modo_depreciacao == "Bem individual":
+            # O método fica fora do formulário porque define quais campos aparecem
+            metodo = st.selectbox("Método", list(METODOS))
+            with st.form("form_depreciacao"):
+                valor_bem = st.number_input("Valor do bem (R$)", min_value=0.0)
+                vida_util = st.number_input("Vida útil (anos)", min_value=1)
+                valor_residual = st.number_input("Valor residual (R$)", min_value=0.0)
+                if metodo == "unidades_produzidas":
+                    unidades_totais = st.number_input("Unidades totais estimadas", min_value=1.0)
+                    unidades_mes = st.number_input("Unidades produzidas por mês", min_value=0.0)
+                else:
+                    unidades_totais = unidades_mes = 0.0
+                enviado = st.form_submit_button("Calcular Depreciação")
             
-            df_depreciacao = pd.DataFrame(dados_depreciacao)
-            st.write("### Tabela de Depreciação Anual")
-            st.dataframe(df_depreciacao)
-    
+            if enviado:
+                df_depreciacao, depreciacao_mensal = tabela_depreciacao(
+                    valor_bem, vida_util, valor_residual, metodo, unidades_totais, unidades_mes
+                )
+                depreciacao_anual = df_depreciacao["Depreciação"].iloc[0]
+                
+                st.write("### Resultados:")
+                st.write(f"Depreciação Anual (1º ano): R$ {depreciacao_anual:.2f}")
+                st.write(f"Depreciação Mensal (1º mês): R$ {depreciacao_mensal:.2f}")
+                
+                st.write("### Tabela de Depreciação Anual")
+                st.dataframe(df_depreciacao)
+        
+        else:
+            st.caption("Colunas aceitas: custo, data_aquisicao, vida_util_meses (ou vida_util_anos), valor_residual, "
+                       "metodo (" + ", ".join(METODOS) + "), fator_saldo_decrescente, unidades_totais, "
+                       "unidades_mes e uma coluna de grupo opcional")
+            arquivo_ativos = st.file_uploader("Faça upload do cadastro de ativos (CSV)", type="csv")
+            
+            if arquivo_ativos is not None:
+                try:
+                    ativos = preparar_ativos(ler_upload_csv(arquivo_ativos))
+                except ValueError as erro:
+                    st.error(f"Cadastro de ativos inválido: {erro}")
+                    st.stop()
+                
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    inicio = st.text_input("Competência inicial (AAAA-MM)", value=f"{pd.Timestamp.today().year}-01")
+                with col2:
+                    fim = st.text_input("Competência final (AAAA-MM)", value=f"{pd.Timestamp.today().year}-12")
+                with col3:
+                    coluna_grupo = st.selectbox("Agrupar por", ["(nenhum)"] + list(ativos.columns))
+                coluna_grupo = None if coluna_grupo == "(nenhum)" else coluna_grupo
+                
+                if st.button("Calcular Depreciação"):
+                    with desempenho.span("calculo", "depreciacao", linhas=len(ativos)) as span:
+                        try:
+                            por_ativo = depreciacao_no_periodo(ativos, inicio, fim)
+                            mensal = totais_mensais(ativos, inicio, fim, coluna_grupo)
+                        except ValueError as erro:
+                            st.error(f"Não foi possível calcular a depreciação: {erro}")
+                            st.stop()
+                    decorrido = span.duracao
+                    
+                    st.write(f"### Resultados ({len(ativos):,} ativos, calculados em {decorrido * 1000:.0f} ms)")
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Depreciação no Período", f"R$ {por_ativo['depreciacao_periodo'].sum():,.2f}")
+                    with col2:
+                        st.metric("Depreciação Acumulada", f"R$ {por_ativo['depreciacao_acumulada'].sum():,.2f}")
+                    with col3:
+                        st.metric("Valor Contábil", f"R$ {por_ativo['valor_contabil'].sum():,.2f}")
+                    
+                    st.write("### Depreciação Mensal")
+                    st.bar_chart(mensal)
+                    
+                    st.write("### Depreciação por Ativo")
+                    st.dataframe(ativos.join(por_ativo).head(1000))
+                
+                # Cronograma mensal expandido apenas para os ativos escolhidos
+                st.write("### Cronograma Detalhado")
+                selecionados = st.multiselect("Ativos (linhas do cadastro)", list(ativos.index[:10000]))
+                if selecionados:
+                    try:
+                        st.dataframe(cronograma(ativos.loc[selecionados], inicio, fim))
+                    except ValueError as erro:
+                        st.error(f"Não foi possível montar o cronograma: {erro}")
+
     elif calculo_tipo == "Margem de Lucro":
-        custo = st.number_input("Custo total (R$)", min_value=0.0)
-        preco_venda = st.number_input("Preço de venda (R$)", min_value=0.0)
+        with st.form("form_margem"):
+            custo = st.number_input("Custo total (R$)", min_value=0.0)
+            preco_venda = st.number_input("Preço de venda (R$)", min_value=0.0)
+            enviado = st.form_submit_button("Calcular Margem")
         
-        if st.button("Calcular Margem"):
+        if enviado:
             if preco_venda > 0:
-                margem_lucro = ((preco_venda - custo) / preco_venda) * 100
-                lucro_valor = preco_venda - custo
+                margens = calcular_margens(pd.DataFrame([{"custo": custo, "preco_venda": preco_venda}])).iloc[0]
+                margem_lucro, lucro_valor = margens["margem_lucro"], margens["lucro"]
                 
                 st.write("### Resultados:")
                 st.write(f"Margem de Lucro: {margem_lucro:.2f}%")
@@ -128,175 +713,312 @@ elif opcao == "Cálculos Contábeis":
                 st.bar_chart(dados_grafico.set_index('Componente'))
     
     elif calculo_tipo == "Análise de Impostos":
-        valor_base = st.number_input("Valor base (R$)", min_value=0.0)
+        modo_impostos = st.radio("Modo", ["Valor único", "Lote de notas fiscais (XML)"], horizontal=True)
         
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            pis = st.number_input("PIS (%)", min_value=0.0, value=0.65)
-        with col2:
-            cofins = st.number_input("COFINS (%)", min_value=0.0, value=3.0)
-        with col3:
-            iss = st.number_input("ISS (%)", min_value=0.0, value=5.0)
-            
-        if st.button("Calcular Impostos"):
-            valor_pis = valor_base * (pis/100)
-            valor_cofins = valor_base * (cofins/100)
-            valor_iss = valor_base * (iss/100)
-            total_impostos = valor_pis + valor_cofins + valor_iss
-            
-            st.write("### Resultados:")
-            col1, col2 = st.columns(2)
+        if modo_impostos == "Valor único":
+            with st.form("form_impostos"):
+                valor_base = st.number_input("Valor base (R$)", min_value=0.0)
+                
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    pis = st.number_input("PIS (%)", min_value=0.0, value=0.65)
+                with col2:
+                    cofins = st.number_input("COFINS (%)", min_value=0.0, value=3.0)
+                with col3:
+                    iss = st.number_input("ISS (%)", min_value=0.0, value=5.0)
+                enviado = st.form_submit_button("Calcular Impostos")
+                
+            if enviado:
+                impostos = calcular_impostos_base(pd.DataFrame([{
+                    "valor_base": valor_base, "pis": pis, "cofins": cofins, "iss": iss,
+                }])).iloc[0]
+                valor_pis, valor_cofins, valor_iss, total_impostos = impostos[
+                    ["valor_pis", "valor_cofins", "valor_iss", "total_impostos"]]
+                
+                st.write("### Resultados:")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write("Valores por imposto:")
+                    st.write(f"PIS: R$ {valor_pis:.2f}")
+                    st.write(f"COFINS: R$ {valor_cofins:.2f}")
+                    st.write(f"ISS: R$ {valor_iss:.2f}")
+                    st.write(f"Total de impostos: R$ {total_impostos:.2f}")
+                
+                with col2:
+                    # Gráfico de pizza dos impostos
+                    dados_impostos = pd.DataFrame({
+                        'Imposto': ['PIS', 'COFINS', 'ISS'],
+                        'Valor': [valor_pis, valor_cofins, valor_iss]
+                    })
+                    st.write("Distribuição dos impostos:")
+                    st.bar_chart(dados_impostos.set_index('Imposto'))
+        
+        else:
+            st.caption("NF-e/NFC-e (modelos 55 e 65) e NFS-e no padrão ABRASF. Envie os XMLs, um .zip "
+                       "ou informe uma pasta no servidor para lotes muito grandes.")
+            arquivos_xml = st.file_uploader("Notas fiscais (XML ou ZIP)", type=["xml", "zip"], accept_multiple_files=True)
+            pasta_servidor = ""
+            if DIRETORIO_SERVIDOR:
+                pasta_servidor = st.text_input(f"Ou pasta com os XMLs em {DIRETORIO_SERVIDOR} no servidor")
             
+            col1, col2, col3 = st.columns(3)
             with col1:
-                st.write("Valores por imposto:")
-                st.write(f"PIS: R$ {valor_pis:.2f}")
-                st.write(f"COFINS: R$ {valor_cofins:.2f}")
-                st.write(f"ISS: R$ {valor_iss:.2f}")
-                st.write(f"Total de impostos: R$ {total_impostos:.2f}")
-            
+                regime = st.selectbox("Regime", ["nao_cumulativo", "cumulativo", "simples"],
+                                      format_func={"nao_cumulativo": "Lucro Real (não cumulativo)",
+                                                   "cumulativo": "Lucro Presumido (cumulativo)",
+                                                   "simples": "Simples Nacional"}.get)
             with col2:
-                # Gráfico de pizza dos impostos
-                dados_impostos = pd.DataFrame({
-                    'Imposto': ['PIS', 'COFINS', 'ISS'],
-                    'Valor': [valor_pis, valor_cofins, valor_iss]
-                })
-                st.write("Distribuição dos impostos:")
-                st.bar_chart(dados_impostos.set_index('Imposto'))
+                anexo = st.selectbox("Anexo do Simples", list(ANEXOS_SIMPLES), disabled=regime != "simples")
+            with col3:
+                receita_12_meses = st.number_input("Receita bruta dos últimos 12 meses (R$)", min_value=0.0,
+                                                   disabled=regime != "simples")
+            iss_padrao = st.number_input("ISS padrão (%)", min_value=0.0, max_value=5.0, value=ISS_PADRAO)
+            arquivo_iss = st.file_uploader("Alíquotas de ISS por município (CSV: codigo_municipio, aliquota)", type="csv")
+            
+            if st.button("Processar Notas"):
+                pasta = caminho_servidor(pasta_servidor.strip()) if pasta_servidor.strip() else None
+                if pasta_servidor.strip() and pasta is None:
+                    st.error(f"Pasta fora de {DIRETORIO_SERVIDOR}: {pasta_servidor.strip()}")
+                    st.stop()
+                # XMLs enviados vão para disco: os processos leem os arquivos diretamente
+                diretorio = tempfile.mkdtemp(prefix="notas_")
+                caminhos = []
+                if pasta is not None:
+                    # Links simbólicos dentro da pasta também não podem apontar para fora dela
+                    encontrados = glob.glob(os.path.join(pasta, "**", "*.xml"), recursive=True)
+                    caminhos += [c for c in map(caminho_servidor, encontrados) if c is not None]
+                for indice_arquivo, arquivo in enumerate(arquivos_xml or []):
+                    if arquivo.name.lower().endswith(".zip"):
+                        destino_zip = os.path.join(diretorio, str(indice_arquivo))
+                        with zipfile.ZipFile(arquivo) as compactado:
+                            # Tamanho declarado no índice do zip; a extração não passa dele
+                            if sum(info.file_size for info in compactado.infolist()) > LIMITE_ZIP_BYTES:
+                                shutil.rmtree(diretorio, ignore_errors=True)
+                                st.error(f"{arquivo.name} passa de {LIMITE_ZIP_BYTES // (1024 * 1024):,} MB "
+                                         "descompactado")
+                                st.stop()
+                            compactado.extractall(destino_zip)
+                        caminhos += glob.glob(os.path.join(destino_zip, "**", "*.xml"), recursive=True)
+                    else:
+                        destino = os.path.join(diretorio, f"{indice_arquivo}_{os.path.basename(arquivo.name)}")
+                        with open(destino, "wb") as saida:
+                            shutil.copyfileobj(arquivo, saida)
+                        caminhos.append(destino)
+                
+                aliquotas_iss = {}
+                if arquivo_iss is not None:
+                    tabela_iss = pd.read_csv(arquivo_iss, dtype={"codigo_municipio": str})
+                    aliquotas_iss = dict(zip(tabela_iss["codigo_municipio"], tabela_iss["aliquota"].astype(float)))
+                
+                regras = montar_regras(regime, anexo, receita_12_meses, aliquotas_iss, iss_padrao)
+                if not caminhos:
+                    shutil.rmtree(diretorio, ignore_errors=True)
+                    st.warning("Nenhum XML encontrado")
+                elif em_segundo_plano:
+                    enviar_tarefa("tarefa_notas", "notas", f"Apuração de {len(caminhos):,} notas fiscais",
+                                  lambda contexto: processar_notas(caminhos, diretorio, regras, contexto.progresso))
+                else:
+                    barra = st.progress(0.0, text="Lendo notas...")
+                    st.session_state.update(processar_notas(
+                        caminhos, diretorio, regras,
+                        progresso=lambda feitos, total: barra.progress(feitos / total, text=f"Lotes lidos: {feitos}/{total}")
+                    ))
+            
+            acompanhar_tarefa("tarefa_notas")
+            if st.session_state.get("notas") is not None:
+                notas = st.session_state.notas
+                decorrido = st.session_state.notas_decorrido
+                st.write(f"{st.session_state.notas_arquivos:,} arquivos, {len(notas):,} itens em {decorrido:.1f}s "
+                         f"({st.session_state.notas_arquivos / max(decorrido, 1e-9):,.0f} arquivos/s)")
+                for arquivo, mensagem in st.session_state.notas_erros[:20]:
+                    st.warning(f"{arquivo}: {mensagem}")
+                
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Base total", f"R$ {notas['base'].sum():,.2f}")
+                col2.metric("PIS + COFINS destacados", f"R$ {(notas['pis'] + notas['cofins']).sum():,.2f}")
+                col3.metric("ISS destacado", f"R$ {notas['iss'].sum():,.2f}")
+                col4.metric("Itens divergentes", f"{(notas['divergencia'] != '').sum():,}")
+                
+                aba_periodo, aba_cfop, aba_nota, aba_divergencias = st.tabs(["Por período", "Por CFOP", "Por nota", "Divergências"])
+                with aba_periodo:
+                    st.dataframe(totalizar(notas, "periodo").style.format("{:,.2f}", na_rep="-"))
+                with aba_cfop:
+                    st.dataframe(totalizar(notas, "cfop").style.format("{:,.2f}", na_rep="-"))
+                with aba_nota:
+                    exibir_previa(totalizar(notas, "nota").reset_index(), "notas")
+                with aba_divergencias:
+                    exibir_previa(notas[notas["divergencia"] != ""], "divergencias_notas")
+                
+                st.download_button(
+                    "Baixar itens apurados",
+                    notas.to_csv(index=False).encode("utf-8"),
+                    file_name="impostos_notas.csv",
+                    mime="text/csv"
+                )
+
 
 elif opcao == "Folha de Pagamento":
     st.header("Cálculos de Folha de Pagamento")
     
-    salario_base = st.number_input("Salário Base (R$)", min_value=0.0)
-    horas_extras = st.number_input("Quantidade de Horas Extras", min_value=0.0)
-    valor_hora_extra = st.number_input("Valor da Hora Extra (R$)", min_value=0.0)
-    
-    # Adicionar outros benefícios
-    st.subheader("Benefícios")
-    vale_transporte = st.checkbox("Vale Transporte")
-    vale_alimentacao = st.number_input("Vale Alimentação (R$)", min_value=0.0)
-    
-    if st.button("Calcular Folha"):
-        # Cálculos básicos
-        valor_total_horas_extras = horas_extras * valor_hora_extra
-        
-        # INSS
-        if salario_base <= 1320.00:
-            inss = salario_base * 0.075
-        elif salario_base <= 2571.29:
-            inss = salario_base * 0.09
-        elif salario_base <= 3856.94:
-            inss = salario_base * 0.12
-        else:
-            inss = salario_base * 0.14
-        
-        # Vale Transporte (6% do salário base)
-        desconto_vt = salario_base * 0.06 if vale_transporte else 0
-        
-        # Total de proventos e descontos
-        total_proventos = salario_base + valor_total_horas_extras + vale_alimentacao
-        total_descontos = inss + desconto_vt
-        salario_liquido = total_proventos - total_descontos
-        
-        # Exibição dos resultados
-        col1, col2 = st.columns(2)
+    # Competência define as tabelas de INSS/IRRF vigentes
+    competencia = st.selectbox(
+        "Competência", pd.period_range(min(TABELAS_INSS), pd.Timestamp.today(), freq="M").astype(str)[::-1]
+    )
+    modo_folha = st.radio("Modo", ["Funcionário individual", "Lote (planilha)"], horizontal=True)
+    
+    if modo_folha == "Funcionário individual":
+        with st.form("form_folha"):
+            salario_base = st.number_input("Salário Base (R$)", min_value=0.0)
+            horas_extras = st.number_input("Quantidade de Horas Extras", min_value=0.0)
+            valor_hora_extra = st.number_input("Valor da Hora Extra (R$)", min_value=0.0)
+            dependentes = st.number_input("Dependentes (IRRF)", min_value=0)
+            
+            # Adicionar outros benefícios
+            st.subheader("Benefícios")
+            vale_transporte = st.checkbox("Vale Transporte")
+            vale_alimentacao = st.number_input("Vale Alimentação (R$)", min_value=0.0)
+            enviado = st.form_submit_button("Calcular Folha")
         
-        with col1:
-            st.write("### Proventos")
-            st.write(f"Salário Base: R$ {salario_base:.2f}")
-            st.write(f"Horas Extras: R$ {valor_total_horas_extras:.2f}")
-            st.write(f"Vale Alimentação: R$ {vale_alimentacao:.2f}")
-            st.write(f"**Total Proventos: R$ {total_proventos:.2f}**")
+        if enviado:
+            # Mesmo motor do cálculo em lote, com uma única linha
+            resultado = calcular_folha(pd.DataFrame([{
+                "salario_base": salario_base,
+                "horas_extras": horas_extras,
+                "valor_hora_extra": valor_hora_extra,
+                "vale_transporte": vale_transporte,
+                "vale_alimentacao": vale_alimentacao,
+                "dependentes": dependentes,
+            }]), competencia).iloc[0]
+            
+            # Exibição dos resultados
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.write("### Proventos")
+                st.write(f"Salário Base: R$ {salario_base:.2f}")
+                st.write(f"Horas Extras: R$ {resultado['valor_horas_extras']:.2f}")
+                st.write(f"Vale Alimentação: R$ {vale_alimentacao:.2f}")
+                st.write(f"**Total Proventos: R$ {resultado['total_proventos']:.2f}**")
+            
+            with col2:
+                st.write("### Descontos")
+                st.write(f"INSS: R$ {resultado['inss']:.2f}")
+                st.write(f"IRRF: R$ {resultado['irrf']:.2f}")
+                if vale_transporte:
+                    st.write(f"Vale Transporte: R$ {resultado['desconto_vt']:.2f}")
+                st.write(f"**Total Descontos: R$ {resultado['total_descontos']:.2f}**")
+            
+            st.write("---")
+            st.write(f"### Salário Líquido: R$ {resultado['salario_liquido']:.2f}")
+            
+            # Gráfico de composição salarial
+            dados_grafico = pd.DataFrame({
+                'Componente': ['Salário Base', 'Horas Extras', 'Benefícios', 'Descontos'],
+                'Valor': [salario_base, resultado['valor_horas_extras'], vale_alimentacao, -resultado['total_descontos']]
+            })
+            st.write("### Composição Salarial")
+            st.bar_chart(dados_grafico.set_index('Componente'))
+    
+    else:
+        st.caption("Colunas aceitas: salario_base, horas_extras, valor_hora_extra, vale_transporte, "
+                   "vale_alimentacao, dependentes e, opcionalmente, empresa")
+        arquivo_folha = st.file_uploader("Faça upload da planilha de funcionários (CSV)", type="csv")
         
-        with col2:
-            st.write("### Descontos")
-            st.write(f"INSS: R$ {inss:.2f}")
-            if vale_transporte:
-                st.write(f"Vale Transporte: R$ {desconto_vt:.2f}")
-            st.write(f"**Total Descontos: R$ {total_descontos:.2f}**")
-        
-        st.write("---")
-        st.write(f"### Salário Líquido: R$ {salario_liquido:.2f}")
-        
-        # Gráfico de composição salarial
-        dados_grafico = pd.DataFrame({
-            'Componente': ['Salário Base', 'Horas Extras', 'Benefícios', 'Descontos'],
-            'Valor': [salario_base, valor_total_horas_extras, vale_alimentacao, -total_descontos]
-        })
-        st.write("### Composição Salarial")
-        st.bar_chart(dados_grafico.set_index('Componente'))
+        if arquivo_folha is not None:
+            funcionarios = ler_upload_csv(arquivo_folha)
+            # Mesma planilha e competência: o resultado vem do histórico, sem recalcular a cada rerun
+            with desempenho.span("calculo", "folha", linhas=len(funcionarios)) as span:
+                try:
+                    resultado = historico.memorizar("folha", calcular_folha, funcionarios, competencia)
+                except ValueError as erro:
+                    st.error(f"Não foi possível calcular a folha: {erro}")
+                    st.stop()
+            decorrido = span.duracao
+            
+            totais = resumir_folha(resultado)
+            st.write(f"### Resumo da Folha ({len(resultado):,} funcionários, calculada em {decorrido * 1000:.0f} ms)")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total Proventos", f"R$ {totais['total_proventos']:,.2f}")
+            with col2:
+                st.metric("Total Descontos", f"R$ {totais['total_descontos']:,.2f}")
+            with col3:
+                st.metric("Total Líquido", f"R$ {totais['salario_liquido']:,.2f}")
+            
+            if "empresa" in resultado.columns:
+                resumo_empresas = resumir_folha(resultado, "empresa")
+                st.write("### Totais por Empresa")
+                st.dataframe(resumo_empresas)
+                st.bar_chart(resumo_empresas[["total_proventos", "total_descontos", "salario_liquido"]])
+            
+            st.write("### Composição da Folha")
+            st.bar_chart(totais[["salario_base", "valor_horas_extras", "vale_alimentacao", "inss", "irrf", "desconto_vt"]])
+            
+            st.write("### Detalhamento por Funcionário")
+            st.dataframe(resultado.head(1000))
+            st.download_button(
+                "Baixar folha calculada",
+                resultado.to_csv(index=False).encode("utf-8"),
+                file_name=f"folha_{competencia}.csv",
+                mime="text/csv"
+            )
 
 elif opcao == "Análise de Balanço":
     st.header("Análise de Balanço Patrimonial")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.subheader("Ativo")
-        ativo_circulante = st.number_input("Ativo Circulante (R$)", min_value=0.0)
-        disponivel = st.number_input("Disponível (R$)", min_value=0.0)
-        estoque = st.number_input("Estoque (R$)", min_value=0.0)
-        ativo_total = st.number_input("Ativo Total (R$)", min_value=0.0)
+    # Campo: valor mínimo aceito (None = aceita negativos, ex.: prejuízo ou PL a descoberto)
+    importar_ecd({"ativo_circulante": 0.0, "disponivel": 0.0, "estoque": 0.0, "ativo_total": 0.0,
+                  "passivo_circulante": 0.0, "passivo_total": 0.0, "patrimonio_liquido": None,
+                  "lucro_liquido": None, "vendas_liquidas": 0.0})
     
-    with col2:
-        st.subheader("Passivo")
-        passivo_circulante = st.number_input("Passivo Circulante (R$)", min_value=0.0)
-        passivo_total = st.number_input("Passivo Total (R$)", min_value=0.0)
-        patrimonio_liquido = st.number_input("Patrimônio Líquido (R$)", min_value=0.0)
-    
-    # Dados de Resultado
-    st.subheader("Dados de Resultado")
-    lucro_liquido = st.number_input("Lucro Líquido (R$)", min_value=0.0)
-    vendas_liquidas = st.number_input("Vendas Líquidas (R$)", min_value=0.0)
-    
-    if st.button("Calcular Índices"):
-        # Cálculo dos índices
-        liquidez_corrente = ativo_circulante / passivo_circulante if passivo_circulante != 0 else 0
-        liquidez_seca = (ativo_circulante - estoque) / passivo_circulante if passivo_circulante != 0 else 0
-        liquidez_imediata = disponivel / passivo_circulante if passivo_circulante != 0 else 0
-        
-        endividamento = (passivo_total / ativo_total * 100) if ativo_total != 0 else 0
-        rentabilidade_pl = (lucro_liquido / patrimonio_liquido * 100) if patrimonio_liquido != 0 else 0
-        margem_liquida = (lucro_liquido / vendas_liquidas * 100) if vendas_liquidas != 0 else 0
+    with st.form("form_balanco"):
+        col1, col2 = st.columns(2)
         
-        # Exibição dos resultados
-        st.write("### Índices de Liquidez")
-        col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Liquidez Corrente", f"{liquidez_corrente:.2f}")
-        with col2:
-            st.metric("Liquidez Seca", f"{liquidez_seca:.2f}")
-        with col3:
-            st.metric("Liquidez Imediata", f"{liquidez_imediata:.2f}")
+            st.subheader("Ativo")
+            ativo_circulante = st.number_input("Ativo Circulante (R$)", min_value=0.0, key="campo_ativo_circulante")
+            disponivel = st.number_input("Disponível (R$)", min_value=0.0, key="campo_disponivel")
+            estoque = st.number_input("Estoque (R$)", min_value=0.0, key="campo_estoque")
+            ativo_total = st.number_input("Ativo Total (R$)", min_value=0.0, key="campo_ativo_total")
         
-        st.write("### Índices de Estrutura e Rentabilidade")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Endividamento", f"{endividamento:.2f}%")
         with col2:
-            st.metric("Rentabilidade do PL", f"{rentabilidade_pl:.2f}%")
-        with col3:
-            st.metric("Margem Líquida", f"{margem_liquida:.2f}%")
+            st.subheader("Passivo")
+            passivo_circulante = st.number_input("Passivo Circulante (R$)", min_value=0.0, key="campo_passivo_circulante")
+            passivo_total = st.number_input("Passivo Total (R$)", min_value=0.0, key="campo_passivo_total")
+            patrimonio_liquido = st.number_input("Patrimônio Líquido (R$)", key="campo_patrimonio_liquido")
         
-        # Análise automática dos índices
-        st.write("### Análise dos Índices")
-        analise = []
+        # Dados de Resultado
+        st.subheader("Dados de Resultado")
+        lucro_liquido = st.number_input("Lucro Líquido (R$)", key="campo_lucro_liquido")
+        vendas_liquidas = st.number_input("Vendas Líquidas (R$)", min_value=0.0, key="campo_vendas_liquidas")
+        entidade, periodo = campos_historico()
+        enviado = st.form_submit_button("Calcular Índices")
+    
+    if enviado:
+        # Cálculo dos índices pelo motor de indicadores (uma linha)
+        dados_balanco = pd.DataFrame([{
+            "ativo_circulante": ativo_circulante, "disponivel": disponivel, "estoque": estoque,
+            "ativo_total": ativo_total, "passivo_circulante": passivo_circulante,
+            "passivo_total": passivo_total, "patrimonio_liquido": patrimonio_liquido,
+            "lucro_liquido": lucro_liquido, "vendas_liquidas": vendas_liquidas,
+        }])
+        indices, mensagens = indices_balanco(dados_balanco)
+        if entidade and periodo:
+            historico.gravar_campos(entidade, periodo, dados_balanco.iloc[0].to_dict(), "balanco")
+            historico.gravar_indicadores(indices.set_axis(pd.MultiIndex.from_tuples([(entidade, periodo)])))
         
-        if liquidez_corrente > 1:
-            analise.append("✅ A empresa possui boa liquidez corrente")
-        else:
-            analise.append("⚠️ A liquidez corrente está abaixo do ideal")
-            
-        if endividamento < 60:
-            analise.append("✅ Nível de endividamento adequado")
-        else:
-            analise.append("⚠️ Alto nível de endividamento")
-            
-        if rentabilidade_pl > 10:
-            analise.append("✅ Boa rentabilidade do Patrimônio Líquido")
-        else:
-            analise.append("⚠️ Rentabilidade do PL abaixo do esperado")
+        # Exibição dos resultados
+        for grupo in ["Liquidez", "Estrutura e Rentabilidade"]:
+            st.write(f"### Índices de {grupo}")
+            chaves = [c for c, d in INDICADORES_BALANCO.items() if d["grupo"] == grupo]
+            for coluna, chave in zip(st.columns(len(chaves)), chaves):
+                with coluna:
+                    st.metric(INDICADORES[chave]["nome"], formatar_indicador(chave, indices[chave].iloc[0]))
         
-        for item in analise:
+        # Análise automática dos índices
+        st.write("### Análise dos Índices")
+        for item in mensagens.iloc[0]:
             st.write(item)
         
         # Gráfico de composição do Ativo
@@ -306,136 +1028,235 @@ elif opcao == "Análise de Balanço":
         })
         st.write("### Composição do Ativo")
         st.bar_chart(dados_ativo.set_index('Componente'))
+        
+        if entidade:
+            exibir_comparacao(entidade, "balanco", list(INDICADORES_BALANCO))
 
 
 elif opcao == "Controle de Orçamento":
     st.header("Controle de Orçamento")
     
-    # Seleção do período
-    periodo = st.selectbox("Selecione o período", ["Mensal", "Trimestral", "Anual"])
-    
-    # Categorias de receitas e despesas
-    categorias = ["Vendas", "Serviços", "Custos Operacionais", "Despesas Administrativas", 
-                 "Despesas com Pessoal", "Marketing", "Outros"]
+    modo_orcamento = st.radio("Modo", ["Valores por categoria", "Arquivos (orçamento + razão)"], horizontal=True)
     
-    st.subheader("Valores Orçados vs Realizados")
+    if modo_orcamento == "Valores por categoria":
+        # Seleção do período
+        with st.form("form_orcamento"):
+            periodo = st.selectbox("Selecione o período", ["Mensal", "Trimestral", "Anual"])
+            
+            # Categorias de receitas e despesas
+            categorias = ["Vendas", "Serviços", "Custos Operacionais", "Despesas Administrativas", 
+                         "Despesas com Pessoal", "Marketing", "Outros"]
+            
+            st.subheader("Valores Orçados vs Realizados")
+            
+            valores_orcados = []
+            valores_realizados = []
+            for categoria in categorias:
+                col1, col2 = st.columns(2)
+                with col1:
+                    valores_orcados.append(st.number_input(f"{categoria} - Orçado (R$)", min_value=0.0, key=f"orc_{categoria}"))
+                with col2:
+                    valores_realizados.append(st.number_input(f"{categoria} - Realizado (R$)", min_value=0.0, key=f"real_{categoria}"))
+            enviado = st.form_submit_button("Analisar Orçamento")
+        
+        if enviado:
+            indice_categorias = pd.Index(categorias, name="Categoria")
+            df_orcamento, totais = analisar_orcamento(
+                pd.Series(valores_orcados, index=indice_categorias),
+                pd.Series(valores_realizados, index=indice_categorias)
+            )
+            total_orcado, total_realizado = totais["total_orcado"], totais["total_realizado"]
+            variacao_total = totais["variacao"]
+            
+            # Exibição dos resultados
+            st.write("### Resumo do Orçamento")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total Orçado", f"R$ {total_orcado:,.2f}")
+            with col2:
+                st.metric("Total Realizado", f"R$ {total_realizado:,.2f}")
+            with col3:
+                st.metric("Variação", f"R$ {variacao_total:,.2f}", 
+                         delta=f"{totais['variacao_percentual']:,.2f}%")
+            
+            # Tabela detalhada
+            st.write("### Análise Detalhada")
+            st.dataframe(df_orcamento.drop(columns="Alerta").style.format({
+                "Orçado": "R$ {:,.2f}",
+                "Realizado": "R$ {:,.2f}",
+                "Variação": "R$ {:,.2f}",
+                "Variação %": "{:,.2f}%"
+            }))
+            
+            # Gráfico comparativo
+            chart_data = df_orcamento[["Categoria", "Orçado", "Realizado"]].melt(id_vars=["Categoria"])
+            
+            st.write("### Comparativo Orçado vs Realizado")
+            st.bar_chart(chart_data.set_index("Categoria"))
+            
+            # Análise automática: o filtro de alertas é vetorizado; só as linhas sinalizadas são exibidas
+            st.write("### Análise de Variações")
+            alertas = df_orcamento.loc[df_orcamento["Alerta"] != "", ["Categoria", "Orçado", "Variação %", "Alerta"]]
+            for categoria, orcado, variacao_pct, alerta in alertas.itertuples(index=False):
+                if orcado == 0:
+                    st.warning(f"⚠️ {categoria}: Realizado sem valor orçado")
+                elif alerta == "acima":
+                    st.warning(f"⚠️ {categoria}: Realizado {variacao_pct:.1f}% acima do orçado")
+                else:
+                    st.info(f"ℹ️ {categoria}: Realizado {abs(variacao_pct):.1f}% abaixo do orçado")
     
-    dados_orcamento = []
-    for categoria in categorias:
+    else:
+        st.caption("Orçamento: categoria, centro_custo, periodo (AAAA-MM) e valor_orcado. "
+                   "Razão: categoria, centro_custo, periodo ou data, e valor.")
         col1, col2 = st.columns(2)
         with col1:
-            orcado = st.number_input(f"{categoria} - Orçado (R$)", min_value=0.0, key=f"orc_{categoria}")
+            arquivo_orcamento = st.file_uploader("Orçamento (CSV)", type="csv")
         with col2:
-            realizado = st.number_input(f"{categoria} - Realizado (R$)", min_value=0.0, key=f"real_{categoria}")
-        
-        dados_orcamento.append({
-            "Categoria": categoria,
-            "Orçado": orcado,
-            "Realizado": realizado,
-            "Variação": realizado - orcado,
-            "Variação %": ((realizado - orcado) / orcado * 100) if orcado != 0 else 0
-        })
-    
-    if st.button("Analisar Orçamento"):
-        df_orcamento = pd.DataFrame(dados_orcamento)
+            arquivo_razao = st.file_uploader("Razão / lançamentos realizados (CSV)", type="csv")
+        limite_variacao = st.number_input("Limite de variação para alerta (%)", min_value=0.0, value=10.0)
         
-        # Totais
-        total_orcado = df_orcamento["Orçado"].sum()
-        total_realizado = df_orcamento["Realizado"].sum()
-        variacao_total = total_realizado - total_orcado
+        if arquivo_orcamento is not None and arquivo_razao is not None and st.button("Carregar Orçamento e Razão"):
+            with desempenho.span("calculo", "orcamento") as span:
+                st.session_state.controle_orcamento = ControleOrcamento(
+                    ler_upload_csv(arquivo_orcamento), ler_upload_csv(arquivo_razao), limite_variacao
+                )
+            st.session_state.controle_orcamento_tempo = span.duracao
         
-        # Exibição dos resultados
-        st.write("### Resumo do Orçamento")
-        col1, col2, col3 = st.columns(3)
+        controle = st.session_state.get("controle_orcamento")
+        if controle is not None:
+            # Novos lançamentos recalculam apenas os grupos afetados
+            arquivo_novos = st.file_uploader("Adicionar lançamentos (ex.: novo mês)", type="csv", key="novos_lancamentos")
+            if arquivo_novos is not None and st.button("Adicionar Lançamentos"):
+                with desempenho.span("calculo", "orcamento_incremental") as span:
+                    afetados = controle.adicionar_lancamentos(ler_upload_csv(arquivo_novos))
+                st.success(f"{len(afetados):,} grupos recalculados em {span.duracao * 1000:.0f} ms")
+            
+            variacoes = controle.variacoes
+            total_orcado = variacoes["Orçado"].sum()
+            total_realizado = variacoes["Realizado"].sum()
+            
+            st.write(f"### Resumo do Orçamento ({len(variacoes):,} grupos, "
+                     f"carregado em {st.session_state.controle_orcamento_tempo:.2f}s)")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Total Orçado", f"R$ {total_orcado:,.2f}")
+            with col2:
+                st.metric("Total Realizado", f"R$ {total_realizado:,.2f}")
+            with col3:
+                st.metric("Grupos em Alerta", f"{(variacoes['Alerta'] != '').sum():,}")
+            
+            niveis = st.multiselect("Agrupar por", ["categoria", "centro_custo", "periodo"], default=["categoria"])
+            if niveis:
+                resumo = controle.resumo(niveis)
+                st.dataframe(resumo)
+                if len(niveis) == 1:
+                    st.bar_chart(resumo[["Orçado", "Realizado"]])
+            
+            # Drill-down por categoria e centro de custo
+            st.write("### Detalhamento")
+            col1, col2 = st.columns(2)
+            with col1:
+                categoria = st.selectbox("Categoria", ["(todas)"] + list(variacoes.index.unique("categoria")))
+            with col2:
+                centro_custo = st.selectbox("Centro de custo", ["(todos)"] + list(variacoes.index.unique("centro_custo")))
+            filtros = {}
+            if categoria != "(todas)":
+                filtros["categoria"] = categoria
+            if centro_custo != "(todos)":
+                filtros["centro_custo"] = centro_custo
+            apenas_alertas = st.checkbox("Somente grupos em alerta")
+            detalhe = controle.detalhar(**filtros)
+            if apenas_alertas:
+                detalhe = detalhe[detalhe["Alerta"] != ""]
+            st.dataframe(detalhe.head(5000))
+
+elif opcao == "Fluxo de Caixa":
+    st.header("Projeção de Fluxo de Caixa")
+    
+    with st.form("form_fluxo"):
+        # Configuração do período
+        col1, col2 = st.columns(2)
         with col1:
-            st.metric("Total Orçado", f"R$ {total_orcado:,.2f}")
+            num_meses = st.slider("Número de meses para projeção", 1, 120, 3)
         with col2:
-            st.metric("Total Realizado", f"R$ {total_realizado:,.2f}")
-        with col3:
-            st.metric("Variação", f"R$ {variacao_total:,.2f}", 
-                     delta=f"{(variacao_total/total_orcado*100 if total_orcado != 0 else 0):,.2f}%")
+            frequencia = st.radio("Granularidade", ["Mensal", "Diária"], horizontal=True)
+        saldo_inicial = st.number_input("Saldo Inicial (R$)", value=0.0)
         
-        # Tabela detalhada
-        st.write("### Análise Detalhada")
-        st.dataframe(df_orcamento.style.format({
-            "Orçado": "R$ {:,.2f}",
-            "Realizado": "R$ {:,.2f}",
-            "Variação": "R$ {:,.2f}",
-            "Variação %": "{:,.2f}%"
-        }))
+        # Entradas recorrentes
+        st.subheader("Entradas Recorrentes")
+        receita_vendas = st.number_input("Receita Mensal de Vendas (R$)", min_value=0.0)
+        receita_servicos = st.number_input("Receita Mensal de Serviços (R$)", min_value=0.0)
+        outras_receitas = st.number_input("Outras Receitas Mensais (R$)", min_value=0.0)
+        
+        # Saídas recorrentes
+        st.subheader("Saídas Recorrentes")
+        custos_fixos = st.number_input("Custos Fixos Mensais (R$)", min_value=0.0)
+        folha_pagamento = st.number_input("Folha de Pagamento Mensal (R$)", min_value=0.0)
+        impostos = st.number_input("Impostos Mensais (R$)", min_value=0.0)
+        outras_despesas = st.number_input("Outras Despesas Mensais (R$)", min_value=0.0)
         
-        # Gráfico comparativo
-        chart_data = pd.DataFrame({
-            "Categoria": categorias,
-            "Orçado": df_orcamento["Orçado"],
-            "Realizado": df_orcamento["Realizado"]
-        }).melt(id_vars=["Categoria"])
+        # Curvas de crescimento, inflação e sazonalidade
+        with st.expander("Crescimento, inflação e sazonalidade"):
+            col1, col2 = st.columns(2)
+            with col1:
+                crescimento_receitas = st.number_input("Crescimento anual das receitas (%)", value=0.0)
+            with col2:
+                inflacao_anual = st.number_input("Inflação anual aplicada às saídas (%)", value=0.0)
+            sazonalidade = st.data_editor(
+                pd.DataFrame({"Mês": ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"],
+                              "Fator das receitas": [1.0] * 12}),
+                disabled=["Mês"], hide_index=True, key="sazonalidade_fluxo"
+            )
         
-        st.write("### Comparativo Orçado vs Realizado")
-        st.bar_chart(chart_data.set_index("Categoria"))
+        # Eventos pontuais (mês a partir de 1; valores negativos são saídas)
+        with st.expander("Eventos pontuais"):
+            eventos = st.data_editor(
+                pd.DataFrame({"Mês": pd.Series(dtype=int), "Valor": pd.Series(dtype=float), "Descrição": pd.Series(dtype=str)}),
+                num_rows="dynamic", key="eventos_fluxo"
+            )
         
-        # Análise automática
-        st.write("### Análise de Variações")
-        for _, row in df_orcamento.iterrows():
-            if abs(row["Variação %"]) > 10:
-                if row["Variação"] > 0:
-                    st.warning(f"⚠️ {row['Categoria']}: Realizado {row['Variação %']:.1f}% acima do orçado")
-                else:
-                    st.info(f"ℹ️ {row['Categoria']}: Realizado {abs(row['Variação %']):.1f}% abaixo do orçado")
-
-elif opcao == "Fluxo de Caixa":
-    st.header("Projeção de Fluxo de Caixa")
+        # Cenários estocásticos
+        with st.expander("Simulação de cenários (Monte Carlo)"):
+            simular_cenarios = st.checkbox("Simular cenários")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                num_cenarios = st.number_input("Número de cenários", min_value=100, max_value=100000, value=10000, step=1000)
+            with col2:
+                volatilidade_receitas = st.number_input("Volatilidade mensal das receitas (%)", min_value=0.0, value=15.0)
+            with col3:
+                volatilidade_despesas = st.number_input("Volatilidade mensal das despesas (%)", min_value=0.0, value=5.0)
+        enviado = st.form_submit_button("Gerar Fluxo de Caixa")
     
-    # Configuração do período
-    num_meses = st.slider("Número de meses para projeção", 1, 12, 3)
-    saldo_inicial = st.number_input("Saldo Inicial (R$)", value=0.0)
-    
-    # Entradas recorrentes
-    st.subheader("Entradas Recorrentes")
-    receita_vendas = st.number_input("Receita Mensal de Vendas (R$)", min_value=0.0)
-    receita_servicos = st.number_input("Receita Mensal de Serviços (R$)", min_value=0.0)
-    outras_receitas = st.number_input("Outras Receitas Mensais (R$)", min_value=0.0)
-    
-    # Saídas recorrentes
-    st.subheader("Saídas Recorrentes")
-    custos_fixos = st.number_input("Custos Fixos Mensais (R$)", min_value=0.0)
-    folha_pagamento = st.number_input("Folha de Pagamento Mensal (R$)", min_value=0.0)
-    impostos = st.number_input("Impostos Mensais (R$)", min_value=0.0)
-    outras_despesas = st.number_input("Outras Despesas Mensais (R$)", min_value=0.0)
-    
-    if st.button("Gerar Fluxo de Caixa"):
-        # Cálculo do fluxo
-        meses = [f"Mês {i+1}" for i in range(num_meses)]
-        total_entradas = receita_vendas + receita_servicos + outras_receitas
-        total_saidas = custos_fixos + folha_pagamento + impostos + outras_despesas
-        
-        fluxo_mensal = total_entradas - total_saidas
-        
-        # Criação do DataFrame
-        dados_fluxo = []
-        saldo_atual = saldo_inicial
-        
-        for mes in meses:
-            saldo_atual += fluxo_mensal
-            dados_fluxo.append({
-                "Mês": mes,
-                "Entradas": total_entradas,
-                "Saídas": total_saidas,
-                "Fluxo Líquido": fluxo_mensal,
-                "Saldo Final": saldo_atual
-            })
+    if enviado:
+        # Cálculo do fluxo pelo motor de projeção
+        codigo_frequencia = "M" if frequencia == "Mensal" else "D"
+        receitas = [receita_vendas, receita_servicos, outras_receitas]
+        despesas = [custos_fixos, folha_pagamento, impostos, outras_despesas]
+        eventos_validos = eventos.dropna(subset=["Mês", "Valor"])
+        parametros_fluxo = dict(
+            crescimento_receitas=crescimento_receitas, sazonalidade=sazonalidade["Fator das receitas"].tolist(),
+            volatilidade_receitas=volatilidade_receitas, volatilidade_despesas=volatilidade_despesas,
+            eventos=list(zip(eventos_validos["Mês"], eventos_validos["Valor"])),
+        )
+        
+        df_fluxo = projetar_fluxo(saldo_inicial, receitas, despesas, num_meses, codigo_frequencia, inflacao_anual,
+                                  **parametros_fluxo)
+        rotulo = df_fluxo.columns[0]
         
-        df_fluxo = pd.DataFrame(dados_fluxo)
+        total_entradas = df_fluxo["Entradas"].iloc[0]
+        total_saidas = df_fluxo["Saídas"].iloc[0]
+        fluxo_mensal = df_fluxo["Fluxo Líquido"].mean()
+        saldo_atual = df_fluxo["Saldo Final"].iloc[-1]
         
         # Exibição dos resultados
         st.write("### Resumo do Fluxo de Caixa")
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Mensal Entradas", f"R$ {total_entradas:,.2f}")
+            st.metric("Entradas no 1º Período", f"R$ {total_entradas:,.2f}")
         with col2:
-            st.metric("Total Mensal Saídas", f"R$ {total_saidas:,.2f}")
+            st.metric("Saídas no 1º Período", f"R$ {total_saidas:,.2f}")
         with col3:
-            st.metric("Fluxo Líquido Mensal", f"R$ {fluxo_mensal:,.2f}", 
+            st.metric("Fluxo Líquido Médio", f"R$ {fluxo_mensal:,.2f}", 
                      delta=f"R$ {saldo_atual - saldo_inicial:,.2f}")
         
         # Tabela detalhada
@@ -443,206 +1264,505 @@ elif opcao == "Fluxo de Caixa":
         st.dataframe(df_fluxo.style.format({
             "Entradas": "R$ {:,.2f}",
             "Saídas": "R$ {:,.2f}",
+            "Eventos": "R$ {:,.2f}",
             "Fluxo Líquido": "R$ {:,.2f}",
             "Saldo Final": "R$ {:,.2f}"
         }))
         
         # Gráfico de evolução
         st.write("### Evolução do Saldo")
-        st.line_chart(df_fluxo.set_index("Mês")["Saldo Final"])
+        st.line_chart(df_fluxo.set_index(rotulo)["Saldo Final"])
         
         # Análise automática
         st.write("### Análise do Fluxo")
         if fluxo_mensal > 0:
-            st.success(f"✅ Fluxo de caixa positivo de R$ {fluxo_mensal:,.2f} por mês")
+            st.success(f"✅ Fluxo de caixa positivo de R$ {fluxo_mensal:,.2f} por período, em média")
         else:
-            st.error(f"⚠️ Fluxo de caixa negativo de R$ {abs(fluxo_mensal):,.2f} por mês")
+            st.error(f"⚠️ Fluxo de caixa negativo de R$ {abs(fluxo_mensal):,.2f} por período, em média")
         
         if saldo_atual > saldo_inicial:
             st.success(f"✅ Projeção de aumento no saldo de R$ {saldo_atual - saldo_inicial:,.2f}")
         else:
             st.warning(f"⚠️ Projeção de redução no saldo de R$ {abs(saldo_atual - saldo_inicial):,.2f}")
+        
+        if simular_cenarios:
+            linhas_fluxo, eventos_fluxo, periodos, inicio = montar_fluxo(receitas, despesas, num_meses,
+                                                                         codigo_frequencia, **parametros_fluxo)
+            # Na granularidade diária o teto de memória da simulação é atingido com bem menos cenários
+            if int(num_cenarios) * periodos > LIMITE_CELULAS_SIMULACAO:
+                st.error(f"Simulação grande demais para {periodos:,} períodos: use no máximo "
+                         f"{LIMITE_CELULAS_SIMULACAO // periodos:,} cenários ou um horizonte menor.")
+                st.stop()
+            with desempenho.span("calculo", "simulacao_fluxo", linhas=int(num_cenarios)) as span:
+                saldos = simular(linhas_fluxo, saldo_inicial, periodos, int(num_cenarios), codigo_frequencia,
+                                 inflacao_anual, eventos_fluxo, inicio)
+                faixas, resumo = resumir_simulacao(saldos)
+            decorrido = span.duracao
+            faixas.index = df_fluxo[rotulo]
+            
+            st.write(f"### Cenários ({int(num_cenarios):,} simulações em {decorrido * 1000:.0f} ms)")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Probabilidade de saldo negativo", f"{resumo['prob_negativo']:.1%}")
+            with col2:
+                if resumo["periodos_ate_zerar"]:
+                    st.metric("Tempo mediano até zerar o caixa", f"{resumo['periodos_ate_zerar']['P50']:.0f} {rotulo.lower()}(s)")
+                else:
+                    st.metric("Tempo até zerar o caixa", "Não ocorre")
+            st.line_chart(faixas[["P5", "P25", "P50", "P75", "P95"]])
+            st.write("Probabilidade de saldo negativo por período")
+            st.area_chart(faixas["Prob. Saldo Negativo"])
 
 elif opcao == "Análise DRE":
     st.header("Análise da Demonstração do Resultado do Exercício")
     
-    # Receitas
-    st.subheader("Receitas")
-    receita_bruta = st.number_input("Receita Bruta (R$)", min_value=0.0)
-    deducoes = st.number_input("Deduções da Receita (R$)", min_value=0.0)
-    
-    # Custos
-    st.subheader("Custos")
-    custo_produtos = st.number_input("Custo dos Produtos Vendidos (R$)", min_value=0.0)
+    modo_dre = st.radio("Modo", ["Período único (formulário)", "Vários períodos (planilha)"], horizontal=True)
     
-    # Despesas
-    st.subheader("Despesas Operacionais")
-    despesas_vendas = st.number_input("Despesas com Vendas (R$)", min_value=0.0)
-    despesas_administrativas = st.number_input("Despesas Administrativas (R$)", min_value=0.0)
-    despesas_financeiras = st.number_input("Despesas Financeiras (R$)", min_value=0.0)
-    
-    if st.button("Analisar DRE"):
-        # Cálculos
-        receita_liquida = receita_bruta - deducoes
-        lucro_bruto = receita_liquida - custo_produtos
-        total_despesas = despesas_vendas + despesas_administrativas + despesas_financeiras
-        lucro_operacional = lucro_bruto - total_despesas
-        
-        # Cálculo de margens
-        margem_bruta = (lucro_bruto / receita_liquida * 100) if receita_liquida != 0 else 0
-        margem_operacional = (lucro_operacional / receita_liquida * 100) if receita_liquida != 0 else 0
-        
-        # Exibição dos resultados
-        st.write("### Demonstração do Resultado")
-        col1, col2 = st.columns(2)
+    if modo_dre == "Período único (formulário)":
+        importar_ecd({"receita_bruta": 0.0, "deducoes": 0.0, "custo_produtos": 0.0, "despesas_vendas": 0.0,
+                      "despesas_administrativas": 0.0, "despesas_financeiras": 0.0})
         
-        with col1:
-            st.write("**Receita Bruta:** R$ {:,.2f}".format(receita_bruta))
-            st.write("(-) **Deduções:** R$ {:,.2f}".format(deducoes))
-            st.write("**Receita Líquida:** R$ {:,.2f}".format(receita_liquida))
-            st.write("(-) **CPV:** R$ {:,.2f}".format(custo_produtos))
-            st.write("**Lucro Bruto:** R$ {:,.2f}".format(lucro_bruto))
-            st.write("(-) **Despesas Operacionais:** R$ {:,.2f}".format(total_despesas))
-            st.write("**Lucro Operacional:** R$ {:,.2f}".format(lucro_operacional))
+        with st.form("form_dre"):
+            # Receitas
+            st.subheader("Receitas")
+            receita_bruta = st.number_input("Receita Bruta (R$)", min_value=0.0, key="campo_receita_bruta")
+            deducoes = st.number_input("Deduções da Receita (R$)", min_value=0.0, key="campo_deducoes")
+            
+            # Custos
+            st.subheader("Custos")
+            custo_produtos = st.number_input("Custo dos Produtos Vendidos (R$)", min_value=0.0, key="campo_custo_produtos")
+            
+            # Despesas
+            st.subheader("Despesas Operacionais")
+            despesas_vendas = st.number_input("Despesas com Vendas (R$)", min_value=0.0, key="campo_despesas_vendas")
+            despesas_administrativas = st.number_input("Despesas Administrativas (R$)", min_value=0.0,
+                                                       key="campo_despesas_administrativas")
+            despesas_financeiras = st.number_input("Despesas Financeiras (R$)", min_value=0.0, key="campo_despesas_financeiras")
+            entidade, periodo = campos_historico()
+            enviado = st.form_submit_button("Analisar DRE")
         
-        with col2:
-            st.metric("Margem Bruta", f"{margem_bruta:.2f}%")
-            st.metric("Margem Operacional", f"{margem_operacional:.2f}%")
-        
-        # Análise vertical
-        st.write("### Análise Vertical")
-        dados_analise = {
-            "Componente": ["Deduções", "CPV", "Despesas Operacionais", "Lucro Operacional"],
-            "Valor": [deducoes, custo_produtos, total_despesas, lucro_operacional],
-            "% da Receita": [
-                (deducoes/receita_bruta*100) if receita_bruta != 0 else 0,
-                (custo_produtos/receita_bruta*100) if receita_bruta != 0 else 0,
-                (total_despesas/receita_bruta*100) if receita_bruta != 0 else 0,
-                (lucro_operacional/receita_bruta*100) if receita_bruta != 0 else 0
-            ]
-        }
-        
-        df_analise = pd.DataFrame(dados_analise)
-        st.dataframe(df_analise.style.format({
-            "Valor": "R$ {:,.2f}",
-            "% da Receita": "{:.2f}%"
-        }))
+        if enviado:
+            # Cálculos em centavos (exatos) pelo motor da DRE; os valores voltam em reais
+            dados_dre = pd.DataFrame([{
+                "receita_bruta": receita_bruta, "deducoes": deducoes, "custo_produtos": custo_produtos,
+                "despesas_vendas": despesas_vendas, "despesas_administrativas": despesas_administrativas,
+                "despesas_financeiras": despesas_financeiras,
+            }])
+            dre = calcular_dre(dados_dre)
+            receita_liquida, lucro_bruto, total_despesas, lucro_operacional, margem_bruta, margem_operacional = (
+                dre.iloc[0][["receita_liquida", "lucro_bruto", "total_despesas", "lucro_operacional",
+                             "margem_bruta", "margem_operacional"]])
+            if entidade and periodo:
+                # Entradas e subtotais da cascata como linhas; margens como indicadores
+                historico.gravar_campos(entidade, periodo, {**dados_dre.iloc[0].to_dict(),
+                                                            **dre.iloc[0].drop(["margem_bruta", "margem_operacional"])},
+                                        "dre")
+                historico.gravar_indicadores(dre[["margem_bruta", "margem_operacional"]].set_axis(
+                    pd.MultiIndex.from_tuples([(entidade, periodo)])))
+            
+            # Exibição dos resultados
+            st.write("### Demonstração do Resultado")
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.write("**Receita Bruta:** R$ {:,.2f}".format(receita_bruta))
+                st.write("(-) **Deduções:** R$ {:,.2f}".format(deducoes))
+                st.write("**Receita Líquida:** R$ {:,.2f}".format(receita_liquida))
+                st.write("(-) **CPV:** R$ {:,.2f}".format(custo_produtos))
+                st.write("**Lucro Bruto:** R$ {:,.2f}".format(lucro_bruto))
+                st.write("(-) **Despesas Operacionais:** R$ {:,.2f}".format(total_despesas))
+                st.write("**Lucro Operacional:** R$ {:,.2f}".format(lucro_operacional))
+            
+            with col2:
+                st.metric("Margem Bruta", f"{margem_bruta:.2f}%")
+                st.metric("Margem Operacional", f"{margem_operacional:.2f}%")
+            
+            # Análise vertical
+            st.write("### Análise Vertical")
+            df_analise = analise_vertical_dre(dados_dre, dre)
+            st.dataframe(df_analise.style.format({
+                "Valor": "R$ {:,.2f}",
+                "% da Receita": "{:.2f}%"
+            }))
+            
+            # Gráfico de composição
+            st.write("### Composição do Resultado")
+            st.bar_chart(df_analise.set_index("Componente")["Valor"])
+            
+            # Análise automática
+            st.write("### Análise dos Indicadores")
+            if margem_bruta > 30:
+                st.success("✅ Boa margem bruta (>30%)")
+            else:
+                st.warning("⚠️ Margem bruta abaixo do ideal")
+                
+            if margem_operacional > 15:
+                st.success("✅ Boa margem operacional (>15%)")
+            else:
+                st.warning("⚠️ Margem operacional precisa de atenção")
+                
+            if total_despesas > lucro_bruto:
+                st.error("⚠️ Despesas operacionais superiores ao lucro bruto")
+            
+            if entidade:
+                exibir_comparacao(entidade, "dre", ["margem_bruta", "margem_operacional"])
+    
+    else:
+        st.caption("Colunas entidade, periodo (AAAA-MM, AAAAQn ou AAAA), conta ou linha, e valor. Contas são "
+                   "mapeadas pelo nome (receita, deduções, custo, despesas, depreciação, financeiras, IR/CSLL).")
+        arquivo_dre = st.file_uploader("Resultado por conta e período (CSV)", type="csv", key="arquivo_dre")
+        sinal_contabil = st.checkbox("Valores com sinal contábil (receitas negativas, como no razão)")
         
-        # Gráfico de composição
-        st.write("### Composição do Resultado")
-        st.bar_chart(df_analise.set_index("Componente")["Valor"])
+        if arquivo_dre is not None and st.button("Carregar DRE"):
+            lancamentos_dre = ler_upload_csv(arquivo_dre)
+            with desempenho.span("calculo", "dre_multiperiodo", linhas=len(lancamentos_dre)) as span:
+                try:
+                    st.session_state.dre_multiperiodo = DREMultiperiodo(lancamentos_dre, sinal_contabil=sinal_contabil)
+                except (KeyError, ValueError) as erro:
+                    st.error(f"Não foi possível montar a DRE: {erro}")
+            st.session_state.dre_multiperiodo_tempo = span.duracao
         
-        # Análise automática
-        st.write("### Análise dos Indicadores")
-        if margem_bruta > 30:
-            st.success("✅ Boa margem bruta (>30%)")
-        else:
-            st.warning("⚠️ Margem bruta abaixo do ideal")
+        dre_periodos = st.session_state.get("dre_multiperiodo")
+        if dre_periodos is not None and dre_periodos.periodos:
+            # Um período novo calcula só a coluna nova (cascata, análises e LTM a partir da janela já somada)
+            arquivo_novo_periodo = st.file_uploader("Adicionar período (ex.: fechamento do mês)", type="csv",
+                                                    key="dre_novo_periodo")
+            if arquivo_novo_periodo is not None and st.button("Adicionar Período"):
+                with desempenho.span("calculo", "dre_incremental") as span:
+                    try:
+                        recalculados = dre_periodos.adicionar(ler_upload_csv(arquivo_novo_periodo))
+                    except (KeyError, ValueError) as erro:
+                        st.error(f"Não foi possível adicionar o período: {erro}")
+                        recalculados = None
+                if recalculados is not None:
+                    st.success(f"{len(recalculados):,} períodos recalculados em {span.duracao * 1000:.0f} ms")
             
-        if margem_operacional > 15:
-            st.success("✅ Boa margem operacional (>15%)")
-        else:
-            st.warning("⚠️ Margem operacional precisa de atenção")
+            st.write(f"### DRE ({len(dre_periodos.entidades):,} entidades x {len(dre_periodos.periodos):,} períodos, "
+                     f"carregada em {st.session_state.dre_multiperiodo_tempo:.2f}s)")
+            if dre_periodos.contas_sem_linha:
+                st.warning(f"{len(dre_periodos.contas_sem_linha):,} contas sem linha da DRE (ignoradas): "
+                           + ", ".join(sorted(dre_periodos.contas_sem_linha)[:20]))
+            
+            periodo_resumo = st.selectbox("Período", [str(p) for p in reversed(dre_periodos.periodos)])
+            resumo_dre = dre_periodos.resumo(periodo_resumo)
+            st.dataframe(resumo_dre.head(1000).style.format("{:,.2f}", na_rep="-"))
+            
+            st.write("### Demonstrativo por Entidade")
+            entidade_dre = st.selectbox("Entidade", dre_periodos.entidades)
+            analise_dre = st.radio("Análise", ["Valores (R$)", "Vertical (% da receita líquida)",
+                                               "Horizontal (% sobre o período anterior)",
+                                               "Horizontal (% sobre o ano anterior)", "Últimos 12 meses (R$)"],
+                                   horizontal=True)
+            tabelas_dre = {
+                "Valores (R$)": lambda: dre_periodos.demonstrativo(entidade_dre),
+                "Vertical (% da receita líquida)": lambda: dre_periodos.vertical(entidade_dre),
+                "Horizontal (% sobre o período anterior)": lambda: dre_periodos.horizontal(entidade_dre),
+                "Horizontal (% sobre o ano anterior)": lambda: dre_periodos.horizontal(entidade_dre, anual=True),
+                "Últimos 12 meses (R$)": lambda: dre_periodos.ltm(entidade_dre),
+            }
+            tabela_dre = tabelas_dre[analise_dre]().rename(index=NOMES_LINHAS)
+            st.dataframe(tabela_dre.style.format("R$ {:,.2f}" if "R$" in analise_dre else "{:,.2f}%", na_rep="-"))
+            st.line_chart(dre_periodos.demonstrativo(entidade_dre, SUBTOTAIS).rename(index=NOMES_LINHAS).T)
             
-        if total_despesas > lucro_bruto:
-            st.error("⚠️ Despesas operacionais superiores ao lucro bruto")
+            st.download_button(
+                "Baixar resumo",
+                resumo_dre.to_csv().encode("utf-8"),
+                file_name=f"dre_{periodo_resumo}.csv",
+                mime="text/csv"
+            )
 
 elif opcao == "Análise de Indicadores":
     st.header("Análise de Indicadores Financeiros")
     
-    # Dados financeiros
-    st.subheader("Dados do Período")
-    faturamento = st.number_input("Faturamento (R$)", min_value=0.0)
-    lucro_liquido = st.number_input("Lucro Líquido (R$)", min_value=0.0)
-    ativo_total = st.number_input("Ativo Total (R$)", min_value=0.0)
-    patrimonio_liquido = st.number_input("Patrimônio Líquido (R$)", min_value=0.0)
-    
-    # Dados operacionais
-    st.subheader("Dados Operacionais")
-    prazo_medio_recebimento = st.number_input("Prazo Médio de Recebimento (dias)", min_value=0)
-    prazo_medio_pagamento = st.number_input("Prazo Médio de Pagamento (dias)", min_value=0)
-    giro_estoque = st.number_input("Giro do Estoque (vezes/ano)", min_value=0.0)
-    
-    if st.button("Calcular Indicadores"):
-        # Cálculos dos indicadores
-        rentabilidade_vendas = (lucro_liquido / faturamento * 100) if faturamento != 0 else 0
-        rentabilidade_ativo = (lucro_liquido / ativo_total * 100) if ativo_total != 0 else 0
-        rentabilidade_pl = (lucro_liquido / patrimonio_liquido * 100) if patrimonio_liquido != 0 else 0
-        ciclo_operacional = prazo_medio_recebimento + (365/giro_estoque if giro_estoque != 0 else 0)
-        ciclo_financeiro = ciclo_operacional - prazo_medio_pagamento
-        
-        # Exibição dos resultados
-        st.write("### Indicadores de Rentabilidade")
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("Rentabilidade das Vendas", f"{rentabilidade_vendas:.2f}%")
-        with col2:
-            st.metric("Rentabilidade do Ativo", f"{rentabilidade_ativo:.2f}%")
-        with col3:
-            st.metric("Rentabilidade do PL", f"{rentabilidade_pl:.2f}%")
-        
-        st.write("### Indicadores de Ciclo")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("Ciclo Operacional", f"{ciclo_operacional:.0f} dias")
-        with col2:
-            st.metric("Ciclo Financeiro", f"{ciclo_financeiro:.0f} dias")
-        
-        # Análise dos indicadores
-        st.write("### Análise dos Indicadores")
-        analises = []
+    modo_indicadores = st.radio("Modo", ["Empresa individual", "Carteira de empresas (planilha)"], horizontal=True)
+    
+    if modo_indicadores == "Empresa individual":
+        # Dados financeiros
+        with st.form("form_indicadores"):
+            st.subheader("Dados do Período")
+            faturamento = st.number_input("Faturamento (R$)", min_value=0.0)
+            lucro_liquido = st.number_input("Lucro Líquido (R$)", min_value=0.0)
+            ativo_total = st.number_input("Ativo Total (R$)", min_value=0.0)
+            patrimonio_liquido = st.number_input("Patrimônio Líquido (R$)", min_value=0.0)
+            
+            # Dados operacionais
+            st.subheader("Dados Operacionais")
+            prazo_medio_recebimento = st.number_input("Prazo Médio de Recebimento (dias)", min_value=0)
+            prazo_medio_pagamento = st.number_input("Prazo Médio de Pagamento (dias)", min_value=0)
+            giro_estoque = st.number_input("Giro do Estoque (vezes/ano)", min_value=0.0)
+            enviado = st.form_submit_button("Calcular Indicadores")
         
-        # Análise de rentabilidade
-        if rentabilidade_vendas > 15:
-            analises.append("✅ Excelente rentabilidade das vendas")
-        elif rentabilidade_vendas > 10:
-            analises.append("✓ Boa rentabilidade das vendas")
-        else:
-            analises.append("⚠️ Rentabilidade das vendas precisa de atenção")
+        if enviado:
+            # Cálculos dos indicadores pelo motor (uma linha)
+            dados_empresa = pd.DataFrame([{
+                "vendas_liquidas": faturamento, "lucro_liquido": lucro_liquido,
+                "ativo_total": ativo_total, "patrimonio_liquido": patrimonio_liquido,
+                "prazo_medio_recebimento": prazo_medio_recebimento,
+                "prazo_medio_pagamento": prazo_medio_pagamento, "giro_estoque": giro_estoque,
+            }])
+            indices, mensagens, recomendacoes = indices_empresa(dados_empresa)
+            ciclo_operacional = indices["ciclo_operacional"].iloc[0]
+            ciclo_financeiro = indices["ciclo_financeiro"].iloc[0]
+            
+            # Exibição dos resultados
+            st.write("### Indicadores de Rentabilidade")
+            col1, col2, col3 = st.columns(3)
+            for coluna, chave in zip([col1, col2, col3], ["rentabilidade_vendas", "rentabilidade_ativo", "rentabilidade_pl"]):
+                with coluna:
+                    st.metric(INDICADORES[chave]["nome"], formatar_indicador(chave, indices[chave].iloc[0]))
+            
+            st.write("### Indicadores de Ciclo")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Ciclo Operacional", f"{ciclo_operacional:.0f} dias")
+            with col2:
+                st.metric("Ciclo Financeiro", f"{ciclo_financeiro:.0f} dias")
+            
+            # Análise dos indicadores
+            st.write("### Análise dos Indicadores")
+            for analise in mensagens.iloc[0]:
+                st.write(analise)
+            
+            # Gráfico comparativo de ciclos
+            dados_ciclo = pd.DataFrame({
+                'Ciclo': ['Prazo Recebimento', 'Prazo Pagamento', 'Ciclo Operacional', 'Ciclo Financeiro'],
+                'Dias': [prazo_medio_recebimento, prazo_medio_pagamento, ciclo_operacional, ciclo_financeiro]
+            })
+            
+            st.write("### Comparativo de Ciclos")
+            st.bar_chart(dados_ciclo.set_index('Ciclo'))
+            
+            # Recomendações
+            st.write("### Recomendações")
+            for mensagem, aplicavel in recomendacoes.iloc[0].items():
+                if aplicavel:
+                    st.info(mensagem)
+    
+    else:
+        st.caption("Formato longo: colunas entidade, periodo, conta e valor (conta com os nomes dos campos, "
+                   "ex.: ativo_circulante). Formato largo: colunas entidade, periodo e um campo por coluna.")
+        arquivo_carteira = st.file_uploader("Faça upload dos dados da carteira (CSV)", type="csv")
         
-        # Análise do ciclo
-        if ciclo_financeiro < 30:
-            analises.append("✅ Ciclo financeiro eficiente")
-        elif ciclo_financeiro < 45:
-            analises.append("✓ Ciclo financeiro adequado")
-        else:
-            analises.append("⚠️ Ciclo financeiro extenso - considere otimização")
+        if arquivo_carteira is not None:
+            carteira = ler_upload_csv(arquivo_carteira)
+            if {"conta", "valor"} <= set(carteira.columns):
+                carteira = pivotar_lancamentos(carteira)
+            else:
+                carteira = carteira.set_index(["entidade", "periodo"])
+            
+            with desempenho.span("calculo", "indicadores_carteira", linhas=len(carteira)) as span:
+                indices, status, recomendacoes = historico.memorizar("indicadores_carteira", _indicadores_carteira, carteira)
+            decorrido = span.duracao
+            
+            st.write(f"### Indicadores ({len(carteira):,} entidades x períodos, calculados em {decorrido * 1000:.0f} ms)")
+            
+            # Semáforo: cores por status das faixas de cada indicador
+            cores = {"bom": "background-color: #d4edda", "atencao": "background-color: #fff3cd",
+                     "ruim": "background-color: #f8d7da", "": ""}
+            exibicao = indices.head(1000)
+            st.dataframe(exibicao.style.format("{:.2f}").apply(
+                lambda coluna: status.loc[exibicao.index, coluna.name].map(cores) if coluna.name in status.columns
+                else [""] * len(coluna)
+            ))
+            
+            st.write("### Resumo de Alertas")
+            st.bar_chart((status == "ruim").sum().rename("Entidades x períodos em alerta"))
+            st.dataframe(recomendacoes.sum().rename("Ocorrências"))
+            
+            st.write("### Evolução por Entidade")
+            entidade = st.selectbox("Entidade", indices.index.get_level_values(0).unique())
+            indicador = st.selectbox("Indicador", list(indices.columns),
+                                     format_func=lambda chave: INDICADORES[chave]["nome"])
+            st.line_chart(indices.loc[entidade, indicador])
+            
+            st.download_button(
+                "Baixar indicadores",
+                indices.join(status, rsuffix="_status").to_csv().encode("utf-8"),
+                file_name="indicadores_carteira.csv",
+                mime="text/csv"
+            )
+            
+            if st.button("Gravar carteira no histórico"):
+                lancamentos = carteira.rename_axis(["entidade", "periodo"]).rename_axis(columns="conta")
+                lancamentos = lancamentos.select_dtypes("number").stack().rename("valor").reset_index()
+                with st.spinner("Gravando..."):
+                    historico.gravar_demonstrativo(lancamentos, "carteira", origem=arquivo_carteira.name)
+                    historico.gravar_indicadores(indices, origem=arquivo_carteira.name)
+                st.success(f"{len(lancamentos):,} lançamentos e {indices.size:,} indicadores gravados")
+
+elif opcao == "Histórico de Empresas":
+    st.header("Histórico de Empresas")
+    
+    estatisticas_historico = historico.estatisticas()
+    st.caption(f"{estatisticas_historico['entidades']:,} empresas, {estatisticas_historico['periodos']:,} períodos, "
+               f"{estatisticas_historico['linhas']:,} linhas, {estatisticas_historico['indicadores']:,} indicadores, "
+               f"{estatisticas_historico['analises']:,} análises da IA, {estatisticas_historico['resultados']:,} "
+               f"resultados memorizados ({estatisticas_historico['tamanho_resultados'] / 1024 ** 2:.1f} MB)")
+    
+    empresas = historico.entidades()
+    if empresas.empty:
+        st.info("Nenhuma empresa gravada. Informe empresa e período em \"Análise de Balanço\" ou \"Análise DRE\", "
+                "ou grave uma carteira em \"Análise de Indicadores\".")
+    else:
+        st.dataframe(empresas, hide_index=True)
+        entidade = st.selectbox("Empresa", empresas["entidade"])
         
-        # Exibição das análises
-        for analise in analises:
-            st.write(analise)
+        inicio = time.perf_counter()
+        demonstrativos = {nome: historico.demonstrativo(entidade, chave) for chave, nome in
+                          [("balanco", "Balanço"), ("dre", "DRE"), ("carteira", "Carteira (planilha)")]}
+        indices = historico.indicadores(entidade)
+        st.caption(f"Lido do histórico em {(time.perf_counter() - inicio) * 1000:.0f} ms")
         
-        # Gráfico comparativo de ciclos
-        dados_ciclo = pd.DataFrame({
-            'Ciclo': ['Prazo Recebimento', 'Prazo Pagamento', 'Ciclo Operacional', 'Ciclo Financeiro'],
-            'Dias': [prazo_medio_recebimento, prazo_medio_pagamento, ciclo_operacional, ciclo_financeiro]
-        })
+        for nome, linhas in demonstrativos.items():
+            if not linhas.empty:
+                st.write(f"### {nome} por Período")
+                st.dataframe(linhas.T.style.format("{:,.2f}", na_rep="-"))
         
-        st.write("### Comparativo de Ciclos")
-        st.bar_chart(dados_ciclo.set_index('Ciclo'))
+        if not indices.empty:
+            st.write("### Indicadores por Período")
+            st.dataframe(indices.T.style.format("{:.2f}", na_rep="-"))
+            indicador = st.selectbox("Indicador", list(indices.columns),
+                                     format_func=lambda chave: INDICADORES[chave]["nome"] if chave in INDICADORES else chave)
+            st.line_chart(indices[indicador])
         
-        # Recomendações
-        st.write("### Recomendações")
-        if ciclo_financeiro > prazo_medio_pagamento:
-            st.info("💡 Considere negociar prazos maiores com fornecedores")
-        if prazo_medio_recebimento > 45:
-            st.info("💡 Avalie políticas de redução no prazo de recebimento")
-        if rentabilidade_vendas < 10:
-            st.info("💡 Analise a estrutura de custos e política de preços")
+        if st.button("Remover empresa do histórico"):
+            historico.remover_entidade(entidade)
+            st.rerun()
+    
+    with st.expander("Análises recentes da IA"):
+        for analise in historico.analises().itertuples():
+            criado_em = time.strftime("%d/%m/%Y %H:%M", time.localtime(analise.criado_em))
+            st.write(f"**{analise.tela}** ({criado_em}) {analise.referencia or ''}")
+            st.write(analise.conteudo)
+    
+    if st.button("Limpar resultados memorizados"):
+        historico.limpar_resultados()
+
+elif opcao == "Tarefas em Segundo Plano":
+    st.header("Tarefas em Segundo Plano")
+    
+    @st.fragment(run_every=3)
+    def exibir_tarefas():
+        estatisticas_fila = fila_tarefas.estatisticas()
+        st.caption(f"Servidor: {estatisticas_fila['executando']} em execução, {estatisticas_fila['na_fila']} na fila")
+        tarefas_usuario = fila_tarefas.listar(usuario)
+        if not tarefas_usuario:
+            st.info("Nenhuma tarefa enviada. Marque \"Executar análises longas em segundo plano\" na barra lateral.")
+        for tarefa in tarefas_usuario:
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                criado_em = time.strftime("%d/%m %H:%M", time.localtime(tarefa["criado_em"]))
+                if tarefa["status"] in ATIVAS:
+                    st.progress(tarefa["progresso"], text=f"{tarefa['titulo']} ({criado_em}): {tarefa['mensagem']}")
+                else:
+                    st.write(f"**{tarefa['titulo']}** ({criado_em}): {tarefa['status']}")
+                    if tarefa["erro"]:
+                        st.caption(tarefa["erro"])
+            with col2:
+                if tarefa["status"] in ATIVAS:
+                    if st.button("Cancelar", key=f"cancelar_lista_{tarefa['id']}"):
+                        fila_tarefas.cancelar(tarefa["id"])
+                else:
+                    if tarefa["status"] == CONCLUIDA and st.button("Abrir", key=f"abrir_{tarefa['id']}"):
+                        st.session_state.tarefa_aberta = tarefa["id"]
+                        st.rerun()
+                    if st.button("Remover", key=f"remover_{tarefa['id']}"):
+                        fila_tarefas.remover(tarefa["id"])
+                        st.rerun(scope="fragment")
+    
+    exibir_tarefas()
+    
+    # Resultado reaberto fica fora do fragmento para não ser redesenhado a cada atualização da lista
+    tarefa_aberta = fila_tarefas.obter(st.session_state.get("tarefa_aberta"))
+    if tarefa_aberta is not None and tarefa_aberta["status"] == CONCLUIDA:
+        st.write(f"### {tarefa_aberta['titulo']}")
+        exibir_resultado_tarefa(tarefa_aberta["tipo"], fila_tarefas.resultado(tarefa_aberta["id"]))
+
+elif opcao == "Desempenho":
+    st.header("Desempenho")
+    
+    resumo_desempenho = desempenho.REGISTRO.resumo()
+    if resumo_desempenho.empty:
+        st.info("Nenhuma medição ainda neste processo.")
+    for span, titulo in [("tela", "Execuções por Tela"), ("leitura", "Leitura de Arquivos"),
+                         ("calculo", "Cálculos"), ("llm", "Chamadas à IA")]:
+        parte = resumo_desempenho[resumo_desempenho["span"] == span].drop(columns="span").set_index("rotulo")
+        if parte.empty:
+            continue
+        st.write(f"### {titulo}")
+        st.dataframe(parte.style.format({"p50_ms": "{:,.1f}", "p95_ms": "{:,.1f}", "maximo_ms": "{:,.1f}"}))
+        st.bar_chart(parte[["p50_ms", "p95_ms"]])
+    
+    if st.session_state.latencias_llm:
+        with st.expander("Chamadas à IA desta sessão"):
+            st.dataframe(pd.DataFrame(st.session_state.latencias_llm))
+    
+    with st.expander("Formato Prometheus"):
+        if desempenho.PORTA_PROMETHEUS:
+            st.caption(f"Disponível em http://{desempenho.ENDERECO_PROMETHEUS}:{desempenho.PORTA_PROMETHEUS}/metrics")
+        st.code(desempenho.REGISTRO.prometheus(), language="text")
+    if desempenho.REGISTRO.arquivo:
+        st.caption(f"Eventos gravados em {desempenho.REGISTRO.arquivo}")
+    if st.button("Zerar medições"):
+        desempenho.REGISTRO.limpar()
+        st.rerun()
 
 else:
     st.header("Dúvidas Contábeis")
+    indice_perguntas = obter_indice_perguntas()
     
     pergunta = st.text_area("Digite sua dúvida contábil:")
+    col1, col2 = st.columns(2)
+    with col1:
+        similaridade_minima = st.slider("Similaridade mínima para reaproveitar uma resposta", 0.5, 1.0,
+                                        SIMILARIDADE_MINIMA_PADRAO, 0.05)
+    with col2:
+        forcar_nova = st.checkbox("Ignorar respostas aprovadas e consultar a IA")
     
     if st.button("Enviar Pergunta"):
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "Você é um especialista contábil."},
-                {"role": "user", "content": pergunta}
-            ]
-        )
-        
-        st.write("### Resposta:")
-        st.write(response.choices[0].message.content)
\ No newline at end of file
+        encontradas = [] if forcar_nova else indice_perguntas.buscar(pergunta, similaridade_minima)
+        if encontradas:
+            # Pergunta equivalente já respondida: resposta imediata, sem chamada ao modelo
+            encontrada = encontradas[0]
+            indice_perguntas.registrar_uso(encontrada["id"])
+            st.write("### Resposta:")
+            st.write(encontrada["resposta"])
+            origem = "curada" if encontrada["origem"] == "curada" else "aprovada anteriormente"
+            st.caption(f"Resposta {origem} para \"{encontrada['pergunta']}\" "
+                       f"(similaridade {encontrada['similaridade']:.0%}). "
+                       "Marque a opção acima para consultar a IA novamente.")
+            st.session_state.duvida_pendente = None
+        else:
+            resposta = exibir_resposta_llm("### Resposta:", pergunta)
+            st.session_state.duvida_pendente = (pergunta, resposta) if resposta else None
+    
+    # Respostas da IA só entram na base depois de aprovadas (e opcionalmente editadas)
+    if st.session_state.get("duvida_pendente"):
+        pergunta_pendente, resposta_pendente = st.session_state.duvida_pendente
+        with st.expander("Aprovar esta resposta para perguntas futuras"):
+            resposta_editada = st.text_area("Resposta", resposta_pendente, height=200)
+            if st.button("Aprovar Resposta"):
+                origem = "ia" if resposta_editada == resposta_pendente else "curada"
+                indice_perguntas.aprovar(pergunta_pendente, resposta_editada, origem)
+                st.session_state.duvida_pendente = None
+                st.success("Resposta incluída na base de perguntas frequentes")
+    
+    with st.expander("Base de perguntas frequentes"):
+        estatisticas_faq = indice_perguntas.estatisticas()
+        st.write(f"Perguntas: {estatisticas_faq['perguntas']} ({estatisticas_faq['curadas']} curadas) | "
+                 f"Respostas reaproveitadas: {estatisticas_faq['respostas_reaproveitadas']}")
+        arquivo_faq = st.file_uploader("Importar FAQ curado (CSV: pergunta, resposta)", type="csv")
+        if arquivo_faq is not None and st.button("Importar Perguntas"):
+            faq_curado = pd.read_csv(arquivo_faq)
+            indice_perguntas.importar(zip(faq_curado["pergunta"], faq_curado["resposta"]))
+            st.success(f"{len(faq_curado)} perguntas importadas")
+        perguntas_base = pd.DataFrame(indice_perguntas.listar(), columns=["id", "pergunta", "resposta", "origem", "usos"])
+        st.dataframe(perguntas_base.head(500))
+        remover = st.selectbox("Remover pergunta", [None] + perguntas_base["id"].tolist()[:500],
+                               format_func=lambda id_: "" if id_ is None else
+                               perguntas_base.set_index("id").at[id_, "pergunta"])
+        if remover is not None and st.button("Remover"):
+            indice_perguntas.remover(remover)
+            st.rerun()
+
+span_execucao.encerrar()
\ No newline at end of file
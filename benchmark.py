@@ -0,0 +1,446 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from calculos import (tabela_depreciacao, calcular_margens, calcular_impostos_base, calcular_dre, analise_vertical_dre,
+                      indices_balanco, CAMPOS_BALANCO, CAMPOS_DRE)
+from depreciacao import preparar_ativos, depreciacao_no_periodo, totais_mensais, cronograma
+from dre import DREMultiperiodo, LINHAS_ENTRADA
+from fluxo_caixa import projetar, simular, resumir_simulacao
+from folha import calcular_folha
+from indicadores import calcular_indicadores, avaliar_indicadores, gerar_recomendacoes
+from notas_fiscais import calcular_impostos, montar_regras
+from orcamento import ControleOrcamento
+
+# Benchmarks dos cálculos e das rotas da IA (contra o stub local, sem custo). Exemplos:
+#   python benchmark.py                                  # compara com benchmark_baseline.json
+#   python benchmark.py --grupos calculos --tamanhos 1000 100000
+#   python benchmark.py --gravar-baseline                # os tempos atuais viram a referência
+# Sai com código 1 se algum caso ficar mais lento que a referência além da tolerância.
+
+BASELINE_PADRAO = "benchmark_baseline.json"
+TAMANHOS_PADRAO = [1_000, 100_000, 1_000_000]
+# Regressão = mediana acima da referência em mais de TOLERANCIA e em mais de PISO_MS (abaixo disso é ruído)
+TOLERANCIA_PADRAO = 0.25
+PISO_MS = 10.0
+REPETICOES_PADRAO = 5
+# Casos longos param de repetir depois deste tempo (a mediana usa as repetições feitas)
+ORCAMENTO_SEGUNDOS = 10.0
+
+
+def _gerador(n):
+    return np.random.default_rng(n)
+
+
+def _ativos(n):
+    rng = _gerador(n)
+    return preparar_ativos(pd.DataFrame({
+        "custo": rng.uniform(1_000, 500_000, n).round(2),
+        "valor_residual": rng.uniform(0, 1_000, n).round(2),
+        "vida_util_meses": rng.choice([24, 60, 120, 300], n),
+        "metodo": rng.choice(["linear", "saldo_decrescente", "unidades_produzidas"], n, p=[0.8, 0.15, 0.05]),
+        "unidades_totais": 100_000.0,
+        "unidades_mes": rng.uniform(500, 3_000, n).round(),
+        "data_aquisicao": pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3650, n), unit="D"),
+        "centro_custo": rng.choice([f"CC{i:03d}" for i in range(50)], n),
+    }))
+
+
+def _funcionarios(n):
+    rng = _gerador(n)
+    return pd.DataFrame({
+        "salario_base": rng.lognormal(8.2, 0.6, n).round(2),
+        "horas_extras": rng.integers(0, 20, n),
+        "valor_hora_extra": rng.uniform(15, 80, n).round(2),
+        "vale_transporte": rng.random(n) < 0.6,
+        "vale_alimentacao": rng.choice([0.0, 400.0, 800.0], n),
+        "dependentes": rng.integers(0, 4, n),
+    })
+
+
+def _valores(n, colunas, minimo=0.0, maximo=1e7):
+    rng = _gerador(n)
+    return pd.DataFrame(rng.uniform(minimo, maximo, (n, len(colunas))).round(2), columns=colunas)
+
+
+def _carteira(n):
+    # n entidades x períodos, indexadas como a tela "Análise de Indicadores"
+    periodos = 10
+    entidades = max(n // periodos, 1)
+    dados = _valores(entidades * periodos, CAMPOS_BALANCO + ["prazo_medio_recebimento", "prazo_medio_pagamento",
+                                                             "giro_estoque"])
+    dados.index = pd.MultiIndex.from_product([[f"E{i}" for i in range(entidades)],
+                                              [str(2015 + p) for p in range(periodos)]], names=["entidade", "periodo"])
+    return dados
+
+
+def _itens_notas(n):
+    rng = _gerador(n)
+    base = rng.uniform(10, 50_000, n).round(2)
+    return pd.DataFrame({
+        "arquivo": [f"nfe{i // 5}.xml" for i in range(n)], "chave": [f"{i // 5:044d}" for i in range(n)],
+        "modelo": rng.choice(["NF-e", "NFS-e"], n, p=[0.8, 0.2]), "numero": np.arange(n) // 5,
+        "emissao": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, n), unit="D"),
+        "emitente": "00000000000191", "crt": 3, "municipio": rng.choice(["3550308", "3304557", "4106902"], n),
+        "cfop": rng.choice(["5102", "6102", "1102", "5910"], n), "base": base, "icms": (base * 0.18).round(2),
+        "pis": (base * 0.0165).round(2), "cofins": (base * 0.076).round(2), "iss": 0.0,
+    })
+
+
+def _orcamento(n):
+    rng = _gerador(n)
+    categorias = [f"Categoria {i}" for i in range(20)]
+    centros = [f"CC{i:03d}" for i in range(50)]
+    periodos = [f"2025-{m:02d}" for m in range(1, 13)]
+    orcamento = pd.MultiIndex.from_product([categorias, centros, periodos], names=["categoria", "centro_custo", "periodo"])
+    orcamento = orcamento.to_frame(index=False).assign(valor_orcado=rng.uniform(1_000, 100_000, len(orcamento)).round(2))
+    lancamentos = pd.DataFrame({
+        "categoria": rng.choice(categorias, n), "centro_custo": rng.choice(centros, n),
+        "periodo": rng.choice(periodos, n), "valor": rng.uniform(10, 5_000, n).round(2),
+    })
+    return orcamento, lancamentos
+
+
+def _lancamentos_dre(n):
+    # n lançamentos: 24 meses x 10 linhas da DRE por entidade
+    rng = _gerador(n)
+    entidades = [f"E{i:05d}" for i in range(max(n // (24 * len(LINHAS_ENTRADA)), 1))]
+    periodos = [str(p) for p in pd.period_range("2023-01", periods=24, freq="M")]
+    lancamentos = pd.MultiIndex.from_product([entidades, periodos, LINHAS_ENTRADA], names=["entidade", "periodo", "linha"])
+    return lancamentos.to_frame(index=False).assign(valor=rng.uniform(100, 100_000, len(lancamentos)).round(2))
+
+
+def _linhas_fluxo(n):
+    rng = _gerador(n)
+    return [{"valor": float(v), "crescimento_anual": 5.0, "indexada_inflacao": v < 0, "volatilidade": 10.0,
+             "sazonalidade": [1.0] * 11 + [1.3]} for v in rng.uniform(-50_000, 80_000, n).round(2)]
+
+
+# Casos de cálculo: cada função recebe o tamanho, gera os dados (fora da medição)
+# e devolve a função sem argumentos que é medida
+def _depreciacao_periodo(n):
+    ativos = _ativos(n)
+    return lambda: depreciacao_no_periodo(ativos, "2025-01", "2025-12")
+
+
+def _depreciacao_mensal_por_grupo(n):
+    ativos = _ativos(n)
+    return lambda: totais_mensais(ativos, "2025-01", "2025-12", "centro_custo")
+
+
+def _depreciacao_cronograma(n):
+    ativos = _ativos(n)
+    return lambda: cronograma(ativos, "2025-01", "2025-12")
+
+
+def _depreciacao_tabela_bem(n):
+    return lambda: tabela_depreciacao(250_000.0, 25, 10_000.0)
+
+
+def _folha(n):
+    funcionarios = _funcionarios(n)
+    return lambda: calcular_folha(funcionarios, "2025-03")
+
+
+def _impostos_base(n):
+    dados = _valores(n, ["valor_base"]).assign(pis=1.65, cofins=7.6, iss=5.0)
+    return lambda: calcular_impostos_base(dados)
+
+
+def _impostos_notas(n):
+    itens, regras = _itens_notas(n), montar_regras("nao_cumulativo")
+    return lambda: calcular_impostos(itens, regras)
+
+
+def _margens(n):
+    dados = _valores(n, ["custo", "preco_venda"])
+    return lambda: calcular_margens(dados)
+
+
+def _indices_balanco(n):
+    dados = _valores(n, CAMPOS_BALANCO)
+    return lambda: indices_balanco(dados)
+
+
+def _indicadores_carteira(n):
+    carteira = _carteira(n)
+
+    def executar():
+        indices = calcular_indicadores(carteira)
+        avaliar_indicadores(indices)
+        gerar_recomendacoes(carteira, indices)
+    return executar
+
+
+def _orcamento_variacoes(n):
+    orcamento, lancamentos = _orcamento(n)
+    return lambda: ControleOrcamento(orcamento, lancamentos)
+
+
+def _orcamento_incremental(n):
+    orcamento, lancamentos = _orcamento(n)
+    controle = ControleOrcamento(orcamento, lancamentos)
+    novos = lancamentos.sample(frac=0.1, random_state=0)
+    return lambda: controle.adicionar_lancamentos(novos)
+
+
+def _fluxo_projecao(n):
+    linhas = _linhas_fluxo(n)
+    return lambda: projetar(linhas, 100_000.0, 60)
+
+
+def _fluxo_simulacao(n):
+    linhas = _linhas_fluxo(4)
+    return lambda: resumir_simulacao(simular(linhas, 100_000.0, 24, n, semente=0))
+
+
+def _dre(n):
+    dados = _valores(n, CAMPOS_DRE)
+    return lambda: calcular_dre(dados)
+
+
+def _dre_analise_vertical(n):
+    dados = _valores(1, CAMPOS_DRE)
+    return lambda: analise_vertical_dre(dados)
+
+
+def _dre_multiperiodo(n):
+    lancamentos = _lancamentos_dre(n)
+    return lambda: DREMultiperiodo(lancamentos)
+
+
+def _dre_novo_periodo(n):
+    lancamentos = _lancamentos_dre(n)
+    dre = DREMultiperiodo(lancamentos)
+    ultimo = lancamentos[lancamentos["periodo"] == lancamentos["periodo"].max()]
+
+    def adicionar():
+        # Cada execução acrescenta o mês seguinte, como um fechamento mensal
+        return dre.adicionar(ultimo.assign(periodo=str(dre.periodos[-1] + 1)))
+    return adicionar
+
+
+# Casos da IA, contra o stub local (configurado por --latencia-stub etc.)
+CONFIGURACAO_STUB = {"latencia": 0.05, "tokens_por_segundo": 2000.0, "tokens_resposta": 100, "variacao": 0.0}
+_stub = {}
+
+
+def _cliente():
+    if not _stub:
+        from cliente_llm import criar_cliente
+        from stub_openai import iniciar_stub
+        _stub["servidor"] = iniciar_stub(**CONFIGURACAO_STUB)
+        _stub["cliente"] = criar_cliente("stub", base_url=_stub["servidor"].url)
+    return _stub["cliente"]
+
+
+def _llm_completar(n):
+    from llm import completar
+    cliente = _cliente()
+    return lambda: completar(cliente, "Explique o regime de competência.")
+
+
+def _llm_stream_primeiro_token(n):
+    from llm import completar_stream
+    cliente = _cliente()
+
+    def executar():
+        gerador = completar_stream(cliente, "Explique o regime de competência.")
+        next(gerador)
+        gerador.close()
+    return executar
+
+
+def _llm_stream_completo(n):
+    from llm import completar_stream
+    cliente = _cliente()
+    return lambda: "".join(completar_stream(cliente, "Explique o regime de competência."))
+
+
+def _llm_demonstrativo_blocos(n):
+    from demonstrativos import dividir_demonstrativo, analisar_em_blocos, reduzir_parciais, montar_prompt_reducao
+    from llm import completar
+    cliente = _cliente()
+    rng = _gerador(n)
+    demonstrativo = pd.DataFrame({"conta": rng.choice([f"{i}.1.01" for i in range(1, 200)], n),
+                                  "periodo": rng.choice([f"2025-{m:02d}" for m in range(1, 13)], n),
+                                  "valor": rng.uniform(-1e5, 1e5, n).round(2)})
+    blocos = dividir_demonstrativo(demonstrativo, 500, coluna_grupo="conta")
+    return lambda: completar(cliente, montar_prompt_reducao(
+        reduzir_parciais(cliente, analisar_em_blocos(cliente, blocos, max_workers=4))))
+
+
+def _llm_classificacao_lote(n):
+    from classificacao import classificar_em_lote
+    cliente = _cliente()
+    descricoes = [f"PAGTO FORNECEDOR {i:06d}" for i in range(n)]
+    return lambda: classificar_em_lote(cliente, descricoes, itens_por_requisicao=50, max_workers=8,
+                                       requisicoes_por_minuto=10 ** 6, tokens_por_minuto=10 ** 9)
+
+
+# Tamanho máximo de cada caso (acima dele o caso é pulado); TAMANHO_FIXO roda uma vez, sem tamanho
+TAMANHO_FIXO = 0
+SEM_LIMITE = None
+CASOS = {
+    "depreciacao_periodo": ("calculos", SEM_LIMITE, _depreciacao_periodo),
+    "depreciacao_mensal_por_grupo": ("calculos", SEM_LIMITE, _depreciacao_mensal_por_grupo),
+    "depreciacao_cronograma": ("calculos", 100_000, _depreciacao_cronograma),
+    "depreciacao_tabela_bem": ("calculos", TAMANHO_FIXO, _depreciacao_tabela_bem),
+    "folha": ("calculos", SEM_LIMITE, _folha),
+    "impostos_base": ("calculos", SEM_LIMITE, _impostos_base),
+    "impostos_notas": ("calculos", SEM_LIMITE, _impostos_notas),
+    "margens": ("calculos", SEM_LIMITE, _margens),
+    "indices_balanco": ("calculos", SEM_LIMITE, _indices_balanco),
+    "indicadores_carteira": ("calculos", SEM_LIMITE, _indicadores_carteira),
+    "orcamento_variacoes": ("calculos", SEM_LIMITE, _orcamento_variacoes),
+    "orcamento_incremental": ("calculos", SEM_LIMITE, _orcamento_incremental),
+    "fluxo_projecao": ("calculos", 10_000, _fluxo_projecao),
+    "fluxo_simulacao": ("calculos", 100_000, _fluxo_simulacao),
+    "dre": ("calculos", SEM_LIMITE, _dre),
+    "dre_analise_vertical": ("calculos", TAMANHO_FIXO, _dre_analise_vertical),
+    "dre_multiperiodo": ("calculos", SEM_LIMITE, _dre_multiperiodo),
+    "dre_novo_periodo": ("calculos", SEM_LIMITE, _dre_novo_periodo),
+    "llm_completar": ("llm", TAMANHO_FIXO, _llm_completar),
+    "llm_stream_primeiro_token": ("llm", TAMANHO_FIXO, _llm_stream_primeiro_token),
+    "llm_stream_completo": ("llm", TAMANHO_FIXO, _llm_stream_completo),
+    "llm_demonstrativo_blocos": ("llm", 10_000, _llm_demonstrativo_blocos),
+    "llm_classificacao_lote": ("llm", 10_000, _llm_classificacao_lote),
+}
+# Chamadas à IA (mesmo locais) oscilam mais que os cálculos
+TOLERANCIAS_GRUPO = {"calculos": TOLERANCIA_PADRAO, "llm": 0.5}
+
+
+def medir(funcao, repeticoes=REPETICOES_PADRAO, orcamento_segundos=ORCAMENTO_SEGUNDOS):
+    """Mediana e mínimo (ms) de `repeticoes` execuções, depois de uma execução de aquecimento."""
+    tempos = []
+    inicio_total = time.perf_counter()
+    for _ in range(repeticoes + 1):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+        if len(tempos) > 1 and time.perf_counter() - inicio_total > orcamento_segundos:
+            break
+    # A primeira execução paga imports e caches frios; fica de fora quando há outras
+    amostras = [t * 1000 for t in (tempos[1:] or tempos)]
+    return {"mediana_ms": statistics.median(amostras), "minimo_ms": min(amostras), "repeticoes": len(amostras)}
+
+
+def _ambiente():
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "sistema": platform.platform(), "processador": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count()}
+
+
+def executar(nomes, tamanhos, repeticoes, progresso=None):
+    """Roda os casos e devolve {chave: resultado}; a chave é "<caso>@<tamanho>" (ou só o caso, se fixo)."""
+    resultados = {}
+    for nome in nomes:
+        grupo, tamanho_maximo, preparar = CASOS[nome]
+        for tamanho in ([None] if tamanho_maximo == TAMANHO_FIXO else
+                        [t for t in tamanhos if tamanho_maximo is None or t <= tamanho_maximo]):
+            chave = nome if tamanho is None else f"{nome}@{tamanho}"
+            resultado = {"caso": nome, "grupo": grupo, "tamanho": tamanho, **medir(preparar(tamanho), repeticoes)}
+            resultados[chave] = resultado
+            if progresso is not None:
+                progresso(chave, resultado)
+    return resultados
+
+
+def comparar(resultados, baseline, tolerancia=None, piso_ms=PISO_MS):
+    """Situação de cada resultado frente à referência: "ok", "regressao", "melhora" ou "novo"."""
+    comparacao = {}
+    for chave, resultado in resultados.items():
+        referencia = baseline.get("resultados", {}).get(chave)
+        if referencia is None:
+            comparacao[chave] = ("novo", None)
+            continue
+        limite = tolerancia if tolerancia is not None else referencia.get(
+            "tolerancia", TOLERANCIAS_GRUPO.get(resultado["grupo"], TOLERANCIA_PADRAO))
+        base, atual = referencia["mediana_ms"], resultado["mediana_ms"]
+        razao = atual / base if base else 1.0
+        if atual > base * (1 + limite) and atual - base > piso_ms:
+            situacao = "regressao"
+        elif atual < base / (1 + limite) and base - atual > piso_ms:
+            situacao = "melhora"
+        else:
+            situacao = "ok"
+        comparacao[chave] = (situacao, razao)
+    return comparacao
+
+
+def montar_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks dos cálculos e das chamadas à IA (stub local)")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO, help="Linhas por caso")
+    parser.add_argument("--grupos", nargs="+", choices=sorted(set(g for g, _, _ in CASOS.values())),
+                        help="Só os casos destes grupos")
+    parser.add_argument("--casos", nargs="+", help="Só os casos cujo nome contém um destes textos")
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES_PADRAO)
+    parser.add_argument("--baseline", default=BASELINE_PADRAO, help="Arquivo JSON de referência")
+    parser.add_argument("--gravar-baseline", action="store_true", help="Grava os tempos medidos como referência")
+    parser.add_argument("--tolerancia", type=float, help="Tolerância relativa para todos os casos (ex.: 0.25)")
+    parser.add_argument("--saida", help="Grava os resultados desta execução em JSON")
+    parser.add_argument("--latencia-stub", type=float, default=CONFIGURACAO_STUB["latencia"])
+    parser.add_argument("--tokens-por-segundo-stub", type=float, default=CONFIGURACAO_STUB["tokens_por_segundo"])
+    return parser
+
+
+def main(argv=None):
+    argumentos = montar_parser().parse_args(argv)
+    CONFIGURACAO_STUB.update(latencia=argumentos.latencia_stub, tokens_por_segundo=argumentos.tokens_por_segundo_stub)
+    nomes = [nome for nome, (grupo, _, _) in CASOS.items()
+             if (not argumentos.grupos or grupo in argumentos.grupos)
+             and (not argumentos.casos or any(texto in nome for texto in argumentos.casos))]
+
+    baseline = {}
+    if os.path.exists(argumentos.baseline):
+        with open(argumentos.baseline, encoding="utf-8") as arquivo:
+            baseline = json.load(arquivo)
+        if baseline.get("ambiente", {}).get("processador") != _ambiente()["processador"] or \
+                baseline.get("ambiente", {}).get("cpus") != _ambiente()["cpus"]:
+            print("Aviso: a referência foi gravada em outra máquina; grave uma nova com --gravar-baseline",
+                  file=sys.stderr)
+
+    def progresso(chave, resultado):
+        print(f"{chave:<45} {resultado['mediana_ms']:>12,.2f} ms (mín. {resultado['minimo_ms']:,.2f}, "
+              f"{resultado['repeticoes']}x)", file=sys.stderr)
+
+    resultados = executar(nomes, argumentos.tamanhos, argumentos.repeticoes, progresso)
+    if argumentos.saida:
+        with open(argumentos.saida, "w", encoding="utf-8") as arquivo:
+            json.dump({"ambiente": _ambiente(), "resultados": resultados}, arquivo, indent=2)
+
+    if argumentos.gravar_baseline:
+        referencia = baseline.get("resultados", {})
+        referencia.update(resultados)
+        with open(argumentos.baseline, "w", encoding="utf-8") as arquivo:
+            json.dump({"ambiente": _ambiente(), "gravado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "resultados": dict(sorted(referencia.items()))}, arquivo, indent=2)
+        print(f"Referência gravada em {argumentos.baseline}", file=sys.stderr)
+        return 0
+
+    if not baseline:
+        print(f"Sem referência em {argumentos.baseline}; rode com --gravar-baseline para criar", file=sys.stderr)
+        return 0
+
+    comparacao = comparar(resultados, baseline, argumentos.tolerancia)
+    regressoes = [chave for chave, (situacao, _) in comparacao.items() if situacao == "regressao"]
+    print(file=sys.stderr)
+    for chave, (situacao, razao) in comparacao.items():
+        marca = {"regressao": "REGRESSÃO", "melhora": "melhora", "ok": "ok", "novo": "novo"}[situacao]
+        relacao = "" if razao is None else f"{razao:.2f}x da referência"
+        print(f"{marca:<10} {chave:<45} {relacao}", file=sys.stderr)
+    if regressoes:
+        print(f"\n{len(regressoes)} caso(s) mais lentos que a referência: {', '.join(regressoes)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Configuração padrão do cache (pode ser sobrescrita pelo .env)
+CAMINHO_PADRAO = os.getenv('CACHE_LLM_CAMINHO', os.path.join('.cache', 'llm.sqlite3'))
+TTL_PADRAO = int(os.getenv('CACHE_LLM_TTL_SEGUNDOS', 7 * 24 * 3600))
+TAMANHO_MAXIMO_PADRAO = int(os.getenv('CACHE_LLM_TAMANHO_MB', 200)) * 1024 * 1024
+
+
+def gerar_chave(model, messages, **parametros):
+    # Serialização canônica: mesma entrada sempre gera o mesmo hash
+    conteudo = json.dumps(
+        {"model": model, "messages": messages, "parametros": parametros},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+class CacheLLM:
+    """Cache de respostas do LLM em SQLite, compartilhado entre sessões e processos."""
+
+    def __init__(self, caminho=CAMINHO_PADRAO, ttl=TTL_PADRAO, tamanho_maximo=TAMANHO_MAXIMO_PADRAO):
+        self.caminho = caminho
+        self.ttl = ttl
+        self.tamanho_maximo = tamanho_maximo
+        self._local = threading.local()
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        with self._conexao() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    conteudo TEXT NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    criado_em REAL NOT NULL,
+                    acessado_em REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas (acessado_em)")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS contadores (
+                    nome TEXT PRIMARY KEY,
+                    valor INTEGER NOT NULL
+                )
+            """)
+            con.execute("INSERT OR IGNORE INTO contadores VALUES ('hits', 0), ('misses', 0)")
+
+    def _conexao(self):
+        # Conexões SQLite não podem ser compartilhadas entre threads
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _incrementar(self, con, nome):
+        con.execute("UPDATE contadores SET valor = valor + 1 WHERE nome = ?", (nome,))
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._conexao() as con:
+            linha = con.execute(
+                "SELECT conteudo, criado_em FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+
+            if linha is None or agora - linha[1] > self.ttl:
+                if linha is not None:
+                    con.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._incrementar(con, "misses")
+                return None
+
+            con.execute("UPDATE respostas SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            self._incrementar(con, "hits")
+            return linha[0]
+
+    def gravar(self, chave, conteudo):
+        agora = time.time()
+        tamanho = len(conteudo.encode("utf-8"))
+        with self._conexao() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?)",
+                (chave, conteudo, tamanho, agora, agora)
+            )
+            self._remover_excedentes(con, agora)
+
+    def _remover_excedentes(self, con, agora):
+        # Expira entradas vencidas e aplica LRU até caber no tamanho máximo
+        con.execute("DELETE FROM respostas WHERE criado_em < ?", (agora - self.ttl,))
+        total = con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        if total <= self.tamanho_maximo:
+            return
+
+        excedente = total - self.tamanho_maximo
+        removidos = []
+        for chave, tamanho in con.execute("SELECT chave, tamanho FROM respostas ORDER BY acessado_em"):
+            removidos.append((chave,))
+            excedente -= tamanho
+            if excedente <= 0:
+                break
+        con.executemany("DELETE FROM respostas WHERE chave = ?", removidos)
+
+    def estatisticas(self):
+        con = self._conexao()
+        contadores = dict(con.execute("SELECT nome, valor FROM contadores").fetchall())
+        entradas, tamanho = con.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM respostas"
+        ).fetchone()
+        consultas = contadores["hits"] + contadores["misses"]
+        return {
+            "hits": contadores["hits"],
+            "misses": contadores["misses"],
+            "taxa_acerto": contadores["hits"] / consultas if consultas else 0.0,
+            "entradas": entradas,
+            "tamanho_bytes": tamanho,
+        }
+
+    def limpar(self):
+        with self._conexao() as con:
+            con.execute("DELETE FROM respostas")
+            con.execute("UPDATE contadores SET valor = 0")
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+from depreciacao import preparar_ativos, acumulada_apos_meses
+from fluxo_caixa import projetar
+from indicadores import calcular_indicadores, avaliar_indicadores, gerar_recomendacoes, selecionar, dividir
+from moeda import para_centavos, para_reais, aplicar_percentual, somar
+from orcamento import calcular_variacoes
+
+# Motor de cálculo sem Streamlit nem chamadas à IA: usado pela interface (app.py) e pelo
+# processamento em lote (cli.py). As funções recebem um DataFrame com uma linha por caso
+# (empresa, produto, período...) e a interface chama as mesmas funções com uma única linha.
+
+CAMPOS_DRE = ["receita_bruta", "deducoes", "custo_produtos", "despesas_vendas",
+              "despesas_administrativas", "despesas_financeiras"]
+CAMPOS_BALANCO = ["ativo_circulante", "disponivel", "estoque", "ativo_total", "passivo_circulante",
+                  "passivo_total", "patrimonio_liquido", "lucro_liquido", "vendas_liquidas"]
+INDICADORES_BALANCO = selecionar("liquidez_corrente", "liquidez_seca", "liquidez_imediata",
+                                 "endividamento", "rentabilidade_pl", "margem_liquida")
+INDICADORES_EMPRESA = selecionar("rentabilidade_vendas", "rentabilidade_ativo", "rentabilidade_pl",
+                                 "ciclo_operacional", "ciclo_financeiro")
+
+
+def _campos(dados, campos):
+    # Campos ausentes contam como zero, como nos formulários da interface
+    return dados.reindex(columns=campos, fill_value=0.0).fillna(0.0)
+
+
+def tabela_depreciacao(valor_bem, vida_util_anos, valor_residual=0.0, metodo="linear",
+                       unidades_totais=0.0, unidades_mes=0.0):
+    """Tabela anual de depreciação de um bem e a depreciação do primeiro mês."""
+    ativo = preparar_ativos(pd.DataFrame([{
+        "custo": valor_bem,
+        "valor_residual": valor_residual,
+        "vida_util_anos": vida_util_anos,
+        "metodo": metodo,
+        "unidades_totais": unidades_totais,
+        "unidades_mes": unidades_mes,
+    }]))
+    # Depreciação acumulada ao fim de cada ano; a anual é a diferença entre anos
+    anos = np.arange(0, int(vida_util_anos) + 1)
+    acumulada = acumulada_apos_meses(ativo, anos * 12)[0]
+    tabela = pd.DataFrame({
+        "Ano": anos[1:],
+        "Valor Inicial": valor_bem - acumulada[:-1],
+        "Depreciação": acumulada[1:] - acumulada[:-1],
+        "Valor Final": valor_bem - acumulada[1:],
+    })
+    return tabela, acumulada_apos_meses(ativo, 1)[0][0]
+
+
+def calcular_margens(dados):
+    """Lucro (R$) e margem de lucro (%) a partir das colunas custo e preco_venda.
+
+    A margem fica vazia (NaN) quando o preço de venda não é positivo.
+    """
+    valores = _campos(dados, ["custo", "preco_venda"])
+    custo, preco = valores["custo"].to_numpy(dtype=float), valores["preco_venda"].to_numpy(dtype=float)
+    resultado = pd.DataFrame(index=dados.index)
+    resultado["lucro"] = para_reais(para_centavos(preco) - para_centavos(custo))
+    resultado["margem_lucro"] = np.where(preco > 0, dividir((preco - custo) * 100, preco), np.nan)
+    return resultado
+
+
+def calcular_impostos_base(dados):
+    """PIS, COFINS e ISS (colunas em %) sobre valor_base, cada um arredondado ao centavo.
+
+    O total é a soma exata dos impostos já arredondados.
+    """
+    valores = _campos(dados, ["valor_base", "pis", "cofins", "iss"])
+    base = para_centavos(valores["valor_base"].to_numpy(dtype=float))
+    impostos = aplicar_percentual(np.asarray(base)[:, None], valores[["pis", "cofins", "iss"]].to_numpy(dtype=float))
+    resultado = pd.DataFrame(para_reais(impostos), index=dados.index, columns=["valor_pis", "valor_cofins", "valor_iss"])
+    resultado["total_impostos"] = para_reais(impostos.sum(axis=1))
+    return resultado
+
+
+def calcular_dre(dados):
+    """Cascata da DRE (receita líquida, lucro bruto, despesas, lucro operacional) e margens em %.
+
+    Os valores são somados em centavos; as margens são zero quando a receita líquida é zero.
+    """
+    centavos = para_centavos(_campos(dados, CAMPOS_DRE).astype(float))
+    liquida = centavos["receita_bruta"] - centavos["deducoes"]
+    bruto = liquida - centavos["custo_produtos"]
+    despesas = centavos["despesas_vendas"] + centavos["despesas_administrativas"] + centavos["despesas_financeiras"]
+    operacional = bruto - despesas
+
+    resultado = pd.DataFrame(index=dados.index)
+    resultado["receita_liquida"] = para_reais(liquida)
+    resultado["lucro_bruto"] = para_reais(bruto)
+    resultado["total_despesas"] = para_reais(despesas)
+    resultado["lucro_operacional"] = para_reais(operacional)
+    resultado["margem_bruta"] = dividir(bruto * 100, liquida)
+    resultado["margem_operacional"] = dividir(operacional * 100, liquida)
+    return resultado
+
+
+def analise_vertical_dre(dados, dre=None):
+    """Deduções, CPV, despesas e lucro operacional como % da receita bruta (uma linha por componente)."""
+    dre = calcular_dre(dados) if dre is None else dre
+    linha = _campos(dados, CAMPOS_DRE).iloc[0]
+    valores = np.array([linha["deducoes"], linha["custo_produtos"],
+                        dre["total_despesas"].iloc[0], dre["lucro_operacional"].iloc[0]])
+    return pd.DataFrame({
+        "Componente": ["Deduções", "CPV", "Despesas Operacionais", "Lucro Operacional"],
+        "Valor": valores,
+        "% da Receita": dividir(valores * 100, linha["receita_bruta"]),
+    })
+
+
+def indices_balanco(dados):
+    """Índices de liquidez, estrutura e rentabilidade do balanço e a análise de cada um."""
+    indices = calcular_indicadores(_campos(dados, CAMPOS_BALANCO), INDICADORES_BALANCO)
+    _, mensagens = avaliar_indicadores(indices, INDICADORES_BALANCO)
+    return indices, mensagens
+
+
+def indices_empresa(dados):
+    """Indicadores de rentabilidade e ciclo, a análise e as recomendações aplicáveis."""
+    indices = calcular_indicadores(dados, INDICADORES_EMPRESA)
+    _, mensagens = avaliar_indicadores(indices, selecionar("rentabilidade_vendas", "ciclo_financeiro"))
+    return indices, mensagens, gerar_recomendacoes(dados, indices)
+
+
+def analisar_orcamento(orcado, realizado):
+    """Variações por categoria e totais (orçado, realizado, variação e variação %)."""
+    variacoes = calcular_variacoes(orcado, realizado).reset_index()
+    total_orcado = somar(variacoes["Orçado"])
+    total_realizado = somar(variacoes["Realizado"])
+    variacao = para_reais(para_centavos(total_realizado) - para_centavos(total_orcado))
+    totais = {
+        "total_orcado": total_orcado,
+        "total_realizado": total_realizado,
+        "variacao": variacao,
+        "variacao_percentual": float(dividir(variacao * 100, total_orcado)),
+    }
+    return variacoes, totais
+
+
+def montar_fluxo(receitas, despesas, num_meses, frequencia="M", crescimento_receitas=0.0, sazonalidade=None,
+                 volatilidade_receitas=0.0, volatilidade_despesas=0.0, eventos=(), inicio=None):
+    """Converte os valores mensais do formulário nos argumentos de `projetar`/`simular`.
+
+    `eventos` são pares (mês a partir de 1, valor); na visão diária caem no primeiro dia do mês.
+    Devolve (linhas, eventos do fluxo, quantidade de períodos, data inicial).
+    """
+    inicio = pd.Timestamp.today().normalize().replace(day=1) if inicio is None else pd.Timestamp(inicio)
+    linhas = [
+        {"valor": valor, "crescimento_anual": crescimento_receitas, "sazonalidade": sazonalidade,
+         "volatilidade": volatilidade_receitas}
+        for valor in receitas
+    ] + [
+        {"valor": -valor, "indexada_inflacao": True, "volatilidade": volatilidade_despesas}
+        for valor in despesas
+    ]
+
+    if frequencia == "M":
+        periodos = num_meses
+    else:
+        periodos = len(pd.date_range(inicio, inicio + pd.DateOffset(months=num_meses), inclusive="left"))
+    datas = pd.date_range(inicio, periods=periodos, freq="MS" if frequencia == "M" else "D")
+    eventos_fluxo = [
+        {"periodo": datas.searchsorted(inicio + pd.DateOffset(months=int(mes) - 1)), "valor": valor}
+        for mes, valor in eventos
+    ]
+    return linhas, eventos_fluxo, periodos, inicio
+
+
+def projetar_fluxo(saldo_inicial, receitas, despesas, num_meses, frequencia="M", inflacao_anual=0.0, **parametros):
+    """Projeção do fluxo de caixa com rótulo do período ("Mês" ou "Dia") no lugar da data."""
+    linhas, eventos_fluxo, periodos, inicio = montar_fluxo(receitas, despesas, num_meses, frequencia, **parametros)
+    fluxo = projetar(linhas, saldo_inicial, periodos, frequencia, inflacao_anual, eventos_fluxo, inicio)
+    rotulo = "Mês" if frequencia == "M" else "Dia"
+    fluxo.insert(0, rotulo, fluxo["Data"].dt.strftime("%m/%Y" if frequencia == "M" else "%d/%m/%Y"))
+    return fluxo.drop(columns="Data")
@@ -0,0 +1,553 @@
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import ExitStack
+
+import httpx
+import numpy as np
+import pandas as pd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+# Teste de carga: sobe o app com `streamlit run` e abre N sessões simultâneas (como abas do navegador,
+# pelo mesmo websocket) que percorrem fluxos reais contra o stub local da OpenAI, sem custo. Exemplos:
+#   python carga.py --sessoes 20 --duracao 120
+#   python carga.py --sessoes 50 --fluxos duvidas calculos --pausa 0.5 --saida carga.json
+#   python carga.py --sessoes 10 --latencia-stub 2 --tokens-por-segundo-stub 30   # IA lenta
+# Relata vazão, percentis de latência por passo, memória por sessão e CPU do processo do servidor
+# (estes dois lidos de /proc, só no Linux).
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_openai.py")
+# Intervalo de amostragem de memória e CPU do servidor (segundos)
+INTERVALO_AMOSTRAS = 0.5
+# Elementos do Streamlit que são widgets (o valor deles volta ao servidor a cada execução)
+TIPOS_WIDGET = ("button", "checkbox", "file_uploader", "number_input", "radio", "selectbox", "slider",
+                "text_area", "text_input")
+ROTULO_MENU = "Escolha a função desejada"
+
+PERGUNTAS = [
+    "Qual a diferença entre regime de competência e regime de caixa?",
+    "Como contabilizar a depreciação de um veículo usado na atividade?",
+    "Quando a empresa deve provisionar férias e 13º salário?",
+    "O que entra no cálculo do capital circulante líquido?",
+    "Como registrar um adiantamento a fornecedor?",
+    "Qual o tratamento contábil de uma multa de trânsito paga pela empresa?",
+    "Como funciona o crédito de PIS e COFINS no regime não cumulativo?",
+    "O que é o ajuste a valor presente de contas a receber?",
+]
+DESCRICOES = ["PAGTO FORNECEDOR", "TARIFA BANCARIA", "ALUGUEL SALA", "ENERGIA ELETRICA", "FOLHA PAGAMENTO",
+              "COMPRA MATERIAL ESCRITORIO", "RECEBIMENTO CLIENTE", "DARF IRPJ", "INTERNET E TELEFONE"]
+
+
+class ErroSessao(Exception):
+    pass
+
+
+class SessaoNavegador:
+    """Uma aba do app: websocket com o servidor, widgets da última execução e valores alterados pelo usuário."""
+
+    def __init__(self, url_servidor, timeout):
+        self.url_servidor = url_servidor
+        self.timeout = timeout
+        self._recursos = ExitStack()
+        self.conexao = self._recursos.enter_context(connect(
+            url_servidor.replace("http", "ws", 1) + "/_stcore/stream", subprotocols=["streamlit"],
+            open_timeout=timeout, max_size=None))
+        self.id_sessao = None
+        self.query_string = ""
+        # rótulo -> (tipo, proto) dos widgets exibidos na última execução
+        self.widgets = {}
+        # id do widget -> WidgetState enviado a cada execução (como o navegador faz com os widgets montados)
+        self.valores = {}
+        self._gatilho = None
+
+    def fechar(self):
+        self._recursos.close()
+
+    def _enviar(self, mensagem):
+        self.conexao.send(mensagem.SerializeToString())
+
+    def _receber(self):
+        mensagem = ForwardMsg()
+        mensagem.ParseFromString(self.conexao.recv(timeout=self.timeout))
+        return mensagem
+
+    def _widget(self, rotulo, tipos=TIPOS_WIDGET):
+        tipo, proto = self.widgets.get(rotulo, (None, None))
+        if tipo not in tipos:
+            raise ErroSessao(f"Widget \"{rotulo}\" não está na tela")
+        return proto
+
+    def selecionar(self, rotulo, opcao):
+        proto = self._widget(rotulo, ("selectbox", "radio"))
+        self.valores[proto.id] = WidgetState(id=proto.id, string_value=opcao)
+
+    def preencher(self, rotulo, valor):
+        tipo, _ = self.widgets.get(rotulo, (None, None))
+        proto = self._widget(rotulo, ("number_input", "text_area", "text_input"))
+        if tipo == "number_input":
+            self.valores[proto.id] = WidgetState(id=proto.id, double_value=float(valor))
+        else:
+            self.valores[proto.id] = WidgetState(id=proto.id, string_value=valor)
+
+    def clicar(self, rotulo):
+        # O clique vale para uma única execução, como no navegador
+        self._gatilho = WidgetState(id=self._widget(rotulo, ("button",)).id, trigger_value=True)
+
+    def enviar_arquivo(self, rotulo, nome, conteudo, tipo_mime):
+        proto = self._widget(rotulo, ("file_uploader",))
+        pedido = BackMsg()
+        pedido.file_urls_request.request_id = uuid.uuid4().hex
+        pedido.file_urls_request.session_id = self.id_sessao
+        pedido.file_urls_request.file_names.append(nome)
+        self._enviar(pedido)
+        while True:
+            mensagem = self._receber()
+            if mensagem.WhichOneof("type") == "file_urls_response" and \
+                    mensagem.file_urls_response.response_id == pedido.file_urls_request.request_id:
+                break
+        urls = mensagem.file_urls_response.file_urls[0]
+        resposta = httpx.put(self.url_servidor + urls.upload_url, files={"file": (nome, conteudo, tipo_mime)},
+                             timeout=self.timeout)
+        resposta.raise_for_status()
+        estado = WidgetState(id=proto.id)
+        arquivo = estado.file_uploader_state_value.uploaded_file_info.add()
+        arquivo.file_id, arquivo.name, arquivo.size = urls.file_id, nome, len(conteudo)
+        arquivo.file_urls.CopyFrom(urls)
+        self.valores[proto.id] = estado
+
+    def executar(self):
+        """Pede uma execução do script com os valores atuais e espera o fim; devolve as exceções exibidas."""
+        pedido = BackMsg()
+        pedido.rerun_script.query_string = self.query_string
+        estados = [estado for id_, estado in self.valores.items() if self._gatilho is None or id_ != self._gatilho.id]
+        pedido.rerun_script.widget_states.widgets.extend(estados + ([self._gatilho] if self._gatilho else []))
+        self._gatilho = None
+        self._enviar(pedido)
+
+        excecoes = []
+        while True:
+            mensagem = self._receber()
+            tipo = mensagem.WhichOneof("type")
+            if tipo == "new_session":
+                # Toda execução começa com new_session; st.rerun() gera outra antes do fim
+                if mensagem.new_session.initialize.session_id:
+                    self.id_sessao = mensagem.new_session.initialize.session_id
+                self.widgets = {}
+                excecoes = []
+            elif tipo == "page_info_changed":
+                self.query_string = mensagem.page_info_changed.query_string
+            elif tipo == "delta" and mensagem.delta.WhichOneof("type") == "new_element":
+                elemento = mensagem.delta.new_element
+                tipo_elemento = elemento.WhichOneof("type")
+                if tipo_elemento == "exception":
+                    excecoes.append(f"{elemento.exception.type}: {elemento.exception.message}")
+                elif tipo_elemento in TIPOS_WIDGET:
+                    proto = getattr(elemento, tipo_elemento)
+                    self.widgets.setdefault(proto.label, (tipo_elemento, proto))
+            elif tipo == "script_finished":
+                if mensagem.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if mensagem.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    excecoes.append("Erro de compilação do script")
+                break
+        # Widgets que saíram da tela voltam ao padrão quando reaparecem, como no navegador
+        ids_exibidos = {proto.id for _, proto in self.widgets.values()}
+        self.valores = {id_: estado for id_, estado in self.valores.items() if id_ in ids_exibidos}
+        return excecoes
+
+
+def _dados_sessao(semente, linhas_demonstrativo, linhas_extrato):
+    """Arquivos e textos de uma sessão; sementes diferentes evitam que o cache de respostas responda tudo."""
+    rng = np.random.default_rng(semente)
+    demonstrativo = pd.DataFrame({
+        "conta": rng.choice([f"{g}.{c}.01 Conta {g}{c}" for g in range(1, 6) for c in range(1, 20)], linhas_demonstrativo),
+        "periodo": rng.choice([f"2024-{m:02d}" for m in range(1, 13)], linhas_demonstrativo),
+        "valor": rng.uniform(-50_000, 150_000, linhas_demonstrativo).round(2),
+    })
+    extrato = pd.DataFrame({
+        "data": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, linhas_extrato), unit="D"),
+        "descricao": [f"{d} {n:04d}" for d, n in zip(rng.choice(DESCRICOES, linhas_extrato),
+                                                      rng.integers(0, 200, linhas_extrato))],
+        "valor": rng.uniform(-20_000, 20_000, linhas_extrato).round(2),
+    })
+    return {
+        "demonstrativo": (f"demonstrativo_{semente}.csv", demonstrativo.to_csv(index=False).encode("utf-8"), "text/csv"),
+        "extrato": (f"extrato_{semente}.csv", extrato.to_csv(index=False).encode("utf-8"), "text/csv"),
+        "pergunta": PERGUNTAS[semente % len(PERGUNTAS)],
+        "descricao": f"{DESCRICOES[semente % len(DESCRICOES)]} {semente:04d}",
+        "salario": round(float(rng.uniform(1_500, 20_000)), 2),
+        "receita": round(float(rng.uniform(1e5, 1e7)), 2),
+    }
+
+
+def _abrir(tela):
+    return lambda sessao, dados: sessao.selecionar(ROTULO_MENU, tela)
+
+
+def _clicar(rotulo):
+    return lambda sessao, dados: sessao.clicar(rotulo)
+
+
+def _enviar_demonstrativo(sessao, dados):
+    sessao.enviar_arquivo("Faça upload do seu demonstrativo (CSV)", *dados["demonstrativo"])
+
+
+def _modo_lote(sessao, dados):
+    sessao.selecionar("Modo", "Lote (CSV/OFX)")
+
+
+def _enviar_extrato(sessao, dados):
+    sessao.enviar_arquivo("Faça upload do extrato (CSV ou OFX)", *dados["extrato"])
+
+
+def _classificar_transacao(sessao, dados):
+    sessao.preencher("Digite a descrição da transação:", dados["descricao"])
+    sessao.clicar("Classificar")
+
+
+def _perguntar(sessao, dados):
+    sessao.preencher("Digite sua dúvida contábil:", dados["pergunta"])
+    sessao.clicar("Enviar Pergunta")
+
+
+def _calcular_folha(sessao, dados):
+    sessao.preencher("Salário Base (R$)", dados["salario"])
+    sessao.clicar("Calcular Folha")
+
+
+def _calcular_balanco(sessao, dados):
+    for rotulo, fator in [("Ativo Circulante (R$)", 0.4), ("Disponível (R$)", 0.1), ("Estoque (R$)", 0.15),
+                          ("Ativo Total (R$)", 1.2), ("Passivo Circulante (R$)", 0.3), ("Passivo Total (R$)", 0.7),
+                          ("Patrimônio Líquido (R$)", 0.5), ("Lucro Líquido (R$)", 0.08),
+                          ("Vendas Líquidas (R$)", 1.0)]:
+        sessao.preencher(rotulo, round(dados["receita"] * fator, 2))
+    sessao.clicar("Calcular Índices")
+
+
+def _analisar_dre(sessao, dados):
+    for rotulo, fator in [("Receita Bruta (R$)", 1.0), ("Deduções da Receita (R$)", 0.12),
+                          ("Custo dos Produtos Vendidos (R$)", 0.5), ("Despesas com Vendas (R$)", 0.08),
+                          ("Despesas Administrativas (R$)", 0.1), ("Despesas Financeiras (R$)", 0.03)]:
+        sessao.preencher(rotulo, round(dados["receita"] * fator, 2))
+    sessao.clicar("Analisar DRE")
+
+
+# Fluxo -> passos (nome, ação); cada passo altera widgets e é seguido de uma execução do script
+FLUXOS = {
+    "demonstrativo": [("abrir", _abrir("Análise de Demonstrativos")), ("upload", _enviar_demonstrativo),
+                      ("analisar", _clicar("Analisar Demonstrativo"))],
+    "classificacao": [("abrir", _abrir("Classificação de Contas")), ("transacao", _classificar_transacao),
+                      ("modo_lote", _modo_lote), ("upload", _enviar_extrato), ("lote", _clicar("Classificar Lote"))],
+    "duvidas": [("abrir", _abrir("Dúvidas Contábeis")), ("perguntar", _perguntar)],
+    "calculos": [("abrir_folha", _abrir("Folha de Pagamento")), ("folha", _calcular_folha),
+                 ("abrir_balanco", _abrir("Análise de Balanço")), ("balanco", _calcular_balanco),
+                 ("abrir_dre", _abrir("Análise DRE")), ("dre", _analisar_dre)],
+}
+
+
+class Medicoes:
+    """Passos executados por todas as sessões e amostras de memória/CPU do servidor."""
+
+    def __init__(self):
+        self.passos = []
+        self.fluxos = 0
+        self.amostras = []
+        self._trava = threading.Lock()
+
+    def registrar_passo(self, sessao, fluxo, passo, inicio, duracao, erro=None):
+        with self._trava:
+            self.passos.append({"sessao": sessao, "fluxo": fluxo, "passo": passo, "inicio": inicio,
+                                "duracao": duracao, "erro": erro})
+
+    def registrar_fluxo(self):
+        with self._trava:
+            self.fluxos += 1
+
+
+def ler_processo(pid):
+    """(memória residente em MB, segundos de CPU) do processo, lidos de /proc; None fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/statm") as arquivo:
+            memoria = int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        with open(f"/proc/{pid}/stat") as arquivo:
+            # Campos 14 e 15 (utime, stime), contados depois do nome do processo entre parênteses
+            campos = arquivo.read().rsplit(")", 1)[1].split()
+        return memoria, (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def amostrar_processo(pid, medicoes, parar):
+    while not parar.wait(INTERVALO_AMOSTRAS):
+        leitura = ler_processo(pid)
+        if leitura is not None:
+            medicoes.amostras.append((time.perf_counter(), *leitura))
+
+
+def executar_passo(sessao, medicoes, indice, fluxo, passo, acao, dados):
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        if acao is not None:
+            acao(sessao, dados)
+        excecoes = sessao.executar()
+        if excecoes:
+            erro = excecoes[0]
+    except Exception as excecao:
+        erro = f"{type(excecao).__name__}: {excecao}"
+    medicoes.registrar_passo(indice, fluxo, passo, inicio, time.perf_counter() - inicio, erro)
+    return erro is None
+
+
+def abrir_sessao(url_servidor, argumentos, medicoes, indice, dados):
+    inicio = time.perf_counter()
+    try:
+        sessao = SessaoNavegador(url_servidor, argumentos.timeout)
+    except Exception as excecao:
+        medicoes.registrar_passo(indice, "app", "conectar", inicio, time.perf_counter() - inicio,
+                                 f"{type(excecao).__name__}: {excecao}")
+        return None
+    if not executar_passo(sessao, medicoes, indice, "app", "carregar", None, dados):
+        sessao.fechar()
+        return None
+    return sessao
+
+
+def executar_sessao(indice, url_servidor, argumentos, medicoes, fim):
+    """Uma aba aberta: carrega o app e percorre os fluxos em sequência até o fim do teste."""
+    semente = 0 if argumentos.dados_compartilhados else indice
+    dados = _dados_sessao(semente, argumentos.linhas_demonstrativo, argumentos.linhas_extrato)
+    rng = random.Random(indice)
+    sessao = abrir_sessao(url_servidor, argumentos, medicoes, indice, dados)
+    iteracao = 0
+    while sessao is not None and time.perf_counter() < fim and \
+            (not argumentos.iteracoes or iteracao < argumentos.iteracoes):
+        # Sessões começam em fluxos diferentes para a carga não andar em bloco
+        fluxo = argumentos.fluxos[(indice + iteracao) % len(argumentos.fluxos)]
+        for passo, acao in FLUXOS[fluxo]:
+            time.sleep(argumentos.pausa * rng.uniform(0.5, 1.5))
+            if not executar_passo(sessao, medicoes, indice, fluxo, passo, acao, dados):
+                # Tela em estado inesperado: o usuário recarrega a página
+                sessao.fechar()
+                sessao = abrir_sessao(url_servidor, argumentos, medicoes, indice, dados)
+                break
+        else:
+            medicoes.registrar_fluxo()
+        iteracao += 1
+    if sessao is not None:
+        sessao.fechar()
+
+
+def _porta_livre():
+    with socket.socket() as conexao:
+        conexao.bind(("127.0.0.1", 0))
+        return conexao.getsockname()[1]
+
+
+def _esperar(url, processo, descricao, limite_segundos=60):
+    limite = time.perf_counter() + limite_segundos
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as resposta:
+                return resposta.read()
+        except OSError:
+            if processo.poll() is not None or time.perf_counter() > limite:
+                processo.kill()
+                raise RuntimeError(f"{descricao} não subiu")
+            time.sleep(0.2)
+
+
+def iniciar_stub(argumentos):
+    """Sobe o stub em um processo próprio (a CPU dele não entra na medição do servidor)."""
+    porta = _porta_livre()
+    processo = subprocess.Popen([sys.executable, STUB, "--porta", str(porta),
+                                 "--latencia", str(argumentos.latencia_stub),
+                                 "--tokens-por-segundo", str(argumentos.tokens_por_segundo_stub),
+                                 "--taxa-erro", str(argumentos.taxa_erro_stub)],
+                                stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{porta}/v1"
+    _esperar(url + "/estatisticas", processo, "O stub da OpenAI")
+    return processo, url
+
+
+def iniciar_servidor(url_stub, diretorio):
+    """Sobe o app com `streamlit run` apontando para o stub; a chave no ambiente tem precedência sobre o .env."""
+    porta = _porta_livre()
+    ambiente = {**os.environ, "OPENAI_API_KEY": "stub", "OPENAI_BASE_URL": url_stub}
+    # Sem XSRF para que o cliente do teste envie arquivos sem o cookie do navegador
+    processo = subprocess.Popen([sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+                                 "--server.port", str(porta), "--server.address", "127.0.0.1",
+                                 "--server.enableXsrfProtection", "false", "--server.fileWatcherType", "none",
+                                 "--browser.gatherUsageStats", "false"],
+                                cwd=diretorio, env=ambiente, stdout=subprocess.DEVNULL,
+                                stderr=open(os.path.join(diretorio, "streamlit.log"), "w"))
+    url = f"http://127.0.0.1:{porta}"
+    _esperar(url + "/_stcore/health", processo, "O servidor do Streamlit")
+    return processo, url
+
+
+def estatisticas_stub(url):
+    with urllib.request.urlopen(url + "/estatisticas", timeout=2) as resposta:
+        return json.load(resposta)
+
+
+def resumir(medicoes, duracao, sessoes, memoria_inicial, memoria_final):
+    """Latências por passo, vazão, memória por sessão e CPU do servidor."""
+    passos = pd.DataFrame(medicoes.passos, columns=["sessao", "fluxo", "passo", "inicio", "duracao", "erro"])
+    por_passo = passos.groupby(["fluxo", "passo"], sort=False).agg(
+        execucoes=("duracao", "size"), erros=("erro", "count"),
+        p50_ms=("duracao", lambda d: d.quantile(0.5) * 1000), p95_ms=("duracao", lambda d: d.quantile(0.95) * 1000),
+        p99_ms=("duracao", lambda d: d.quantile(0.99) * 1000), maximo_ms=("duracao", lambda d: d.max() * 1000))
+
+    amostras = pd.DataFrame(medicoes.amostras, columns=["instante", "memoria_mb", "cpu_segundos"])
+    uso_cpu = (amostras["cpu_segundos"].diff() / amostras["instante"].diff() * 100).dropna()
+    memoria_pico = amostras["memoria_mb"].max() if not amostras.empty else None
+    geral = {
+        "sessoes": sessoes, "duracao_s": duracao, "passos": len(passos), "fluxos": medicoes.fluxos,
+        "erros": int(passos["erro"].notna().sum()),
+        "passos_por_segundo": len(passos) / duracao, "fluxos_por_minuto": medicoes.fluxos / duracao * 60,
+        "p50_ms": passos["duracao"].quantile(0.5) * 1000 if len(passos) else None,
+        "p95_ms": passos["duracao"].quantile(0.95) * 1000 if len(passos) else None,
+        "p99_ms": passos["duracao"].quantile(0.99) * 1000 if len(passos) else None,
+        "memoria_inicial_mb": memoria_inicial, "memoria_pico_mb": memoria_pico, "memoria_final_mb": memoria_final,
+        "memoria_por_sessao_mb": (memoria_pico - memoria_inicial) / max(sessoes, 1)
+        if memoria_pico is not None and memoria_inicial is not None else None,
+        # Percentual de um núcleo (200% = dois núcleos ocupados)
+        "cpu_media_pct": uso_cpu.mean() if not uso_cpu.empty else None,
+        "cpu_pico_pct": uso_cpu.max() if not uso_cpu.empty else None, "nucleos": os.cpu_count(),
+    }
+    erros = passos["erro"].dropna().value_counts().head(10)
+    return geral, por_passo, erros
+
+
+def imprimir(geral, por_passo, erros):
+    print("\nLatência por passo (cada passo = uma execução do script, do pedido ao fim):")
+    print(por_passo.round(1).to_string())
+    print(f"\n{geral['sessoes']} sessões, {geral['duracao_s']:.0f}s: {geral['passos']:,} passos "
+          f"({geral['passos_por_segundo']:.2f}/s), {geral['fluxos']:,} fluxos ({geral['fluxos_por_minuto']:.1f}/min), "
+          f"{geral['erros']:,} erros")
+    if geral["passos"]:
+        print(f"Latência geral: p50 {geral['p50_ms']:,.0f} ms | p95 {geral['p95_ms']:,.0f} ms | "
+              f"p99 {geral['p99_ms']:,.0f} ms")
+    if geral["memoria_por_sessao_mb"] is not None:
+        print(f"Memória do servidor: {geral['memoria_inicial_mb']:,.0f} MB antes das sessões, pico "
+              f"{geral['memoria_pico_mb']:,.0f} MB (~{geral['memoria_por_sessao_mb']:,.1f} MB por sessão), "
+              f"{geral['memoria_final_mb']:,.0f} MB ao final")
+    if geral["cpu_media_pct"] is not None:
+        print(f"CPU do servidor: média {geral['cpu_media_pct']:.0f}%, pico {geral['cpu_pico_pct']:.0f}% "
+              f"(100% = um núcleo; {geral['nucleos']} núcleos)")
+    print(f"IA (stub): {geral['requisicoes_ia']:,} requisições, pico de {geral['pico_requisicoes_simultaneas_ia']} "
+          f"simultâneas")
+    if not erros.empty:
+        print("\nErros mais frequentes:")
+        for mensagem, quantidade in erros.items():
+            print(f"  {quantidade:>5}x {mensagem[:200]}")
+
+
+def montar_parser():
+    parser = argparse.ArgumentParser(description="Teste de carga do app com sessões simultâneas (stub local da IA)")
+    parser.add_argument("--sessoes", type=int, default=10, help="Sessões simultâneas")
+    parser.add_argument("--duracao", type=float, default=60.0, help="Segundos de teste (após a rampa)")
+    parser.add_argument("--iteracoes", type=int, default=0, help="Fluxos por sessão (0 = até o fim da duração)")
+    parser.add_argument("--rampa", type=float, default=10.0, help="Segundos para abrir todas as sessões")
+    parser.add_argument("--pausa", type=float, default=1.0, help="Tempo médio entre ações do usuário (s)")
+    parser.add_argument("--fluxos", nargs="+", choices=list(FLUXOS), default=list(FLUXOS))
+    parser.add_argument("--linhas-demonstrativo", type=int, default=2000)
+    parser.add_argument("--linhas-extrato", type=int, default=300)
+    parser.add_argument("--dados-compartilhados", action="store_true",
+                        help="Todas as sessões enviam os mesmos arquivos (exercita o cache de respostas)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Limite de cada execução do script (s)")
+    parser.add_argument("--servidor-url", help="Usa um app já em execução (ex.: http://localhost:8501); "
+                                               "memória e CPU não são medidas")
+    parser.add_argument("--stub-url", help="Usa um stub já em execução (ex.: http://localhost:8001/v1)")
+    parser.add_argument("--latencia-stub", type=float, default=0.5)
+    parser.add_argument("--tokens-por-segundo-stub", type=float, default=50.0)
+    parser.add_argument("--taxa-erro-stub", type=float, default=0.0)
+    parser.add_argument("--diretorio", help="Pasta de trabalho do app (.cache); padrão: temporária, começa vazia")
+    parser.add_argument("--saida", help="Grava o resumo e os passos em JSON")
+    return parser
+
+
+def main(argv=None):
+    argumentos = montar_parser().parse_args(argv)
+    processos = []
+    try:
+        if argumentos.stub_url:
+            url_stub = argumentos.stub_url
+        else:
+            processo_stub, url_stub = iniciar_stub(argumentos)
+            processos.append(processo_stub)
+        pid_servidor = None
+        if argumentos.servidor_url:
+            url_servidor = argumentos.servidor_url.rstrip("/")
+        else:
+            processo_servidor, url_servidor = iniciar_servidor(
+                url_stub, argumentos.diretorio or tempfile.mkdtemp(prefix="carga_"))
+            processos.append(processo_servidor)
+            pid_servidor = processo_servidor.pid
+
+        # Uma sessão de aquecimento importa os módulos e cria os recursos compartilhados;
+        # a memória a partir daqui é atribuída às sessões
+        aquecimento = Medicoes()
+        sessao = abrir_sessao(url_servidor, argumentos, aquecimento, -1, None)
+        if sessao is None:
+            raise RuntimeError(f"O app não carregou: {aquecimento.passos[-1]['erro']}")
+        sessao.fechar()
+        memoria_inicial = (ler_processo(pid_servidor) or (None,))[0]
+        requisicoes_iniciais = estatisticas_stub(url_stub)["requisicoes"]
+
+        medicoes = Medicoes()
+        parar = threading.Event()
+        if pid_servidor is not None:
+            threading.Thread(target=amostrar_processo, args=(pid_servidor, medicoes, parar), daemon=True).start()
+        inicio = time.perf_counter()
+        fim = inicio + argumentos.rampa + argumentos.duracao
+        sessoes = []
+        for indice in range(argumentos.sessoes):
+            sessao = threading.Thread(target=executar_sessao, args=(indice, url_servidor, argumentos, medicoes, fim),
+                                      name=f"sessao-{indice}", daemon=True)
+            sessao.start()
+            sessoes.append(sessao)
+            time.sleep(argumentos.rampa / max(argumentos.sessoes, 1))
+        while any(sessao.is_alive() for sessao in sessoes):
+            time.sleep(1)
+            leitura = ler_processo(pid_servidor) if pid_servidor is not None else None
+            memoria = f" | servidor {leitura[0]:,.0f} MB" if leitura else ""
+            print(f"\r{time.perf_counter() - inicio:6.0f}s | {len(medicoes.passos):,} passos | "
+                  f"{medicoes.fluxos:,} fluxos{memoria}", end="", file=sys.stderr)
+        parar.set()
+        duracao = time.perf_counter() - inicio
+        print(file=sys.stderr)
+        memoria_final = (ler_processo(pid_servidor) or (None,))[0] if pid_servidor is not None else None
+        stub = estatisticas_stub(url_stub)
+    finally:
+        for processo in processos:
+            processo.terminate()
+
+    geral, por_passo, erros = resumir(medicoes, duracao, argumentos.sessoes, memoria_inicial, memoria_final)
+    geral["requisicoes_ia"] = stub["requisicoes"] - requisicoes_iniciais
+    geral["pico_requisicoes_simultaneas_ia"] = stub["pico_simultaneas"]
+    imprimir(geral, por_passo, erros)
+
+    if argumentos.saida:
+        with open(argumentos.saida, "w", encoding="utf-8") as arquivo:
+            json.dump({"geral": geral, "por_passo": por_passo.reset_index().to_dict(orient="records"),
+                       "passos": medicoes.passos}, arquivo, indent=2, default=str)
+    return 1 if geral["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
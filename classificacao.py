@@ -0,0 +1,287 @@
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from cliente_llm import ErroLLM
+from llm import completar, estimar_tokens, LimitadorTaxa
+
+NAO_CLASSIFICADO = "NÃO CLASSIFICADO"
+
+CAMINHO_REGRAS = os.getenv('CLASSIFICACAO_REGRAS_CAMINHO', os.path.join('.cache', 'regras_classificacao.json'))
+
+# Plano de contas usado quando nenhum arquivo é carregado: (código, conta, palavras-chave)
+PLANO_CONTAS_PADRAO = [
+    ("1.1.1.02", "Bancos Conta Movimento", "saldo transferencia ted doc"),
+    ("1.1.2.01", "Clientes", "pix recebido credito recebimento boleto liquidacao cobranca deposito"),
+    ("1.1.5.01", "Aplicações Financeiras", "aplicacao cdb rdb poupanca fundo investimento"),
+    ("2.1.1.01", "Fornecedores", "pagamento fornecedor boleto pago compra"),
+    ("2.1.3.01", "Salários a Pagar", "salario folha pagamento adiantamento ferias rescisao"),
+    ("2.1.4.01", "Impostos a Recolher", "darf das gps gare iss icms pis cofins irpj csll simples tributo imposto"),
+    ("2.1.4.05", "FGTS a Recolher", "fgts grf"),
+    ("2.2.1.01", "Empréstimos e Financiamentos", "emprestimo financiamento parcela contrato"),
+    ("3.1.1.01", "Receita de Vendas", "venda vendas cartao stone cielo rede getnet maquininha"),
+    ("3.1.2.01", "Receitas Financeiras", "rendimento juros recebidos resgate"),
+    ("4.1.1.01", "Despesas Bancárias", "tarifa bancaria pacote servicos manutencao conta cesta taxa"),
+    ("4.1.1.02", "Despesas com Juros", "juros mora multa iof encargos cheque especial"),
+    ("4.1.2.01", "Aluguéis", "aluguel locacao condominio"),
+    ("4.1.2.02", "Energia Elétrica", "energia eletrica luz enel cemig copel light"),
+    ("4.1.2.03", "Água e Esgoto", "agua esgoto sabesp saneamento"),
+    ("4.1.2.04", "Telefone e Internet", "telefone internet vivo claro tim oi telecom"),
+    ("4.1.2.05", "Combustíveis", "combustivel posto gasolina etanol diesel"),
+    ("4.1.2.06", "Material de Escritório", "papelaria material escritorio kalunga"),
+    ("4.1.2.07", "Honorários Contábeis", "honorarios contabilidade contador"),
+]
+
+SISTEMA_LOTE = (
+    "Você é um especialista contábil. Classifique cada transação na conta contábil adequada. "
+    "Responda somente com JSON no formato "
+    '{"classificacoes": [{"id": <número>, "conta": "<conta contábil>"}]}, '
+    "com exatamente um item para cada id recebido."
+)
+
+
+def ler_extrato(arquivo, nome_arquivo):
+    """Lê um extrato em CSV ou OFX e devolve um DataFrame com a coluna `descricao`."""
+    if nome_arquivo.lower().endswith(".ofx"):
+        conteudo = arquivo.read()
+        if isinstance(conteudo, bytes):
+            conteudo = conteudo.decode("latin-1")
+        return ler_ofx(conteudo)
+    return pd.read_csv(arquivo)
+
+
+def _campo_ofx(bloco, campo):
+    # OFX 1.x (SGML) não fecha as tags; OFX 2.x (XML) fecha
+    encontrado = re.search(rf"<{campo}>([^<\r\n]*)", bloco, re.IGNORECASE)
+    return encontrado.group(1).strip() if encontrado else ""
+
+
+def ler_ofx(conteudo):
+    transacoes = []
+    for bloco in re.findall(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))",
+                            conteudo, re.IGNORECASE | re.DOTALL):
+        data = _campo_ofx(bloco, "DTPOSTED")[:8]
+        transacoes.append({
+            "data": pd.to_datetime(data, format="%Y%m%d", errors="coerce"),
+            "descricao": _campo_ofx(bloco, "MEMO") or _campo_ofx(bloco, "NAME"),
+            "valor": float(_campo_ofx(bloco, "TRNAMT").replace(",", ".") or 0),
+            "id_transacao": _campo_ofx(bloco, "FITID"),
+        })
+    return pd.DataFrame(transacoes, columns=["data", "descricao", "valor", "id_transacao"])
+
+
+def _montar_prompt_lote(descricoes):
+    itens = "\n".join(json.dumps({"id": i, "descricao": d}, ensure_ascii=False) for i, d in enumerate(descricoes))
+    return f"Transações:\n{itens}"
+
+
+def _interpretar_resposta(resposta, quantidade):
+    # Aceita texto ao redor do JSON (ex.: blocos ```json```)
+    inicio, fim = resposta.find("{"), resposta.rfind("}")
+    if inicio == -1 or fim == -1:
+        raise ValueError("Resposta sem JSON")
+    dados = json.loads(resposta[inicio:fim + 1])
+    itens = dados.get("classificacoes", []) if isinstance(dados, dict) else None
+    if not isinstance(itens, list) or not all(isinstance(item, dict) for item in itens):
+        raise ValueError("Resposta fora do formato esperado")
+
+    contas = [NAO_CLASSIFICADO] * quantidade
+    for item in itens:
+        try:
+            indice = int(item.get("id", -1))
+        except (TypeError, ValueError):
+            # Item sem id utilizável ("id": null, texto...): a descrição fica sem classificação
+            continue
+        if 0 <= indice < quantidade and item.get("conta"):
+            contas[indice] = str(item["conta"]).strip()
+    return contas
+
+
+def _classificar_pacote(client, descricoes, limitador, tentativas, cache):
+    prompt = _montar_prompt_lote(descricoes)
+    # Estimativa de tokens de entrada + saída para o limitador
+    tokens = estimar_tokens(SISTEMA_LOTE + prompt) + 20 * len(descricoes)
+    # Erros da API já chegam depois das repetições do ClienteLLM; aqui só se repete resposta malformada
+    for tentativa in range(tentativas):
+        try:
+            limitador.aguardar(tokens)
+            # Só respostas que se convertem em classificações vão para o cache; uma malformada
+            # não volta do cache na próxima tentativa
+            resposta = completar(client, prompt, sistema=SISTEMA_LOTE, cache=cache, temperature=0,
+                                 validar=lambda texto: _interpretar_resposta(texto, len(descricoes)))
+            return _interpretar_resposta(resposta, len(descricoes))
+        except ValueError:
+            if tentativa == tentativas - 1:
+                raise
+
+
+def classificar_em_lote(client, descricoes, itens_por_requisicao=50, max_workers=8,
+                        requisicoes_por_minuto=500, tokens_por_minuto=80000,
+                        tentativas=3, cache=None, progresso=None):
+    """Classifica uma lista de descrições, devolvendo (dict descricao -> conta, descrições com falha).
+
+    Descrições repetidas são enviadas uma única vez; os pacotes são processados em
+    paralelo respeitando os limites de requisições e tokens por minuto. Descrições de
+    pacotes em que a API falhou (ErroLLM) ou respondeu fora do formato ficam como
+    NAO_CLASSIFICADO e também vão na lista de falhas; outros erros interrompem o lote.
+    """
+    unicas = list(dict.fromkeys(d for d in descricoes if isinstance(d, str) and d.strip()))
+    pacotes = [unicas[i:i + itens_por_requisicao] for i in range(0, len(unicas), itens_por_requisicao)]
+    limitador = LimitadorTaxa(requisicoes_por_minuto, tokens_por_minuto)
+
+    resultado = {}
+    falhas = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {
+            executor.submit(_classificar_pacote, client, pacote, limitador, tentativas, cache): pacote
+            for pacote in pacotes
+        }
+        try:
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                pacote = futuros[futuro]
+                try:
+                    contas = futuro.result()
+                except (ErroLLM, ValueError):
+                    # Um pacote com falha não derruba o lote inteiro
+                    contas = [NAO_CLASSIFICADO] * len(pacote)
+                    falhas.extend(pacote)
+                resultado.update(zip(pacote, contas))
+                if progresso is not None:
+                    progresso(concluidos, len(pacotes))
+        except BaseException:
+            # Interrompido (ex.: tarefa cancelada): pacotes que ainda não começaram são descartados
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return resultado, falhas
+
+
+def normalizar_texto(texto):
+    # Remove acentos, números e pontuação; mantém palavras com 2+ letras em minúsculas
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii").lower()
+    return [token for token in re.findall(r"[a-z]+", texto) if len(token) > 1]
+
+
+class ClassificadorLocal:
+    """Classificador local de transações por TF-IDF sobre o plano de contas.
+
+    Regras aprendidas (descrições confirmadas) têm prioridade e confiança 1.0; as
+    demais descrições são comparadas às contas por similaridade de cosseno em um
+    índice invertido.
+    """
+
+    def __init__(self, plano=None, caminho_regras=CAMINHO_REGRAS):
+        self.caminho_regras = caminho_regras
+        self._trava = threading.Lock()
+        self.regras = {}
+        if caminho_regras and os.path.exists(caminho_regras):
+            with open(caminho_regras, encoding="utf-8") as arquivo:
+                self.regras = json.load(arquivo)
+        self.definir_plano(plano)
+
+    def definir_plano(self, plano=None):
+        """Aceita um DataFrame com colunas `codigo`, `conta` e opcionalmente `palavras_chave`."""
+        if plano is None:
+            plano = pd.DataFrame(PLANO_CONTAS_PADRAO, columns=["codigo", "conta", "palavras_chave"])
+        if "palavras_chave" not in plano.columns:
+            plano = plano.assign(palavras_chave="")
+        self.contas = [f"{codigo} - {conta}" for codigo, conta in zip(plano["codigo"], plano["conta"])]
+        self._textos_plano = [f"{conta} {palavras}" for conta, palavras
+                              in zip(plano["conta"], plano["palavras_chave"].fillna(""))]
+        self._construir_indice()
+
+    def _construir_indice(self):
+        # Documento de cada conta = nome + palavras-chave + descrições confirmadas para ela
+        documentos = [Counter(normalizar_texto(texto)) for texto in self._textos_plano]
+        posicao = {conta: i for i, conta in enumerate(self.contas)}
+        for chave, conta in self.regras.items():
+            if conta in posicao:
+                documentos[posicao[conta]].update(chave.split())
+
+        frequencia = Counter(token for documento in documentos for token in documento)
+        total = len(documentos)
+        self._idf = {token: math.log((1 + total) / (1 + n)) + 1 for token, n in frequencia.items()}
+
+        self._indice = defaultdict(list)
+        for i, documento in enumerate(documentos):
+            pesos = {token: tf * self._idf[token] for token, tf in documento.items()}
+            norma = math.sqrt(sum(p * p for p in pesos.values())) or 1.0
+            for token, peso in pesos.items():
+                self._indice[token].append((i, peso / norma))
+
+    def classificar(self, descricao):
+        """Devolve (conta, confiança entre 0 e 1); conta é None se nada for encontrado."""
+        tokens = normalizar_texto(descricao)
+        chave = " ".join(tokens)
+        if chave in self.regras:
+            return self.regras[chave], 1.0
+
+        if not tokens:
+            return None, 0.0
+        # Palavras fora do vocabulário recebem o maior IDF possível e reduzem a confiança
+        idf_maximo = math.log(1 + len(self.contas)) + 1
+        pesos = {token: tf * self._idf.get(token, idf_maximo) for token, tf in Counter(tokens).items()}
+        norma = math.sqrt(sum(p * p for p in pesos.values()))
+
+        pontuacao = defaultdict(float)
+        cobertura = defaultdict(float)
+        for token, peso in pesos.items():
+            for i, peso_conta in self._indice.get(token, ()):
+                pontuacao[i] += peso * peso_conta / norma
+                cobertura[i] += peso
+        if not pontuacao:
+            return None, 0.0
+
+        ordenadas = sorted(pontuacao, key=pontuacao.get, reverse=True)
+        melhor = ordenadas[0]
+        # Confiança = parcela da descrição explicada pela conta, penalizada se houver empate com a segunda
+        segunda = pontuacao[ordenadas[1]] / pontuacao[melhor] if len(ordenadas) > 1 else 0.0
+        confianca = cobertura[melhor] / sum(pesos.values()) * (1 - segunda / 2)
+        return self.contas[melhor], confianca
+
+    def aprender(self, confirmacoes):
+        """Registra pares descricao -> conta confirmados pelo usuário e persiste as regras."""
+        with self._trava:
+            for descricao, conta in confirmacoes:
+                chave = " ".join(normalizar_texto(descricao))
+                if chave and conta and conta != NAO_CLASSIFICADO:
+                    self.regras[chave] = conta
+            self._construir_indice()
+            if self.caminho_regras:
+                diretorio = os.path.dirname(self.caminho_regras)
+                if diretorio:
+                    os.makedirs(diretorio, exist_ok=True)
+                temporario = self.caminho_regras + ".tmp"
+                with open(temporario, "w", encoding="utf-8") as arquivo:
+                    json.dump(self.regras, arquivo, ensure_ascii=False)
+                os.replace(temporario, self.caminho_regras)
+
+
+def classificar_com_triagem(client, descricoes, classificador, confianca_minima=0.6, **parametros_lote):
+    """Classifica localmente e envia ao LLM apenas as descrições de baixa confiança.
+
+    Devolve um dict descricao -> (conta, confiança, origem); a origem é "local", "IA" ou
+    "falha" (pacote que a IA não conseguiu classificar).
+    """
+    unicas = list(dict.fromkeys(d for d in descricoes if isinstance(d, str) and d.strip()))
+    resultado = {}
+    pendentes = []
+    for descricao in unicas:
+        conta, confianca = classificador.classificar(descricao)
+        if conta is not None and confianca >= confianca_minima:
+            resultado[descricao] = (conta, confianca, "local")
+        else:
+            pendentes.append(descricao)
+
+    if pendentes:
+        contas, falhas = classificar_em_lote(client, pendentes, **parametros_lote)
+        falhas = set(falhas)
+        for descricao, conta in contas.items():
+            resultado[descricao] = (conta, None, "falha" if descricao in falhas else "IA")
+    return resultado
@@ -0,0 +1,206 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import pandas as pd
+
+from calculos import (calcular_margens, calcular_impostos_base, calcular_dre, indices_balanco, CAMPOS_BALANCO,
+                      CAMPOS_DRE)
+from depreciacao import preparar_ativos, depreciacao_no_periodo, totais_mensais
+from folha import calcular_folha
+from indicadores import calcular_indicadores, avaliar_indicadores, pivotar_lancamentos
+from ingestao import carregar_csv
+from notas_fiscais import ler_lote_notas, montar_regras, calcular_impostos, totalizar, ANEXOS_SIMPLES, ISS_PADRAO
+from orcamento import ControleOrcamento
+from sped import ler_arquivos, apurar_campos
+
+# Processamento em lote, sem Streamlit e sem IA. Exemplos:
+#   python cli.py folha funcionarios/*.csv --competencia 2025-03
+#   python cli.py depreciacao ativos.csv --inicio 2025-01 --fim 2025-12 --grupo centro_custo
+#   python cli.py notas /dados/xmls --regime simples --anexo III --receita-12-meses 1500000
+#   python cli.py ecd ecd_2023.txt ecd_2024.txt
+# Cada arquivo de entrada gera <nome>_<comando>.csv na pasta --saida.
+
+
+def ler_csv(caminho):
+    with open(caminho, "rb") as arquivo:
+        return carregar_csv(arquivo)
+
+
+def _com_resultado(funcao):
+    # Colunas de entrada seguidas das colunas calculadas
+    return lambda dados, argumentos: dados.join(funcao(dados))
+
+
+def _folha(dados, argumentos):
+    return calcular_folha(dados, argumentos.competencia)
+
+
+def _depreciacao(dados, argumentos):
+    ativos = preparar_ativos(dados)
+    return ativos.join(depreciacao_no_periodo(ativos, argumentos.inicio, argumentos.fim))
+
+
+def _balanco(dados, argumentos):
+    indices, mensagens = indices_balanco(dados)
+    return dados.join(indices).join(mensagens, rsuffix="_analise")
+
+
+def _indicadores(dados, argumentos):
+    # Mesmos formatos da tela "Análise de Indicadores": longo (conta, valor) ou largo
+    if {"conta", "valor"} <= set(dados.columns):
+        dados = pivotar_lancamentos(dados)
+    else:
+        dados = dados.set_index(["entidade", "periodo"])
+    indices = calcular_indicadores(dados)
+    status, _ = avaliar_indicadores(indices)
+    return indices.join(status, rsuffix="_status").reset_index()
+
+
+# Comando -> função que recebe o DataFrame de um arquivo e devolve o resultado
+POR_ARQUIVO = {
+    "folha": _folha,
+    "depreciacao": _depreciacao,
+    "margem": _com_resultado(calcular_margens),
+    "impostos": _com_resultado(calcular_impostos_base),
+    "dre": _com_resultado(calcular_dre),
+    "balanco": _balanco,
+    "indicadores": _indicadores,
+}
+
+
+def _gravar(resultado, caminho_entrada, comando, saida, sufixo=""):
+    nome = os.path.splitext(os.path.basename(caminho_entrada))[0]
+    destino = os.path.join(saida, f"{nome}_{comando}{sufixo}.csv")
+    resultado.to_csv(destino, index=False)
+    return destino
+
+
+def processar_arquivos(argumentos):
+    funcao = POR_ARQUIVO[argumentos.comando]
+    falhas = 0
+    total = len(argumentos.arquivos)
+    for indice, caminho in enumerate(argumentos.arquivos, start=1):
+        inicio = time.perf_counter()
+        try:
+            dados = ler_csv(caminho)
+            resultado = funcao(dados, argumentos)
+            destino = _gravar(resultado, caminho, argumentos.comando, argumentos.saida)
+            if argumentos.comando == "depreciacao":
+                mensal = totais_mensais(preparar_ativos(dados), argumentos.inicio, argumentos.fim, argumentos.grupo)
+                _gravar(mensal.rename_axis("competencia").reset_index(), caminho, argumentos.comando,
+                        argumentos.saida, "_mensal")
+        except Exception as erro:
+            falhas += 1
+            print(f"[{indice}/{total}] {caminho}: erro - {erro}", file=sys.stderr)
+            continue
+        print(f"[{indice}/{total}] {caminho}: {len(dados):,} linhas em {time.perf_counter() - inicio:.2f}s -> {destino}",
+              file=sys.stderr)
+    return falhas
+
+
+def _progresso(rotulo):
+    return lambda feitos, total: print(f"{rotulo}: {feitos}/{total}", file=sys.stderr)
+
+
+def processar_notas(argumentos):
+    caminhos = []
+    for entrada in argumentos.arquivos:
+        if os.path.isdir(entrada):
+            caminhos += glob.glob(os.path.join(entrada, "**", "*.xml"), recursive=True)
+        else:
+            caminhos.append(entrada)
+    aliquotas_iss = {}
+    if argumentos.aliquotas_iss:
+        tabela_iss = pd.read_csv(argumentos.aliquotas_iss, dtype={"codigo_municipio": str})
+        aliquotas_iss = dict(zip(tabela_iss["codigo_municipio"], tabela_iss["aliquota"].astype(float)))
+
+    itens, erros = ler_lote_notas(caminhos, progresso=_progresso("Lotes de notas"))
+    regras = montar_regras(argumentos.regime, argumentos.anexo, argumentos.receita_12_meses, aliquotas_iss,
+                           argumentos.iss_padrao)
+    notas = calcular_impostos(itens, regras)
+    notas.to_csv(os.path.join(argumentos.saida, "notas_itens.csv"), index=False)
+    totalizar(notas, "nota").to_csv(os.path.join(argumentos.saida, "notas_por_nota.csv"))
+    totalizar(notas, "periodo").to_csv(os.path.join(argumentos.saida, "notas_por_periodo.csv"))
+    for arquivo, mensagem in erros:
+        print(f"{arquivo}: {mensagem}", file=sys.stderr)
+    print(f"{len(caminhos):,} arquivos, {len(notas):,} itens, {len(erros):,} com erro", file=sys.stderr)
+    return len(erros)
+
+
+def processar_ecd(argumentos):
+    # Uma linha por arquivo com os campos apurados, a DRE e os índices do balanço
+    resultados = ler_arquivos(argumentos.arquivos, progresso=_progresso("Arquivos da ECD"))
+    linhas = pd.DataFrame([
+        {"arquivo": r["arquivo"], "empresa": r["empresa"], "cnpj": r["cnpj"], "inicio": r["inicio"], "fim": r["fim"],
+         **apurar_campos(r)}
+        for r in resultados
+    ])
+    campos = linhas.reindex(columns=CAMPOS_BALANCO + CAMPOS_DRE, fill_value=0.0)
+    indices, _ = indices_balanco(campos)
+    linhas.join(calcular_dre(campos)).join(indices).to_csv(os.path.join(argumentos.saida, "ecd.csv"), index=False)
+    return 0
+
+
+def processar_orcamento(argumentos):
+    controle = ControleOrcamento(ler_csv(argumentos.orcamento), ler_csv(argumentos.razao), argumentos.limite)
+    controle.variacoes.reset_index().to_csv(os.path.join(argumentos.saida, "orcamento_variacoes.csv"), index=False)
+    print(f"{len(controle.variacoes):,} grupos, {(controle.variacoes['Alerta'] != '').sum():,} em alerta",
+          file=sys.stderr)
+    return 0
+
+
+def montar_parser():
+    parser = argparse.ArgumentParser(description="Cálculos contábeis em lote (sem interface e sem IA)")
+    parser.add_argument("--saida", default="resultados", help="Pasta dos arquivos gerados")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    folha = comandos.add_parser("folha", help="Folha de pagamento (CSV de funcionários)")
+    folha.add_argument("arquivos", nargs="+")
+    folha.add_argument("--competencia", default=pd.Timestamp.today().strftime("%Y-%m"), help="AAAA-MM")
+
+    depreciacao = comandos.add_parser("depreciacao", help="Depreciação do cadastro de ativos no período")
+    depreciacao.add_argument("arquivos", nargs="+")
+    depreciacao.add_argument("--inicio", required=True, help="Competência inicial (AAAA-MM)")
+    depreciacao.add_argument("--fim", required=True, help="Competência final (AAAA-MM)")
+    depreciacao.add_argument("--grupo", help="Coluna para agrupar os totais mensais")
+
+    for nome, ajuda in [("margem", "Margem de lucro (colunas custo, preco_venda)"),
+                        ("impostos", "PIS/COFINS/ISS (colunas valor_base, pis, cofins, iss em %)"),
+                        ("dre", "DRE com margens (" + ", ".join(CAMPOS_DRE) + ")"),
+                        ("balanco", "Índices do balanço (" + ", ".join(CAMPOS_BALANCO) + ")"),
+                        ("indicadores", "Indicadores da carteira (formato longo ou largo)")]:
+        comandos.add_parser(nome, help=ajuda).add_argument("arquivos", nargs="+")
+
+    notas = comandos.add_parser("notas", help="Impostos de NF-e/NFS-e (XMLs ou pastas)")
+    notas.add_argument("arquivos", nargs="+")
+    notas.add_argument("--regime", default="nao_cumulativo", choices=["nao_cumulativo", "cumulativo", "simples"])
+    notas.add_argument("--anexo", default="III", choices=list(ANEXOS_SIMPLES))
+    notas.add_argument("--receita-12-meses", type=float, default=0.0)
+    notas.add_argument("--iss-padrao", type=float, default=ISS_PADRAO)
+    notas.add_argument("--aliquotas-iss", help="CSV com codigo_municipio e aliquota")
+
+    ecd = comandos.add_parser("ecd", help="Campos do balanço e da DRE a partir de arquivos da ECD")
+    ecd.add_argument("arquivos", nargs="+")
+
+    orcamento = comandos.add_parser("orcamento", help="Orçado x realizado (orçamento + razão)")
+    orcamento.add_argument("--orcamento", required=True)
+    orcamento.add_argument("--razao", required=True)
+    orcamento.add_argument("--limite", type=float, default=10.0, help="Limite de variação para alerta (%%)")
+    return parser
+
+
+def main(argv=None):
+    argumentos = montar_parser().parse_args(argv)
+    os.makedirs(argumentos.saida, exist_ok=True)
+    if argumentos.comando in POR_ARQUIVO:
+        falhas = processar_arquivos(argumentos)
+    else:
+        falhas = {"notas": processar_notas, "ecd": processar_ecd, "orcamento": processar_orcamento}[argumentos.comando](argumentos)
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from cache_llm import gerar_chave
+
+# Configuração padrão do cliente (pode ser sobrescrita pelo .env)
+TIMEOUT_CONEXAO = float(os.getenv('OPENAI_TIMEOUT_CONEXAO', 10))
+TIMEOUT_LEITURA = float(os.getenv('OPENAI_TIMEOUT_LEITURA', 120))
+MAX_CONEXOES = int(os.getenv('OPENAI_MAX_CONEXOES', 20))
+TENTATIVAS_PADRAO = int(os.getenv('OPENAI_TENTATIVAS', 5))
+ESPERA_BASE = float(os.getenv('OPENAI_ESPERA_BASE_SEGUNDOS', 1))
+ESPERA_MAXIMA = float(os.getenv('OPENAI_ESPERA_MAXIMA_SEGUNDOS', 60))
+
+# Erros transitórios: vale a pena tentar de novo
+STATUS_REPETIVEIS = {408, 409, 429, 500, 502, 503, 504}
+
+_UNIDADES = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _duracao(texto):
+    # Formato dos cabeçalhos x-ratelimit-reset-*: "20ms", "1.5s", "6m0s"
+    partes = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", texto or "")
+    if not partes:
+        return None
+    return sum(float(numero) * _UNIDADES[unidade] for numero, unidade in partes)
+
+
+class ErroLLM(Exception):
+    """Falha da API que persistiu após as repetições (ou que não vale repetir)."""
+
+
+def _erro_api(erro):
+    import openai
+    return isinstance(erro, openai.OpenAIError)
+
+
+def repetivel(erro):
+    import openai
+    if isinstance(erro, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(erro, openai.APIStatusError) and (
+        erro.status_code in STATUS_REPETIVEIS or erro.status_code >= 500
+    )
+
+
+def tempo_espera(erro, tentativa, base=ESPERA_BASE, maximo=ESPERA_MAXIMA):
+    """Segundos a aguardar antes da próxima tentativa.
+
+    Respeita os cabeçalhos de limite de taxa da resposta (retry-after-ms, retry-after,
+    x-ratelimit-reset-requests/tokens); sem eles, usa backoff exponencial com jitter.
+    """
+    resposta = getattr(erro, "response", None)
+    cabecalhos = resposta.headers if resposta is not None else {}
+
+    espera = None
+    if cabecalhos.get("retry-after-ms"):
+        try:
+            espera = float(cabecalhos["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if espera is None and cabecalhos.get("retry-after"):
+        try:
+            espera = float(cabecalhos["retry-after"])
+        except ValueError:
+            pass
+    if espera is None:
+        resets = [_duracao(cabecalhos.get(nome)) for nome in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+        resets = [reset for reset in resets if reset is not None]
+        if resets:
+            espera = max(resets)
+    if espera is None:
+        # Jitter evita que as sessões que falharam juntas voltem todas no mesmo instante
+        espera = base * 2 ** tentativa * random.uniform(0.5, 1.5)
+    return min(max(espera, 0), maximo)
+
+
+class ClienteLLM:
+    """Cliente da OpenAI compartilhado entre sessões e threads.
+
+    Repete chamadas que falham por erro transitório e agrupa requisições idênticas
+    em andamento: quem pedir a mesma completion enquanto ela não voltou espera a
+    mesma resposta, em vez de gerar outra chamada à API.
+    """
+
+    def __init__(self, fabrica, tentativas=TENTATIVAS_PADRAO, espera_maxima=ESPERA_MAXIMA):
+        # `fabrica()` cria o cliente OpenAI na primeira requisição
+        self._fabrica = fabrica
+        self._client = None
+        self.tentativas = tentativas
+        self.espera_maxima = espera_maxima
+        self._em_andamento = {}
+        self._trava = threading.Lock()
+        self.chamadas = 0
+        self.agrupadas = 0
+        self.repeticoes = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._trava:
+                if self._client is None:
+                    self._client = self._fabrica()
+        return self._client
+
+    def _criar_com_repeticao(self, parametros):
+        client = self.client
+        for tentativa in range(self.tentativas):
+            try:
+                with self._trava:
+                    self.chamadas += 1
+                return client.chat.completions.create(**parametros)
+            except Exception as erro:
+                if not _erro_api(erro):
+                    raise
+                if tentativa == self.tentativas - 1 or not repetivel(erro):
+                    raise ErroLLM(str(erro)) from erro
+                with self._trava:
+                    self.repeticoes += 1
+                time.sleep(tempo_espera(erro, tentativa, maximo=self.espera_maxima))
+
+    def criar(self, **parametros):
+        """Equivalente a `client.chat.completions.create`, com repetição e agrupamento.
+
+        Streams não são agrupados: cada consumidor precisa da sua própria conexão.
+        """
+        if parametros.get("stream"):
+            return _StreamProtegido(self._criar_com_repeticao(parametros))
+
+        chave = gerar_chave(**parametros)
+        with self._trava:
+            futuro = self._em_andamento.get(chave)
+            if futuro is not None:
+                self.agrupadas += 1
+                dono = False
+            else:
+                futuro = self._em_andamento[chave] = Future()
+                dono = True
+        if not dono:
+            return futuro.result()
+
+        try:
+            futuro.set_result(self._criar_com_repeticao(parametros))
+        except BaseException as erro:
+            futuro.set_exception(erro)
+        finally:
+            with self._trava:
+                del self._em_andamento[chave]
+        return futuro.result()
+
+    def estatisticas(self):
+        with self._trava:
+            return {"chamadas": self.chamadas, "agrupadas": self.agrupadas,
+                    "repeticoes": self.repeticoes, "em_andamento": len(self._em_andamento)}
+
+    def fechar(self):
+        if self._client is not None:
+            self._client.close()
+
+
+class _StreamProtegido:
+    # Erros da API no meio do stream chegam como ErroLLM, como os da requisição inicial
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except Exception as erro:
+            if not _erro_api(erro):
+                raise
+            raise ErroLLM(str(erro)) from erro
+
+    def close(self):
+        self._stream.close()
+
+
+def criar_cliente(api_key, timeout_conexao=TIMEOUT_CONEXAO, timeout_leitura=TIMEOUT_LEITURA,
+                  max_conexoes=MAX_CONEXOES, tentativas=TENTATIVAS_PADRAO, base_url=None):
+    """Cria o ClienteLLM com pool de conexões HTTP (keep-alive) e timeouts configuráveis.
+
+    As repetições automáticas do SDK ficam desligadas: quem repete é o ClienteLLM,
+    que respeita os cabeçalhos de limite de taxa. `base_url` aponta para outro servidor
+    compatível (ex.: o stub local dos benchmarks); sem ela vale OPENAI_BASE_URL ou a API da OpenAI.
+    """
+    def fabrica():
+        # Importados só na primeira requisição: telas sem IA e o processamento em lote
+        # não pagam o custo de carregar o SDK
+        import httpx
+        import openai
+
+        timeout = httpx.Timeout(timeout_leitura, connect=timeout_conexao)
+        http_client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_conexoes, max_keepalive_connections=max_conexoes),
+        )
+        return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, timeout=timeout,
+                             max_retries=0)
+
+    return ClienteLLM(fabrica, tentativas=tentativas)
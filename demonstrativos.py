@@ -0,0 +1,233 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from llm import completar, estimar_tokens, MODELO_PADRAO
+
+PROMPT_BLOCO = (
+    "Analise o seguinte trecho ({indice} de {total}) de um demonstrativo financeiro "
+    "e liste os insights mais relevantes de forma objetiva:\n{dados}"
+)
+
+PROMPT_ANALISE = "Analise os seguintes dados financeiros e forneça insights importantes:\n{dados}"
+
+# Tokens do prompt de redução: o contexto do GPT-4 (8 mil) menos espaço para a resposta
+ORCAMENTO_REDUCAO_TOKENS = 6000
+
+PROMPT_REDUCAO = (
+    "As análises abaixo foram feitas sobre partes de um mesmo demonstrativo financeiro. "
+    "Consolide-as em uma única análise, eliminando repetições e destacando os "
+    "insights mais importantes do conjunto:\n\n{parciais}"
+)
+
+
+def dividir_demonstrativo(df, linhas_por_bloco=500, coluna_grupo=None):
+    """Divide o demonstrativo em blocos de até `linhas_por_bloco` linhas.
+
+    Com `coluna_grupo`, grupos de contas inteiros são mantidos juntos sempre
+    que cabem no limite; grupos maiores que o limite são fatiados.
+    """
+    if coluna_grupo is None:
+        return [df.iloc[i:i + linhas_por_bloco] for i in range(0, len(df), linhas_por_bloco)]
+
+    blocos = []
+    atual = []
+    linhas_atual = 0
+    for _, grupo in df.groupby(coluna_grupo, sort=False, observed=True):
+        if len(grupo) > linhas_por_bloco:
+            # Fecha o bloco pendente antes, para os blocos saírem na ordem do demonstrativo
+            if atual:
+                blocos.append(atual)
+                atual, linhas_atual = [], 0
+            blocos.extend([grupo.iloc[i:i + linhas_por_bloco]] for i in range(0, len(grupo), linhas_por_bloco))
+            continue
+        if linhas_atual + len(grupo) > linhas_por_bloco and atual:
+            blocos.append(atual)
+            atual, linhas_atual = [], 0
+        atual.append(grupo)
+        linhas_atual += len(grupo)
+    if atual:
+        blocos.append(atual)
+
+    return [pd.concat(partes) if len(partes) > 1 else partes[0] for partes in blocos]
+
+
+def _analisar_bloco(client, bloco, indice, total, cache):
+    # Repetições e espera por limite de taxa ficam a cargo do ClienteLLM
+    prompt = PROMPT_BLOCO.format(indice=indice, total=total, dados=bloco.to_csv(index=False))
+    return completar(client, prompt, cache=cache)
+
+
+def analisar_em_blocos(client, blocos, max_workers=4, cache=None, progresso=None):
+    """Etapa "map": analisa os blocos em paralelo e devolve as análises parciais na ordem original.
+
+    `progresso(concluidos, total)` é chamado na thread de quem invocou a função,
+    o que permite atualizar componentes do Streamlit com segurança.
+    """
+    total = len(blocos)
+    parciais = [None] * total
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {
+            executor.submit(_analisar_bloco, client, bloco, i + 1, total, cache): i
+            for i, bloco in enumerate(blocos)
+        }
+        try:
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                parciais[futuros[futuro]] = futuro.result()
+                if progresso is not None:
+                    progresso(concluidos, total)
+        except BaseException:
+            # Interrompido (erro ou tarefa cancelada): blocos que ainda não começaram são descartados
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return parciais
+
+
+def montar_prompt_reducao(parciais):
+    # Etapa "reduce": consolida as análises parciais em uma só
+    texto = "\n\n".join(f"--- Parte {i} ---\n{parcial}" for i, parcial in enumerate(parciais, start=1))
+    return PROMPT_REDUCAO.format(parciais=texto)
+
+
+def _agrupar_parciais(parciais, orcamento_tokens, model):
+    # Grupos consecutivos cujo prompt de redução cabe no orçamento (uma parcial maior fica sozinha)
+    base = estimar_tokens(montar_prompt_reducao([]), model)
+    grupos, atual, tokens_atual = [], [], base
+    for parcial in parciais:
+        tokens = estimar_tokens(f"--- Parte {len(atual) + 1} ---\n{parcial}\n\n", model)
+        if atual and tokens_atual + tokens > orcamento_tokens:
+            grupos.append(atual)
+            atual, tokens_atual = [], base
+        atual.append(parcial)
+        tokens_atual += tokens
+    if atual:
+        grupos.append(atual)
+    return grupos
+
+
+def reduzir_parciais(client, parciais, orcamento_tokens=ORCAMENTO_REDUCAO_TOKENS, max_workers=4, cache=None,
+                     model=MODELO_PADRAO):
+    """Reduz as análises parciais em níveis até o prompt final caber em `orcamento_tokens`.
+
+    Enquanto não couberem, grupos de parciais consecutivas são consolidados em paralelo
+    e os resultados viram as parciais do nível seguinte. Devolve as parciais do último
+    nível, prontas para `montar_prompt_reducao`.
+    """
+    parciais = list(parciais)
+    while estimar_tokens(montar_prompt_reducao(parciais), model) > orcamento_tokens:
+        grupos = _agrupar_parciais(parciais, orcamento_tokens, model)
+        if len(grupos) == len(parciais):
+            # Nenhuma parcial cabe junto de outra: agrupar não reduz mais nada
+            break
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parciais = list(executor.map(
+                lambda grupo: grupo[0] if len(grupo) == 1
+                else completar(client, montar_prompt_reducao(grupo), model=model, cache=cache),
+                grupos,
+            ))
+    return parciais
+
+
+def _csv(df):
+    return df.to_csv(index=False, float_format="%.2f").strip()
+
+
+def compactar_demonstrativo(df, orcamento_tokens=6000, coluna_grupo=None, coluna_periodo=None, top_n=10,
+                            model=MODELO_PADRAO):
+    """Gera uma representação densa do demonstrativo que caiba em `orcamento_tokens`.
+
+    O resumo (totais, subtotais, variações entre períodos e maiores movimentações)
+    vem primeiro; as linhas de detalhe entram em CSV, das mais relevantes para as
+    menos relevantes, até esgotar o orçamento.
+    """
+    numericas = df.select_dtypes("number").columns.tolist()
+    principal = numericas[0] if numericas else None
+
+    # Seções em ordem de prioridade; as últimas são descartadas primeiro se faltar espaço
+    secoes = [f"Linhas: {len(df)} | Colunas: {', '.join(map(str, df.columns))}"]
+    if numericas:
+        secoes.append("Totais:\n" + _csv(df[numericas].sum().to_frame().T))
+
+        if coluna_periodo is not None:
+            por_periodo = df.groupby(coluna_periodo, observed=True)[numericas].sum().sort_index()
+            secoes.append(f"Totais por {coluna_periodo}:\n" + _csv(por_periodo.reset_index()))
+            variacoes = por_periodo.diff().dropna(how="all")
+            if not variacoes.empty:
+                secoes.append("Variação entre períodos:\n" + _csv(variacoes.reset_index()))
+
+        movimentos = _maiores_movimentos(df, principal, coluna_grupo, coluna_periodo, top_n)
+        if movimentos is not None:
+            secoes.append(f"Maiores movimentações ({principal}):\n" + _csv(movimentos))
+
+        if coluna_grupo is not None:
+            subtotais = df.groupby(coluna_grupo, observed=True)[numericas].sum()
+            subtotais = subtotais.reindex(subtotais[principal].abs().sort_values(ascending=False).index)
+            secoes.append(f"Subtotais por {coluna_grupo}:\n" + _csv(subtotais.reset_index()))
+
+    secoes_omitidas = 0
+    while len(secoes) > 1 and estimar_tokens("\n\n".join(secoes), model) > orcamento_tokens:
+        secoes.pop()
+        secoes_omitidas += 1
+    resumo = "\n\n".join(secoes)
+
+    # Detalhe: linhas mais materiais primeiro, quantas couberem no orçamento restante
+    detalhe = df
+    if principal is not None:
+        detalhe = df.reindex(df[principal].abs().sort_values(ascending=False).index)
+    linhas = _csv(detalhe).splitlines()
+    cabecalho, linhas = linhas[0], linhas[1:]
+
+    def montar(n):
+        texto = resumo
+        if n > 0:
+            texto += "\n\nDetalhe:\n" + "\n".join([cabecalho] + linhas[:n])
+        if n < len(linhas):
+            texto += f"\n[{len(linhas) - n} linhas de detalhe omitidas; valores já incluídos nos totais]"
+        return texto
+
+    # Busca binária pelo maior número de linhas que cabe (cada linha tem ao menos 1 token)
+    baixo, alto = 0, min(len(linhas), orcamento_tokens)
+    while baixo < alto:
+        meio = (baixo + alto + 1) // 2
+        if estimar_tokens(montar(meio), model) <= orcamento_tokens:
+            baixo = meio
+        else:
+            alto = meio - 1
+
+    texto = montar(baixo)
+
+    return {
+        "texto": texto,
+        "tokens": estimar_tokens(texto, model),
+        "linhas_detalhe": baixo,
+        "secoes_omitidas": secoes_omitidas,
+    }
+
+
+def _maiores_movimentos(df, principal, coluna_grupo, coluna_periodo, top_n):
+    # Compara os dois últimos períodos por conta. Sem período, as linhas de maior
+    # valor absoluto já abrem a seção de detalhe, então não há o que repetir aqui.
+    if principal is None or coluna_periodo is None:
+        return None
+
+    chave = coluna_grupo
+    if chave is None:
+        numericas = df.select_dtypes("number").columns
+        candidatas = [c for c in df.columns if c != coluna_periodo and c not in numericas]
+        if not candidatas:
+            return None
+        chave = candidatas[0]
+
+    tabela = df.pivot_table(index=chave, columns=coluna_periodo, values=principal, aggfunc="sum", observed=True).sort_index(axis=1)
+    if tabela.shape[1] < 2:
+        return None
+
+    anterior, atual = tabela.columns[-2], tabela.columns[-1]
+    variacao = (tabela[atual] - tabela[anterior]).dropna()
+    maiores = variacao.abs().nlargest(top_n).index
+    return pd.DataFrame({
+        chave: maiores,
+        str(anterior): tabela.loc[maiores, anterior].values,
+        str(atual): tabela.loc[maiores, atual].values,
+        "variacao": variacao.loc[maiores].values,
+    })
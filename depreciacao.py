@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+from moeda import para_centavos, para_reais, dividir_arredondando, arredondar
+
+METODOS = {
+    "linear": 0,
+    "saldo_decrescente": 1,
+    "unidades_produzidas": 2,
+}
+
+# Colunas aceitas no cadastro de ativos e seus valores padrão
+COLUNAS_ATIVOS = {
+    "custo": 0.0,
+    "valor_residual": 0.0,
+    "vida_util_meses": 12,
+    "metodo": "linear",
+    "fator_saldo_decrescente": 2.0,
+    "unidades_totais": 0.0,
+    "unidades_mes": 0.0,
+}
+
+
+def preparar_ativos(cadastro):
+    """Normaliza o cadastro de ativos (DataFrame) para o motor de depreciação.
+
+    Além das colunas de COLUNAS_ATIVOS, aceita `data_aquisicao` (a depreciação
+    começa no mês da aquisição) ou `vida_util_anos` no lugar de `vida_util_meses`.
+    """
+    ativos = cadastro.copy()
+    if "vida_util_meses" not in ativos.columns and "vida_util_anos" in ativos.columns:
+        ativos["vida_util_meses"] = ativos["vida_util_anos"] * 12
+    for coluna, padrao in COLUNAS_ATIVOS.items():
+        if coluna not in ativos.columns:
+            ativos[coluna] = padrao
+        if isinstance(ativos[coluna].dtype, pd.CategoricalDtype):
+            ativos[coluna] = ativos[coluna].astype(object)
+        ativos[coluna] = ativos[coluna].fillna(padrao)
+
+    metodos_invalidos = set(ativos["metodo"].unique()) - set(METODOS)
+    if metodos_invalidos:
+        raise ValueError(f"Métodos de depreciação desconhecidos: {', '.join(map(str, metodos_invalidos))}")
+    ativos["codigo_metodo"] = ativos["metodo"].map(METODOS).astype(np.int8)
+
+    if "data_aquisicao" in ativos.columns:
+        datas = pd.to_datetime(ativos["data_aquisicao"])
+        # Mês absoluto (ano * 12 + mês) para comparar com as competências
+        ativos["mes_inicio"] = (datas.dt.year * 12 + datas.dt.month - 1).astype(np.int32)
+    return ativos
+
+
+def _coluna(ativos, nome, ndim):
+    # Em cálculos ativos x meses, as colunas do cadastro viram vetores coluna (n, 1)
+    valores = ativos[nome].to_numpy(dtype=float)
+    return valores[:, None] if ndim == 2 else valores
+
+
+def _acumulada(ativos, meses_decorridos):
+    """Depreciação acumulada, em centavos (int64), após `meses_decorridos` meses de uso.
+
+    `meses_decorridos` pode ter formato (n_ativos,) ou (n_ativos, n_meses); os
+    três métodos são expressos em forma fechada, sem laço por ativo ou por mês.
+    A depreciação de cada mês é a diferença entre acumuladas já arredondadas,
+    então a soma dos meses fecha exatamente no valor depreciável.
+    """
+    k = np.maximum(np.asarray(meses_decorridos), 0).astype(np.int64)
+    coluna = lambda nome: _coluna(ativos, nome, k.ndim)
+
+    custo = para_centavos(coluna("custo"))
+    depreciavel = np.maximum(custo - para_centavos(coluna("valor_residual")), 0)
+    vida = np.maximum(np.rint(coluna("vida_util_meses")).astype(np.int64), 1)
+    metodo = coluna("codigo_metodo")
+
+    linear = dividir_arredondando(depreciavel * np.minimum(k, vida), vida)
+
+    # Saldo decrescente: valor contábil custo * (1 - taxa)^k, limitado ao residual e zerado no fim da vida útil
+    taxa = np.minimum(coluna("fator_saldo_decrescente") / vida, 1)
+    decrescente = np.where(k >= vida, depreciavel, np.minimum(arredondar(custo * (1 - (1 - taxa) ** k)), depreciavel))
+
+    unidades_totais = coluna("unidades_totais")
+    proporcao_unidades = np.divide(coluna("unidades_mes") * k, unidades_totais,
+                                   out=np.zeros(np.broadcast(k, unidades_totais).shape), where=unidades_totais > 0)
+    unidades = arredondar(depreciavel * np.minimum(proporcao_unidades, 1))
+
+    return np.select([metodo == 0, metodo == 1], [linear, decrescente], unidades)
+
+
+def acumulada_apos_meses(ativos, meses):
+    """Matriz (ativos x meses) da depreciação acumulada após cada quantidade de meses de uso."""
+    meses = np.atleast_1d(meses)
+    return para_reais(_acumulada(ativos, np.broadcast_to(meses[None, :], (len(ativos), len(meses)))))
+
+
+def _mes_absoluto(competencia):
+    periodo = pd.Period(competencia, freq="M")
+    return periodo.year * 12 + periodo.month - 1
+
+
+def _meses_decorridos(ativos, meses_absolutos):
+    # Competência do mês de aquisição já conta como primeiro mês de uso
+    if "mes_inicio" not in ativos.columns:
+        raise ValueError("O cadastro de ativos precisa da coluna data_aquisicao")
+    inicio = ativos["mes_inicio"].to_numpy()[:, None]
+    return np.asarray(meses_absolutos)[None, :] - inicio + 1
+
+
+def depreciacao_no_periodo(ativos, inicio, fim):
+    """Depreciação de cada ativo entre as competências `inicio` e `fim` (inclusive) e valor contábil final."""
+    meses = np.array([_mes_absoluto(inicio) - 1, _mes_absoluto(fim)])
+    acumulada = _acumulada(ativos, _meses_decorridos(ativos, meses))
+    resultado = pd.DataFrame(index=ativos.index)
+    resultado["depreciacao_periodo"] = para_reais(acumulada[:, 1] - acumulada[:, 0])
+    resultado["depreciacao_acumulada"] = para_reais(acumulada[:, 1])
+    resultado["valor_contabil"] = para_reais(para_centavos(ativos["custo"].to_numpy(dtype=float)) - acumulada[:, 1])
+    return resultado
+
+
+def totais_mensais(ativos, inicio, fim, coluna_grupo=None, tamanho_bloco=10000):
+    """Depreciação total por competência (e por grupo, se informado).
+
+    Os ativos são processados em blocos de `tamanho_bloco` linhas, de modo que a
+    matriz ativos x meses nunca é materializada inteira.
+    """
+    competencias = pd.period_range(inicio, fim, freq="M")
+    # Um mês a mais no início para obter a depreciação do primeiro mês por diferença
+    meses = np.arange(_mes_absoluto(inicio) - 1, _mes_absoluto(fim) + 1)
+
+    grupos = None
+    if coluna_grupo is not None:
+        grupos, nomes_grupos = pd.factorize(ativos[coluna_grupo])
+        totais = np.zeros((len(nomes_grupos), len(competencias)), dtype=np.int64)
+    else:
+        totais = np.zeros(len(competencias), dtype=np.int64)
+
+    for inicio_bloco in range(0, len(ativos), tamanho_bloco):
+        bloco = ativos.iloc[inicio_bloco:inicio_bloco + tamanho_bloco]
+        mensal = np.diff(_acumulada(bloco, _meses_decorridos(bloco, meses)), axis=1)
+        if grupos is None:
+            totais += mensal.sum(axis=0)
+        else:
+            np.add.at(totais, grupos[inicio_bloco:inicio_bloco + tamanho_bloco], mensal)
+
+    if grupos is None:
+        return pd.Series(para_reais(totais), index=competencias.astype(str), name="depreciacao")
+    return pd.DataFrame(para_reais(totais.T), index=competencias.astype(str), columns=nomes_grupos)
+
+
+def cronograma(ativos, inicio, fim):
+    """Expande o cronograma mensal (ativos x competências) sob demanda.
+
+    Use apenas para os ativos selecionados; para o cadastro inteiro prefira
+    `totais_mensais` ou `depreciacao_no_periodo`.
+    """
+    competencias = pd.period_range(inicio, fim, freq="M")
+    meses = np.arange(_mes_absoluto(inicio) - 1, _mes_absoluto(fim) + 1)
+    mensal = np.diff(_acumulada(ativos, _meses_decorridos(ativos, meses)), axis=1)
+    return pd.DataFrame(para_reais(mensal), index=ativos.index, columns=competencias.astype(str))
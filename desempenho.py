@@ -0,0 +1,210 @@
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+# Configuração padrão da instrumentação (pode ser sobrescrita pelo .env)
+ARQUIVO_PADRAO = os.getenv('DESEMPENHO_ARQUIVO', os.path.join('.cache', 'desempenho.jsonl'))
+TAMANHO_MAXIMO_ARQUIVO = int(os.getenv('DESEMPENHO_ARQUIVO_MB', 50)) * 1024 * 1024
+PORTA_PROMETHEUS = int(os.getenv('DESEMPENHO_PORTA_PROMETHEUS', 0))
+# /metrics não tem autenticação: por padrão só aceita conexões da própria máquina
+ENDERECO_PROMETHEUS = os.getenv('DESEMPENHO_ENDERECO_PROMETHEUS', '127.0.0.1')
+# Percentis calculados sobre as amostras mais recentes de cada série
+AMOSTRAS_POR_SERIE = 2000
+
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Atributos numéricos somados por série (e exportados como contadores)
+CONTADORES = ("linhas", "tokens_prompt", "tokens_resposta")
+
+
+class Span:
+    """Mede um trecho com `with`; atributos (linhas, tokens...) podem ser definidos durante o trecho.
+
+    Exceções marcam o span com erro e continuam subindo. A duração fica em `duracao` ao final.
+    """
+
+    __slots__ = ("registro", "nome", "rotulo", "atributos", "inicio", "duracao")
+
+    def __init__(self, registro, nome, rotulo, atributos):
+        self.registro = registro
+        self.nome = nome
+        self.rotulo = rotulo
+        self.atributos = atributos
+        self.inicio = time.perf_counter()
+        self.duracao = None
+
+    def __setitem__(self, chave, valor):
+        self.atributos[chave] = valor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, rastro):
+        if tipo is not None:
+            self.atributos["erro"] = tipo.__name__
+        self.encerrar()
+        return False
+
+    def encerrar(self):
+        if self.duracao is None:
+            self.duracao = time.perf_counter() - self.inicio
+            self.registro.registrar(self.nome, self.rotulo, self.duracao, **self.atributos)
+
+
+class Registro:
+    """Métricas do processo: histogramas e amostras recentes por (span, rótulo).
+
+    No caminho quente só há uma soma sob trava e um `put` em fila; a gravação do JSONL
+    é feita por uma thread própria e os percentis só são calculados quando consultados.
+    """
+
+    def __init__(self, arquivo=ARQUIVO_PADRAO, tamanho_maximo_arquivo=TAMANHO_MAXIMO_ARQUIVO):
+        self.arquivo = arquivo
+        self.tamanho_maximo_arquivo = tamanho_maximo_arquivo
+        self._series = {}
+        self._trava = threading.Lock()
+        self._fila = None
+
+    def span(self, nome, rotulo="", **atributos):
+        return Span(self, nome, rotulo, atributos)
+
+    def _nova_serie(self):
+        return {"amostras": deque(maxlen=AMOSTRAS_POR_SERIE), "buckets": [0] * (len(LIMITES_HISTOGRAMA) + 1),
+                "contagem": 0, "soma": 0.0, "erros": 0, "cache": 0, **{c: 0 for c in CONTADORES}}
+
+    def registrar(self, nome, rotulo, duracao, erro=None, **atributos):
+        """Registra um trecho já medido (duração em segundos)."""
+        with self._trava:
+            serie = self._series.get((nome, rotulo))
+            if serie is None:
+                serie = self._series[(nome, rotulo)] = self._nova_serie()
+            serie["amostras"].append(duracao)
+            serie["buckets"][bisect.bisect_left(LIMITES_HISTOGRAMA, duracao)] += 1
+            serie["contagem"] += 1
+            serie["soma"] += duracao
+            serie["erros"] += erro is not None
+            serie["cache"] += bool(atributos.get("cache"))
+            for contador in CONTADORES:
+                serie[contador] += atributos.get(contador) or 0
+        if self.arquivo:
+            self._gravar({"instante": time.time(), "span": nome, "rotulo": rotulo, "duracao": duracao,
+                          "erro": erro, **atributos})
+
+    def _gravar(self, evento):
+        if self._fila is None:
+            with self._trava:
+                if self._fila is None:
+                    self._fila = queue.SimpleQueue()
+                    threading.Thread(target=self._gravador, name="desempenho-jsonl", daemon=True).start()
+        self._fila.put(evento)
+
+    def _gravador(self):
+        diretorio = os.path.dirname(self.arquivo)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        while True:
+            eventos = [self._fila.get()]
+            # Grava em lote o que chegou enquanto esperava
+            while True:
+                try:
+                    eventos.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if os.path.exists(self.arquivo) and os.path.getsize(self.arquivo) > self.tamanho_maximo_arquivo:
+                    os.replace(self.arquivo, self.arquivo + ".1")
+                with open(self.arquivo, "a", encoding="utf-8") as saida:
+                    for evento in eventos:
+                        saida.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+            except OSError:
+                # Falha de disco não pode derrubar a aplicação; os eventos do lote são descartados
+                pass
+
+    def resumo(self):
+        """Uma linha por (span, rótulo): chamadas, p50/p95/máximo em ms, erros, acertos de cache, linhas e tokens."""
+        with self._trava:
+            copias = [(nome, rotulo, list(serie["amostras"]), {**serie})
+                      for (nome, rotulo), serie in self._series.items()]
+        linhas = []
+        for nome, rotulo, amostras, serie in copias:
+            p50, p95 = np.percentile(amostras, [50, 95]) * 1000
+            linhas.append({"span": nome, "rotulo": rotulo, "chamadas": serie["contagem"], "p50_ms": p50,
+                           "p95_ms": p95, "maximo_ms": max(amostras) * 1000, "erros": serie["erros"],
+                           "cache": serie["cache"], **{c: serie[c] for c in CONTADORES}})
+        colunas = ["span", "rotulo", "chamadas", "p50_ms", "p95_ms", "maximo_ms", "erros", "cache", *CONTADORES]
+        return pd.DataFrame(linhas, columns=colunas).sort_values(["span", "p95_ms"], ascending=[True, False])
+
+    def prometheus(self):
+        """Métricas no formato texto do Prometheus."""
+        with self._trava:
+            series = [(nome, rotulo, {**serie, "buckets": list(serie["buckets"])})
+                      for (nome, rotulo), serie in sorted(self._series.items())]
+        linhas = ["# HELP assistente_duracao_segundos Duração de telas, cálculos e chamadas à IA",
+                  "# TYPE assistente_duracao_segundos histogram"]
+        for nome, rotulo, serie in series:
+            rotulos = f'span="{_escapar(nome)}",rotulo="{_escapar(rotulo)}"'
+            acumulado = 0
+            for limite, quantidade in zip(LIMITES_HISTOGRAMA + ("+Inf",), serie["buckets"]):
+                acumulado += quantidade
+                linhas.append(f'assistente_duracao_segundos_bucket{{{rotulos},le="{limite}"}} {acumulado}')
+            linhas.append(f"assistente_duracao_segundos_sum{{{rotulos}}} {serie['soma']}")
+            linhas.append(f"assistente_duracao_segundos_count{{{rotulos}}} {serie['contagem']}")
+        for metrica, campo, ajuda in [("assistente_erros_total", "erros", "Trechos que terminaram com erro"),
+                                      ("assistente_cache_hits_total", "cache", "Respostas servidas pelo cache"),
+                                      ("assistente_linhas_total", "linhas", "Linhas processadas"),
+                                      ("assistente_tokens_prompt_total", "tokens_prompt", "Tokens enviados à IA"),
+                                      ("assistente_tokens_resposta_total", "tokens_resposta", "Tokens gerados pela IA")]:
+            linhas += [f"# HELP {metrica} {ajuda}", f"# TYPE {metrica} counter"]
+            linhas += [f'{metrica}{{span="{_escapar(nome)}",rotulo="{_escapar(rotulo)}"}} {serie[campo]}'
+                       for nome, rotulo, serie in series]
+        return "\n".join(linhas) + "\n"
+
+    def limpar(self):
+        with self._trava:
+            self._series.clear()
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def iniciar_servidor(registro, porta=PORTA_PROMETHEUS, endereco=ENDERECO_PROMETHEUS):
+    """Serve `/metrics` (formato Prometheus) em uma thread própria; devolve o servidor."""
+
+    class Manipulador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = registro.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((endereco, porta), Manipulador)
+    threading.Thread(target=servidor.serve_forever, name="desempenho-prometheus", daemon=True).start()
+    return servidor
+
+
+# Registro único do processo, usado pela interface, pelas chamadas à IA e pelas tarefas em segundo plano
+REGISTRO = Registro()
+
+
+def span(nome, rotulo="", **atributos):
+    return REGISTRO.span(nome, rotulo, **atributos)
+
+
+def registrar(nome, rotulo, duracao, erro=None, **atributos):
+    REGISTRO.registrar(nome, rotulo, duracao, erro, **atributos)
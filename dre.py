@@ -0,0 +1,318 @@
+import numpy as np
+import pandas as pd
+
+from classificacao import normalizar_texto
+from indicadores import dividir
+from moeda import para_centavos, para_reais
+
+# Linhas de entrada da DRE, no sinal natural (receitas e despesas positivas)
+LINHAS_ENTRADA = ["receita_bruta", "deducoes", "custo_produtos", "despesas_vendas", "despesas_administrativas",
+                  "outras_despesas_operacionais", "depreciacao_amortizacao", "receitas_financeiras",
+                  "despesas_financeiras", "impostos_lucro"]
+# Linhas de natureza credora: com `sinal_contabil` (débito positivo, como no razão) trocam de sinal
+LINHAS_CREDORAS = ["receita_bruta", "receitas_financeiras"]
+
+# Cascata: subtotal -> (subtotal anterior, linhas somadas ou subtraídas a partir dele)
+CASCATA = {
+    "receita_liquida": (None, {"receita_bruta": 1, "deducoes": -1}),
+    "lucro_bruto": ("receita_liquida", {"custo_produtos": -1}),
+    "ebitda": ("lucro_bruto", {"despesas_vendas": -1, "despesas_administrativas": -1,
+                               "outras_despesas_operacionais": -1}),
+    "lucro_operacional": ("ebitda", {"depreciacao_amortizacao": -1}),
+    "resultado_antes_impostos": ("lucro_operacional", {"receitas_financeiras": 1, "despesas_financeiras": -1}),
+    "lucro_liquido": ("resultado_antes_impostos", {"impostos_lucro": -1}),
+}
+# Ordem de exibição: cada subtotal logo depois das linhas que o compõem
+LINHAS_DRE = ["receita_bruta", "deducoes", "receita_liquida", "custo_produtos", "lucro_bruto", "despesas_vendas",
+              "despesas_administrativas", "outras_despesas_operacionais", "ebitda", "depreciacao_amortizacao",
+              "lucro_operacional", "receitas_financeiras", "despesas_financeiras", "resultado_antes_impostos",
+              "impostos_lucro", "lucro_liquido"]
+NOMES_LINHAS = {
+    "receita_bruta": "Receita Bruta", "deducoes": "(-) Deduções", "receita_liquida": "= Receita Líquida",
+    "custo_produtos": "(-) Custo dos Produtos/Serviços", "lucro_bruto": "= Lucro Bruto",
+    "despesas_vendas": "(-) Despesas com Vendas", "despesas_administrativas": "(-) Despesas Administrativas",
+    "outras_despesas_operacionais": "(-) Outras Despesas Operacionais", "ebitda": "= EBITDA",
+    "depreciacao_amortizacao": "(-) Depreciação e Amortização", "lucro_operacional": "= Lucro Operacional (EBIT)",
+    "receitas_financeiras": "(+) Receitas Financeiras", "despesas_financeiras": "(-) Despesas Financeiras",
+    "resultado_antes_impostos": "= Resultado antes do IR/CSLL", "impostos_lucro": "(-) IR e CSLL",
+    "lucro_liquido": "= Lucro Líquido",
+}
+SUBTOTAIS = list(CASCATA)
+
+# Conta -> linha pelo nome (sem acento, minúsculas); vale a primeira regra que casar,
+# por isso as mais específicas vêm antes ("receitas financeiras" antes de "receita")
+REGRAS_CONTAS = [
+    ("receitas_financeiras", ["receitas financeiras", "receita financeira", "rendimentos de aplicacoes",
+                              "juros ativos", "descontos obtidos"]),
+    ("despesas_financeiras", ["despesas financeiras", "despesa financeira", "juros passivos", "tarifas bancarias",
+                              "descontos concedidos"]),
+    ("impostos_lucro", ["irpj", "csll", "imposto de renda", "contribuicao social sobre lucro"]),
+    ("depreciacao_amortizacao", ["depreciacao", "amortizacao", "exaustao"]),
+    ("deducoes", ["deducoes", "devolucoes", "abatimentos", "impostos sobre vendas", "impostos incidentes"]),
+    ("custo_produtos", ["custo"]),
+    ("despesas_vendas", ["despesas com vendas", "despesas comerciais", "despesas de vendas", "comissoes"]),
+    ("despesas_administrativas", ["despesas administrativas", "despesas gerais"]),
+    ("receita_bruta", ["receita", "faturamento", "vendas"]),
+    ("outras_despesas_operacionais", ["despesa", "outras"]),
+]
+
+# Períodos por ano de cada frequência: janela do LTM e distância da comparação anual
+PERIODOS_POR_ANO = {"M": 12, "Q": 4, "Y": 1}
+
+
+def _matriz_cascata():
+    # Cada linha da DRE como combinação (+1/-1) das linhas de entrada: a cascata inteira é um produto de matrizes
+    combinacoes = {linha: {linha: 1} for linha in LINHAS_ENTRADA}
+    for subtotal, (anterior, parcelas) in CASCATA.items():
+        combinacao = dict(combinacoes[anterior]) if anterior else {}
+        for linha, sinal in parcelas.items():
+            combinacao[linha] = combinacao.get(linha, 0) + sinal
+        combinacoes[subtotal] = combinacao
+    matriz = np.zeros((len(LINHAS_DRE), len(LINHAS_ENTRADA)), dtype=np.int64)
+    for i, linha in enumerate(LINHAS_DRE):
+        for entrada, sinal in combinacoes[linha].items():
+            matriz[i, LINHAS_ENTRADA.index(entrada)] = sinal
+    return matriz
+
+
+MATRIZ_CASCATA = _matriz_cascata()
+RECEITA_LIQUIDA = LINHAS_DRE.index("receita_liquida")
+
+
+def mapear_contas(contas, regras=REGRAS_CONTAS):
+    """Linha da DRE de cada nome de conta (None quando nenhuma regra casa)."""
+    termos = [(linha, [" " + " ".join(normalizar_texto(termo)) + " " for termo in lista]) for linha, lista in regras]
+    mapeamento = {}
+    for conta in pd.unique(pd.Series(contas, dtype=str)):
+        if conta in LINHAS_ENTRADA:
+            # Conta já com o nome da linha (ex.: receita_bruta), como nos formulários e no histórico
+            mapeamento[conta] = conta
+            continue
+        nome = " " + " ".join(normalizar_texto(conta)) + " "
+        mapeamento[conta] = next((linha for linha, lista in termos if any(t in nome for t in lista)), None)
+    return mapeamento
+
+
+def _frequencia(periodo):
+    # "M", "Q-DEC", "Y-DEC" (ou "A-DEC" em versões antigas do pandas) -> "M", "Q", "Y"
+    letra = "Y" if periodo.freqstr[0] == "A" else periodo.freqstr[0]
+    return letra if letra in PERIODOS_POR_ANO else periodo.freqstr
+
+
+class DREMultiperiodo:
+    """DRE de várias entidades e períodos: cascata, análises vertical e horizontal e LTM.
+
+    Os valores ficam em arrays entidade x período x linha, em centavos. Acrescentar um
+    período calcula só a coluna nova (cascata, vertical, variações contra o período
+    anterior e o mesmo período do ano anterior) e o LTM dela a partir da janela já
+    somada; lançamentos de períodos existentes recalculam só as colunas afetadas.
+    """
+
+    def __init__(self, lancamentos=None, mapeamento=None, sinal_contabil=False):
+        # mapeamento: conta -> linha da DRE; sem ele (e sem coluna `linha`), as contas são mapeadas pelo nome
+        self.mapeamento = mapeamento
+        self.sinal_contabil = sinal_contabil
+        self.frequencia = None
+        self.contas_sem_linha = set()
+        self._zerar()
+        if lancamentos is not None:
+            self.adicionar(lancamentos)
+
+    def _zerar(self):
+        self.entidades = []
+        self.periodos = []
+        self._indice_entidades = {}
+        self._entradas = np.zeros((0, 0, len(LINHAS_ENTRADA)), dtype=np.int64)
+        self._valores = np.zeros((0, 0, len(LINHAS_DRE)), dtype=np.int64)
+        self._ltm = np.zeros((0, 0, len(LINHAS_DRE)), dtype=np.int64)
+        self._vertical = np.zeros((0, 0, len(LINHAS_DRE)))
+        self._horizontal = np.zeros((0, 0, len(LINHAS_DRE)))
+        self._horizontal_anual = np.zeros((0, 0, len(LINHAS_DRE)))
+
+    @property
+    def janela(self):
+        return PERIODOS_POR_ANO.get(self.frequencia, 1)
+
+    def _linhas(self, lancamentos):
+        # Linha da DRE de cada lançamento: coluna `linha`, mapeamento informado ou nome da conta
+        if "linha" in lancamentos.columns:
+            return lancamentos["linha"]
+        mapeamento = self.mapeamento if self.mapeamento is not None else mapear_contas(lancamentos["conta"])
+        return lancamentos["conta"].astype(str).map(mapeamento)
+
+    def _preparar(self, lancamentos, coluna_entidade, coluna_periodo):
+        linhas = self._linhas(lancamentos)
+        validos = linhas.isin(LINHAS_ENTRADA).to_numpy()
+        if "conta" in lancamentos.columns:
+            self.contas_sem_linha.update(lancamentos.loc[~validos, "conta"].astype(str).unique())
+        dados = pd.DataFrame({
+            "entidade": lancamentos[coluna_entidade].astype(str).to_numpy()[validos],
+            "periodo": lancamentos[coluna_periodo].astype(str).to_numpy()[validos],
+            "linha": linhas.to_numpy()[validos],
+            "valor": para_centavos(lancamentos["valor"].fillna(0)).to_numpy()[validos],
+        })
+        if self.sinal_contabil:
+            dados["valor"] = np.where(dados["linha"].isin(LINHAS_CREDORAS), -dados["valor"], dados["valor"])
+        return dados.groupby(["entidade", "periodo", "linha"], sort=False)["valor"].sum().reset_index()
+
+    def _redimensionar(self, entidades, periodos):
+        # Períodos crescem com folga (dobrando) para que acrescentar um mês não copie o histórico toda vez.
+        # Entidades novas entram com zero nos períodos anteriores; sem base de comparação, variação NaN
+        capacidade = max(periodos, 2 * self._entradas.shape[1]) if periodos > self._entradas.shape[1] \
+            else self._entradas.shape[1]
+
+        def crescer(array, preenchimento):
+            novo = np.full((entidades, capacidade, array.shape[2]), preenchimento, dtype=array.dtype)
+            novo[:array.shape[0], :array.shape[1]] = array
+            return novo
+        self._entradas = crescer(self._entradas, 0)
+        self._valores = crescer(self._valores, 0)
+        self._ltm = crescer(self._ltm, 0)
+        self._vertical = crescer(self._vertical, 0.0)
+        self._horizontal = crescer(self._horizontal, np.nan)
+        self._horizontal_anual = crescer(self._horizontal_anual, np.nan)
+
+    def adicionar(self, lancamentos, coluna_entidade="entidade", coluna_periodo="periodo"):
+        """Soma lançamentos (entidade, período, conta ou linha, valor); devolve os períodos recalculados.
+
+        Períodos novos depois do último são acrescentados (meses intermediários sem
+        lançamentos contam como zero); um período anterior ao primeiro refaz tudo.
+        """
+        return self._incorporar(self._preparar(lancamentos, coluna_entidade, coluna_periodo))
+
+    def _incorporar(self, dados):
+        if dados.empty:
+            return []
+        codigos_periodo, textos_periodo = pd.factorize(dados["periodo"])
+        periodos_dados = [pd.Period(texto) for texto in textos_periodo]
+        frequencias = {_frequencia(periodo) for periodo in periodos_dados}
+        if self.frequencia is None and len(frequencias) == 1:
+            self.frequencia = next(iter(frequencias))
+        elif frequencias != {self.frequencia}:
+            raise ValueError(f"Períodos com frequências diferentes: {sorted(frequencias | {self.frequencia} - {None})}")
+
+        if self.periodos and min(periodos_dados) < self.periodos[0]:
+            # Histórico anterior ao já carregado: recalcula tudo com as entradas acumuladas
+            anteriores = self._entradas_longas()
+            self._zerar()
+            self._incorporar(pd.concat([anteriores, dados], ignore_index=True))
+            return [str(periodo) for periodo in self.periodos]
+
+        primeiro_novo = len(self.periodos)
+        inicio = self.periodos[0] if self.periodos else min(periodos_dados)
+        fim = max([*periodos_dados, *self.periodos])
+        self.periodos = list(pd.period_range(inicio, fim, freq=inicio.freq))
+        for entidade in dados["entidade"].unique():
+            if entidade not in self._indice_entidades:
+                self._indice_entidades[entidade] = len(self.entidades)
+                self.entidades.append(entidade)
+        if len(self.entidades) > self._entradas.shape[0] or len(self.periodos) > self._entradas.shape[1]:
+            self._redimensionar(len(self.entidades), len(self.periodos))
+
+        # Índices vetorizados (uma busca por valor distinto, não por lançamento)
+        i_entidade = pd.Index(self.entidades).get_indexer(dados["entidade"])
+        i_periodo = np.array([periodo.ordinal - self.periodos[0].ordinal for periodo in periodos_dados])[codigos_periodo]
+        i_linha = pd.Index(LINHAS_ENTRADA).get_indexer(dados["linha"])
+        np.add.at(self._entradas, (i_entidade, i_periodo, i_linha), dados["valor"].to_numpy())
+
+        afetados = np.unique(np.concatenate([i_periodo, np.arange(primeiro_novo, len(self.periodos))]))
+        self._recalcular(afetados, primeiro_novo)
+        return [str(self.periodos[i]) for i in afetados]
+
+    def _entradas_longas(self):
+        # Entradas acumuladas no formato de `_preparar` (centavos, sinal natural)
+        entidades, periodos, linhas = np.nonzero(self._entradas[:len(self.entidades), :len(self.periodos)])
+        return pd.DataFrame({
+            "entidade": np.asarray(self.entidades, dtype=object)[entidades],
+            "periodo": [str(self.periodos[i]) for i in periodos],
+            "linha": np.asarray(LINHAS_ENTRADA, dtype=object)[linhas],
+            "valor": self._entradas[entidades, periodos, linhas],
+        })
+
+    def _recalcular(self, afetados, primeiro_novo):
+        janela = self.janela
+        antigos = afetados[afetados < primeiro_novo]
+        novos = afetados[afetados >= primeiro_novo]
+
+        # Cascata das colunas afetadas: (entidades x colunas x entradas) @ (entradas x linhas da DRE)
+        anteriores = self._valores[:, antigos].copy()
+        self._valores[:, afetados] = self._entradas[:, afetados] @ MATRIZ_CASCATA.T
+
+        # LTM de colunas já existentes: a diferença entra nas janelas que contêm a coluna
+        for posicao, coluna in enumerate(antigos):
+            diferenca = self._valores[:, coluna] - anteriores[:, posicao]
+            self._ltm[:, coluna:min(coluna + janela, primeiro_novo)] += diferenca[:, None]
+        # LTM das colunas novas: soma acumulada só da janela que termina nelas
+        if len(novos):
+            inicio = max(novos[0] - janela + 1, 0)
+            acumulado = np.concatenate([np.zeros_like(self._valores[:, :1]),
+                                        np.cumsum(self._valores[:, inicio:novos[-1] + 1], axis=1)], axis=1)
+            posicoes = novos - inicio + 1
+            self._ltm[:, novos] = acumulado[:, posicoes] - acumulado[:, np.maximum(posicoes - janela, 0)]
+
+        # Vertical: cada linha sobre a receita líquida do período
+        self._vertical[:, afetados] = dividir(self._valores[:, afetados] * 100,
+                                              self._valores[:, afetados, RECEITA_LIQUIDA][:, :, None])
+        # Horizontal: a coluna afetada e a seguinte (que a usa como base); anual: a coluna e a de um ano depois
+        for destino, distancia in [(self._horizontal, 1), (self._horizontal_anual, janela)]:
+            colunas = np.unique(np.concatenate([afetados, afetados + distancia]))
+            colunas = colunas[(colunas >= distancia) & (colunas < len(self.periodos))]
+            atual, base = self._valores[:, colunas], self._valores[:, colunas - distancia]
+            destino[:, colunas] = dividir((atual - base) * 100, np.abs(base), np.nan)
+
+    def _fatia(self, array, entidade):
+        return array[self._indice_entidades[entidade], :len(self.periodos)]
+
+    def _tabela(self, valores, linhas=None, reais=False):
+        tabela = pd.DataFrame(para_reais(valores.T) if reais else valores.T, index=LINHAS_DRE,
+                              columns=[str(p) for p in self.periodos])
+        return tabela.loc[linhas] if linhas is not None else tabela
+
+    def demonstrativo(self, entidade, linhas=None):
+        """DRE da entidade em R$: uma linha da cascata por linha, um período por coluna."""
+        return self._tabela(self._fatia(self._valores, entidade), linhas, reais=True)
+
+    def vertical(self, entidade, linhas=None):
+        """Cada linha em % da receita líquida do período."""
+        return self._tabela(self._fatia(self._vertical, entidade), linhas)
+
+    def horizontal(self, entidade, linhas=None, anual=False):
+        """Variação % contra o período anterior (ou contra o mesmo período do ano anterior, com `anual`)."""
+        return self._tabela(self._fatia(self._horizontal_anual if anual else self._horizontal, entidade), linhas)
+
+    def ltm(self, entidade, linhas=None):
+        """Soma dos últimos 12 meses (4 trimestres, 1 ano) em R$; só períodos com a janela completa."""
+        tabela = self._tabela(self._fatia(self._ltm, entidade), linhas, reais=True)
+        return tabela.iloc[:, self.janela - 1:]
+
+    def por_linha(self, linha, analise="valor"):
+        """Uma linha da DRE para todas as entidades (entidade x período): valor, vertical, horizontal ou ltm."""
+        arrays = {"valor": self._valores, "vertical": self._vertical, "horizontal": self._horizontal,
+                  "horizontal_anual": self._horizontal_anual, "ltm": self._ltm}
+        valores = arrays[analise][:len(self.entidades), :len(self.periodos), LINHAS_DRE.index(linha)]
+        if analise in ("valor", "ltm"):
+            valores = para_reais(valores)
+        return pd.DataFrame(valores, index=pd.Index(self.entidades, name="entidade"),
+                            columns=[str(p) for p in self.periodos])
+
+    def resumo(self, periodo=None):
+        """Uma linha por entidade no período (padrão: o último): subtotais, margens, variações e LTM."""
+        coluna = len(self.periodos) - 1 if periodo is None else self.periodos.index(pd.Period(periodo))
+        indices = [LINHAS_DRE.index(linha) for linha in SUBTOTAIS]
+        entidades = len(self.entidades)
+        partes = [
+            pd.DataFrame(para_reais(self._valores[:entidades, coluna, indices]), columns=SUBTOTAIS),
+            pd.DataFrame(self._vertical[:entidades, coluna, indices[1:]],
+                         columns=[f"margem_{linha}" for linha in SUBTOTAIS[1:]]),
+            pd.DataFrame(self._horizontal[:entidades, coluna, indices], columns=[f"var_{linha}" for linha in SUBTOTAIS]),
+        ]
+        if coluna >= self.janela - 1:
+            partes.append(pd.DataFrame(para_reais(self._ltm[:entidades, coluna, indices]),
+                                       columns=[f"ltm_{linha}" for linha in SUBTOTAIS]))
+        return pd.concat(partes, axis=1).set_axis(pd.Index(self.entidades, name="entidade"))
+
+    def lancamentos(self):
+        """Linhas de entrada acumuladas no formato longo (entidade, período, linha, valor em R$)."""
+        lancamentos = self._entradas_longas()
+        lancamentos["valor"] = para_reais(lancamentos["valor"])
+        return lancamentos
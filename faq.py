@@ -0,0 +1,234 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from classificacao import normalizar_texto
+
+CAMINHO_PADRAO = os.getenv('FAQ_CAMINHO', os.path.join('.cache', 'faq.sqlite3'))
+SIMILARIDADE_MINIMA_PADRAO = float(os.getenv('FAQ_SIMILARIDADE_MINIMA', 0.7))
+
+# Vetorização por hashing: o vocabulário não precisa ser guardado nem reconstruído
+DIMENSOES = 2 ** 20
+PESO_PALAVRA = 1.0
+PESO_TRIGRAMA = 0.3
+
+# Palavras que não distinguem uma pergunta de outra
+PALAVRAS_VAZIAS = {
+    "como", "qual", "quais", "quando", "onde", "porque", "por", "que", "de", "da", "do", "das", "dos", "em", "no",
+    "na", "nos", "nas", "um", "uma", "uns", "umas", "para", "pra", "com", "sem", "se", "ao", "aos", "ou", "os",
+    "as", "me", "eu", "meu", "minha", "voce", "devo", "deve", "posso", "pode", "fazer", "faco", "feito", "sobre",
+    "ser", "ter", "tem", "isso", "esse", "essa", "este", "esta", "duvida", "pergunta",
+}
+
+# Formas equivalentes no vocabulário contábil, reduzidas a um termo canônico
+SINONIMOS = {
+    "lancamento": "contabilizar", "lancar": "contabilizar", "contabilizacao": "contabilizar",
+    "registrar": "contabilizar", "registro": "contabilizar", "escriturar": "contabilizar",
+    "depreciar": "depreciacao", "amortizar": "amortizacao", "provisionar": "provisao",
+    "apurar": "apuracao", "calculo": "calcular", "recolher": "recolhimento",
+}
+
+
+def _radical(token):
+    # Reduz plurais e flexões mais comuns: "depreciacoes" -> "depreciacao", "contabeis" -> "contabel"
+    for sufixo, troca in (("coes", "cao"), ("oes", "ao"), ("ais", "al"), ("eis", "el"), ("ns", "m")):
+        if token.endswith(sufixo) and len(token) > len(sufixo) + 2:
+            return token[:-len(sufixo)] + troca
+    if token.endswith("s") and len(token) > 4:
+        return token[:-1]
+    return token
+
+
+def termos(texto):
+    """Termos normalizados da pergunta: sem acento, sem palavras vazias, plurais e sinônimos reduzidos."""
+    resultado = []
+    for token in normalizar_texto(texto):
+        if token in PALAVRAS_VAZIAS:
+            continue
+        token = _radical(token)
+        resultado.append(SINONIMOS.get(token, token))
+    return resultado
+
+
+def _indice_hash(caracteristica):
+    # crc32 é estável entre processos (hash() do Python não é)
+    return zlib.crc32(caracteristica.encode("utf-8")) & (DIMENSOES - 1)
+
+
+def vetorizar(texto):
+    """Vetor esparso normalizado {dimensão: peso} com palavras e trigramas de caracteres.
+
+    Os trigramas aproximam variações de grafia e flexões que a normalização não cobre.
+    """
+    vetor = defaultdict(float)
+    for termo in termos(texto):
+        vetor[_indice_hash(termo)] += PESO_PALAVRA
+        marcado = f"<{termo}>"
+        for i in range(len(marcado) - 2):
+            vetor[_indice_hash("#" + marcado[i:i + 3])] += PESO_TRIGRAMA
+    norma = math.sqrt(sum(peso * peso for peso in vetor.values())) or 1.0
+    return {dimensao: peso / norma for dimensao, peso in vetor.items()}
+
+
+class IndicePerguntas:
+    """Índice local de perguntas e respostas aprovadas, persistido em SQLite.
+
+    A busca usa similaridade de cosseno sobre vetores por hashing em um índice
+    invertido mantido em memória; aprovações e remoções (deste ou de outros processos)
+    são incorporadas de forma incremental, sem reconstruir o índice.
+    """
+
+    def __init__(self, caminho=CAMINHO_PADRAO):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._trava = threading.Lock()
+        self._indice = defaultdict(list)
+        self._entradas = {}
+        self._ultimo_id = 0
+        self._ultima_remocao = 0
+        self._sincronizado_em = 0.0
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        with self._conexao() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS perguntas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chave TEXT UNIQUE NOT NULL,
+                    pergunta TEXT NOT NULL,
+                    resposta TEXT NOT NULL,
+                    origem TEXT NOT NULL,
+                    usos INTEGER NOT NULL DEFAULT 0,
+                    criado_em REAL NOT NULL,
+                    atualizado_em REAL NOT NULL
+                )
+            """)
+            # Cada remoção deixa um registro, para os outros processos tirarem a pergunta do índice
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS remocoes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pergunta_id INTEGER NOT NULL,
+                    removido_em REAL NOT NULL
+                )
+            """)
+            con.execute("""
+                CREATE TRIGGER IF NOT EXISTS registrar_remocao AFTER DELETE ON perguntas
+                BEGIN
+                    INSERT INTO remocoes (pergunta_id, removido_em) VALUES (old.id, (julianday('now') - 2440587.5) * 86400.0);
+                END
+            """)
+            # Remoções anteriores à carga não interessam: as perguntas removidas já não estão no banco
+            self._ultima_remocao = con.execute("SELECT COALESCE(MAX(id), 0) FROM remocoes").fetchone()[0]
+        self._sincronizar()
+
+    def _conexao(self):
+        # Conexões SQLite não podem ser compartilhadas entre threads
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            self._local.con = con
+        return con
+
+    def _sincronizar(self):
+        # Lê só o que mudou desde a última leitura (inclusive gravações de outros processos);
+        # a margem de 1s relê algumas linhas mas não perde gravações concorrentes
+        with self._trava:
+            agora = time.time()
+            con = self._conexao()
+            linhas = con.execute(
+                "SELECT id, pergunta, resposta, origem FROM perguntas WHERE id > ? OR atualizado_em > ?",
+                (self._ultimo_id, self._sincronizado_em - 1),
+            ).fetchall()
+            # Lidas depois das perguntas: uma pergunta incluída e removida no intervalo sai na mesma passada
+            remocoes = con.execute(
+                "SELECT id, pergunta_id FROM remocoes WHERE id > ? ORDER BY id", (self._ultima_remocao,)
+            ).fetchall()
+            self._sincronizado_em = agora
+            for id_, pergunta, resposta, origem in linhas:
+                if id_ not in self._entradas:
+                    for dimensao, peso in vetorizar(pergunta).items():
+                        self._indice[dimensao].append((id_, peso))
+                self._entradas[id_] = {"id": id_, "pergunta": pergunta, "resposta": resposta, "origem": origem}
+                self._ultimo_id = max(self._ultimo_id, id_)
+            for id_remocao, id_ in remocoes:
+                self._descartar(id_)
+                self._ultima_remocao = id_remocao
+
+    def _descartar(self, id_):
+        # Tira a pergunta só das dimensões do seu próprio vetor (chamado com a trava adquirida)
+        entrada = self._entradas.pop(id_, None)
+        if entrada is None:
+            return
+        for dimensao in vetorizar(entrada["pergunta"]):
+            restantes = [item for item in self._indice.get(dimensao, ()) if item[0] != id_]
+            if restantes:
+                self._indice[dimensao] = restantes
+            else:
+                self._indice.pop(dimensao, None)
+
+    def buscar(self, pergunta, similaridade_minima=SIMILARIDADE_MINIMA_PADRAO, quantidade=1):
+        """Perguntas aprovadas mais parecidas com `pergunta` acima do limite, da mais similar para a menos.
+
+        Cada resultado é um dict com pergunta, resposta, origem e similaridade (0 a 1).
+        """
+        self._sincronizar()
+        pontuacao = defaultdict(float)
+        for dimensao, peso in vetorizar(pergunta).items():
+            for id_, peso_entrada in self._indice.get(dimensao, ()):
+                pontuacao[id_] += peso * peso_entrada
+        melhores = sorted(pontuacao.items(), key=lambda item: item[1], reverse=True)[:quantidade]
+        return [{**self._entradas[id_], "similaridade": min(similaridade, 1.0)}
+                for id_, similaridade in melhores if similaridade >= similaridade_minima]
+
+    def registrar_uso(self, id_):
+        with self._conexao() as con:
+            con.execute("UPDATE perguntas SET usos = usos + 1 WHERE id = ?", (id_,))
+
+    def aprovar(self, pergunta, resposta, origem="ia"):
+        """Inclui (ou atualiza) um par pergunta/resposta aprovado; `origem` é "ia" ou "curada"."""
+        self.importar([(pergunta, resposta)], origem)
+
+    def importar(self, pares, origem="curada"):
+        """Aprova vários pares (pergunta, resposta) de uma vez, ex.: um FAQ curado em planilha.
+
+        Tudo é gravado em uma única transação, com uma só sincronização do índice no fim.
+        """
+        agora = time.time()
+        linhas = []
+        for pergunta, resposta in pares:
+            pergunta, resposta = str(pergunta), str(resposta)
+            chave = " ".join(termos(pergunta))
+            if chave and resposta.strip():
+                linhas.append((chave, pergunta, resposta, origem, agora, agora))
+        if not linhas:
+            return
+        with self._conexao() as con:
+            con.executemany("""
+                INSERT INTO perguntas (chave, pergunta, resposta, origem, criado_em, atualizado_em)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(chave) DO UPDATE SET resposta = excluded.resposta, origem = excluded.origem,
+                                                 atualizado_em = excluded.atualizado_em
+            """, linhas)
+        self._sincronizar()
+
+    def remover(self, id_):
+        with self._conexao() as con:
+            con.execute("DELETE FROM perguntas WHERE id = ?", (id_,))
+        self._sincronizar()
+
+    def estatisticas(self):
+        linha = self._conexao().execute(
+            "SELECT COUNT(*), COALESCE(SUM(usos), 0), COALESCE(SUM(origem = 'curada'), 0) FROM perguntas"
+        ).fetchone()
+        return {"perguntas": linha[0], "respostas_reaproveitadas": linha[1], "curadas": linha[2]}
+
+    def listar(self):
+        return self._conexao().execute(
+            "SELECT id, pergunta, resposta, origem, usos FROM perguntas ORDER BY usos DESC, id DESC"
+        ).fetchall()
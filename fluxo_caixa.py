@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from moeda import para_centavos, para_reais, arredondar
+
+FREQUENCIAS = {"M": 12, "D": 365}
+
+# Teto de cenários x períodos da simulação: cada célula custa 4 bytes na matriz de saldos
+# e outros 4 na de choques (50 milhões ~ 400 MB)
+LIMITE_CELULAS_SIMULACAO = 50_000_000
+
+
+def _datas(inicio, periodos, frequencia):
+    inicio = pd.Timestamp.today().normalize() if inicio is None else pd.Timestamp(inicio)
+    return pd.date_range(inicio, periods=periodos, freq="MS" if frequencia == "M" else "D")
+
+
+def _curva_linha(linha, datas, frequencia, inflacao_anual):
+    """Valor esperado da linha em cada período: base x crescimento x inflação x sazonalidade.
+
+    `linha` é um dict com `valor` (mensal; positivo = entrada, negativo = saída) e,
+    opcionalmente, `crescimento_anual` (%), `indexada_inflacao` (bool) e
+    `sazonalidade` (12 multiplicadores, um por mês do ano).
+    """
+    por_ano = FREQUENCIAS[frequencia]
+    t = np.arange(len(datas)) / por_ano
+    curva = np.full(len(datas), float(linha["valor"]))
+    if frequencia == "D":
+        # Valores informados são mensais; distribui pelos dias de cada mês
+        curva /= datas.days_in_month.to_numpy()
+
+    taxa_anual = (1 + linha.get("crescimento_anual", 0.0) / 100)
+    if linha.get("indexada_inflacao", False):
+        taxa_anual *= (1 + inflacao_anual / 100)
+    curva *= taxa_anual ** t
+
+    if linha.get("sazonalidade") is not None:
+        curva *= np.asarray(linha["sazonalidade"], dtype=float)[datas.month.to_numpy() - 1]
+    return curva
+
+
+def _vetor_eventos(eventos, periodos):
+    # Eventos pontuais: lista de dicts com `periodo` (índice a partir de 0) e `valor`
+    vetor = np.zeros(periodos)
+    for evento in eventos or []:
+        if 0 <= int(evento["periodo"]) < periodos:
+            vetor[int(evento["periodo"])] += float(evento["valor"])
+    return vetor
+
+
+def projetar(linhas, saldo_inicial, periodos, frequencia="M", inflacao_anual=0.0, eventos=None, inicio=None):
+    """Projeção determinística: DataFrame com entradas, saídas, eventos, fluxo líquido e saldo por período.
+
+    Cada linha é arredondada ao centavo em cada período e os saldos são
+    acumulados em centavos inteiros, sem deriva ao longo de horizontes longos.
+    """
+    datas = _datas(inicio, periodos, frequencia)
+    curvas = np.array([_curva_linha(linha, datas, frequencia, inflacao_anual) for linha in linhas]).reshape(-1, periodos)
+    curvas = arredondar(curvas * 100)
+    entradas = np.where(curvas > 0, curvas, 0).sum(axis=0)
+    saidas = -np.where(curvas < 0, curvas, 0).sum(axis=0)
+    vetor_eventos = para_centavos(_vetor_eventos(eventos, periodos))
+    fluxo = entradas - saidas + vetor_eventos
+
+    return pd.DataFrame({
+        "Data": datas,
+        "Entradas": para_reais(entradas),
+        "Saídas": para_reais(saidas),
+        "Eventos": para_reais(vetor_eventos),
+        "Fluxo Líquido": para_reais(fluxo),
+        "Saldo Final": para_reais(para_centavos(saldo_inicial) + np.cumsum(fluxo)),
+    })
+
+
+def simular(linhas, saldo_inicial, periodos, cenarios=10000, frequencia="M", inflacao_anual=0.0,
+            eventos=None, inicio=None, semente=None):
+    """Simulação de Monte Carlo dos saldos: matriz (cenários x períodos) em float32.
+
+    Cada linha pode ter `volatilidade` (% de desvio padrão por período) aplicada
+    como choque multiplicativo normal e independente em cada período e cenário.
+    Recusa simulações acima de LIMITE_CELULAS_SIMULACAO células.
+    """
+    if cenarios * periodos > LIMITE_CELULAS_SIMULACAO:
+        raise ValueError(f"Simulação grande demais: {cenarios:,} cenários x {periodos:,} períodos; "
+                         f"o máximo é {LIMITE_CELULAS_SIMULACAO // periodos:,} cenários para {periodos:,} períodos")
+    gerador = np.random.default_rng(semente)
+    datas = _datas(inicio, periodos, frequencia)
+    fluxos = np.zeros((cenarios, periodos), dtype=np.float32)
+    for linha in linhas:
+        curva = _curva_linha(linha, datas, frequencia, inflacao_anual).astype(np.float32)
+        volatilidade = linha.get("volatilidade", 0.0) / 100
+        if volatilidade > 0:
+            choques = gerador.standard_normal((cenarios, periodos), dtype=np.float32)
+            choques *= volatilidade
+            choques += 1
+            # Choques não invertem o sinal da linha (entrada nunca vira saída)
+            np.maximum(choques, 0, out=choques)
+            choques *= curva
+            fluxos += choques
+        else:
+            fluxos += curva
+    fluxos += _vetor_eventos(eventos, periodos).astype(np.float32)
+
+    saldos = np.cumsum(fluxos, axis=1, out=fluxos)
+    saldos += np.float32(saldo_inicial)
+    return saldos
+
+
+def resumir_simulacao(saldos, percentis=(5, 25, 50, 75, 95)):
+    """Faixas de percentis por período, probabilidade de saldo negativo e tempo até o caixa zerar.
+
+    Devolve (faixas, resumo): `faixas` é um DataFrame por período; `resumo` é um dict
+    com a probabilidade de o saldo ficar negativo em algum momento e os percentis
+    do primeiro período negativo entre os cenários que zeram o caixa.
+    """
+    negativo = saldos < 0
+    faixas = pd.DataFrame(np.percentile(saldos, percentis, axis=0).T, columns=[f"P{p}" for p in percentis])
+    faixas["Prob. Saldo Negativo"] = negativo.mean(axis=0)
+
+    algum_negativo = negativo.any(axis=1)
+    # argmax devolve o primeiro True; só é válido nos cenários que ficam negativos
+    primeiro_negativo = negativo.argmax(axis=1)[algum_negativo] + 1
+    resumo = {
+        "prob_negativo": float(algum_negativo.mean()),
+        "periodos_ate_zerar": (
+            {f"P{p}": float(v) for p, v in zip((10, 50, 90), np.percentile(primeiro_negativo, (10, 50, 90)))}
+            if len(primeiro_negativo) else {}
+        ),
+    }
+    return faixas, resumo
@@ -0,0 +1,160 @@
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from moeda import ESCALA_PERCENTUAL, para_centavos, para_reais, dividir_arredondando, aplicar_percentual, somar
+
+# Tabelas versionadas por competência (AAAA-MM de início de vigência).
+# INSS progressivo: (limite superior da faixa, alíquota); o último limite é o teto.
+TABELAS_INSS = {
+    "2023-05": [(1320.00, 0.075), (2571.29, 0.09), (3856.94, 0.12), (7507.49, 0.14)],
+    "2024-01": [(1412.00, 0.075), (2666.68, 0.09), (4000.03, 0.12), (7786.02, 0.14)],
+    "2025-01": [(1518.00, 0.075), (2793.88, 0.09), (4190.83, 0.12), (8157.41, 0.14)],
+}
+
+# IRRF mensal: (limite superior da faixa, alíquota, parcela a deduzir)
+TABELAS_IRRF = {
+    "2023-05": [(2112.00, 0.0, 0.0), (2826.65, 0.075, 158.40), (3751.05, 0.15, 370.40),
+                (4664.68, 0.225, 651.73), (np.inf, 0.275, 884.96)],
+    "2024-02": [(2259.20, 0.0, 0.0), (2826.65, 0.075, 169.44), (3751.05, 0.15, 381.44),
+                (4664.68, 0.225, 662.77), (np.inf, 0.275, 896.00)],
+    "2025-05": [(2428.80, 0.0, 0.0), (2826.65, 0.075, 182.16), (3751.05, 0.15, 394.16),
+                (4664.68, 0.225, 675.49), (np.inf, 0.275, 908.73)],
+}
+
+# Desconto simplificado mensal: substitui as deduções legais (INSS e dependentes) quando for maior
+DESCONTO_SIMPLIFICADO_IRRF = {
+    "2023-05": 528.00,
+    "2024-02": 564.80,
+    "2025-05": 607.20,
+}
+
+DEDUCAO_DEPENDENTE_IRRF = 189.59
+PERCENTUAL_VALE_TRANSPORTE = 0.06
+
+# Alíquotas viram inteiros nesta escala (0,075 -> 75000) para o cálculo em centavos ser exato
+ESCALA_TAXA = 100 * ESCALA_PERCENTUAL
+
+# Colunas aceitas na planilha de funcionários e seus valores padrão
+COLUNAS_FOLHA = {
+    "salario_base": 0.0,
+    "horas_extras": 0.0,
+    "valor_hora_extra": 0.0,
+    "vale_transporte": False,
+    "vale_alimentacao": 0.0,
+    "dependentes": 0,
+}
+
+
+def tabela_vigente(tabelas, competencia):
+    """Devolve a tabela em vigor na competência (AAAA-MM)."""
+    vigencias = sorted(v for v in tabelas if v <= competencia)
+    if not vigencias:
+        raise ValueError(f"Nenhuma tabela vigente para a competência {competencia}")
+    return tabelas[vigencias[-1]]
+
+
+# Valores aceitos na coluna vale_transporte (comparados sem acento e em minúsculas)
+VALORES_VERDADEIROS = {"sim", "s", "true", "verdadeiro", "v", "yes", "y", "x", "1", "1.0"}
+VALORES_FALSOS = {"nao", "n", "false", "falso", "f", "no", "", "0", "0.0"}
+
+
+def _booleano(serie):
+    """Converte uma coluna sim/não da planilha em array bool, recusando valores desconhecidos."""
+    if serie.dtype == bool:
+        return serie.to_numpy()
+    textos = serie.map(lambda valor: unicodedata.normalize("NFKD", str(valor)).encode("ascii", "ignore")
+                       .decode("ascii").strip().lower())
+    desconhecidos = sorted(set(textos) - VALORES_VERDADEIROS - VALORES_FALSOS)
+    if desconhecidos:
+        raise ValueError(f"Valores não reconhecidos em {serie.name}: {', '.join(desconhecidos[:5])}")
+    return textos.isin(VALORES_VERDADEIROS).to_numpy()
+
+
+def _taxas(aliquotas):
+    return np.rint(np.asarray(aliquotas, dtype=float) * ESCALA_TAXA).astype(np.int64)
+
+
+def _preparar_inss(tabela):
+    # Converte a tabela progressiva em (limites, taxas, parcelas a deduzir) para cálculo por faixa,
+    # tudo em inteiros: limites em centavos, parcelas em centavos x ESCALA_TAXA
+    limites = para_centavos([limite for limite, _ in tabela])
+    taxas = _taxas([aliquota for _, aliquota in tabela])
+    inferiores = np.concatenate(([0], limites[:-1]))
+    # Contribuição acumulada das faixas anteriores menos o que a alíquota da faixa atual "cobraria" sobre elas
+    acumulado = np.concatenate(([0], np.cumsum((limites - inferiores) * taxas)[:-1]))
+    parcelas = inferiores * taxas - acumulado
+    return limites, taxas, parcelas
+
+
+def calcular_inss(base, tabela):
+    """INSS progressivo sobre `base` em centavos (int64); devolve centavos."""
+    limites, taxas, parcelas = _preparar_inss(tabela)
+    base = np.minimum(np.asarray(base, dtype=np.int64), limites[-1])
+    faixa = np.searchsorted(limites, base, side="left")
+    return dividir_arredondando(base * taxas[faixa] - parcelas[faixa], ESCALA_TAXA)
+
+
+def calcular_irrf(base, tabela):
+    """IRRF mensal sobre `base` em centavos (int64); devolve centavos."""
+    limites = np.array([limite for limite, _, _ in tabela])
+    taxas = _taxas([aliquota for _, aliquota, _ in tabela])
+    parcelas = para_centavos([parcela for _, _, parcela in tabela])
+    base = np.asarray(base, dtype=np.int64)
+    faixa = np.searchsorted(limites * 100, base, side="left")
+    return np.maximum(dividir_arredondando(base * taxas[faixa] - parcelas[faixa] * ESCALA_TAXA, ESCALA_TAXA), 0)
+
+
+def calcular_folha(funcionarios, competencia):
+    """Calcula proventos, descontos e líquido de todos os funcionários de uma vez.
+
+    `funcionarios` é um DataFrame com as colunas de COLUNAS_FOLHA (as ausentes
+    assumem o valor padrão). Devolve uma cópia com as colunas calculadas.
+    """
+    folha = funcionarios.copy()
+    for coluna, padrao in COLUNAS_FOLHA.items():
+        if coluna not in folha.columns:
+            folha[coluna] = padrao
+        # Colunas de texto repetitivo chegam da ingestão como categoria, que não aceita o padrão novo
+        if isinstance(folha[coluna].dtype, pd.CategoricalDtype):
+            folha[coluna] = folha[coluna].astype(object)
+        folha[coluna] = folha[coluna].fillna(padrao)
+
+    # Cálculo em centavos (int64); as colunas devolvidas são convertidas para reais só no fim
+    salario = para_centavos(folha["salario_base"].to_numpy(dtype=float))
+    horas_extras = para_centavos(folha["horas_extras"].to_numpy(dtype=float) * folha["valor_hora_extra"].to_numpy(dtype=float))
+    vale_alimentacao = para_centavos(folha["vale_alimentacao"].to_numpy(dtype=float))
+    dependentes = folha["dependentes"].to_numpy(dtype=np.int64)
+
+    remuneracao = salario + horas_extras
+    inss = calcular_inss(remuneracao, tabela_vigente(TABELAS_INSS, competencia))
+    deducoes = inss + dependentes * para_centavos(DEDUCAO_DEPENDENTE_IRRF)
+    simplificado = para_centavos(tabela_vigente(DESCONTO_SIMPLIFICADO_IRRF, competencia))
+    base_irrf = np.maximum(remuneracao - np.maximum(deducoes, simplificado), 0)
+    irrf = calcular_irrf(base_irrf, tabela_vigente(TABELAS_IRRF, competencia))
+    desconto_vt = np.where(_booleano(folha["vale_transporte"]),
+                           aplicar_percentual(salario, PERCENTUAL_VALE_TRANSPORTE * 100), 0)
+
+    total_proventos = remuneracao + vale_alimentacao
+    total_descontos = inss + irrf + desconto_vt
+
+    folha["valor_horas_extras"] = para_reais(horas_extras)
+    folha["total_proventos"] = para_reais(total_proventos)
+    folha["inss"] = para_reais(inss)
+    folha["irrf"] = para_reais(irrf)
+    folha["desconto_vt"] = para_reais(desconto_vt)
+    folha["total_descontos"] = para_reais(total_descontos)
+    folha["salario_liquido"] = para_reais(total_proventos - total_descontos)
+    return folha
+
+
+def resumir_folha(folha, coluna_grupo=None):
+    """Totais da folha, geral ou por grupo (ex.: empresa, departamento)."""
+    colunas = ["salario_base", "valor_horas_extras", "vale_alimentacao", "total_proventos",
+               "inss", "irrf", "desconto_vt", "total_descontos", "salario_liquido"]
+    if coluna_grupo is None:
+        return somar(folha[colunas])
+    resumo = somar(folha[colunas], por=folha[coluna_grupo])
+    resumo.insert(0, "funcionarios", folha.groupby(coluna_grupo, observed=True).size())
+    return resumo
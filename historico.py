@@ -0,0 +1,413 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from moeda import para_centavos
+
+# Configuração padrão do histórico (pode ser sobrescrita pelo .env)
+CAMINHO_PADRAO = os.getenv('HISTORICO_CAMINHO', os.path.join('.cache', 'historico.sqlite3'))
+TAMANHO_RESULTADOS_PADRAO = int(os.getenv('HISTORICO_RESULTADOS_MB', 500)) * 1024 * 1024
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS entidades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT UNIQUE NOT NULL,
+        cnpj TEXT,
+        criado_em REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS periodos (
+        entidade_id INTEGER NOT NULL REFERENCES entidades (id),
+        periodo TEXT NOT NULL,
+        origem TEXT NOT NULL,
+        atualizado_em REAL NOT NULL,
+        PRIMARY KEY (entidade_id, periodo)
+    );
+    CREATE TABLE IF NOT EXISTS linhas (
+        entidade_id INTEGER NOT NULL,
+        periodo TEXT NOT NULL,
+        conta TEXT NOT NULL,
+        demonstrativo TEXT NOT NULL,
+        valor INTEGER NOT NULL,
+        PRIMARY KEY (entidade_id, periodo, conta, demonstrativo)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_linhas_conta ON linhas (entidade_id, conta, periodo);
+    CREATE TABLE IF NOT EXISTS indicadores (
+        entidade_id INTEGER NOT NULL,
+        periodo TEXT NOT NULL,
+        indicador TEXT NOT NULL,
+        valor REAL,
+        PRIMARY KEY (entidade_id, periodo, indicador)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS analises (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tela TEXT NOT NULL,
+        referencia TEXT,
+        entidade_id INTEGER,
+        periodo TEXT,
+        chave TEXT NOT NULL,
+        conteudo TEXT NOT NULL,
+        criado_em REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_analises_tela ON analises (tela, referencia, criado_em);
+    CREATE INDEX IF NOT EXISTS idx_analises_entidade ON analises (entidade_id, periodo);
+    CREATE TABLE IF NOT EXISTS resultados (
+        chave TEXT PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        versao TEXT NOT NULL DEFAULT '',
+        dados BLOB NOT NULL,
+        tamanho INTEGER NOT NULL,
+        criado_em REAL NOT NULL,
+        acessado_em REAL NOT NULL
+    );
+"""
+
+
+def _atualizar_hash(sha, valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        # Conteúdo, índice, nomes e tipos: o mesmo DataFrame lido de novo gera a mesma chave
+        sha.update(type(valor).__name__.encode())
+        sha.update(repr(list(valor.columns) if isinstance(valor, pd.DataFrame) else valor.name).encode("utf-8"))
+        sha.update(repr(list(valor.index.names)).encode("utf-8"))
+        sha.update(repr(valor.dtypes.astype(str).tolist() if isinstance(valor, pd.DataFrame)
+                        else str(valor.dtype)).encode())
+        sha.update(pd.util.hash_pandas_object(valor, index=True).to_numpy().tobytes())
+    elif isinstance(valor, np.ndarray):
+        sha.update(str(valor.dtype).encode() + repr(valor.shape).encode())
+        sha.update(np.ascontiguousarray(valor).tobytes())
+    elif isinstance(valor, dict):
+        for chave in sorted(valor, key=repr):
+            _atualizar_hash(sha, chave)
+            _atualizar_hash(sha, valor[chave])
+    elif isinstance(valor, (list, tuple)):
+        sha.update(f"{type(valor).__name__}{len(valor)}".encode())
+        for item in valor:
+            _atualizar_hash(sha, item)
+    else:
+        sha.update(repr(valor).encode("utf-8"))
+    sha.update(b"\x00")
+
+
+def chave_entradas(*entradas):
+    """SHA-256 das entradas de um cálculo (DataFrames, arrays, dicts, listas e escalares)."""
+    sha = hashlib.sha256()
+    for entrada in entradas:
+        _atualizar_hash(sha, entrada)
+    return sha.hexdigest()
+
+
+# Módulos desta pasta entram na versão dos cálculos memorizados; bibliotecas instaladas não
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+TIPOS_CONSTANTES = (bool, int, float, complex, str, bytes, tuple, list, dict, set, frozenset)
+
+
+def _do_projeto(modulo):
+    caminho = getattr(modulo, "__file__", None)
+    return caminho is not None and os.path.dirname(os.path.abspath(caminho)) == PASTA_PROJETO
+
+
+def _nomes_usados(codigo):
+    # Nomes globais e atributos lidos pela função, inclusive em funções internas e lambdas
+    nomes = set(codigo.co_names)
+    for constante in codigo.co_consts:
+        if inspect.iscode(constante):
+            nomes |= _nomes_usados(constante)
+    return nomes
+
+
+def _arquivos_modulo(modulo, arquivos):
+    # O módulo e, transitivamente, os módulos do projeto que ele importa
+    if not _do_projeto(modulo) or modulo.__file__ in arquivos:
+        return
+    arquivos.add(modulo.__file__)
+    for valor in list(vars(modulo).values()):
+        dependencia = valor if inspect.ismodule(valor) else sys.modules.get(getattr(valor, "__module__", None) or "")
+        if dependencia is not None:
+            _arquivos_modulo(dependencia, arquivos)
+
+
+@functools.lru_cache(maxsize=None)
+def versao_funcao(funcao):
+    """Hash do código de que `funcao` depende: muda quando o cálculo ou suas dependências mudam.
+
+    Do próprio módulo entram só a função, as funções e classes que ela usa e os valores das
+    constantes que lê (não o arquivo inteiro: uma tela alterada não invalida o cálculo). De
+    outros módulos do projeto usados por ela entra o arquivo inteiro, com os que eles importam.
+    """
+    sha = hashlib.sha256()
+    arquivos = set()
+    pendentes, vistos = [funcao], set()
+    while pendentes:
+        atual = pendentes.pop()
+        if atual in vistos:
+            continue
+        vistos.add(atual)
+        sha.update(f"{atual.__module__}.{atual.__qualname__}".encode("utf-8"))
+        try:
+            sha.update(inspect.getsource(atual).encode("utf-8"))
+        except (TypeError, OSError):
+            # Sem código-fonte (função embutida ou definida no console): vale só o nome
+            pass
+        if not inspect.isfunction(atual):
+            continue
+        for nome in sorted(_nomes_usados(atual.__code__)):
+            if nome not in atual.__globals__:
+                continue
+            valor = atual.__globals__[nome]
+            if inspect.ismodule(valor):
+                _arquivos_modulo(valor, arquivos)
+            elif isinstance(valor, TIPOS_CONSTANTES):
+                # Constantes (tabelas, limites, dicionários de configuração) entram pelo valor
+                texto = repr(sorted(valor, key=repr)) if isinstance(valor, (set, frozenset)) else repr(valor)
+                sha.update(f"{nome}={texto}".encode("utf-8"))
+            elif getattr(valor, "__module__", None) == atual.__module__ and (
+                    inspect.isfunction(valor) or inspect.isclass(valor)):
+                pendentes.append(valor)
+            elif getattr(valor, "__module__", None) in sys.modules:
+                # Funções, classes e objetos de outros módulos: vale o módulo de origem
+                _arquivos_modulo(sys.modules[valor.__module__], arquivos)
+    for caminho in sorted(arquivos):
+        with open(caminho, "rb") as arquivo:
+            sha.update(arquivo.read())
+    return sha.hexdigest()[:16]
+
+
+class Historico:
+    """Base local (SQLite) de empresas, períodos, linhas de demonstrativos, indicadores e análises da IA.
+
+    As linhas ficam em centavos, indexadas por (empresa, período, conta), para comparar
+    períodos sem recalcular. Resultados de cálculos pesados são memorizados pelo hash das
+    entradas e pela versão do cálculo (`memorizar`), com limite de tamanho e descarte dos
+    menos usados.
+    """
+
+    def __init__(self, caminho=CAMINHO_PADRAO, tamanho_resultados=TAMANHO_RESULTADOS_PADRAO):
+        self.caminho = caminho
+        self.tamanho_resultados = tamanho_resultados
+        self._local = threading.local()
+        # Versão já conferida por tipo de resultado, para limpar os antigos uma vez por processo
+        self._versoes = {}
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        with self._conexao() as con:
+            con.executescript(ESQUEMA)
+            # Bases criadas antes da coluna versao: os resultados antigos ficam com versão vazia e são descartados
+            if "versao" not in [coluna[1] for coluna in con.execute("PRAGMA table_info(resultados)")]:
+                con.execute("ALTER TABLE resultados ADD COLUMN versao TEXT NOT NULL DEFAULT ''")
+
+    def _conexao(self):
+        # Conexões SQLite não podem ser compartilhadas entre threads
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _ids_entidades(self, con, nomes, cnpjs=None):
+        agora = time.time()
+        cnpjs = cnpjs or {}
+        con.executemany("INSERT OR IGNORE INTO entidades (nome, cnpj, criado_em) VALUES (?, ?, ?)",
+                        [(nome, cnpjs.get(nome), agora) for nome in nomes])
+        if cnpjs:
+            con.executemany("UPDATE entidades SET cnpj = ? WHERE nome = ? AND cnpj IS NULL",
+                            [(cnpj, nome) for nome, cnpj in cnpjs.items() if cnpj])
+        marcadores = ", ".join("?" * len(nomes))
+        return dict(con.execute(f"SELECT nome, id FROM entidades WHERE nome IN ({marcadores})", list(nomes)))
+
+    def _registrar_periodos(self, con, pares, origem):
+        agora = time.time()
+        con.executemany("""
+            INSERT INTO periodos (entidade_id, periodo, origem, atualizado_em) VALUES (?, ?, ?, ?)
+            ON CONFLICT (entidade_id, periodo) DO UPDATE SET origem = excluded.origem,
+                                                             atualizado_em = excluded.atualizado_em
+        """, [(id_, periodo, origem, agora) for id_, periodo in pares])
+
+    def _id_entidade(self, nome):
+        linha = self._conexao().execute("SELECT id FROM entidades WHERE nome = ?", (nome,)).fetchone()
+        return linha[0] if linha else None
+
+    def gravar_demonstrativo(self, lancamentos, demonstrativo, origem="manual", cnpjs=None):
+        """Grava linhas de demonstrativo no formato longo (colunas entidade, periodo, conta e valor em R$).
+
+        Substitui o que já existia para cada (empresa, período, conta) do mesmo demonstrativo.
+        """
+        if lancamentos.empty:
+            return 0
+        lancamentos = lancamentos.assign(
+            entidade=lancamentos["entidade"].astype(str),
+            periodo=lancamentos["periodo"].astype(str),
+            conta=lancamentos["conta"].astype(str),
+            valor=para_centavos(lancamentos["valor"].fillna(0.0)),
+        )
+        with self._conexao() as con:
+            ids = self._ids_entidades(con, lancamentos["entidade"].unique().tolist(), cnpjs)
+            entidade_ids = lancamentos["entidade"].map(ids)
+            self._registrar_periodos(con, set(zip(entidade_ids, lancamentos["periodo"])), origem)
+            con.executemany(
+                "INSERT OR REPLACE INTO linhas (entidade_id, periodo, conta, demonstrativo, valor) VALUES (?, ?, ?, ?, ?)",
+                zip(entidade_ids.tolist(), lancamentos["periodo"], lancamentos["conta"],
+                    [demonstrativo] * len(lancamentos), lancamentos["valor"].tolist())
+            )
+        return len(lancamentos)
+
+    def gravar_campos(self, entidade, periodo, campos, demonstrativo, origem="manual", cnpj=None):
+        """Atalho para um período de uma empresa: `campos` é {conta: valor em R$}."""
+        lancamentos = pd.DataFrame({"entidade": entidade, "periodo": periodo,
+                                    "conta": list(campos), "valor": [float(v) for v in campos.values()]})
+        return self.gravar_demonstrativo(lancamentos, demonstrativo, origem, {entidade: cnpj} if cnpj else None)
+
+    def gravar_indicadores(self, indices, origem="manual"):
+        """Grava indicadores calculados; `indices` tem índice (entidade, periodo) e um indicador por coluna."""
+        if indices.empty:
+            return 0
+        longo = indices.rename_axis(["entidade", "periodo"]).reset_index().melt(
+            id_vars=["entidade", "periodo"], var_name="indicador", value_name="valor")
+        longo["entidade"] = longo["entidade"].astype(str)
+        longo["periodo"] = longo["periodo"].astype(str)
+        valores = longo["valor"].astype(float).replace([np.inf, -np.inf], np.nan)
+        with self._conexao() as con:
+            ids = self._ids_entidades(con, longo["entidade"].unique().tolist())
+            entidade_ids = longo["entidade"].map(ids)
+            self._registrar_periodos(con, set(zip(entidade_ids, longo["periodo"])), origem)
+            con.executemany(
+                "INSERT OR REPLACE INTO indicadores (entidade_id, periodo, indicador, valor) VALUES (?, ?, ?, ?)",
+                zip(entidade_ids.tolist(), longo["periodo"], longo["indicador"],
+                    [None if pd.isna(v) else v for v in valores])
+            )
+        return len(longo)
+
+    def gravar_analise(self, tela, prompt, conteudo, referencia=None, entidade=None, periodo=None):
+        """Guarda a resposta da IA com a tela, a referência (ex.: nome do arquivo) e o hash do prompt."""
+        if not conteudo:
+            return
+        with self._conexao() as con:
+            entidade_id = self._ids_entidades(con, [entidade])[entidade] if entidade else None
+            con.execute(
+                "INSERT INTO analises (tela, referencia, entidade_id, periodo, chave, conteudo, criado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (tela, referencia, entidade_id, periodo, chave_entradas(prompt), conteudo, time.time())
+            )
+
+    def entidades(self):
+        """Empresas com dados gravados e a quantidade de períodos de cada uma."""
+        return pd.read_sql_query("""
+            SELECT e.nome AS entidade, e.cnpj, COUNT(p.periodo) AS periodos,
+                   MIN(p.periodo) AS primeiro, MAX(p.periodo) AS ultimo
+            FROM entidades e JOIN periodos p ON p.entidade_id = e.id
+            GROUP BY e.id ORDER BY e.nome
+        """, self._conexao())
+
+    def demonstrativo(self, entidade, demonstrativo=None, contas=None):
+        """Comparação entre períodos: uma linha por período e uma coluna por conta (R$)."""
+        id_ = self._id_entidade(entidade)
+        consulta = "SELECT periodo, conta, valor FROM linhas WHERE entidade_id = ?"
+        parametros = [id_]
+        if demonstrativo is not None:
+            consulta += " AND demonstrativo = ?"
+            parametros.append(demonstrativo)
+        if contas:
+            consulta += f" AND conta IN ({', '.join('?' * len(contas))})"
+            parametros += list(contas)
+        linhas = pd.read_sql_query(consulta, self._conexao(), params=parametros)
+        tabela = linhas.pivot_table(index="periodo", columns="conta", values="valor", aggfunc="sum")
+        return tabela.rename_axis(columns=None) / 100
+
+    def indicadores(self, entidade, indicadores=None):
+        """Indicadores gravados da empresa: uma linha por período e uma coluna por indicador."""
+        consulta = "SELECT periodo, indicador, valor FROM indicadores WHERE entidade_id = ?"
+        parametros = [self._id_entidade(entidade)]
+        if indicadores:
+            consulta += f" AND indicador IN ({', '.join('?' * len(indicadores))})"
+            parametros += list(indicadores)
+        linhas = pd.read_sql_query(consulta, self._conexao(), params=parametros)
+        return linhas.pivot(index="periodo", columns="indicador", values="valor").rename_axis(columns=None)
+
+    def analises(self, tela=None, referencia=None, entidade=None, limite=20):
+        """Análises da IA gravadas, das mais recentes para as mais antigas."""
+        consulta = ("SELECT a.id, a.tela, a.referencia, e.nome AS entidade, a.periodo, a.conteudo, a.criado_em "
+                    "FROM analises a LEFT JOIN entidades e ON e.id = a.entidade_id WHERE 1 = 1")
+        parametros = []
+        for coluna, valor in (("a.tela", tela), ("a.referencia", referencia), ("e.nome", entidade)):
+            if valor is not None:
+                consulta += f" AND {coluna} = ?"
+                parametros.append(valor)
+        consulta += " ORDER BY a.criado_em DESC LIMIT ?"
+        parametros.append(limite)
+        return pd.read_sql_query(consulta, self._conexao(), params=parametros)
+
+    def memorizar(self, tipo, funcao, *entradas, versao=None):
+        """`funcao(*entradas)` calculada uma vez por conteúdo das entradas; depois vem da base.
+
+        A chave inclui a `versao` do cálculo (por padrão, o hash do módulo de `funcao`):
+        mudar o código ou as tabelas do cálculo invalida os resultados antigos do `tipo`,
+        que são apagados. O resultado precisa ser serializável com pickle (DataFrames, dicts, tuplas...).
+        """
+        versao = versao_funcao(funcao) if versao is None else str(versao)
+        chave = chave_entradas(tipo, versao, *entradas)
+        agora = time.time()
+        con = self._conexao()
+        if self._versoes.get(tipo) != versao:
+            with con:
+                con.execute("DELETE FROM resultados WHERE tipo = ? AND versao != ?", (tipo, versao))
+            self._versoes[tipo] = versao
+        linha = con.execute("SELECT dados FROM resultados WHERE chave = ?", (chave,)).fetchone()
+        if linha is not None:
+            with con:
+                con.execute("UPDATE resultados SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            return pickle.loads(linha[0])
+
+        resultado = funcao(*entradas)
+        dados = pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL)
+        with con:
+            con.execute("INSERT OR REPLACE INTO resultados (chave, tipo, versao, dados, tamanho, criado_em, acessado_em) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", (chave, tipo, versao, dados, len(dados), agora, agora))
+            self._remover_excedentes(con)
+        return resultado
+
+    def _remover_excedentes(self, con):
+        # LRU até caber no tamanho máximo
+        total = con.execute("SELECT COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()[0]
+        if total <= self.tamanho_resultados:
+            return
+
+        excedente = total - self.tamanho_resultados
+        removidos = []
+        for chave, tamanho in con.execute("SELECT chave, tamanho FROM resultados ORDER BY acessado_em"):
+            removidos.append((chave,))
+            excedente -= tamanho
+            if excedente <= 0:
+                break
+        con.executemany("DELETE FROM resultados WHERE chave = ?", removidos)
+
+    def remover_entidade(self, entidade):
+        id_ = self._id_entidade(entidade)
+        if id_ is None:
+            return
+        with self._conexao() as con:
+            for tabela in ("linhas", "indicadores", "periodos", "analises"):
+                con.execute(f"DELETE FROM {tabela} WHERE entidade_id = ?", (id_,))
+            con.execute("DELETE FROM entidades WHERE id = ?", (id_,))
+
+    def estatisticas(self):
+        con = self._conexao()
+        contagens = {tabela: con.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+                     for tabela in ("entidades", "periodos", "linhas", "indicadores", "analises", "resultados")}
+        contagens["tamanho_resultados"] = con.execute(
+            "SELECT COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()[0]
+        return contagens
+
+    def limpar_resultados(self):
+        with self._conexao() as con:
+            con.execute("DELETE FROM resultados")
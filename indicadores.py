@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+
+
+def dividir(numerador, denominador, padrao=0.0):
+    """Divisão elemento a elemento que devolve `padrao` quando o denominador é zero."""
+    numerador = np.asarray(numerador, dtype=float)
+    denominador = np.asarray(denominador, dtype=float)
+    return np.divide(numerador, denominador, out=np.full(np.broadcast(numerador, denominador).shape, padrao),
+                     where=denominador != 0)
+
+
+# Registro declarativo dos indicadores. Cada entrada define:
+#   nome: rótulo exibido; grupo: seção da tela; campos: linhas do balanço/DRE necessárias;
+#   formula: função vetorizada sobre o DataFrame; sufixo: unidade exibida;
+#   faixas: (limite, status, mensagem) avaliadas em ordem; limite None captura o restante;
+#   maior_melhor: se o indicador bom está acima (True) ou abaixo (False) dos limites.
+INDICADORES = {
+    "liquidez_corrente": {
+        "nome": "Liquidez Corrente", "grupo": "Liquidez",
+        "campos": ["ativo_circulante", "passivo_circulante"],
+        "formula": lambda d: dividir(d["ativo_circulante"], d["passivo_circulante"]),
+        "sufixo": "", "maior_melhor": True,
+        "faixas": [(1, "bom", "✅ A empresa possui boa liquidez corrente"),
+                   (None, "ruim", "⚠️ A liquidez corrente está abaixo do ideal")],
+    },
+    "liquidez_seca": {
+        "nome": "Liquidez Seca", "grupo": "Liquidez",
+        "campos": ["ativo_circulante", "estoque", "passivo_circulante"],
+        "formula": lambda d: dividir(d["ativo_circulante"] - d["estoque"], d["passivo_circulante"]),
+        "sufixo": "",
+    },
+    "liquidez_imediata": {
+        "nome": "Liquidez Imediata", "grupo": "Liquidez",
+        "campos": ["disponivel", "passivo_circulante"],
+        "formula": lambda d: dividir(d["disponivel"], d["passivo_circulante"]),
+        "sufixo": "",
+    },
+    "endividamento": {
+        "nome": "Endividamento", "grupo": "Estrutura e Rentabilidade",
+        "campos": ["passivo_total", "ativo_total"],
+        "formula": lambda d: dividir(d["passivo_total"], d["ativo_total"]) * 100,
+        "sufixo": "%", "maior_melhor": False,
+        "faixas": [(60, "bom", "✅ Nível de endividamento adequado"),
+                   (None, "ruim", "⚠️ Alto nível de endividamento")],
+    },
+    "rentabilidade_pl": {
+        "nome": "Rentabilidade do PL", "grupo": "Estrutura e Rentabilidade",
+        "campos": ["lucro_liquido", "patrimonio_liquido"],
+        "formula": lambda d: dividir(d["lucro_liquido"], d["patrimonio_liquido"]) * 100,
+        "sufixo": "%", "maior_melhor": True,
+        "faixas": [(10, "bom", "✅ Boa rentabilidade do Patrimônio Líquido"),
+                   (None, "ruim", "⚠️ Rentabilidade do PL abaixo do esperado")],
+    },
+    "margem_liquida": {
+        "nome": "Margem Líquida", "grupo": "Estrutura e Rentabilidade",
+        "campos": ["lucro_liquido", "vendas_liquidas"],
+        "formula": lambda d: dividir(d["lucro_liquido"], d["vendas_liquidas"]) * 100,
+        "sufixo": "%",
+    },
+    "rentabilidade_vendas": {
+        "nome": "Rentabilidade das Vendas", "grupo": "Rentabilidade",
+        "campos": ["lucro_liquido", "vendas_liquidas"],
+        "formula": lambda d: dividir(d["lucro_liquido"], d["vendas_liquidas"]) * 100,
+        "sufixo": "%", "maior_melhor": True,
+        "faixas": [(15, "bom", "✅ Excelente rentabilidade das vendas"),
+                   (10, "atencao", "✓ Boa rentabilidade das vendas"),
+                   (None, "ruim", "⚠️ Rentabilidade das vendas precisa de atenção")],
+    },
+    "rentabilidade_ativo": {
+        "nome": "Rentabilidade do Ativo", "grupo": "Rentabilidade",
+        "campos": ["lucro_liquido", "ativo_total"],
+        "formula": lambda d: dividir(d["lucro_liquido"], d["ativo_total"]) * 100,
+        "sufixo": "%",
+    },
+    "ciclo_operacional": {
+        "nome": "Ciclo Operacional", "grupo": "Ciclo",
+        "campos": ["prazo_medio_recebimento", "giro_estoque"],
+        "formula": lambda d: d["prazo_medio_recebimento"] + dividir(365, d["giro_estoque"]),
+        "sufixo": " dias",
+    },
+    "ciclo_financeiro": {
+        "nome": "Ciclo Financeiro", "grupo": "Ciclo",
+        "campos": ["prazo_medio_recebimento", "giro_estoque", "prazo_medio_pagamento"],
+        "formula": lambda d: (d["prazo_medio_recebimento"] + dividir(365, d["giro_estoque"])
+                              - d["prazo_medio_pagamento"]),
+        "sufixo": " dias", "maior_melhor": False,
+        "faixas": [(30, "bom", "✅ Ciclo financeiro eficiente"),
+                   (45, "atencao", "✓ Ciclo financeiro adequado"),
+                   (None, "ruim", "⚠️ Ciclo financeiro extenso - considere otimização")],
+    },
+}
+
+# Recomendações: (campos/indicadores necessários, condição vetorizada, mensagem)
+RECOMENDACOES = [
+    (["ciclo_financeiro", "prazo_medio_pagamento"],
+     lambda d: d["ciclo_financeiro"] > d["prazo_medio_pagamento"],
+     "💡 Considere negociar prazos maiores com fornecedores"),
+    (["prazo_medio_recebimento"],
+     lambda d: d["prazo_medio_recebimento"] > 45,
+     "💡 Avalie políticas de redução no prazo de recebimento"),
+    (["rentabilidade_vendas"],
+     lambda d: d["rentabilidade_vendas"] < 10,
+     "💡 Analise a estrutura de custos e política de preços"),
+]
+
+
+def pivotar_lancamentos(lancamentos, coluna_entidade="entidade", coluna_periodo="periodo",
+                        coluna_conta="conta", coluna_valor="valor"):
+    """Converte linhas (entidade, período, conta, valor) em uma linha por entidade e período."""
+    return lancamentos.pivot_table(index=[coluna_entidade, coluna_periodo], columns=coluna_conta,
+                                   values=coluna_valor, aggfunc="sum", observed=True).rename_axis(columns=None)
+
+
+def calcular_indicadores(dados, indicadores=None):
+    """Calcula os indicadores do registro para todas as linhas de `dados` de uma vez.
+
+    Indicadores cujos campos não existem em `dados` são ignorados. Devolve um
+    DataFrame com o mesmo índice de `dados` e uma coluna por indicador.
+    """
+    indicadores = INDICADORES if indicadores is None else indicadores
+    dados = dados.select_dtypes("number").fillna(0)
+    resultado = pd.DataFrame(index=dados.index)
+    for chave, definicao in indicadores.items():
+        if all(campo in dados.columns for campo in definicao["campos"]):
+            resultado[chave] = definicao["formula"](dados)
+    return resultado
+
+
+def avaliar_indicadores(resultado, indicadores=None):
+    """Classifica cada indicador com faixas em bom/atencao/ruim e a mensagem correspondente.
+
+    Devolve dois DataFrames (status, mensagens) com uma coluna por indicador avaliado.
+    """
+    indicadores = INDICADORES if indicadores is None else indicadores
+    status = pd.DataFrame(index=resultado.index)
+    mensagens = pd.DataFrame(index=resultado.index)
+    for chave, definicao in indicadores.items():
+        if chave not in resultado.columns or "faixas" not in definicao:
+            continue
+        valores = resultado[chave].to_numpy()
+        condicoes = []
+        for limite, _, _ in definicao["faixas"]:
+            if limite is None:
+                condicoes.append(np.ones(len(valores), dtype=bool))
+            elif definicao["maior_melhor"]:
+                condicoes.append(valores > limite)
+            else:
+                condicoes.append(valores < limite)
+        status[chave] = np.select(condicoes, [s for _, s, _ in definicao["faixas"]], default="")
+        mensagens[chave] = np.select(condicoes, [m for _, _, m in definicao["faixas"]], default="")
+    return status, mensagens
+
+
+def gerar_recomendacoes(dados, resultado):
+    """Tabela booleana (linhas x recomendações) indicando quais recomendações se aplicam a cada linha."""
+    combinado = pd.concat([dados.select_dtypes("number").fillna(0), resultado], axis=1)
+    combinado = combinado.loc[:, ~combinado.columns.duplicated()]
+    recomendacoes = pd.DataFrame(index=combinado.index)
+    for campos, condicao, mensagem in RECOMENDACOES:
+        if all(campo in combinado.columns for campo in campos):
+            recomendacoes[mensagem] = np.asarray(condicao(combinado), dtype=bool)
+    return recomendacoes
+
+
+def selecionar(*chaves):
+    """Subconjunto do registro, na ordem informada."""
+    return {chave: INDICADORES[chave] for chave in chaves}
+
+
+def formatar_indicador(chave, valor):
+    definicao = INDICADORES[chave]
+    casas = 0 if definicao["sufixo"] == " dias" else 2
+    return f"{valor:.{casas}f}{definicao['sufixo']}"
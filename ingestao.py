@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+DIRETORIO_CACHE = os.getenv('INGESTAO_CACHE_DIRETORIO', os.path.join('.cache', 'ingestao'))
+# Arquivos acima deste tamanho são lidos em blocos e gravados em Parquet antes de carregar
+LIMITE_STREAMING_BYTES = int(os.getenv('INGESTAO_LIMITE_STREAMING_MB', 100)) * 1024 * 1024
+LINHAS_POR_BLOCO = 500_000
+# Entra no nome dos arquivos em cache; mudar a otimização de tipos exige trocar a versão
+VERSAO_CACHE = 2
+
+# Colunas de código (conta, centro de custo...) viram categóricas mesmo com muitos valores distintos
+PADRAO_COLUNAS_CODIGO = re.compile(r"conta|codigo|cod_|centro|categoria|cfop|cnpj|cpf|grupo", re.IGNORECASE)
+
+
+def hash_arquivo(arquivo, tamanho_bloco=8 * 1024 * 1024):
+    """SHA-256 do conteúdo, lido em blocos para não duplicar arquivos grandes na memória."""
+    sha = hashlib.sha256()
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+        sha.update(bloco)
+    arquivo.seek(0)
+    return sha.hexdigest()
+
+
+def _tamanho(arquivo):
+    posicao = arquivo.tell()
+    arquivo.seek(0, os.SEEK_END)
+    tamanho = arquivo.tell()
+    arquivo.seek(posicao)
+    return tamanho
+
+
+def otimizar_tipos(df, limite_cardinalidade=0.5, copiar=True):
+    """Reduz o uso de memória: inteiros menores quando seguro, texto repetitivo como categoria.
+
+    Com `copiar=False` as colunas são trocadas no próprio `df` (para DataFrames recém-lidos).
+    """
+    otimizado = df.copy() if copiar else df
+    for coluna in otimizado.columns:
+        serie = otimizado[coluna]
+        # Floats ficam em float64: são valores monetários, e float32 perde centavos a partir de ~R$ 100 mil
+        if pd.api.types.is_integer_dtype(serie):
+            otimizado[coluna] = pd.to_numeric(serie, downcast="integer")
+        elif pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            distintos = serie.nunique(dropna=True)
+            if PADRAO_COLUNAS_CODIGO.search(str(coluna)) or distintos <= limite_cardinalidade * max(len(serie), 1):
+                otimizado[coluna] = serie.astype("category")
+    return otimizado
+
+
+def _hash_opcoes(opcoes_csv):
+    # sep, decimal, encoding, dtype...: o mesmo arquivo lido de outro jeito é outro DataFrame
+    texto = json.dumps(opcoes_csv, sort_keys=True, default=repr)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def _caminho_cache(chave, diretorio):
+    return os.path.join(diretorio, f"{chave}.v{VERSAO_CACHE}.parquet")
+
+
+def _parquet_disponivel():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _tipo_ampliado(tipos):
+    # Tipo que comporta todos os blocos: iguais ficam como estão, números mistos viram float64
+    # (inteiros com vazios ou frações em blocos posteriores) e o resto vira texto
+    tipos = list(dict.fromkeys(tipos))
+    if len(tipos) == 1:
+        return tipos[0]
+    if all(pd.api.types.is_numeric_dtype(t) and not pd.api.types.is_bool_dtype(t) for t in tipos):
+        return np.dtype("float64")
+    return str
+
+
+def _tipos_ampliados(arquivo, linhas_por_bloco, opcoes_csv):
+    # Primeira passada: só os tipos de cada bloco, sem guardar os dados
+    vistos = {}
+    for bloco in pd.read_csv(arquivo, chunksize=linhas_por_bloco, **opcoes_csv):
+        for coluna, tipo in bloco.dtypes.items():
+            vistos.setdefault(coluna, []).append(tipo)
+    return {coluna: _tipo_ampliado(tipos) for coluna, tipos in vistos.items()}
+
+
+def _esquema_arrow(tipos):
+    import pyarrow as pa
+
+    return pa.schema([(str(coluna), pa.string() if tipo is str or pd.api.types.is_string_dtype(tipo)
+                       or pd.api.types.is_object_dtype(tipo) else pa.from_numpy_dtype(tipo))
+                      for coluna, tipo in tipos.items()])
+
+
+def converter_para_parquet(arquivo, destino, linhas_por_bloco=LINHAS_POR_BLOCO, **opcoes_csv):
+    """Lê o CSV em blocos e grava em Parquet incrementalmente (memória limitada a um bloco).
+
+    São duas passadas: a primeira descobre, bloco a bloco, o tipo que comporta todos os
+    valores de cada coluna (nunca o de um bloco só); a segunda lê com esses tipos e grava.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Os tipos pedidos em `dtype` já valem na primeira passada e entram no resultado dela
+    tipos = _tipos_ampliados(arquivo, linhas_por_bloco, opcoes_csv)
+    opcoes_csv = {chave: valor for chave, valor in opcoes_csv.items() if chave != "dtype"}
+    esquema = _esquema_arrow(tipos)
+    arquivo.seek(0)
+
+    temporario = destino + ".tmp"
+    with pq.ParquetWriter(temporario, esquema) as escritor:
+        for bloco in pd.read_csv(arquivo, chunksize=linhas_por_bloco, dtype=tipos, **opcoes_csv):
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+    os.replace(temporario, destino)
+
+
+def _tipos_colunas_codigo(arquivo, opcoes_csv):
+    # Lê só o cabeçalho para forçar texto nas colunas de código ("1.10" não pode virar 1.1)
+    arquivo.seek(0)
+    colunas = pd.read_csv(arquivo, nrows=0, **opcoes_csv).columns
+    arquivo.seek(0)
+    return {coluna: str for coluna in colunas if PADRAO_COLUNAS_CODIGO.search(str(coluna))}
+
+
+def carregar_csv(arquivo, chave=None, diretorio=DIRETORIO_CACHE, **opcoes_csv):
+    """Carrega um CSV com cache em disco por hash do conteúdo e tipos otimizados.
+
+    Na primeira leitura o resultado é gravado em Parquet (se o pyarrow estiver
+    instalado); leituras seguintes do mesmo conteúdo e das mesmas `opcoes_csv` vêm
+    direto do formato colunar.
+
+    Acima de LIMITE_STREAMING_BYTES só a conversão para Parquet é feita em blocos: o
+    DataFrame devolvido fica inteiro em memória (uma cópia, sem duplicar na otimização).
+    """
+    chave = chave or hash_arquivo(arquivo)
+    opcoes_csv.setdefault("dtype", _tipos_colunas_codigo(arquivo, opcoes_csv))
+    if not _parquet_disponivel():
+        arquivo.seek(0)
+        return otimizar_tipos(pd.read_csv(arquivo, **opcoes_csv), copiar=False)
+
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = _caminho_cache(f"{chave}_{_hash_opcoes(opcoes_csv)}", diretorio)
+    if not os.path.exists(caminho):
+        arquivo.seek(0)
+        if _tamanho(arquivo) > LIMITE_STREAMING_BYTES:
+            converter_para_parquet(arquivo, caminho, **opcoes_csv)
+        else:
+            df = otimizar_tipos(pd.read_csv(arquivo, **opcoes_csv), copiar=False)
+            temporario = caminho + ".tmp"
+            df.to_parquet(temporario, index=False)
+            os.replace(temporario, caminho)
+            return df
+    return otimizar_tipos(pd.read_parquet(caminho), copiar=False)
+
+
+def pagina(df, numero, tamanho=100):
+    """Fatia de `tamanho` linhas para pré-visualização (páginas a partir de 1)."""
+    inicio = (numero - 1) * tamanho
+    return df.iloc[inicio:inicio + tamanho]
+
+
+def uso_memoria_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
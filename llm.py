@@ -0,0 +1,202 @@
+import threading
+import time
+from functools import lru_cache
+
+import desempenho
+from cache_llm import gerar_chave
+
+MODELO_PADRAO = "gpt-4"
+SISTEMA_PADRAO = "Você é um especialista contábil."
+
+
+@lru_cache(maxsize=None)
+def _codificador(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def estimar_tokens(texto, model=MODELO_PADRAO):
+    codificador = _codificador(model)
+    if codificador is None:
+        # Sem tiktoken instalado: aproximação de ~4 caracteres por token
+        return len(texto) // 4 + 1
+    return len(codificador.encode(texto))
+
+
+def montar_mensagens(prompt, sistema=SISTEMA_PADRAO):
+    return [
+        {"role": "system", "content": sistema},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _criar(client, **parametros):
+    # Aceita o ClienteLLM compartilhado (repetição e agrupamento) ou um cliente OpenAI direto
+    criar = getattr(client, "criar", None) or client.chat.completions.create
+    return criar(**parametros)
+
+
+def _tokens(uso, metricas):
+    # `usage` da resposta (ou do último chunk do stream); ausente em clientes que não informam
+    if uso is not None:
+        metricas.update(tokens_prompt=uso.prompt_tokens, tokens_resposta=uso.completion_tokens)
+
+
+def _registrar(model, metricas, erro=None):
+    # Cada chamada (inclusive as servidas pelo cache) vira um span "llm" no registro de desempenho
+    desempenho.registrar("llm", "cache" if metricas.get("cache") else model, metricas.get("latencia_total", 0.0),
+                         erro, cache=metricas.get("cache", False), tokens_prompt=metricas.get("tokens_prompt", 0),
+                         tokens_resposta=metricas.get("tokens_resposta", 0),
+                         tempo_primeiro_token=metricas.get("tempo_primeiro_token"),
+                         cancelado=metricas.get("cancelado", False))
+
+
+def completar(client, prompt, sistema=SISTEMA_PADRAO, model=MODELO_PADRAO, cache=None, metricas=None, validar=None,
+              **parametros):
+    """Envia o prompt ao modelo, consultando o cache antes de chamar a API.
+
+    `validar(conteudo)` levanta exceção para respostas inválidas (ex.: JSON malformado):
+    elas não são gravadas no cache e, se já estiverem nele, são pedidas de novo.
+    """
+    messages = montar_mensagens(prompt, sistema)
+    metricas = {} if metricas is None else metricas
+    inicio = time.perf_counter()
+
+    chave = None
+    if cache is not None:
+        chave = gerar_chave(model, messages, **parametros)
+        conteudo = cache.obter(chave)
+        if conteudo is not None and validar is not None and not _valida(validar, conteudo):
+            conteudo = None
+        if conteudo is not None:
+            decorrido = time.perf_counter() - inicio
+            metricas.update(tempo_primeiro_token=decorrido, latencia_total=decorrido, cache=True)
+            _registrar(model, metricas)
+            return conteudo
+
+    try:
+        response = _criar(client, model=model, messages=messages, **parametros)
+    except Exception as erro:
+        metricas.update(latencia_total=time.perf_counter() - inicio, cache=False)
+        _registrar(model, metricas, type(erro).__name__)
+        raise
+    conteudo = response.choices[0].message.content
+
+    # Sem streaming o primeiro token só chega junto com a resposta completa
+    decorrido = time.perf_counter() - inicio
+    metricas.update(tempo_primeiro_token=decorrido, latencia_total=decorrido, cache=False)
+    _tokens(getattr(response, "usage", None), metricas)
+    _registrar(model, metricas)
+
+    if validar is not None:
+        validar(conteudo)
+    if cache is not None and conteudo:
+        cache.gravar(chave, conteudo)
+    return conteudo
+
+
+def _valida(validar, conteudo):
+    try:
+        validar(conteudo)
+    except Exception:
+        return False
+    return True
+
+
+def completar_stream(client, prompt, sistema=SISTEMA_PADRAO, model=MODELO_PADRAO, cache=None, metricas=None, **parametros):
+    """Gera os tokens da resposta à medida que chegam (stream=True).
+
+    Se o consumidor abandonar o gerador (rerun ou troca de tela no Streamlit),
+    a conexão HTTP é fechada e a resposta parcial não é gravada no cache.
+    """
+    messages = montar_mensagens(prompt, sistema)
+    metricas = {} if metricas is None else metricas
+    inicio = time.perf_counter()
+
+    chave = None
+    if cache is not None:
+        chave = gerar_chave(model, messages, **parametros)
+        conteudo = cache.obter(chave)
+        if conteudo is not None:
+            decorrido = time.perf_counter() - inicio
+            metricas.update(tempo_primeiro_token=decorrido, latencia_total=decorrido, cache=True, cancelado=False)
+            _registrar(model, metricas)
+            yield conteudo
+            return
+
+    metricas["cache"] = False
+    try:
+        # include_usage: o último chunk traz a contagem de tokens
+        stream = _criar(client, model=model, messages=messages, stream=True,
+                        stream_options={"include_usage": True}, **parametros)
+    except Exception as erro:
+        metricas["latencia_total"] = time.perf_counter() - inicio
+        _registrar(model, metricas, type(erro).__name__)
+        raise
+    partes = []
+    concluido = False
+    erro = None
+    try:
+        for chunk in stream:
+            _tokens(getattr(chunk, "usage", None), metricas)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not partes:
+                    metricas["tempo_primeiro_token"] = time.perf_counter() - inicio
+                partes.append(delta)
+                yield delta
+        concluido = True
+    except Exception as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        stream.close()
+        metricas["latencia_total"] = time.perf_counter() - inicio
+        metricas["cancelado"] = not concluido
+        _registrar(model, metricas, erro)
+
+    if cache is not None and partes:
+        cache.gravar(chave, "".join(partes))
+
+
+class LimitadorTaxa:
+    """Controla requisições/min e tokens/min compartilhados entre threads (token bucket)."""
+
+    def __init__(self, requisicoes_por_minuto=500, tokens_por_minuto=80000):
+        self.rpm = requisicoes_por_minuto
+        self.tpm = tokens_por_minuto
+        self._requisicoes = float(requisicoes_por_minuto)
+        self._tokens = float(tokens_por_minuto)
+        self._ultimo = time.monotonic()
+        self._trava = threading.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        decorrido = agora - self._ultimo
+        self._ultimo = agora
+        self._requisicoes = min(self.rpm, self._requisicoes + decorrido * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + decorrido * self.tpm / 60)
+
+    def aguardar(self, tokens):
+        # Requisições maiores que o limite por minuto esperam o balde encher por completo
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._trava:
+                self._repor()
+                if self._requisicoes >= 1 and self._tokens >= tokens:
+                    self._requisicoes -= 1
+                    self._tokens -= tokens
+                    return
+                espera = max(
+                    (1 - self._requisicoes) * 60 / self.rpm,
+                    (tokens - self._tokens) * 60 / self.tpm,
+                )
+            time.sleep(max(espera, 0.01))
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+# Valores monetários em centavos (int64): somas e diferenças exatas, sem deriva de ponto flutuante.
+# Percentuais são aplicados como inteiros com até 4 casas decimais (ex.: 1,65% -> 16500).
+ESCALA_PERCENTUAL = 10 ** 4
+
+# meio_para_cima: 0,5 afasta do zero (padrão fiscal); meio_par: 0,5 vai para o par (bancário);
+# truncar: descarta a fração; para_cima: qualquer fração afasta do zero
+MODOS_ARREDONDAMENTO = ("meio_para_cima", "meio_par", "truncar", "para_cima")
+ARREDONDAMENTO_PADRAO = "meio_para_cima"
+
+
+def _escalar_ou_vetor(valores):
+    return valores.item() if isinstance(valores, np.ndarray) and valores.ndim == 0 else valores
+
+
+def para_centavos(reais):
+    """Converte reais (número, vetor, Series ou DataFrame) em centavos int64, arredondando ao centavo."""
+    if isinstance(reais, (pd.Series, pd.DataFrame)):
+        return reais.astype(float).mul(100).round().astype(np.int64)
+    return _escalar_ou_vetor(np.rint(np.asarray(reais, dtype=float) * 100).astype(np.int64))
+
+
+def para_reais(centavos):
+    """Centavos -> reais (float), apenas para exibição e exportação."""
+    if isinstance(centavos, (pd.Series, pd.DataFrame)):
+        return centavos / 100
+    return _escalar_ou_vetor(np.asarray(centavos, dtype=np.int64) / 100)
+
+
+def dividir_arredondando(numerador, denominador, modo=ARREDONDAMENTO_PADRAO):
+    """Divisão de inteiros com o modo de arredondamento informado, sem passar por ponto flutuante."""
+    numerador = np.asarray(numerador, dtype=np.int64)
+    denominador = np.asarray(denominador, dtype=np.int64)
+    sinal = np.sign(numerador) * np.sign(denominador)
+    divisor = np.abs(denominador)
+    quociente, resto = np.divmod(np.abs(numerador), divisor)
+    if modo == "meio_para_cima":
+        ajuste = 2 * resto >= divisor
+    elif modo == "meio_par":
+        ajuste = (2 * resto > divisor) | ((2 * resto == divisor) & (quociente % 2 == 1))
+    elif modo == "truncar":
+        ajuste = np.zeros_like(resto, dtype=bool)
+    elif modo == "para_cima":
+        ajuste = resto > 0
+    else:
+        raise ValueError(f"Modo de arredondamento desconhecido: {modo}")
+    return _escalar_ou_vetor(sinal * (quociente + ajuste))
+
+
+def aplicar_percentual(centavos, percentual, modo=ARREDONDAMENTO_PADRAO):
+    """`percentual`% de `centavos` (escalares ou vetores), arredondado ao centavo."""
+    taxa = np.rint(np.asarray(percentual, dtype=float) * ESCALA_PERCENTUAL).astype(np.int64)
+    return dividir_arredondando(np.asarray(centavos, dtype=np.int64) * taxa, 100 * ESCALA_PERCENTUAL, modo)
+
+
+def arredondar(centavos, modo=ARREDONDAMENTO_PADRAO):
+    """Arredonda centavos fracionários (resultado de fórmulas com fatores reais) para int64."""
+    valores = np.asarray(centavos, dtype=float)
+    if modo == "meio_para_cima":
+        arredondado = np.sign(valores) * np.floor(np.abs(valores) + 0.5)
+    elif modo == "meio_par":
+        arredondado = np.rint(valores)
+    elif modo == "truncar":
+        arredondado = np.trunc(valores)
+    elif modo == "para_cima":
+        arredondado = np.sign(valores) * np.ceil(np.abs(valores))
+    else:
+        raise ValueError(f"Modo de arredondamento desconhecido: {modo}")
+    return _escalar_ou_vetor(arredondado.astype(np.int64))
+
+
+def ratear(total, pesos):
+    """Divide `total` centavos proporcionalmente aos `pesos`, sem perder nem criar centavos.
+
+    Cada parte recebe o piso da sua cota e os centavos que sobram vão para as
+    maiores frações (método do maior resto); a soma das partes é sempre `total`.
+    """
+    pesos = np.asarray(pesos, dtype=float)
+    soma_pesos = pesos.sum()
+    if soma_pesos == 0:
+        raise ValueError("A soma dos pesos do rateio não pode ser zero")
+    cotas = int(total) * (pesos / soma_pesos)
+    partes = np.floor(cotas).astype(np.int64)
+    sobra = int(total) - int(partes.sum())
+    partes[np.argsort(partes - cotas, kind="stable")[:sobra]] += 1
+    return partes
+
+
+def somar(reais, por=None):
+    """Soma exata de colunas em reais: converte para centavos, soma (opcionalmente agrupando) e volta a reais.
+
+    Valores ausentes contam como zero, como em `Series.sum`.
+    """
+    centavos = para_centavos(reais.fillna(0))
+    if por is not None:
+        centavos = centavos.groupby(por, observed=True)
+    return para_reais(centavos.sum())
+
+
+def formatar(centavos):
+    return f"R$ {para_reais(centavos):,.2f}"
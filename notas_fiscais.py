@@ -0,0 +1,270 @@
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from moeda import para_centavos, para_reais, aplicar_percentual
+
+# PIS/COFINS por regime de apuração (%)
+REGIMES_PIS_COFINS = {
+    "cumulativo": {"pis": 0.65, "cofins": 3.0},
+    "nao_cumulativo": {"pis": 1.65, "cofins": 7.6},
+}
+
+# Simples Nacional (LC 123/2006, redação da LC 155/2016): por anexo,
+# (limite da receita bruta em 12 meses, alíquota nominal %, parcela a deduzir)
+ANEXOS_SIMPLES = {
+    "I": [(180000.00, 4.0, 0.0), (360000.00, 7.3, 5940.0), (720000.00, 9.5, 13860.0),
+          (1800000.00, 10.7, 22500.0), (3600000.00, 14.3, 87300.0), (4800000.00, 19.0, 378000.0)],
+    "II": [(180000.00, 4.5, 0.0), (360000.00, 7.8, 5940.0), (720000.00, 10.0, 13860.0),
+           (1800000.00, 11.2, 22500.0), (3600000.00, 14.7, 85500.0), (4800000.00, 30.0, 720000.0)],
+    "III": [(180000.00, 6.0, 0.0), (360000.00, 11.2, 9360.0), (720000.00, 13.5, 17640.0),
+            (1800000.00, 16.0, 35640.0), (3600000.00, 21.0, 125640.0), (4800000.00, 33.0, 648000.0)],
+    "IV": [(180000.00, 4.5, 0.0), (360000.00, 9.0, 8100.0), (720000.00, 10.2, 12420.0),
+           (1800000.00, 14.0, 39780.0), (3600000.00, 22.0, 183780.0), (4800000.00, 33.0, 828000.0)],
+    "V": [(180000.00, 15.5, 0.0), (360000.00, 18.0, 4500.0), (720000.00, 19.5, 9900.0),
+          (1800000.00, 20.5, 17100.0), (3600000.00, 23.0, 62100.0), (4800000.00, 30.5, 540000.0)],
+}
+
+# ISS: alíquota padrão e exceções por código IBGE do município (carregadas pelo usuário)
+ISS_PADRAO = 5.0
+
+# CFOPs de saída começam com 5, 6 ou 7; os grupos x.9xx (remessas, bonificações...) não geram receita
+PREFIXOS_SAIDA = ("5", "6", "7")
+PREFIXOS_SEM_RECEITA = ("59", "69", "79")
+
+# Diferença (R$) entre o imposto destacado e o calculado a partir da qual a linha é sinalizada
+TOLERANCIA_DIVERGENCIA = 0.05
+
+COLUNAS_ITENS = ["arquivo", "chave", "modelo", "numero", "emissao", "emitente", "crt", "municipio", "cfop",
+                 "base", "icms", "pis", "cofins", "iss"]
+
+
+def _nome(tag):
+    # Remove o namespace: "{http://www.portalfiscal.inf.br/nfe}det" -> "det"
+    return tag.rsplit("}", 1)[-1]
+
+
+def _numero(texto):
+    return float(texto) if texto else 0.0
+
+
+def ler_notas(caminho):
+    """Extrai os itens de um XML de NF-e (modelo 55/65) ou NFS-e (padrão ABRASF) sem montar a árvore inteira.
+
+    Cada item de NF-e vira uma linha; cada NFS-e vira uma linha com CFOP "SERVICO".
+    Os elementos são descartados assim que lidos, então arquivos com muitas notas
+    (lotes, CompNfse) não crescem em memória.
+    """
+    itens = []
+    caminho_atual = []
+    nota = {}
+    item = None
+    arquivo = os.path.basename(caminho)
+
+    for evento, elemento in ET.iterparse(caminho, events=("start", "end")):
+        tag = _nome(elemento.tag)
+        if evento == "start":
+            caminho_atual.append(tag)
+            if tag == "infNFe":
+                nota = {"arquivo": arquivo, "chave": elemento.get("Id", "")[3:], "modelo": "NF-e",
+                        "numero": "", "emissao": "", "emitente": "", "crt": "", "municipio": ""}
+            elif tag == "InfNfse":
+                nota = {"arquivo": arquivo, "chave": "", "modelo": "NFS-e", "numero": "", "emissao": "",
+                        "emitente": "", "crt": "", "municipio": "", "cfop": "SERVICO",
+                        "base": 0.0, "icms": 0.0, "pis": 0.0, "cofins": 0.0, "iss": 0.0}
+            elif tag == "det":
+                item = {"cfop": "", "base": 0.0, "icms": 0.0, "pis": 0.0, "cofins": 0.0, "iss": 0.0}
+            continue
+
+        caminho_atual.pop()
+        pai = caminho_atual[-1] if caminho_atual else ""
+        texto = (elemento.text or "").strip()
+
+        # NF-e
+        if item is not None:
+            if tag == "det":
+                itens.append({**nota, **item})
+                item = None
+                elemento.clear()
+            elif pai == "prod" and tag == "CFOP":
+                item["cfop"] = texto
+            elif pai == "prod" and tag == "vProd":
+                item["base"] += _numero(texto)
+            elif pai == "prod" and tag == "vDesc":
+                item["base"] -= _numero(texto)
+            elif tag == "vICMS" and "ICMS" in caminho_atual:
+                item["icms"] = _numero(texto)
+            elif tag == "vPIS" and "PIS" in caminho_atual:
+                item["pis"] = _numero(texto)
+            elif tag == "vCOFINS" and "COFINS" in caminho_atual:
+                item["cofins"] = _numero(texto)
+            elif tag == "vISSQN":
+                item["iss"] = _numero(texto)
+        elif pai == "ide" and tag == "nNF":
+            nota["numero"] = texto
+        elif pai == "ide" and tag == "mod":
+            nota["modelo"] = "NFC-e" if texto == "65" else "NF-e"
+        elif pai == "ide" and tag in ("dhEmi", "dEmi"):
+            nota["emissao"] = texto[:10]
+        elif pai == "emit" and tag in ("CNPJ", "CPF"):
+            nota["emitente"] = texto
+        elif pai == "emit" and tag == "CRT":
+            nota["crt"] = texto
+        elif pai == "enderEmit" and tag == "cMun":
+            nota["municipio"] = texto
+        elif tag == "infNFe":
+            elemento.clear()
+
+        # NFS-e (ABRASF)
+        elif tag == "InfNfse":
+            itens.append(dict(nota))
+            elemento.clear()
+        elif nota.get("modelo") == "NFS-e":
+            if pai == "InfNfse" and tag == "Numero":
+                nota["numero"] = texto
+            elif pai == "InfNfse" and tag == "CodigoVerificacao":
+                nota["chave"] = texto
+            elif pai == "InfNfse" and tag == "DataEmissao":
+                nota["emissao"] = texto[:10]
+            elif pai == "Valores" and tag == "ValorServicos":
+                nota["base"] += _numero(texto)
+            elif pai == "Valores" and tag == "ValorDeducoes":
+                nota["base"] -= _numero(texto)
+            elif pai in ("Valores", "ValoresNfse") and tag == "ValorIss":
+                nota["iss"] = _numero(texto)
+            elif pai == "Valores" and tag == "ValorPis":
+                nota["pis"] = _numero(texto)
+            elif pai == "Valores" and tag == "ValorCofins":
+                nota["cofins"] = _numero(texto)
+            elif pai == "Servico" and tag == "CodigoMunicipio":
+                nota["municipio"] = texto
+            elif tag == "Cnpj" and "Prestador" in "".join(caminho_atual):
+                nota["emitente"] = texto
+    return itens
+
+
+def _ler_lote(caminhos):
+    # Executado nos processos: devolve o lote já como DataFrame (uma serialização só)
+    itens, erros = [], []
+    for caminho in caminhos:
+        try:
+            itens.extend(ler_notas(caminho))
+        except (ET.ParseError, OSError, ValueError) as erro:
+            # Um arquivo ilegível ou com número malformado vai para os erros sem derrubar o lote
+            erros.append((os.path.basename(caminho), str(erro)))
+    return pd.DataFrame(itens, columns=COLUNAS_ITENS), erros
+
+
+def ler_lote_notas(caminhos, max_workers=None, tamanho_lote=None, progresso=None):
+    """Lê muitos XMLs em paralelo, dividindo os arquivos em lotes entre processos.
+
+    Devolve (itens, erros): um DataFrame com uma linha por item/serviço e a lista
+    de (arquivo, mensagem) dos XMLs que não puderam ser lidos.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    # Lotes pequenos o bastante para equilibrar a carga, grandes o bastante para diluir o custo de cada tarefa
+    tamanho_lote = tamanho_lote or min(max(len(caminhos) // (max_workers * 4), 1), 500)
+    lotes = [caminhos[i:i + tamanho_lote] for i in range(0, len(caminhos), tamanho_lote)]
+    if max_workers == 1 or len(lotes) == 1:
+        partes = []
+        for concluidos, lote in enumerate(lotes, start=1):
+            partes.append(_ler_lote(lote))
+            if progresso is not None:
+                progresso(concluidos, len(lotes))
+    else:
+        partes = [None] * len(lotes)
+        # "spawn" evita herdar as threads do servidor do Streamlit por fork
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as executor:
+            futuros = {executor.submit(_ler_lote, lote): i for i, lote in enumerate(lotes)}
+            try:
+                for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                    partes[futuros[futuro]] = futuro.result()
+                    if progresso is not None:
+                        progresso(concluidos, len(lotes))
+            except BaseException:
+                # Interrompido (erro ou tarefa cancelada): lotes que ainda não começaram são descartados
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    itens = pd.concat([p[0] for p in partes], ignore_index=True) if partes else pd.DataFrame(columns=COLUNAS_ITENS)
+    erros = [erro for p in partes for erro in p[1]]
+    return itens, erros
+
+
+def aliquota_simples(anexo, receita_12_meses):
+    """Alíquota efetiva (%) do Simples Nacional: (RBT12 x nominal - parcela a deduzir) / RBT12."""
+    faixas = ANEXOS_SIMPLES[anexo]
+    if receita_12_meses <= 0:
+        return faixas[0][1]
+    limites = np.array([limite for limite, _, _ in faixas])
+    faixa = min(int(np.searchsorted(limites, receita_12_meses, side="left")), len(faixas) - 1)
+    _, nominal, parcela = faixas[faixa]
+    return (receita_12_meses * nominal / 100 - parcela) / receita_12_meses * 100
+
+
+def montar_regras(regime, anexo="I", receita_12_meses=0.0, aliquotas_iss=None, iss_padrao=ISS_PADRAO):
+    """Conjunto de regras aplicado ao lote: regime ("cumulativo", "nao_cumulativo" ou "simples") e ISS."""
+    regras = {"regime": regime, "aliquotas_iss": dict(aliquotas_iss or {}), "iss_padrao": iss_padrao}
+    if regime == "simples":
+        regras["anexo"] = anexo
+        regras["aliquota_simples"] = aliquota_simples(anexo, receita_12_meses)
+    else:
+        regras.update(REGIMES_PIS_COFINS[regime])
+    return regras
+
+
+def calcular_impostos(itens, regras, tolerancia=TOLERANCIA_DIVERGENCIA):
+    """Calcula os impostos esperados de todos os itens de uma vez e sinaliza divergências.
+
+    PIS/COFINS (ou o DAS do Simples) são calculados sobre as saídas que geram
+    receita e sobre serviços; o ISS, sobre serviços e itens com ISSQN destacado
+    (no Simples o ISS é recolhido dentro do DAS e não é recalculado).
+    Linhas sem cálculo esperado (ex.: entradas) ficam com NaN e não são comparadas.
+    """
+    itens = itens.copy()
+    cfop = itens["cfop"].astype(str)
+    servico = (itens["modelo"] == "NFS-e").to_numpy()
+    receita = (cfop.str.startswith(PREFIXOS_SAIDA) & ~cfop.str.startswith(PREFIXOS_SEM_RECEITA)).to_numpy() | servico
+    # Cálculo em centavos; NaN marca as linhas sem imposto esperado
+    base = para_centavos(itens["base"].to_numpy(dtype=float))
+    calcular = lambda mascara, percentual: np.where(mascara, para_reais(aplicar_percentual(base, percentual)), np.nan)
+
+    if regras["regime"] == "simples":
+        itens["pis_calculado"] = np.nan
+        itens["cofins_calculado"] = np.nan
+        itens["simples_calculado"] = calcular(receita, regras["aliquota_simples"])
+    else:
+        itens["pis_calculado"] = calcular(receita, regras["pis"])
+        itens["cofins_calculado"] = calcular(receita, regras["cofins"])
+
+    if regras["regime"] == "simples":
+        itens["iss_calculado"] = np.nan
+    else:
+        aliquota_iss = itens["municipio"].astype(str).map(regras["aliquotas_iss"]).fillna(regras["iss_padrao"])
+        com_iss = servico | (itens["iss"].to_numpy(dtype=float) > 0)
+        itens["iss_calculado"] = calcular(com_iss, aliquota_iss.to_numpy(dtype=float))
+
+    # Lista dos impostos divergentes por linha, montada coluna a coluna (comparação em centavos)
+    divergencia = np.full(len(itens), "", dtype=object)
+    for imposto in ("pis", "cofins", "iss"):
+        calculado = itens[f"{imposto}_calculado"].to_numpy()
+        diferenca = np.abs(para_centavos(itens[imposto].to_numpy(dtype=float)) - para_centavos(np.nan_to_num(calculado)))
+        diverge = ~np.isnan(calculado) & (diferenca > para_centavos(tolerancia))
+        divergencia = np.where(diverge, divergencia + imposto.upper() + " ", divergencia)
+    itens["divergencia"] = pd.Series(divergencia, index=itens.index).str.strip()
+    itens["periodo"] = itens["emissao"].astype(str).str[:7]
+    return itens
+
+
+def totalizar(itens, nivel):
+    """Totais por "nota", "cfop" ou "periodo", com a quantidade de linhas divergentes."""
+    chaves = {"nota": ["arquivo", "chave", "numero"], "cfop": ["cfop"], "periodo": ["periodo"]}[nivel]
+    valores = [c for c in ["base", "icms", "pis", "pis_calculado", "cofins", "cofins_calculado",
+                           "iss", "iss_calculado", "simples_calculado"] if c in itens.columns]
+    totais = itens.groupby(chaves, observed=True)[valores].sum(min_count=1).round(2)
+    totais["divergencias"] = (itens["divergencia"] != "").groupby([itens[c] for c in chaves], observed=True).sum()
+    return totais
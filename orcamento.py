@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from moeda import somar
+
+CHAVES = ["categoria", "centro_custo", "periodo"]
+LIMITE_VARIACAO_PADRAO = 10.0
+
+
+def agregar(dados, coluna_valor):
+    """Soma os valores por categoria x centro de custo x período (AAAA-MM).
+
+    Aceita coluna `periodo` ou `data` do lançamento; sem `centro_custo`, tudo vai para "Geral".
+    """
+    if "centro_custo" not in dados.columns:
+        dados = dados.assign(centro_custo="Geral")
+    if "periodo" not in dados.columns and "data" in dados.columns:
+        # Trunca no mês com NumPy e só formata os períodos distintos depois da soma
+        dados = dados.assign(periodo=pd.to_datetime(dados["data"]).to_numpy().astype("datetime64[M]"))
+    totais = somar(dados[coluna_valor], por=[dados[chave] for chave in CHAVES])
+
+    # Chaves sempre como texto, para alinhar orçamento e razão mesmo se vierem como categorias
+    niveis = [nivel.strftime("%Y-%m") if pd.api.types.is_datetime64_any_dtype(nivel) else nivel.astype(str)
+              for nivel in totais.index.levels]
+    return totais.set_axis(totais.index.set_levels(niveis))
+
+
+def calcular_variacoes(orcado, realizado, limite_percentual=LIMITE_VARIACAO_PADRAO):
+    """Compara duas séries indexadas pelas mesmas chaves e sinaliza variações acima do limite.
+
+    Devolve um DataFrame com Orçado, Realizado, Variação, Variação % e Alerta
+    ("acima", "abaixo" ou ""), calculado sem iterar linha a linha.
+    """
+    variacoes = pd.concat([orcado.rename("Orçado"), realizado.rename("Realizado")], axis=1).fillna(0.0)
+    variacoes["Variação"] = variacoes["Realizado"] - variacoes["Orçado"]
+    orcado_valores = variacoes["Orçado"].to_numpy()
+    variacoes["Variação %"] = np.divide(variacoes["Variação"].to_numpy(), orcado_valores,
+                                        out=np.zeros(len(variacoes)), where=orcado_valores != 0) * 100
+    # Gasto ou receita sem orçamento também é sinalizado
+    fora_limite = (variacoes["Variação %"].abs() > limite_percentual) | ((orcado_valores == 0) & (variacoes["Variação"] != 0))
+    variacoes["Alerta"] = np.select(
+        [fora_limite & (variacoes["Variação"] > 0), fora_limite & (variacoes["Variação"] < 0)],
+        ["acima", "abaixo"], default=""
+    )
+    return variacoes
+
+
+class ControleOrcamento:
+    """Orçado x realizado por categoria, centro de custo e período, com reagregação incremental.
+
+    O razão é mantido apenas na forma agregada; novos lançamentos são somados aos
+    grupos existentes e só as variações dos grupos afetados são recalculadas.
+    """
+
+    def __init__(self, orcamento, lancamentos=None, limite_percentual=LIMITE_VARIACAO_PADRAO,
+                 coluna_orcado="valor_orcado", coluna_realizado="valor"):
+        self.limite_percentual = limite_percentual
+        self.coluna_realizado = coluna_realizado
+        self.orcado = agregar(orcamento, coluna_orcado)
+        self.realizado = pd.Series(0.0, index=self.orcado.index[:0], name=coluna_realizado)
+        self.variacoes = calcular_variacoes(self.orcado, self.realizado, limite_percentual)
+        if lancamentos is not None:
+            self.adicionar_lancamentos(lancamentos)
+
+    def adicionar_lancamentos(self, lancamentos):
+        """Incorpora novos lançamentos; devolve o índice dos grupos recalculados."""
+        novos = agregar(lancamentos, self.coluna_realizado)
+        # Arredonda ao centavo a cada carga para as somas incrementais não acumularem resíduo
+        self.realizado = self.realizado.add(novos, fill_value=0.0).round(2)
+
+        afetados = novos.index
+        # Grupos sem orçamento entram com orçado zero
+        atualizadas = calcular_variacoes(self.orcado.reindex(afetados), self.realizado.reindex(afetados),
+                                         self.limite_percentual)
+        self.variacoes = pd.concat([self.variacoes.drop(afetados, errors="ignore"), atualizadas]).sort_index()
+        return afetados
+
+    def resumo(self, niveis=("categoria",)):
+        """Variações reagregadas em um ou mais níveis (categoria, centro_custo, periodo)."""
+        totais = self.variacoes.groupby(list(niveis), observed=True)[["Orçado", "Realizado"]].sum()
+        return calcular_variacoes(totais["Orçado"], totais["Realizado"], self.limite_percentual)
+
+    def detalhar(self, **filtros):
+        """Linhas de variação filtradas por chave, ex.: detalhar(categoria="Marketing")."""
+        detalhe = self.variacoes
+        for nivel, valor in filtros.items():
+            detalhe = detalhe[detalhe.index.get_level_values(nivel) == valor]
+        return detalhe
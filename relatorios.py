@@ -0,0 +1,417 @@
+import argparse
+import csv
+import hashlib
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+
+import pandas as pd
+
+from cache_llm import CacheLLM
+from calculos import projetar_fluxo, CAMPOS_BALANCO
+from cli import ler_csv
+from cliente_llm import criar_cliente, ErroLLM
+from dre import DREMultiperiodo, NOMES_LINHAS
+from historico import Historico
+from indicadores import calcular_indicadores, avaliar_indicadores, pivotar_lancamentos, dividir, INDICADORES
+from llm import completar
+from moeda import somar
+from orcamento import ControleOrcamento, LIMITE_VARIACAO_PADRAO
+
+# Pacotes de fechamento por empresa (Excel e/ou PDF) para uma carteira inteira. Exemplos:
+#   python relatorios.py demonstrativos.csv --orcamento orcamento.csv --razao razao.csv --fluxo fluxo.csv
+#   python relatorios.py demonstrativos.csv --formatos xlsx pdf --comentario --processos 8
+# Os cálculos da carteira são feitos uma vez para todas as empresas (e memorizados no histórico);
+# cada pacote é gravado por um processo do pool assim que fica pronto, e o índice (relatorios.csv)
+# cresce a cada pacote, sem acumular os resultados em memória.
+
+# Configuração padrão (pode ser sobrescrita pelo .env)
+PROCESSOS_PADRAO = int(os.getenv('RELATORIOS_PROCESSOS', os.cpu_count() or 2))
+SIMULTANEAS_IA_PADRAO = int(os.getenv('RELATORIOS_SIMULTANEAS_IA', 8))
+MESES_FLUXO_PADRAO = 12
+FORMATOS = ("xlsx", "pdf")
+INDICE = "relatorios.csv"
+# O PDF mostra os últimos períodos e as primeiras linhas de cada tabela; o Excel leva tudo
+COLUNAS_PDF = 8
+LINHAS_PDF = 40
+
+FORMATO_NUMERO = "#,##0.00"
+FORMATO_PERCENTUAL = '#,##0.00"%"'
+
+
+def _disponivel(modulo):
+    try:
+        __import__(modulo)
+    except ImportError:
+        return False
+    return True
+
+
+def _motor_excel():
+    # xlsxwriter grava bem mais rápido; sem ele, o openpyxl que o pandas já usa
+    return "xlsxwriter" if _disponivel("xlsxwriter") else "openpyxl"
+
+
+def calcular_carteira(demonstrativos):
+    """Cálculos compartilhados pelos pacotes: DRE multiperíodo e indicadores do balanço de todas as empresas.
+
+    `demonstrativos` tem entidade, periodo, conta e valor; contas com nome de campo do
+    balanço (ex.: ativo_circulante) vão para os indicadores e as demais para a DRE.
+    """
+    demonstrativos = demonstrativos.assign(entidade=demonstrativos["entidade"].astype(str),
+                                           periodo=demonstrativos["periodo"].astype(str))
+    do_balanco = demonstrativos["conta"].astype(str).isin(CAMPOS_BALANCO)
+    dre = DREMultiperiodo(demonstrativos[~do_balanco])
+
+    balanco = pivotar_lancamentos(demonstrativos[do_balanco]) if do_balanco.any() else pd.DataFrame()
+    # Vendas e lucro ausentes no balanço vêm da DRE do mesmo período
+    for campo, linha in [("vendas_liquidas", "receita_liquida"), ("lucro_liquido", "lucro_liquido")]:
+        if not balanco.empty and campo not in balanco.columns and dre.periodos:
+            balanco[campo] = dre.por_linha(linha).stack().reindex(balanco.index).to_numpy()
+    indices = calcular_indicadores(balanco)
+    status, _ = avaliar_indicadores(indices)
+    return {"dre": dre, "balanco": balanco, "indices": indices, "status": status}
+
+
+def _por_entidade(dados):
+    if dados is None:
+        return {}
+    return {str(entidade): grupo for entidade, grupo in dados.groupby("entidade", sort=False)}
+
+
+def _da_entidade(tabela, entidade):
+    # Linhas (período) de uma entidade em uma tabela indexada por (entidade, período)
+    if tabela.empty or entidade not in tabela.index.get_level_values(0):
+        return tabela.iloc[:0].droplevel(0) if isinstance(tabela.index, pd.MultiIndex) else tabela.iloc[:0]
+    return tabela.xs(entidade, level=0)
+
+
+def montar_conteudo(entidade, carteira, periodo=None, resumo_dre=None, orcamento=None, razao=None, fluxo=None,
+                    meses_fluxo=MESES_FLUXO_PADRAO, inflacao_anual=0.0, limite_variacao=LIMITE_VARIACAO_PADRAO):
+    """Números-chave e tabelas do pacote de uma empresa, ainda sem formatação.
+
+    `resumo` é uma lista de (rótulo, valor, unidade) e `secoes` de (título, DataFrame);
+    colunas terminadas em "%" são percentuais e as demais, valores.
+    """
+    dre = carteira["dre"]
+    resumo, secoes = [], []
+    if dre.periodos and entidade in dre.entidades:
+        periodo = periodo or str(dre.periodos[-1])
+        linha = (resumo_dre if resumo_dre is not None else dre.resumo(periodo)).loc[entidade]
+        resumo += [("Receita Líquida", linha["receita_liquida"], "R$"), ("EBITDA", linha["ebitda"], "R$"),
+                   ("Lucro Líquido", linha["lucro_liquido"], "R$"),
+                   ("Margem Bruta", linha["margem_lucro_bruto"], "%"), ("Margem EBITDA", linha["margem_ebitda"], "%"),
+                   ("Margem Líquida", linha["margem_lucro_liquido"], "%"),
+                   ("Variação da Receita Líquida", linha["var_receita_liquida"], "%")]
+        if "ltm_receita_liquida" in linha.index:
+            resumo += [("Receita Líquida (12 meses)", linha["ltm_receita_liquida"], "R$"),
+                       ("Lucro Líquido (12 meses)", linha["ltm_lucro_liquido"], "R$")]
+        secoes += [
+            ("DRE", dre.demonstrativo(entidade).rename(index=NOMES_LINHAS)),
+            ("Análise Vertical %", dre.vertical(entidade).rename(index=NOMES_LINHAS).add_suffix(" %")),
+            ("Análise Horizontal %", dre.horizontal(entidade).rename(index=NOMES_LINHAS).add_suffix(" %")),
+        ]
+        ltm = dre.ltm(entidade)
+        if not ltm.empty:
+            secoes.append(("Últimos 12 Meses", ltm.rename(index=NOMES_LINHAS)))
+
+    indices = _da_entidade(carteira["indices"], entidade)
+    saldo_inicial = 0.0
+    if not indices.empty:
+        atual = periodo if periodo in indices.index else indices.index[-1]
+        # Indicadores que repetem um número da DRE (ex.: margem líquida) não entram de novo no resumo
+        rotulos = {rotulo for rotulo, _, _ in resumo}
+        resumo += [(INDICADORES[chave]["nome"], valor, INDICADORES[chave]["sufixo"].strip() or "índice")
+                   for chave, valor in indices.loc[atual].items() if INDICADORES[chave]["nome"] not in rotulos]
+        secoes.append(("Indicadores", indices.rename(columns=lambda chave: INDICADORES[chave]["nome"] + (
+            " %" if INDICADORES[chave]["sufixo"] == "%" else ""))))
+        balanco = _da_entidade(carteira["balanco"], entidade)
+        if "disponivel" in balanco.columns:
+            saldo_inicial = float(balanco.loc[atual, "disponivel"])
+
+    if orcamento is not None:
+        controle = ControleOrcamento(orcamento, razao, limite_variacao)
+        variacoes = controle.variacoes
+        orcado, realizado = somar(variacoes["Orçado"]), somar(variacoes["Realizado"])
+        resumo += [("Orçado", orcado, "R$"), ("Realizado", realizado, "R$"),
+                   ("Variação do Orçamento", float(dividir((realizado - orcado) * 100, orcado)), "%"),
+                   ("Grupos do Orçamento em Alerta", (variacoes["Alerta"] != "").sum(), "grupos")]
+        secoes += [("Orçamento", controle.resumo(["categoria"])),
+                   ("Alertas do Orçamento", variacoes[variacoes["Alerta"] != ""])]
+
+    if fluxo is not None:
+        # Projeção a partir do disponível do balanço; valores positivos entram e negativos saem
+        valores = fluxo["valor"].astype(float)
+        inicio = (pd.Period(periodo) + 1).start_time if periodo else None
+        projecao = projetar_fluxo(saldo_inicial, valores[valores > 0].tolist(), (-valores[valores < 0]).tolist(),
+                                  meses_fluxo, inflacao_anual=inflacao_anual, inicio=inicio)
+        resumo += [("Saldo Projetado ao Final", projecao["Saldo Final"].iloc[-1], "R$"),
+                   ("Menor Saldo Projetado", projecao["Saldo Final"].min(), "R$")]
+        secoes.append(("Fluxo de Caixa", projecao.set_index("Mês")))
+
+    if not secoes:
+        raise ValueError(f"Sem dados para {entidade}")
+    return {"entidade": entidade, "periodo": periodo, "resumo": resumo, "secoes": secoes, "comentario": None}
+
+
+def _formatar_valor(valor, unidade):
+    if pd.isna(valor):
+        return "-"
+    if unidade == "R$":
+        return f"R$ {valor:,.2f}"
+    if unidade == "%":
+        return f"{valor:,.2f}%"
+    if unidade == "grupos":
+        return f"{int(valor):,}"
+    return f"{valor:,.2f}" + (f" {unidade}" if unidade not in ("", "índice") else "")
+
+
+def comentar(client, cache, conteudo, **parametros):
+    """Comentário da IA sobre os números do pacote.
+
+    O prompt leva só os números (sem o nome da empresa), então pacotes com os mesmos
+    números e reprocessamentos do mesmo fechamento saem do cache.
+    """
+    linhas = [f"- {rotulo}: {_formatar_valor(valor, unidade)}" for rotulo, valor, unidade in conteudo["resumo"]]
+    prompt = (f"Com base nos números de {conteudo['periodo']} abaixo, escreva um comentário gerencial curto "
+              "(até 6 frases) para o pacote de fechamento de uma empresa cliente: desempenho, riscos e pontos "
+              "de atenção.\n" + "\n".join(linhas))
+    return completar(client, prompt, cache=cache, **parametros)
+
+
+def _nome_arquivo(entidade):
+    # O hash curto do nome original separa empresas que ficariam iguais depois de limpar ("A/B" e "A B")
+    limpo = re.sub(r"[^\w.-]+", "_", entidade).strip("._") or "entidade"
+    return f"{limpo}_{hashlib.sha256(entidade.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _formatar_aba(writer, aba, tabela, colunas_rotulo):
+    planilha = writer.sheets[aba]
+    largura_rotulo = max([len(str(valor)) for valor in tabela.index] + [12]) + 2
+    numericas = [(colunas_rotulo + i, FORMATO_PERCENTUAL if str(coluna).endswith("%") else FORMATO_NUMERO)
+                 for i, (coluna, tipo) in enumerate(tabela.dtypes.items()) if pd.api.types.is_numeric_dtype(tipo)]
+    if writer.engine == "xlsxwriter":
+        planilha.set_column(0, colunas_rotulo - 1, largura_rotulo)
+        formatos = {}
+        for coluna, formato in numericas:
+            if formato not in formatos:
+                formatos[formato] = writer.book.add_format({"num_format": formato})
+            planilha.set_column(coluna, coluna, 16, formatos[formato])
+    else:
+        from openpyxl.utils import get_column_letter
+        for coluna in range(colunas_rotulo):
+            planilha.column_dimensions[get_column_letter(coluna + 1)].width = largura_rotulo
+        for coluna, formato in numericas:
+            planilha.column_dimensions[get_column_letter(coluna + 1)].width = 16
+            for (celula,) in planilha.iter_rows(min_row=2, min_col=coluna + 1, max_col=coluna + 1):
+                celula.number_format = formato
+
+
+def _gravar_excel(conteudo, caminho):
+    with pd.ExcelWriter(caminho, engine=_motor_excel()) as writer:
+        resumo = pd.DataFrame(conteudo["resumo"], columns=["Item", "Valor", "Unidade"]).set_index("Item")
+        resumo.to_excel(writer, sheet_name="Resumo")
+        _formatar_aba(writer, "Resumo", resumo, 1)
+        if conteudo["comentario"]:
+            pd.DataFrame({"Comentário": [conteudo["comentario"]]}).to_excel(
+                writer, sheet_name="Resumo", startrow=len(resumo) + 2, index=False)
+        for titulo, tabela in conteudo["secoes"]:
+            # Nomes de aba: até 31 caracteres e sem os símbolos que o Excel recusa
+            aba = re.sub(r"[\[\]:*?/\\]", "", titulo)[:31]
+            tabela.to_excel(writer, sheet_name=aba)
+            _formatar_aba(writer, aba, tabela, tabela.index.nlevels)
+
+
+def _celulas_pdf(tabela):
+    colunas = list(tabela.columns)
+    linhas = [[""] + [str(coluna) for coluna in colunas]]
+    for rotulo, valores in zip(tabela.index, tabela.itertuples(index=False)):
+        linhas.append([" / ".join(map(str, rotulo)) if isinstance(rotulo, tuple) else str(rotulo)] + [
+            _formatar_valor(valor, "%" if str(coluna).endswith("%") else "")
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool) else str(valor)
+            for coluna, valor in zip(colunas, valores)
+        ])
+    return linhas
+
+
+def _gravar_pdf(conteudo, caminho):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    estilos = getSampleStyleSheet()
+    estilo_tabela = TableStyle([
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#dde4ee")),
+        ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ])
+    titulo = f"{conteudo['entidade']} - fechamento {conteudo['periodo']}" if conteudo["periodo"] else conteudo["entidade"]
+    elementos = [Paragraph(escape(titulo), estilos["Title"])]
+    resumo = [[rotulo, _formatar_valor(valor, unidade)] for rotulo, valor, unidade in conteudo["resumo"]]
+    if resumo:
+        elementos.append(Table(resumo, style=estilo_tabela, hAlign="LEFT"))
+    if conteudo["comentario"]:
+        elementos += [Spacer(1, 8), Paragraph(escape(conteudo["comentario"]), estilos["BodyText"])]
+    for titulo_secao, tabela in conteudo["secoes"]:
+        parcial = tabela.iloc[:LINHAS_PDF, -COLUNAS_PDF:]
+        elementos += [Spacer(1, 10), Paragraph(escape(titulo_secao), estilos["Heading3"]),
+                      Table(_celulas_pdf(parcial), style=estilo_tabela, hAlign="LEFT", repeatRows=1)]
+        if parcial.shape != tabela.shape:
+            elementos.append(Paragraph(f"Recorte de {tabela.shape[0]:,} x {tabela.shape[1]:,}; completo no Excel.",
+                                       estilos["Italic"]))
+    SimpleDocTemplate(caminho, pagesize=landscape(A4), title=titulo).build(elementos)
+
+
+def gravar_pacote(conteudo, formatos, saida):
+    """Grava os arquivos do pacote (roda em um processo do pool) e devolve os caminhos.
+
+    Cada arquivo é escrito com outro nome e renomeado no fim: pacote interrompido não fica pela metade.
+    """
+    base = os.path.join(saida, _nome_arquivo(conteudo["entidade"]))
+    caminhos = []
+    for formato in formatos:
+        destino = f"{base}.{formato}"
+        temporario = f"{base}.parcial.{formato}"
+        (_gravar_excel if formato == "xlsx" else _gravar_pdf)(conteudo, temporario)
+        os.replace(temporario, destino)
+        caminhos.append(destino)
+    return caminhos
+
+
+def gerar_relatorios(carteira, saida, formatos=("xlsx",), entidades=None, periodo=None, orcamento=None, razao=None,
+                     fluxo=None, client=None, cache=None, processos=PROCESSOS_PADRAO,
+                     simultaneas_ia=SIMULTANEAS_IA_PADRAO, progresso=None, **opcoes):
+    """Gera os pacotes das entidades em paralelo e devolve (pacotes gerados, falhas, caminho do índice).
+
+    Threads montam o conteúdo de cada empresa e esperam o comentário da IA (com `client`);
+    um pool de `processos` grava os arquivos. `opcoes` segue para `montar_conteudo`
+    (meses_fluxo, inflacao_anual, limite_variacao). `progresso(feitos, total, mensagem)`
+    é chamado a cada pacote, como nas tarefas em segundo plano.
+    """
+    os.makedirs(saida, exist_ok=True)
+    dre = carteira["dre"]
+    if entidades is None:
+        entidades = list(dict.fromkeys([*dre.entidades, *carteira["indices"].index.get_level_values(0).astype(str)]))
+    periodo = periodo or (str(dre.periodos[-1]) if dre.periodos else None)
+    # Resumo da DRE de todas as entidades de uma vez (vetorizado), consultado por cada pacote
+    resumo_dre = dre.resumo(periodo) if dre.periodos else None
+    orcamentos, razoes, fluxos = _por_entidade(orcamento), _por_entidade(razao), _por_entidade(fluxo)
+
+    def pacote(entidade):
+        inicio = time.perf_counter()
+        conteudo = montar_conteudo(entidade, carteira, periodo, resumo_dre, orcamentos.get(entidade),
+                                   razoes.get(entidade), fluxos.get(entidade), **opcoes)
+        aviso = ""
+        if client is not None:
+            try:
+                conteudo["comentario"] = comentar(client, cache, conteudo)
+            except ErroLLM as erro:
+                aviso = f"sem comentário da IA ({erro})"
+        caminhos = pool.submit(gravar_pacote, conteudo, formatos, saida).result()
+        return caminhos, aviso, time.perf_counter() - inicio
+
+    gerados, falhas = 0, 0
+    caminho_indice = os.path.join(saida, INDICE)
+    # Processos iniciados do zero (spawn), como no Windows: as threads abaixo já estariam rodando num fork.
+    # Threads: uma espera por processo de gravação, mais as que aguardam a IA
+    with open(caminho_indice, "w", newline="", encoding="utf-8") as arquivo_indice, \
+            ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn")) as pool, \
+            ThreadPoolExecutor(max_workers=processos + (simultaneas_ia if client is not None else processos),
+                               thread_name_prefix="relatorio") as threads:
+        indice = csv.writer(arquivo_indice)
+        indice.writerow(["entidade", "arquivos", "segundos", "aviso", "erro"])
+        futuros = {threads.submit(pacote, entidade): entidade for entidade in entidades}
+        try:
+            for feitos, futuro in enumerate(as_completed(futuros), start=1):
+                entidade = futuros.pop(futuro)
+                try:
+                    caminhos, aviso, segundos = futuro.result()
+                except Exception as erro:
+                    falhas += 1
+                    indice.writerow([entidade, "", "", "", f"{type(erro).__name__}: {erro}"])
+                    mensagem = f"{entidade}: erro - {erro}"
+                else:
+                    gerados += 1
+                    indice.writerow([entidade, ";".join(caminhos), f"{segundos:.2f}", aviso, ""])
+                    mensagem = f"{entidade}: {segundos:.2f}s" + (f" ({aviso})" if aviso else "")
+                arquivo_indice.flush()
+                if progresso is not None:
+                    progresso(feitos, len(entidades), mensagem)
+        except BaseException:
+            # Cancelamento (ou Ctrl+C): os pacotes que ainda não começaram não são gerados
+            threads.shutdown(wait=False, cancel_futures=True)
+            raise
+    return gerados, falhas, caminho_indice
+
+
+def montar_parser():
+    parser = argparse.ArgumentParser(description="Pacotes de fechamento (Excel/PDF) para uma carteira de empresas")
+    parser.add_argument("demonstrativos", help="CSV com entidade, periodo, conta e valor (balanço e DRE)")
+    parser.add_argument("--orcamento", help="CSV com entidade, categoria, centro_custo, periodo e valor_orcado")
+    parser.add_argument("--razao", help="CSV com entidade, categoria, centro_custo, periodo ou data, e valor")
+    parser.add_argument("--fluxo", help="CSV com entidade, descricao e valor mensal (+ entrada, - saída)")
+    parser.add_argument("--saida", default="relatorios", help="Pasta dos pacotes e do índice")
+    parser.add_argument("--formatos", nargs="+", choices=FORMATOS, default=["xlsx"])
+    parser.add_argument("--entidades", nargs="+", help="Só estas entidades (padrão: todas)")
+    parser.add_argument("--periodo", help="Período de fechamento (padrão: o último)")
+    parser.add_argument("--processos", type=int, default=PROCESSOS_PADRAO)
+    parser.add_argument("--comentario", action="store_true", help="Inclui o comentário da IA em cada pacote")
+    parser.add_argument("--simultaneas-ia", type=int, default=SIMULTANEAS_IA_PADRAO,
+                        help="Chamadas à IA em andamento ao mesmo tempo")
+    parser.add_argument("--meses-fluxo", type=int, default=MESES_FLUXO_PADRAO)
+    parser.add_argument("--inflacao", type=float, default=0.0, help="Inflação anual da projeção (%%)")
+    parser.add_argument("--limite-variacao", type=float, default=LIMITE_VARIACAO_PADRAO,
+                        help="Limite de variação do orçamento para alerta (%%)")
+    parser.add_argument("--sem-historico", action="store_true",
+                        help="Não reaproveita nem grava os cálculos da carteira no histórico")
+    return parser
+
+
+def main(argv=None):
+    argumentos = montar_parser().parse_args(argv)
+    if "pdf" in argumentos.formatos and not _disponivel("reportlab"):
+        print("PDF precisa do pacote reportlab (pip install reportlab)", file=sys.stderr)
+        return 1
+    client = cache = None
+    if argumentos.comentario:
+        from dotenv import load_dotenv
+        load_dotenv()
+        if not os.getenv("OPENAI_API_KEY"):
+            print("Chave API da OpenAI não encontrada (OPENAI_API_KEY)", file=sys.stderr)
+            return 1
+        client, cache = criar_cliente(os.getenv("OPENAI_API_KEY")), CacheLLM()
+
+    inicio = time.perf_counter()
+    demonstrativos = ler_csv(argumentos.demonstrativos)
+    if argumentos.sem_historico:
+        carteira = calcular_carteira(demonstrativos)
+    else:
+        carteira = Historico().memorizar("relatorios_carteira", calcular_carteira, demonstrativos)
+    entradas = {nome: ler_csv(caminho) if caminho else None for nome, caminho in
+                [("orcamento", argumentos.orcamento), ("razao", argumentos.razao), ("fluxo", argumentos.fluxo)]}
+    print(f"Carteira calculada em {time.perf_counter() - inicio:.2f}s", file=sys.stderr)
+
+    def progresso(feitos, total, mensagem):
+        decorrido = time.perf_counter() - inicio
+        restante = decorrido / feitos * (total - feitos)
+        print(f"[{feitos}/{total}] {mensagem} ({feitos / decorrido:.1f} pacotes/s, faltam ~{restante:.0f}s)",
+              file=sys.stderr)
+
+    gerados, falhas, caminho_indice = gerar_relatorios(
+        carteira, argumentos.saida, argumentos.formatos, argumentos.entidades, argumentos.periodo,
+        client=client, cache=cache, processos=argumentos.processos, simultaneas_ia=argumentos.simultaneas_ia,
+        progresso=progresso, meses_fluxo=argumentos.meses_fluxo, inflacao_anual=argumentos.inflacao,
+        limite_variacao=argumentos.limite_variacao, **entradas)
+    print(f"{gerados:,} pacotes em {time.perf_counter() - inicio:.1f}s, {falhas:,} com erro; índice em {caminho_indice}",
+          file=sys.stderr)
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from classificacao import normalizar_texto
+from moeda import para_reais
+
+# Naturezas das contas no I050 (COD_NAT)
+NATUREZAS = {"01": "Ativo", "02": "Passivo", "03": "Patrimônio Líquido", "04": "Resultado",
+             "05": "Compensação", "09": "Outras"}
+
+# Como cada campo das telas de Balanço e DRE é apurado a partir do plano de contas:
+#   naturezas: COD_NAT aceitos; termos: trechos do nome da conta ou de qualquer conta superior
+#   (sem acento, minúsculas); prefixos: início do código da conta; excluir: termos que eliminam a conta;
+#   sinal: lado natural do saldo ("D" devedor, "C" credor), para o valor sair positivo.
+# Sem termos nem prefixos, entram todas as contas das naturezas informadas.
+MAPEAMENTO_PADRAO = {
+    "ativo_total": {"naturezas": ["01"], "sinal": "D"},
+    "ativo_circulante": {"naturezas": ["01"], "termos": ["ativo circulante"], "sinal": "D"},
+    "disponivel": {"naturezas": ["01"], "termos": ["disponivel", "disponibilidades", "caixa e equivalentes"],
+                   "sinal": "D"},
+    "estoque": {"naturezas": ["01"], "termos": ["estoque"], "sinal": "D"},
+    "passivo_circulante": {"naturezas": ["02"], "termos": ["passivo circulante"], "sinal": "C"},
+    "passivo_total": {"naturezas": ["02"], "sinal": "C"},
+    "patrimonio_liquido": {"naturezas": ["03"], "sinal": "C"},
+    "lucro_liquido": {"naturezas": ["04"], "sinal": "C"},
+    "vendas_liquidas": {"naturezas": ["04"], "termos": ["receita bruta", "receita operacional", "receitas de vendas",
+                                                        "receita de vendas", "deducoes"],
+                        "excluir": ["financeira"], "sinal": "C"},
+    "receita_bruta": {"naturezas": ["04"], "termos": ["receita bruta", "receita operacional", "receitas de vendas",
+                                                      "receita de vendas"],
+                      "excluir": ["deducoes", "devolucoes", "financeira"], "sinal": "C"},
+    "deducoes": {"naturezas": ["04"], "termos": ["deducoes", "devolucoes", "impostos sobre vendas",
+                                                 "impostos incidentes sobre vendas"], "sinal": "D"},
+    "custo_produtos": {"naturezas": ["04"], "termos": ["custo"], "sinal": "D"},
+    "despesas_vendas": {"naturezas": ["04"], "termos": ["despesas com vendas", "despesas comerciais",
+                                                        "despesas de vendas"], "sinal": "D"},
+    "despesas_administrativas": {"naturezas": ["04"], "termos": ["despesas administrativas", "despesas gerais"],
+                                 "sinal": "D"},
+    "despesas_financeiras": {"naturezas": ["04"], "termos": ["despesas financeiras"], "sinal": "D"},
+}
+
+# Registros lidos; os demais são descartados sem dividir a linha
+REGISTROS = {"0000", "I050", "I150", "I155", "I200", "I250", "I355", "J100", "J150"}
+
+
+def _valor(texto):
+    # Valores do SPED usam vírgula decimal e não têm separador de milhar; somados em centavos (int)
+    return round(float(texto.replace(",", ".")) * 100) if texto else 0
+
+
+def _com_sinal(texto, indicador):
+    # Convenção interna: saldo devedor positivo, credor negativo
+    valor = _valor(texto)
+    return -valor if indicador == "C" else valor
+
+
+def _datas(serie):
+    # Datas do SPED: DDMMAAAA
+    return pd.to_datetime(serie, format="%d%m%Y", errors="coerce")
+
+
+def ler_ecd(caminho, encoding="latin-1"):
+    """Lê um arquivo da ECD (ou razão no mesmo leiaute) linha a linha, em memória constante.
+
+    Só os agregados por conta ficam em memória: plano de contas (I050), saldos
+    periódicos (I155), lançamentos somados por conta (I250, separando os de
+    encerramento do I200), saldos antes do encerramento (I355) e as
+    demonstrações publicadas (J100/J150, leiaute 8 ou posterior).
+    Valores com sinal: devedor positivo, credor negativo.
+    """
+    cabecalho = {}
+    plano = {}
+    saldos = defaultdict(lambda: [0, 0, 0, 0])
+    # debitos, creditos, debitos de encerramento, creditos de encerramento
+    movimentos = defaultdict(lambda: [0, 0, 0, 0])
+    antes_encerramento = defaultdict(int)
+    demonstracoes = []
+    periodo = ("", "")
+    deslocamento = 0
+    linhas = 0
+
+    with open(caminho, encoding=encoding, errors="replace") as arquivo:
+        for linha in arquivo:
+            linhas += 1
+            registro = linha[1:5]
+            if registro not in REGISTROS:
+                continue
+            campos = linha.rstrip("\r\n").split("|")
+
+            if registro == "I250":
+                # Partida do lançamento: |I250|COD_CTA|COD_CCUS|VL_DC|IND_DC|...
+                movimento = movimentos[campos[2]]
+                movimento[deslocamento + (1 if campos[5] == "C" else 0)] += _valor(campos[4])
+            elif registro == "I200":
+                # Lançamentos de encerramento (IND_LCTO = "E") ficam fora do resultado do período
+                deslocamento = 2 if campos[5] == "E" else 0
+            elif registro == "I155":
+                saldo = saldos[(periodo, campos[2])]
+                saldo[0] += _com_sinal(campos[4], campos[5])
+                saldo[1] += _valor(campos[6])
+                saldo[2] += _valor(campos[7])
+                saldo[3] += _com_sinal(campos[8], campos[9])
+            elif registro == "I150":
+                periodo = (campos[2], campos[3])
+            elif registro == "I355":
+                antes_encerramento[campos[2]] += _com_sinal(campos[4], campos[5])
+            elif registro == "I050":
+                plano[campos[6]] = (campos[7], campos[8], campos[3], campos[4], campos[5])
+            elif registro == "J100" and len(campos) >= 13:
+                demonstracoes.append(("BP", campos[2], campos[7], campos[5], campos[6],
+                                      _com_sinal(campos[10], campos[11])))
+            elif registro == "J150" and len(campos) >= 14:
+                demonstracoes.append(("DRE", campos[3], campos[7], campos[6], campos[12],
+                                      _com_sinal(campos[10], campos[11])))
+            elif registro == "0000":
+                cabecalho = {"inicio": campos[3], "fim": campos[4], "empresa": campos[5], "cnpj": campos[6]}
+
+    balancete = pd.DataFrame(
+        [(inicio, fim, conta, *valores) for ((inicio, fim), conta), valores in saldos.items()],
+        columns=["periodo_inicio", "periodo_fim", "conta", "saldo_inicial", "debitos", "creditos", "saldo_final"],
+    )
+    valores = ["saldo_inicial", "debitos", "creditos", "saldo_final"]
+    balancete[valores] = para_reais(balancete[valores])
+    balancete["periodo_inicio"] = _datas(balancete["periodo_inicio"])
+    balancete["periodo_fim"] = _datas(balancete["periodo_fim"])
+
+    return {
+        "arquivo": os.path.basename(caminho),
+        "empresa": cabecalho.get("empresa", ""),
+        "cnpj": cabecalho.get("cnpj", ""),
+        "inicio": _datas(pd.Series([cabecalho.get("inicio", "")]))[0],
+        "fim": _datas(pd.Series([cabecalho.get("fim", "")]))[0],
+        "linhas": linhas,
+        "plano": pd.DataFrame.from_dict(plano, orient="index",
+                                        columns=["superior", "nome", "natureza", "tipo", "nivel"]),
+        "balancete": balancete,
+        "movimentos": para_reais(pd.DataFrame.from_dict(
+            movimentos, orient="index",
+            columns=["debitos", "creditos", "debitos_encerramento", "creditos_encerramento"],
+        )),
+        "antes_encerramento": para_reais(pd.Series(antes_encerramento, dtype=np.int64)),
+        "demonstracoes": pd.DataFrame(demonstracoes, columns=["demonstracao", "codigo", "descricao",
+                                                              "superior", "grupo", "valor"]).assign(
+            valor=lambda d: para_reais(d["valor"])),
+    }
+
+
+def ler_arquivos(caminhos, max_workers=None, progresso=None):
+    """Lê vários arquivos da ECD em paralelo, um processo por arquivo; devolve os resultados na ordem.
+
+    Com um único arquivo a leitura é feita no próprio processo, sem custo de iniciar workers.
+    `progresso(concluidos, total)` é chamado no processo de quem invocou a função.
+    """
+    total = len(caminhos)
+    if total == 1:
+        resultados = [ler_ecd(caminhos[0])]
+        if progresso is not None:
+            progresso(1, 1)
+        return resultados
+
+    resultados = [None] * total
+    max_workers = min(max_workers or os.cpu_count() or 1, total)
+    # "spawn" evita herdar as threads do servidor do Streamlit por fork
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as executor:
+        futuros = {executor.submit(ler_ecd, caminho): i for i, caminho in enumerate(caminhos)}
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            resultados[futuros[futuro]] = futuro.result()
+            if progresso is not None:
+                progresso(concluidos, total)
+    return resultados
+
+
+def _hierarquia(plano):
+    # Nome normalizado da conta e de todas as superiores, para casar termos em qualquer nível
+    nomes = {codigo: " " + " ".join(normalizar_texto(nome)) for codigo, nome in plano["nome"].items()}
+    superiores = plano["superior"].to_dict()
+    hierarquia = {}
+    for codigo in plano.index:
+        partes, atual, visitados = [], codigo, set()
+        while atual in nomes and atual not in visitados:
+            visitados.add(atual)
+            partes.append(nomes[atual])
+            atual = superiores.get(atual)
+        hierarquia[codigo] = " |".join(partes) + " "
+    return hierarquia
+
+
+def saldos_por_conta(resultado):
+    """Saldo de cada conta analítica: `saldo_final` para o balanço e `resultado` para a DRE.
+
+    O saldo final vem do último período do I155 (ou, sem I155, da soma de todos os
+    lançamentos). O resultado usa o I355; na falta dele, os lançamentos sem os de
+    encerramento; e por último o próprio saldo final.
+    """
+    balancete = resultado["balancete"]
+    movimentos = resultado["movimentos"]
+    if len(balancete):
+        ultimo = balancete[balancete["periodo_fim"] == balancete["periodo_fim"].max()]
+        saldo_final = ultimo.groupby("conta")["saldo_final"].sum()
+    else:
+        saldo_final = (movimentos["debitos"] - movimentos["creditos"]
+                       + movimentos["debitos_encerramento"] - movimentos["creditos_encerramento"])
+
+    if len(resultado["antes_encerramento"]):
+        valor_resultado = resultado["antes_encerramento"]
+    elif len(movimentos):
+        valor_resultado = movimentos["debitos"] - movimentos["creditos"]
+    else:
+        valor_resultado = saldo_final
+
+    plano = resultado["plano"]
+    contas = pd.DataFrame({"saldo_final": saldo_final, "resultado": valor_resultado}).fillna(0.0)
+    contas = contas.join(plano[["nome", "natureza"]]).fillna({"nome": "", "natureza": ""})
+    contas["hierarquia"] = contas.index.map(_hierarquia(plano)).fillna("")
+    contas["valor"] = np.where(contas["natureza"] == "04", contas["resultado"], contas["saldo_final"])
+    return contas
+
+
+def _termos(termos):
+    return [" " + " ".join(normalizar_texto(termo)) for termo in termos]
+
+
+def _filtro(contas, regra):
+    filtro = np.ones(len(contas), dtype=bool)
+    if regra.get("naturezas"):
+        filtro &= contas["natureza"].isin(regra["naturezas"]).to_numpy()
+    if regra.get("termos") or regra.get("prefixos"):
+        criterio = np.zeros(len(contas), dtype=bool)
+        if regra.get("termos"):
+            padrao = "|".join(re.escape(termo) for termo in _termos(regra["termos"]))
+            criterio |= contas["hierarquia"].str.contains(padrao).to_numpy()
+        if regra.get("prefixos"):
+            criterio |= contas.index.astype(str).str.startswith(tuple(regra["prefixos"]))
+        filtro &= criterio
+    if regra.get("excluir"):
+        padrao = "|".join(re.escape(termo) for termo in _termos(regra["excluir"]))
+        filtro &= ~contas["hierarquia"].str.contains(padrao).to_numpy()
+    return filtro
+
+
+def apurar_campos(resultado, mapeamento=None):
+    """Valores dos campos das telas de Balanço e DRE, no sinal natural de cada campo."""
+    mapeamento = MAPEAMENTO_PADRAO if mapeamento is None else mapeamento
+    contas = saldos_por_conta(resultado)
+    valores = contas["valor"].to_numpy()
+    campos = {}
+    for campo, regra in mapeamento.items():
+        total = valores[_filtro(contas, regra)].sum()
+        campos[campo] = round(float(-total if regra.get("sinal") == "C" else total), 2)
+    return campos
+
+
+def descrever(resultado):
+    """Rótulo curto do arquivo: empresa, período e nome do arquivo."""
+    periodo = ""
+    if pd.notna(resultado["inicio"]) and pd.notna(resultado["fim"]):
+        periodo = f" ({resultado['inicio']:%d/%m/%Y} a {resultado['fim']:%d/%m/%Y})"
+    return f"{resultado['empresa'] or 'Sem identificação'}{periodo} - {resultado['arquivo']}"
@@ -0,0 +1,186 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local compatível com POST /v1/chat/completions da OpenAI (com e sem streaming),
+# para benchmarks e testes de carga sem custo nem limite de taxa. Exemplo:
+#   python stub_openai.py --porta 8001 --latencia 0.8 --tokens-por-segundo 40
+#   OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub streamlit run app.py
+
+PALAVRAS = ("A análise indica liquidez adequada, endividamento sob controle e margem operacional "
+            "estável; recomenda-se acompanhar o ciclo financeiro e as despesas administrativas.").split()
+
+
+class ConfiguracaoStub:
+    """Comportamento do stub: latência até o primeiro token, ritmo do stream, tamanho da resposta e erros."""
+
+    def __init__(self, latencia=0.5, tokens_por_segundo=50.0, tokens_resposta=200, variacao=0.2, taxa_erro=0.0):
+        self.latencia = latencia
+        self.tokens_por_segundo = tokens_por_segundo
+        self.tokens_resposta = tokens_resposta
+        # Variação aleatória (±) aplicada à latência de cada requisição
+        self.variacao = variacao
+        # Fração das requisições respondidas com 429 (com retry-after-ms), para exercitar as repetições
+        self.taxa_erro = taxa_erro
+
+
+def _resposta(mensagens, config):
+    # Prompts de classificação em lote ("Transações:" + uma linha JSON por item) recebem JSON válido,
+    # para o app seguir o mesmo caminho que seguiria com a API real
+    texto = mensagens[-1].get("content", "") if mensagens else ""
+    if texto.startswith("Transações:"):
+        ids = [json.loads(linha)["id"] for linha in texto.splitlines()[1:] if linha.startswith("{")]
+        classificacoes = [{"id": id_, "conta": "Despesas Administrativas"} for id_ in ids]
+        return [json.dumps({"classificacoes": classificacoes}, ensure_ascii=False)]
+    return [(" " if i else "") + PALAVRAS[i % len(PALAVRAS)] for i in range(config.tokens_resposta)]
+
+
+class _Manipulador(BaseHTTPRequestHandler):
+    # HTTP/1.1: o cliente reaproveita as conexões (keep-alive), como faz com a API real
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _json(self, status, corpo, cabecalhos=()):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in cabecalhos:
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _parte(self, evento):
+        # Um evento SSE por bloco da transferência "chunked"
+        dados = f"data: {evento}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(dados):X}\r\n".encode() + dados + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        # Contadores do stub, usados pelo teste de carga quando ele roda em outro processo
+        if self.path.rstrip("/").endswith("/estatisticas"):
+            self._json(200, self.server.estatisticas())
+        else:
+            self._json(404, {"error": {"message": f"Rota desconhecida: {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": f"Rota desconhecida: {self.path}", "type": "invalid_request_error"}})
+            return
+
+        servidor = self.server
+        config = servidor.config
+        with servidor.trava:
+            servidor.requisicoes += 1
+            servidor.em_andamento += 1
+            servidor.pico_simultaneas = max(servidor.pico_simultaneas, servidor.em_andamento)
+        try:
+            if random.random() < config.taxa_erro:
+                self._json(429, {"error": {"message": "Rate limit (stub)", "type": "rate_limit_error"}},
+                           [("retry-after-ms", "100")])
+                return
+            time.sleep(max(config.latencia * random.uniform(1 - config.variacao, 1 + config.variacao), 0))
+            self._responder(corpo, config)
+        finally:
+            with servidor.trava:
+                servidor.em_andamento -= 1
+
+    def _responder(self, corpo, config):
+        mensagens = corpo.get("messages", [])
+        modelo = corpo.get("model", "stub")
+        partes = _resposta(mensagens, config)
+        uso = {"prompt_tokens": sum(len(m.get("content", "")) for m in mensagens) // 4 + 1,
+               "completion_tokens": len(partes)}
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": modelo}
+        intervalo = 1 / config.tokens_por_segundo if config.tokens_por_segundo > 0 else 0
+
+        if not corpo.get("stream"):
+            time.sleep(intervalo * len(partes))
+            self._json(200, {**base, "object": "chat.completion", "usage": uso, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": "".join(partes)}, "finish_reason": "stop"}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pedaco = {**base, "object": "chat.completion.chunk"}
+        self._parte(json.dumps({**pedaco, "choices": [
+            {"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}))
+        for parte in partes:
+            time.sleep(intervalo)
+            self._parte(json.dumps({**pedaco, "choices": [
+                {"index": 0, "delta": {"content": parte}, "finish_reason": None}]}, ensure_ascii=False))
+        self._parte(json.dumps({**pedaco, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        if (corpo.get("stream_options") or {}).get("include_usage"):
+            self._parte(json.dumps({**pedaco, "choices": [], "usage": uso}))
+        self._parte("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class ServidorStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, config):
+        super().__init__(endereco, _Manipulador)
+        self.config = config
+        self.trava = threading.Lock()
+        self.requisicoes = 0
+        self.em_andamento = 0
+        self.pico_simultaneas = 0
+
+    def handle_error(self, requisicao, endereco_cliente):
+        # Cliente que fecha o stream no meio (ex.: mede só o primeiro token) não é erro do stub
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(requisicao, endereco_cliente)
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}/v1"
+
+    def estatisticas(self):
+        with self.trava:
+            return {"requisicoes": self.requisicoes, "em_andamento": self.em_andamento,
+                    "pico_simultaneas": self.pico_simultaneas}
+
+
+def iniciar_stub(porta=0, endereco="127.0.0.1", **configuracao):
+    """Sobe o stub em uma thread própria (porta 0 = livre) e devolve o servidor; use `servidor.url` como base_url."""
+    servidor = ServidorStub((endereco, porta), ConfiguracaoStub(**configuracao))
+    threading.Thread(target=servidor.serve_forever, name="stub-openai", daemon=True).start()
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local compatível com a API de chat da OpenAI")
+    parser.add_argument("--porta", type=int, default=8001)
+    parser.add_argument("--endereco", default="127.0.0.1")
+    parser.add_argument("--latencia", type=float, default=0.5, help="Segundos até o primeiro token")
+    parser.add_argument("--tokens-por-segundo", type=float, default=50.0)
+    parser.add_argument("--tokens-resposta", type=int, default=200)
+    parser.add_argument("--variacao", type=float, default=0.2, help="Variação relativa da latência (0 a 1)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de respostas 429 (0 a 1)")
+    argumentos = parser.parse_args(argv)
+    servidor = ServidorStub((argumentos.endereco, argumentos.porta), ConfiguracaoStub(
+        argumentos.latencia, argumentos.tokens_por_segundo, argumentos.tokens_resposta, argumentos.variacao,
+        argumentos.taxa_erro))
+    print(f"Stub em {servidor.url} (Ctrl+C para encerrar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
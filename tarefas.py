@@ -0,0 +1,246 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuração padrão da fila (pode ser sobrescrita pelo .env)
+CAMINHO_PADRAO = os.getenv('TAREFAS_CAMINHO', os.path.join('.cache', 'tarefas.sqlite3'))
+MAX_SIMULTANEAS = int(os.getenv('TAREFAS_MAX_SIMULTANEAS', 4))
+MAX_POR_USUARIO = int(os.getenv('TAREFAS_MAX_POR_USUARIO', 2))
+RETENCAO_PADRAO = int(os.getenv('TAREFAS_RETENCAO_DIAS', 7)) * 24 * 3600
+# Cada processo renova seu sinal de vida neste intervalo; sem sinal por 3 intervalos, é dado como encerrado
+INTERVALO_PULSO = int(os.getenv('TAREFAS_INTERVALO_PULSO', 30))
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDA = "concluída"
+ERRO = "erro"
+CANCELADA = "cancelada"
+ATIVAS = (PENDENTE, EXECUTANDO)
+
+
+class TarefaCancelada(Exception):
+    pass
+
+
+class LimiteTarefasExcedido(Exception):
+    pass
+
+
+class Contexto:
+    """Passado como primeiro argumento à função da tarefa.
+
+    `progresso(concluidos, total)` tem a mesma assinatura dos callbacks de progresso
+    dos módulos de cálculo e interrompe a tarefa (TarefaCancelada) se ela foi cancelada.
+    """
+
+    def __init__(self, fila, id_):
+        self._fila = fila
+        self.id = id_
+        self._cancelar = threading.Event()
+
+    def cancelado(self):
+        return self._cancelar.is_set()
+
+    def verificar(self):
+        if self._cancelar.is_set():
+            raise TarefaCancelada()
+
+    def progresso(self, concluidos, total, mensagem=None):
+        self._fila._atualizar(self.id, progresso=concluidos / total if total else 1.0,
+                              mensagem=mensagem or f"{concluidos}/{total}")
+        self.verificar()
+
+
+class FilaTarefas:
+    """Executa análises longas fora da execução do script do Streamlit.
+
+    As tarefas rodam em um pool de threads compartilhado (limite global) e cada
+    usuário tem um limite de tarefas ativas. O andamento fica em memória; situação
+    e resultado (pickle) ficam em SQLite, e podem ser reabertos depois de um rerun
+    ou de um novo acesso.
+
+    Vários processos podem usar o mesmo banco: cada tarefa guarda o processo dono,
+    e só as de processos encerrados (sem sinal de vida) são marcadas como erro.
+    """
+
+    def __init__(self, caminho=CAMINHO_PADRAO, max_simultaneas=MAX_SIMULTANEAS, max_por_usuario=MAX_POR_USUARIO,
+                 retencao=RETENCAO_PADRAO):
+        self.caminho = caminho
+        self.max_por_usuario = max_por_usuario
+        self._executor = ThreadPoolExecutor(max_workers=max_simultaneas, thread_name_prefix="tarefa")
+        self._local = threading.local()
+        self._trava = threading.Lock()
+        self._ativas = {}
+        self.dono = uuid.uuid4().hex
+
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        with self._conexao() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS tarefas (
+                    id TEXT PRIMARY KEY,
+                    usuario TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    titulo TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    erro TEXT,
+                    resultado BLOB,
+                    criado_em REAL NOT NULL,
+                    concluido_em REAL
+                )
+            """)
+            # Bancos criados antes da coluna dono: as tarefas antigas ficam sem dono
+            if "dono" not in [coluna[1] for coluna in con.execute("PRAGMA table_info(tarefas)")]:
+                con.execute("ALTER TABLE tarefas ADD COLUMN dono TEXT")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_usuario ON tarefas (usuario, criado_em)")
+            con.execute("CREATE TABLE IF NOT EXISTS donos (dono TEXT PRIMARY KEY, visto_em REAL NOT NULL)")
+            con.execute("INSERT INTO donos (dono, visto_em) VALUES (?, ?)", (self.dono, time.time()))
+            con.execute("DELETE FROM tarefas WHERE criado_em < ?", (time.time() - retencao,))
+        self._encerrar_orfas()
+        threading.Thread(target=self._pulsar, name="tarefas-pulso", daemon=True).start()
+
+    def _conexao(self):
+        # Conexões SQLite não podem ser compartilhadas entre threads
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            self._local.con = con
+        return con
+
+    def _encerrar_orfas(self):
+        # Tarefas em andamento de processos encerrados (ou de antes da coluna dono) não voltam mais
+        limite = time.time() - 3 * INTERVALO_PULSO
+        with self._conexao() as con:
+            con.execute("DELETE FROM donos WHERE visto_em < ?", (limite,))
+            con.execute("UPDATE tarefas SET status = ?, erro = ? WHERE status IN (?, ?) "
+                        "AND (dono IS NULL OR dono NOT IN (SELECT dono FROM donos))",
+                        (ERRO, "Interrompida pelo encerramento do servidor", *ATIVAS))
+
+    def _pulsar(self):
+        while True:
+            time.sleep(INTERVALO_PULSO)
+            try:
+                with self._conexao() as con:
+                    con.execute("INSERT OR REPLACE INTO donos (dono, visto_em) VALUES (?, ?)", (self.dono, time.time()))
+                self._encerrar_orfas()
+            except sqlite3.Error:
+                # Banco ocupado ou indisponível: tenta de novo no próximo pulso
+                pass
+
+    def _atualizar(self, id_, **campos):
+        with self._trava:
+            tarefa = self._ativas.get(id_)
+            if tarefa is not None:
+                tarefa.update(campos)
+
+    def submeter(self, usuario, tipo, titulo, funcao, *args, **kwargs):
+        """Agenda `funcao(contexto, *args, **kwargs)` e devolve o id da tarefa.
+
+        `tipo` identifica quem sabe exibir o resultado (normalmente a tela de origem).
+        """
+        with self._trava:
+            ativas = sum(1 for t in self._ativas.values() if t["usuario"] == usuario)
+            if ativas >= self.max_por_usuario:
+                raise LimiteTarefasExcedido(
+                    f"Limite de {self.max_por_usuario} tarefas simultâneas atingido; aguarde ou cancele uma delas")
+            id_ = uuid.uuid4().hex
+            contexto = Contexto(self, id_)
+            self._ativas[id_] = {"id": id_, "usuario": usuario, "tipo": tipo, "titulo": titulo, "status": PENDENTE,
+                                 "progresso": 0.0, "mensagem": "Na fila", "erro": None,
+                                 "criado_em": time.time(), "concluido_em": None, "contexto": contexto}
+        with self._conexao() as con:
+            con.execute("INSERT INTO tarefas (id, usuario, tipo, titulo, status, criado_em, dono) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (id_, usuario, tipo, titulo, PENDENTE, self._ativas[id_]["criado_em"], self.dono))
+        self._executor.submit(self._executar, contexto, funcao, args, kwargs)
+        return id_
+
+    def _executar(self, contexto, funcao, args, kwargs):
+        id_ = contexto.id
+        resultado, erro = None, None
+        if contexto.cancelado():
+            status = CANCELADA
+        else:
+            self._atualizar(id_, status=EXECUTANDO, mensagem="Em execução")
+            try:
+                resultado = funcao(contexto, *args, **kwargs)
+                status = CANCELADA if contexto.cancelado() else CONCLUIDA
+            except TarefaCancelada:
+                status = CANCELADA
+            except Exception as e:
+                status, erro = ERRO, f"{type(e).__name__}: {e}"
+
+        try:
+            dados = pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL) if status == CONCLUIDA else None
+            with self._conexao() as con:
+                con.execute("UPDATE tarefas SET status = ?, erro = ?, resultado = ?, concluido_em = ? WHERE id = ?",
+                            (status, erro, dados, time.time(), id_))
+        except Exception as e:
+            # Resultado que não serializa (ou falha ao gravar) não pode deixar a tarefa "executando" para sempre
+            with self._conexao() as con:
+                con.execute("UPDATE tarefas SET status = ?, erro = ?, resultado = NULL, concluido_em = ? WHERE id = ?",
+                            (ERRO, f"Falha ao gravar o resultado: {type(e).__name__}: {e}", time.time(), id_))
+        finally:
+            with self._trava:
+                self._ativas.pop(id_, None)
+
+    def cancelar(self, id_):
+        # Tarefas na fila nem começam; as em execução param no próximo aviso de progresso
+        with self._trava:
+            tarefa = self._ativas.get(id_)
+            if tarefa is not None:
+                tarefa["contexto"]._cancelar.set()
+                tarefa["mensagem"] = "Cancelando..."
+
+    def _publica(self, tarefa):
+        return {chave: valor for chave, valor in tarefa.items() if chave != "contexto"}
+
+    def obter(self, id_):
+        """Situação da tarefa (sem o resultado) ou None se ela não existe mais."""
+        with self._trava:
+            tarefa = self._ativas.get(id_)
+            if tarefa is not None:
+                return self._publica(tarefa)
+        linha = self._conexao().execute(
+            "SELECT id, usuario, tipo, titulo, status, erro, criado_em, concluido_em FROM tarefas WHERE id = ?", (id_,)
+        ).fetchone()
+        return self._linha_para_tarefa(linha) if linha else None
+
+    def _linha_para_tarefa(self, linha):
+        id_, usuario, tipo, titulo, status, erro, criado_em, concluido_em = linha
+        return {"id": id_, "usuario": usuario, "tipo": tipo, "titulo": titulo, "status": status,
+                "progresso": 1.0 if status == CONCLUIDA else 0.0, "mensagem": status.capitalize(), "erro": erro,
+                "criado_em": criado_em, "concluido_em": concluido_em}
+
+    def listar(self, usuario):
+        """Tarefas do usuário, das mais recentes para as mais antigas."""
+        linhas = self._conexao().execute(
+            "SELECT id, usuario, tipo, titulo, status, erro, criado_em, concluido_em FROM tarefas "
+            "WHERE usuario = ? ORDER BY criado_em DESC", (usuario,)
+        ).fetchall()
+        with self._trava:
+            return [self._publica(self._ativas[linha[0]]) if linha[0] in self._ativas else self._linha_para_tarefa(linha)
+                    for linha in linhas]
+
+    def resultado(self, id_):
+        linha = self._conexao().execute(
+            "SELECT resultado FROM tarefas WHERE id = ? AND status = ?", (id_, CONCLUIDA)
+        ).fetchone()
+        return pickle.loads(linha[0]) if linha and linha[0] is not None else None
+
+    def remover(self, id_):
+        self.cancelar(id_)
+        with self._conexao() as con:
+            con.execute("DELETE FROM tarefas WHERE id = ? AND status NOT IN (?, ?)", (id_, *ATIVAS))
+
+    def estatisticas(self):
+        with self._trava:
+            ativas = list(self._ativas.values())
+        return {"executando": sum(1 for t in ativas if t["status"] == EXECUTANDO),
+                "na_fila": sum(1 for t in ativas if t["status"] == PENDENTE)}
@@ -0,0 +1,44 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from classificacao import NAO_CLASSIFICADO, classificar_em_lote, _interpretar_resposta
+from cliente_llm import ErroLLM
+
+LIMITES = dict(itens_por_requisicao=2, max_workers=1, requisicoes_por_minuto=10 ** 6, tokens_por_minuto=10 ** 9)
+
+
+class ClienteFalso:
+    """Devolve (ou levanta) as respostas na ordem das chamadas."""
+
+    def __init__(self, respostas):
+        self.respostas = list(respostas)
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **parametros):
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        mensagem = SimpleNamespace(content=json.dumps(resposta))
+        return SimpleNamespace(choices=[SimpleNamespace(message=mensagem)], usage=None)
+
+
+def test_pacote_com_erro_da_api_vira_falha():
+    cliente = ClienteFalso([{"classificacoes": [{"id": 0, "conta": "Tarifas"}, {"id": 1, "conta": "Vendas"}]},
+                            ErroLLM("401 não autorizado")])
+
+    contas, falhas = classificar_em_lote(cliente, ["tarifa", "venda", "aluguel"], **LIMITES)
+
+    assert contas == {"tarifa": "Tarifas", "venda": "Vendas", "aluguel": NAO_CLASSIFICADO}
+    assert falhas == ["aluguel"]
+
+
+def test_outros_erros_nao_sao_engolidos():
+    with pytest.raises(RuntimeError):
+        classificar_em_lote(ClienteFalso([RuntimeError("bug")]), ["tarifa"], **LIMITES)
+
+
+def test_id_nulo_nao_derruba_a_resposta():
+    resposta = json.dumps({"classificacoes": [{"id": None, "conta": "X"}, {"id": 1, "conta": "Vendas"}]})
+    assert _interpretar_resposta(resposta, 2) == [NAO_CLASSIFICADO, "Vendas"]
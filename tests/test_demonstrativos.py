@@ -0,0 +1,38 @@
+import threading
+from types import SimpleNamespace
+
+from demonstrativos import montar_prompt_reducao, reduzir_parciais
+from llm import estimar_tokens
+
+
+class ClienteFalso:
+    """Responde a cada consolidação com um resumo curto e conta os prompts recebidos."""
+
+    def __init__(self):
+        self.prompts = []
+        self._trava = threading.Lock()
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, messages, **parametros):
+        with self._trava:
+            self.prompts.append(messages[-1]["content"])
+            numero = len(self.prompts)
+        resposta = SimpleNamespace(content=f"Resumo consolidado {numero}.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=resposta)], usage=None)
+
+
+def test_reducao_em_niveis_cabe_no_orcamento():
+    parciais = [f"Bloco {i}: " + "receita cresceu e despesas caíram " * 60 for i in range(40)]
+    cliente = ClienteFalso()
+
+    reduzidas = reduzir_parciais(cliente, parciais, orcamento_tokens=2000, max_workers=2)
+
+    assert estimar_tokens(montar_prompt_reducao(reduzidas)) <= 2000
+    assert cliente.prompts
+    assert all(estimar_tokens(prompt) <= 2000 for prompt in cliente.prompts)
+
+
+def test_parciais_que_cabem_nao_chamam_a_ia():
+    cliente = ClienteFalso()
+    assert reduzir_parciais(cliente, ["a", "b"], orcamento_tokens=2000) == ["a", "b"]
+    assert cliente.prompts == []
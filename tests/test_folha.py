@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from folha import calcular_folha
+
+
+def test_coluna_categorica_com_vazio():
+    # A ingestão transforma "sim"/"nao" em categoria; o vazio assume o padrão (sem vale-transporte)
+    funcionarios = pd.DataFrame({
+        "salario_base": [3000.0, 3000.0, 3000.0],
+        "vale_transporte": pd.Categorical(["sim", np.nan, "nao"]),
+    })
+
+    folha = calcular_folha(funcionarios, "2025-05")
+
+    assert folha["desconto_vt"].tolist() == [180.0, 0.0, 0.0]
+
+
+def test_desconto_simplificado_irrf():
+    folha = calcular_folha(pd.DataFrame({"salario_base": [3000.0]}), "2025-05")
+    assert folha["irrf"].iloc[0] == 0.0
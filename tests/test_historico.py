@@ -0,0 +1,39 @@
+import importlib
+import sys
+
+import pandas as pd
+
+import historico
+from historico import Historico, versao_funcao
+
+
+def _escrever_modulos(pasta, taxa):
+    (pasta / "dep_taxa.py").write_text(f"TAXA = {taxa}\n\n\ndef aplicar(valor):\n    return valor * TAXA\n")
+    (pasta / "calc_taxa.py").write_text("from dep_taxa import aplicar\n\n\n"
+                                        "def calcular(df):\n    return df.assign(total=aplicar(df['valor']))\n")
+
+
+def _importar(pasta):
+    for nome in ("calc_taxa", "dep_taxa"):
+        sys.modules.pop(nome, None)
+    importlib.invalidate_caches()
+    return importlib.import_module("calc_taxa").calcular
+
+
+def test_mudanca_em_dependencia_invalida_resultado(tmp_path, monkeypatch):
+    monkeypatch.setattr(historico, "PASTA_PROJETO", str(tmp_path))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    base = Historico(str(tmp_path / "historico.sqlite3"))
+    df = pd.DataFrame({"valor": [10.0, 20.0]})
+
+    _escrever_modulos(tmp_path, 0.1)
+    calcular = _importar(tmp_path)
+    versao_antiga = versao_funcao(calcular)
+    assert base.memorizar("taxa", calcular, df)["total"].tolist() == [1.0, 2.0]
+
+    # Só o módulo importado muda; o da função memorizada continua igual
+    _escrever_modulos(tmp_path, 0.2)
+    calcular = _importar(tmp_path)
+    assert versao_funcao(calcular) != versao_antiga
+    assert base.memorizar("taxa", calcular, df)["total"].tolist() == [2.0, 4.0]
+    assert base.estatisticas()["resultados"] == 1
@@ -0,0 +1,35 @@
+import io
+
+import pandas as pd
+import pytest
+
+import ingestao
+
+pytest.importorskip("pyarrow")
+
+
+def test_streaming_amplia_tipos_de_blocos_posteriores(tmp_path):
+    # Primeiro bloco só com inteiros; fração, vazio e texto aparecem depois
+    linhas = [f"1.{i},{i},{i}" for i in range(5)] + ["1.9,1.5,1", "1.8,,2", "1.7,2.75,abc"]
+    arquivo = io.BytesIO(("conta,valor,quantidade\n" + "\n".join(linhas) + "\n").encode())
+    destino = str(tmp_path / "saida.parquet")
+
+    ingestao.converter_para_parquet(arquivo, destino, linhas_por_bloco=5, dtype={"conta": str})
+
+    df = pd.read_parquet(destino)
+    assert df["valor"].dtype == "float64"
+    assert df["valor"].iloc[5] == 1.5
+    assert pd.isna(df["valor"].iloc[6])
+    assert df["valor"].iloc[7] == 2.75
+    assert df["quantidade"].tolist() == ["0", "1", "2", "3", "4", "1", "2", "abc"]
+    assert df["conta"].tolist()[:2] == ["1.0", "1.1"]
+
+
+def test_cache_separa_opcoes_de_leitura(tmp_path):
+    conteudo = b"a;b\n1,5;2\n"
+    virgula = ingestao.carregar_csv(io.BytesIO(conteudo), diretorio=str(tmp_path))
+    ponto_e_virgula = ingestao.carregar_csv(io.BytesIO(conteudo), diretorio=str(tmp_path), sep=";", decimal=",")
+
+    assert list(virgula.columns) == ["a;b"]
+    assert list(ponto_e_virgula.columns) == ["a", "b"]
+    assert ponto_e_virgula["a"].iloc[0] == 1.5